@@ -112,9 +112,21 @@ start_web() {
     export OLLAMA_HOST="localhost"  # Since ollama is running on the same container
     export OLLAMA_PORT=11434
     export PYTHONUNBUFFERED=1  # Ensure Python output is not buffered
-    
-    # Start Flask application directly with error handling
-    python3 -m flask run --host=0.0.0.0 --port=7071 >>/var/log/webapp.log 2>&1 &
+    # Command history and chats are written to the PostgreSQL started above
+    export DATABASE_URL="${DATABASE_URL:-postgresql://postgres@127.0.0.1:5433/postgres}"
+    
+    # SERVER_MODE=asgi serves chat routes on asyncio instead of one thread per request;
+    # SERVER_MODE=gunicorn runs WEB_WORKERS processes sharing state through SQLite
+    SERVER_MODE="${SERVER_MODE:-flask}"
+    
+    # Start the web application directly with error handling
+    if [ "$SERVER_MODE" = "asgi" ]; then
+        python3 -m uvicorn asgi:app --host 0.0.0.0 --port 7071 >>/var/log/webapp.log 2>&1 &
+    elif [ "$SERVER_MODE" = "gunicorn" ]; then
+        python3 -m gunicorn -c gunicorn.conf.py app:app >>/var/log/webapp.log 2>&1 &
+    else
+        python3 -m flask run --host=0.0.0.0 --port=7071 >>/var/log/webapp.log 2>&1 &
+    fi
     WEB_PID=$!
     
     echo "Web app started with PID: $WEB_PID"
@@ -1,6 +1,7 @@
-from flask import Flask, jsonify, request, render_template, redirect, url_for
+from flask import Flask, jsonify, request, render_template, redirect, url_for, Response, stream_with_context, g, send_file
 import os
-import requests
+import math
+import time
 import json
 import logging
 from typing import Dict, List, Optional
@@ -8,6 +9,21 @@ import argparse
 
 # Import local modules
 from modules.ollama_manager import OllamaManager
+from modules.http_transport import timeouts_from_env
+from modules.response_cache import ResponseCache
+from modules.ingest import IngestJobs
+from modules.sessions import SessionManager
+from modules.persistence import Persistence, create_backend
+from modules.residency import parse_keep_alive, parse_keep_alive_map, parse_model_list
+from modules.admission import AdmissionController, AdmissionRejected, PRIORITIES, parse_limits
+from modules.node_pool import parse_hosts
+from modules.metrics import REGISTRY, CONTENT_TYPE, HTTP_REQUESTS, HTTP_DURATION
+from modules.profiler import RequestProfiler
+from modules.terminal_jobs import TerminalBusy
+from modules.library_search import LibrarySearch
+from modules.model_catalog import ModelCatalog
+from modules.shared_state import SharedStore
+from modules.semantic_cache import SemanticCache, InMemoryVectorIndex, WeaviateVectorIndex, parse_thresholds
 
 # Configure logging
 logging.basicConfig(
@@ -20,19 +36,274 @@ logger = logging.getLogger(__name__)
 # Global variables from environment
 OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'localhost')
 OLLAMA_PORT = int(os.getenv('OLLAMA_PORT', '11434'))
+OLLAMA_HOSTS = os.getenv('OLLAMA_HOSTS', '')  # Several servers, e.g. "gpu1:11434,gpu2:11434"; overrides OLLAMA_HOST
+OLLAMA_NODE_HEALTH_INTERVAL = float(os.getenv('OLLAMA_NODE_HEALTH_INTERVAL', '10'))  # Seconds between node probes
 APP_PORT = int(os.getenv('APP_PORT', '7071'))  # Match the port in start.sh
+OLLAMA_POOL_SIZE = int(os.getenv('OLLAMA_POOL_SIZE', '10'))
+OLLAMA_PULL_PARALLELISM = int(os.getenv('OLLAMA_PULL_PARALLELISM', '2'))
+PROGRESS_MAX_HZ = float(os.getenv('PROGRESS_MAX_HZ', '2'))  # Max progress events per second per client
+GPU_SAMPLE_INTERVAL = float(os.getenv('GPU_SAMPLE_INTERVAL', '5'))  # Seconds; 0 probes on demand instead
+GPU_HISTORY_SIZE = int(os.getenv('GPU_HISTORY_SIZE', '720'))  # Samples kept per GPU
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv('CHAT_CACHE_MAX_ENTRIES', '256'))  # 0 disables the response cache
+CHAT_CACHE_MAX_BYTES = int(os.getenv('CHAT_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+CHAT_CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL', '3600'))  # Seconds
+SEMANTIC_CACHE = os.getenv('SEMANTIC_CACHE', 'off').lower()  # off, memory or weaviate
+SEMANTIC_CACHE_EMBED_MODEL = os.getenv('SEMANTIC_CACHE_EMBED_MODEL', 'nomic-embed-text:latest')
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_THRESHOLDS = os.getenv('SEMANTIC_CACHE_THRESHOLDS', '')  # e.g. "llama3=0.97,mistral=0.93"
+WEAVIATE_URL = os.getenv('WEAVIATE_URL', 'http://127.0.0.1:8081')
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', '32'))  # 1 disables batching
+EMBED_BATCH_WAIT_MS = float(os.getenv('EMBED_BATCH_WAIT_MS', '5'))  # Window to collect a batch
+EMBED_MAX_IN_FLIGHT = int(os.getenv('EMBED_MAX_IN_FLIGHT', '2'))  # Concurrent embed calls per model
+INGEST_CHECKPOINT_DIR = os.getenv('INGEST_CHECKPOINT_DIR', '~/.aione/ingest')
+OLLAMA_CONTEXT_LENGTH = int(os.getenv('OLLAMA_CONTEXT_LENGTH', '2048'))  # Ollama's num_ctx for models that don't set one
+SESSION_MAX = int(os.getenv('SESSION_MAX', '1000'))  # Chat sessions kept in memory
+SESSION_IDLE_TTL = float(os.getenv('SESSION_IDLE_TTL', str(24 * 3600)))  # Seconds
+DATABASE_URL = os.getenv('DATABASE_URL', '')  # postgresql://... or sqlite:///path; unset keeps history in memory only
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '5'))
+PERSISTENCE_BATCH_SIZE = int(os.getenv('PERSISTENCE_BATCH_SIZE', '200'))  # Rows per commit
+PERSISTENCE_FLUSH_MS = float(os.getenv('PERSISTENCE_FLUSH_MS', '500'))  # Max delay before a row is committed
+PERSISTENCE_QUEUE_SIZE = int(os.getenv('PERSISTENCE_QUEUE_SIZE', '10000'))  # Rows beyond this are dropped
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '')  # e.g. "30m"; unset uses Ollama's default
+MODEL_KEEP_ALIVE = os.getenv('MODEL_KEEP_ALIVE', '')  # Per model, e.g. "llama3=1h,phi3=10m"
+PINNED_MODELS = os.getenv('PINNED_MODELS', '')  # Kept loaded and never evicted, e.g. "llama3"
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', '')  # Loaded at startup
+RESIDENCY_VRAM_FRACTION = float(os.getenv('RESIDENCY_VRAM_FRACTION', '0.9'))  # GPU memory share models may fill
+CHAT_MAX_IN_FLIGHT = int(os.getenv('CHAT_MAX_IN_FLIGHT', '4'))  # Concurrent chats per model sent to Ollama
+CHAT_MODEL_LIMITS = os.getenv('CHAT_MODEL_LIMITS', '')  # Per model, e.g. "llama3=8,mixtral=1"
+CHAT_MAX_QUEUE = int(os.getenv('CHAT_MAX_QUEUE', '32'))  # Chats waiting per model before 429
+CHAT_MAX_WAIT = float(os.getenv('CHAT_MAX_WAIT', '120'))  # Seconds a chat may wait before 503
+CLIENT_RATE_LIMIT = float(os.getenv('CLIENT_RATE_LIMIT', '0'))  # Chats per second per client; 0 = unlimited
+CLIENT_BURST = float(os.getenv('CLIENT_BURST', '10'))
+CLIENT_ID_HEADER = os.getenv('CLIENT_ID_HEADER', '')  # Header identifying clients (set by a trusted proxy); default: IP
+TERMINAL_MAX_JOBS = int(os.getenv('TERMINAL_MAX_JOBS', '4'))  # Terminal commands running at once; more get 429
+TERMINAL_OUTPUT_MB = float(os.getenv('TERMINAL_OUTPUT_MB', '1'))  # Output kept per command (ring buffer)
+TERMINAL_TIMEOUT = float(os.getenv('TERMINAL_TIMEOUT', '300'))  # Default seconds before a command is stopped
+OLLAMA_LIBRARY_URL = os.getenv('OLLAMA_LIBRARY_URL', 'https://ollama.com')  # Site searched for models to install
+LIBRARY_SEARCH_TTL = float(os.getenv('LIBRARY_SEARCH_TTL', '3600'))  # Seconds a query's results are cached
+LIBRARY_INDEX_PATH = os.getenv('LIBRARY_INDEX_PATH', '~/.aione/library_index.json')  # Models seen in searches, for offline search
+PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', 'off').lower()  # off, header (X-Profile opt-in) or all
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'cprofile')  # cprofile (deterministic, pstats) or sample (collapsed stacks)
+PROFILE_DIR = os.getenv('PROFILE_DIR', '~/.aione/profiles')
+PROFILE_MAX_MB = float(os.getenv('PROFILE_MAX_MB', '100'))  # Oldest captures are deleted beyond this
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+SHARED_STATE = os.getenv('SHARED_STATE', '')  # SQLite file shared by worker processes; unset keeps state in-process
+SHARED_STATE_POLL_MS = float(os.getenv('SHARED_STATE_POLL_MS', '100'))  # How often waits check for changes by other workers
 
 # For container setups, localhost may need to be 0.0.0.0 or 127.0.0.1
 # When running inside the same container as Ollama, use localhost
 # Don't include port in OLLAMA_HOST if it will be managed separately
 logger.info(f"Configured OLLAMA_HOST={OLLAMA_HOST} and OLLAMA_PORT={OLLAMA_PORT}")
 
+def create_persistence() -> Optional[Persistence]:
+    """Open the database configured by DATABASE_URL, None if unset or unreachable"""
+    if not DATABASE_URL:
+        return None
+    try:
+        backend = create_backend(DATABASE_URL, max_connections=DATABASE_POOL_SIZE)
+    except Exception as e:
+        logger.warning(f"Database unavailable ({str(e)}), keeping history in memory only")
+        return None
+    return Persistence(
+        backend,
+        batch_size=PERSISTENCE_BATCH_SIZE,
+        flush_interval=PERSISTENCE_FLUSH_MS / 1000,
+        queue_size=PERSISTENCE_QUEUE_SIZE
+    )
+
+def create_shared_state() -> Optional[SharedStore]:
+    """Open the store shared by the worker processes, None when running a single process"""
+    if not SHARED_STATE:
+        return None
+    logger.info(f"Sharing state between worker processes in {SHARED_STATE}")
+    return SharedStore(SHARED_STATE, poll_interval=SHARED_STATE_POLL_MS / 1000)
+
 # Initialize managers
-ollama_manager = OllamaManager(host=OLLAMA_HOST, port=OLLAMA_PORT)
+persistence = create_persistence()
+shared_state = create_shared_state()
+ollama_manager = OllamaManager(
+    host=OLLAMA_HOST,
+    port=OLLAMA_PORT,
+    pool_size=OLLAMA_POOL_SIZE,
+    timeouts=timeouts_from_env(),
+    pull_parallelism=OLLAMA_PULL_PARALLELISM,
+    default_context_length=OLLAMA_CONTEXT_LENGTH,
+    response_cache=ResponseCache(
+        max_entries=CHAT_CACHE_MAX_ENTRIES,
+        max_bytes=CHAT_CACHE_MAX_BYTES,
+        ttl=CHAT_CACHE_TTL
+    ),
+    embed_batch_size=EMBED_BATCH_SIZE,
+    embed_batch_wait=EMBED_BATCH_WAIT_MS / 1000,
+    embed_max_in_flight=EMBED_MAX_IN_FLIGHT,
+    persistence=persistence,
+    keep_alive=parse_keep_alive(OLLAMA_KEEP_ALIVE) if OLLAMA_KEEP_ALIVE else None,
+    model_keep_alive=parse_keep_alive_map(MODEL_KEEP_ALIVE),
+    pinned_models=parse_model_list(PINNED_MODELS),
+    vram_fraction=RESIDENCY_VRAM_FRACTION,
+    hosts=parse_hosts(OLLAMA_HOSTS, OLLAMA_PORT) or None,
+    node_health_interval=OLLAMA_NODE_HEALTH_INTERVAL,
+    terminal_max_running=TERMINAL_MAX_JOBS,
+    terminal_output_bytes=int(TERMINAL_OUTPUT_MB * 1024 * 1024),
+    terminal_timeout=TERMINAL_TIMEOUT,
+    shared_state=shared_state
+)
+
+def create_semantic_cache(manager: OllamaManager) -> Optional[SemanticCache]:
+    """Build the semantic cache configured by SEMANTIC_CACHE, falling back to
+    the in-process index if Weaviate cannot be reached"""
+    if SEMANTIC_CACHE not in ('memory', 'weaviate'):
+        return None
+    
+    index = None
+    if SEMANTIC_CACHE == 'weaviate':
+        try:
+            index = WeaviateVectorIndex(WEAVIATE_URL)
+        except Exception as e:
+            logger.warning(f"Weaviate unavailable at {WEAVIATE_URL} ({str(e)}), using in-process semantic cache")
+    
+    return SemanticCache(
+        index or InMemoryVectorIndex(),
+        manager.embed_batched,
+        embed_model=SEMANTIC_CACHE_EMBED_MODEL,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        thresholds=parse_thresholds(SEMANTIC_CACHE_THRESHOLDS)
+    )
+
+ollama_manager.semantic_cache = create_semantic_cache(ollama_manager)
+session_manager = SessionManager(
+    ollama_manager.chat_messages,
+    ollama_manager.get_context_length,
+    max_sessions=SESSION_MAX,
+    idle_ttl=SESSION_IDLE_TTL,
+    persistence=persistence,
+    store=shared_state
+)
+admission = AdmissionController(
+    max_in_flight=CHAT_MAX_IN_FLIGHT,
+    model_limits=parse_limits(CHAT_MODEL_LIMITS),
+    max_queue=CHAT_MAX_QUEUE,
+    max_wait=CHAT_MAX_WAIT,
+    client_rate=CLIENT_RATE_LIMIT,
+    client_burst=CLIENT_BURST
+)
+ingest_jobs = IngestJobs(ollama_manager.embed, weaviate_url=WEAVIATE_URL, checkpoint_dir=INGEST_CHECKPOINT_DIR)
+model_catalog = ModelCatalog(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models.json'))
+library_search = LibrarySearch(base_url=OLLAMA_LIBRARY_URL, ttl=LIBRARY_SEARCH_TTL, index_path=LIBRARY_INDEX_PATH)
+try:
+    # The curated model list makes offline search useful before the first remote search
+    with open(model_catalog.path) as f:
+        library_search.seed(name for names in json.load(f).values() for name in names)
+except (OSError, ValueError) as e:
+    logger.warning(f"Could not seed the library index from models.json: {str(e)}")
+if GPU_SAMPLE_INTERVAL > 0:
+    ollama_manager.start_gpu_sampler(GPU_SAMPLE_INTERVAL, GPU_HISTORY_SIZE)
+if len(ollama_manager.node_pool.nodes) > 1:
+    ollama_manager.node_pool.start()
+# Pinned models are loaded right away too, so the first request finds them warm
+preload_models = list(dict.fromkeys(parse_model_list(PRELOAD_MODELS) + parse_model_list(PINNED_MODELS)))
+if preload_models:
+    ollama_manager.residency.preload(preload_models)
+
+def register_gauges() -> None:
+    """Expose the state gauges of the managers on /metrics, read at scrape time"""
+    REGISTRY.gauge_function(
+        "aione_pull_bytes_per_second", "Current download rate of running model pulls",
+        lambda: sum(job["rate_bps"] for job in ollama_manager.get_pull_jobs() if job["state"] == "running")
+    )
+    REGISTRY.gauge_function(
+        "aione_admission_in_flight", "Chats sent to Ollama per model",
+        lambda: {(name,): model["in_flight"] for name, model in admission.get_stats()["models"].items()}, ("model",)
+    )
+    REGISTRY.gauge_function(
+        "aione_admission_queue_depth", "Chats waiting for a slot per model",
+        lambda: {(name,): model["queue_depth"] for name, model in admission.get_stats()["models"].items()}, ("model",)
+    )
+    REGISTRY.gauge_function(
+        "aione_ollama_node_healthy", "1 if the Ollama server is in rotation",
+        lambda: {(node.name,): int(node.healthy) for node in ollama_manager.node_pool.nodes}, ("node",)
+    )
+    REGISTRY.gauge_function(
+        "aione_ollama_node_outstanding", "Requests in flight per Ollama server",
+        lambda: {(node.name,): node.outstanding for node in ollama_manager.node_pool.nodes}, ("node",)
+    )
+    REGISTRY.gauge_function(
+        "aione_terminal_jobs_running", "Terminal commands running",
+        lambda: ollama_manager.terminal_jobs.get_stats()["running"]
+    )
+    if persistence is not None:
+        REGISTRY.gauge_function(
+            "aione_persistence_queue_depth", "Rows waiting in the history write-behind queue",
+            lambda: persistence.queue.qsize()
+        )
+
+register_gauges()
+
+def create_profiler() -> Optional[RequestProfiler]:
+    """Build the request profiler if PROFILE_REQUESTS enables it"""
+    if PROFILE_REQUESTS not in ('header', 'all'):
+        return None
+    try:
+        return RequestProfiler(
+            PROFILE_DIR,
+            default_mode=PROFILE_MODE,
+            max_bytes=int(PROFILE_MAX_MB * 1024 * 1024),
+            max_files=PROFILE_MAX_FILES,
+            sample_interval=PROFILE_SAMPLE_INTERVAL_MS / 1000
+        )
+    except (OSError, ValueError) as e:
+        logger.warning(f"Request profiling disabled: {str(e)}")
+        return None
+
+profiler = create_profiler()
 
 # Create Flask app
 app = Flask(__name__)
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and record its latency under the route template
+    
+    Runs once the handler returned, so streamed responses are timed to their
+    first byte. Unmatched URLs share one label to keep the series bounded.
+    """
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUESTS.inc(request.method, route, str(response.status_code))
+        HTTP_DURATION.observe(time.perf_counter() - start, request.method, route)
+    return response
+
+# The profiling hooks are only registered when enabled, so they cost nothing otherwise
+if profiler is not None:
+    @app.before_request
+    def start_profile():
+        """Profile the request if it sends X-Profile (1, cprofile or sample) or PROFILE_REQUESTS=all"""
+        mode = request.headers.get('X-Profile')
+        if (mode or PROFILE_REQUESTS == 'all') and not request.path.startswith('/api/debug/'):
+            g.profile = profiler.start(request.method, request.path, mode.lower() if mode else None)
+
+    @app.after_request
+    def finish_profile(response):
+        """Save the profile once the response is closed, so streamed bodies are included"""
+        capture = g.pop('profile', None)
+        if capture is not None:
+            response.headers['X-Profile-Id'] = capture.id
+            response.call_on_close(lambda: capture.finish(response.status_code))
+        return response
+
+    @app.teardown_request
+    def abort_profile(error=None):
+        """Save the profile of a request that failed before it had a response"""
+        capture = g.pop('profile', None)
+        if capture is not None:
+            capture.finish(500)
+
 # Routes
 @app.route('/')
 def index():
@@ -44,29 +315,59 @@ def health():
     """Health check endpoint"""
     return jsonify({"status": "ok"})
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics: request, Ollama call and generation histograms, counters and gauges"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route('/api/models', methods=['GET'])
 def get_models():
-    """Get the list of installed models"""
+    """Get the list of installed models
+    
+    Serves the cached snapshot with an ETag, answering 304 when the client's
+    copy is current. ?refresh=1 forces a fetch from Ollama.
+    """
     try:
-        models = ollama_manager.get_models(force_refresh=True)
-        return jsonify({"models": models})
+        snapshot = ollama_manager.get_models_snapshot(force_refresh=request.args.get('refresh') == '1')
+        if snapshot["etag"] is None:
+            # Ollama unreachable and nothing cached
+            return jsonify({"models": snapshot["models"]})
+        
+        if snapshot["etag"] in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(snapshot["body"], mimetype='application/json')
+        response.set_etag(snapshot["etag"])
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         logger.error(f"Error getting models: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/models/available', methods=['GET'])
 def get_available_models():
-    """Get the list of available models from models.json"""
+    """Get the model catalog from models.json joined with the installed models
+    
+    Everything the Models tab shows comes from this one response: categories,
+    per-model installed state, size and digest, family and tag indexes, and
+    the installed models. It carries an ETag covering both the catalog and the
+    installed snapshot, answering 304 when the client's copy is current.
+    ?refresh=1 fetches the installed models from Ollama first.
+    """
     try:
-        models_json_path = os.path.join(app.root_path, 'models.json')
+        installed = ollama_manager.get_models_snapshot(force_refresh=request.args.get('refresh') == '1')
+        view = model_catalog.get(installed)
         
-        if os.path.exists(models_json_path):
-            with open(models_json_path, 'r') as f:
-                models_data = json.load(f)
-            return jsonify(models_data)
+        if view["etag"] in request.if_none_match:
+            response = Response(status=304)
         else:
-            logger.error(f"models.json file not found at {models_json_path}")
-            return jsonify({"error": "Models list not found"}), 404
+            response = Response(view["body"], mimetype='application/json')
+        response.set_etag(view["etag"])
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except FileNotFoundError:
+        logger.error(f"models.json file not found at {model_catalog.path}")
+        return jsonify({"error": "Models list not found"}), 404
     except Exception as e:
         logger.error(f"Error loading available models: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -81,12 +382,38 @@ def install_model():
         return jsonify({"error": "Model name is required"}), 400
     
     try:
-        result = ollama_manager.pull_model(model_name)
-        return jsonify({"message": result})
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Priority must be an integer"}), 400
+    
+    try:
+        job, created = ollama_manager.queue_pull(model_name, priority)
+        if created:
+            message = f"Queued installation of {model_name}. This may take several minutes."
+        else:
+            message = f"{model_name} is already being installed."
+        return jsonify({"message": message, "job": job, "created": created})
     except Exception as e:
         logger.error(f"Error installing model: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/models/jobs', methods=['GET'])
+def get_pull_jobs():
+    """List queued, running and recently finished model downloads"""
+    try:
+        return jsonify({"jobs": ollama_manager.get_pull_jobs()})
+    except Exception as e:
+        logger.error(f"Error getting download jobs: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/models/jobs/<job_id>', methods=['GET'])
+def get_pull_job(job_id):
+    """Get a single model download job"""
+    job = ollama_manager.get_pull_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
 @app.route('/api/models/delete', methods=['POST'])
 def delete_model():
     """Delete a model"""
@@ -103,9 +430,59 @@ def delete_model():
         logger.error(f"Error deleting model: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/models/resident', methods=['GET'])
+def resident_models():
+    """List the models loaded in memory with their footprint, keep_alive and last use"""
+    try:
+        return jsonify(ollama_manager.get_residency())
+    except Exception as e:
+        logger.error(f"Error getting resident models: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/models/resident/<action>', methods=['POST'])
+def change_residency(action):
+    """Load, unload, pin or unpin a model
+    
+    load accepts an optional keep_alive ("10m", seconds, -1 for forever).
+    """
+    data = request.json or {}
+    model = data.get('model')
+    if not model:
+        return jsonify({"error": "Model name is required"}), 400
+    
+    residency = ollama_manager.residency
+    try:
+        if action == 'load':
+            keep_alive = data.get('keep_alive')
+            residency.load(model, parse_keep_alive(str(keep_alive)) if keep_alive is not None else None)
+        elif action == 'unload':
+            residency.unload(model)
+        elif action == 'pin':
+            residency.pin(model)
+        elif action == 'unpin':
+            residency.pin(model, pinned=False)
+        else:
+            return jsonify({"error": f"Unknown action: {action}"}), 404
+        return jsonify(ollama_manager.get_residency())
+    except Exception as e:
+        logger.error(f"Error changing residency of {model}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/models/progress', methods=['GET'])
 def get_progress():
-    """Get the installation progress"""
+    """Get the installation progress
+    
+    With ?since=<version>, long-polls: waits up to ?wait= seconds (max 60) for
+    the progress to change past that version before answering.
+    """
+    since = request.args.get('since', type=int)
+    if since is not None:
+        wait = min(request.args.get('wait', 30, type=float), 60)
+        version, state = ollama_manager.wait_for_progress(since, wait)
+        response = jsonify(dict(state["progress"], version=version))
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        return response
+    
     try:
         # Add a caching header for empty responses
         progress = ollama_manager.get_installation_progress()
@@ -124,6 +501,27 @@ def get_progress():
         logger.error(f"Error getting progress: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/models/progress/stream', methods=['GET'])
+def stream_progress():
+    """Push installation progress as Server-Sent Events whenever it changes"""
+    # EventSource sends Last-Event-ID when it reconnects
+    since = request.headers.get('Last-Event-ID', type=int) or request.args.get('since', 0, type=int)
+    min_interval = 1.0 / PROGRESS_MAX_HZ if PROGRESS_MAX_HZ > 0 else 0
+    
+    def generate():
+        for change in ollama_manager.subscribe_progress(since, min_interval):
+            if change is None:
+                # Heartbeat; also detects clients that went away
+                yield ": keepalive\n\n"
+                continue
+            version, state = change
+            yield f"id: {version}\nevent: progress\ndata: {json.dumps(state)}\n\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/terminal/execute', methods=['POST'])
 def execute_command():
     """Execute a terminal command"""
@@ -140,6 +538,155 @@ def execute_command():
         logger.error(f"Error executing command: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/terminal/jobs', methods=['GET', 'POST'])
+def terminal_jobs():
+    """Start a terminal command in the background ({"command": ..., "timeout": 300}), or list jobs"""
+    if request.method == 'GET':
+        return jsonify({"jobs": ollama_manager.terminal_jobs.list(), "stats": ollama_manager.terminal_jobs.get_stats()})
+    
+    data = request.get_json(silent=True) or {}
+    command = data.get('command')
+    if not command or not str(command).strip():
+        return jsonify({"error": "Command is required"}), 400
+    try:
+        timeout = float(data['timeout']) if data.get('timeout') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "Timeout must be a number of seconds"}), 400
+    if timeout is not None and not (math.isfinite(timeout) and timeout > 0):
+        return jsonify({"error": "Timeout must be a positive number of seconds"}), 400
+    
+    try:
+        job = ollama_manager.start_terminal_job(str(command), timeout)
+        return jsonify(job), 202
+    except TerminalBusy as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    except Exception as e:
+        logger.error(f"Error starting command: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/terminal/jobs/<job_id>', methods=['GET'])
+def terminal_job(job_id):
+    """Get a terminal job's state"""
+    job = ollama_manager.terminal_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/terminal/jobs/<job_id>/output', methods=['GET'])
+def terminal_job_output(job_id):
+    """Read a job's output from ?since=<next> on; ?wait=30 long-polls for new output"""
+    job = ollama_manager.terminal_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    since = request.args.get('since', 0, type=int)
+    wait = min(request.args.get('wait', 0, type=float), 60)
+    if wait > 0:
+        job.output.wait(since, wait)
+    output = job.output.read(since)
+    output["state"] = job.state
+    return jsonify(output)
+
+@app.route('/api/terminal/jobs/<job_id>/stream', methods=['GET'])
+def terminal_job_stream(job_id):
+    """Push a job's output as Server-Sent Events, then a done event with the final state"""
+    job = ollama_manager.terminal_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    # EventSource sends Last-Event-ID (the output offset) when it reconnects
+    since = request.headers.get('Last-Event-ID', type=int) or request.args.get('since', 0, type=int)
+    
+    def generate():
+        position = since
+        while True:
+            if not job.output.wait(position, 15):
+                # Heartbeat; also detects clients that went away
+                yield ": keepalive\n\n"
+                continue
+            output = job.output.read(position)
+            if output["text"] or output["dropped"]:
+                position = output["next"]
+                data = json.dumps({"text": output["text"], "dropped": output["dropped"]})
+                yield f"id: {position}\nevent: output\ndata: {data}\n\n"
+            if output["done"]:
+                ollama_manager.terminal_jobs.wait(job)
+                yield f"event: done\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/terminal/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_terminal_job(job_id):
+    """Stop a running terminal job and the processes it started"""
+    job = ollama_manager.terminal_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+def _client_id() -> str:
+    """Identify the client for rate limiting"""
+    if CLIENT_ID_HEADER and request.headers.get(CLIENT_ID_HEADER):
+        return request.headers[CLIENT_ID_HEADER]
+    return request.remote_addr or 'unknown'
+
+def _priority(data: Dict) -> Optional[str]:
+    """Get a chat's priority, interactive (default) or batch; None if it is neither"""
+    priority = data.get('priority') or request.headers.get('X-Priority', 'interactive')
+    return priority if isinstance(priority, str) and priority in PRIORITIES else None
+
+def _admit(model: str, priority: str):
+    """Wait for a chat slot for the model, see _priority"""
+    return admission.acquire(model, _client_id(), priority)
+
+def _rejected(e: AdmissionRejected):
+    """Answer a request that was not admitted"""
+    response = jsonify({"error": str(e), "reason": e.reason, "retry_after": e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def _page_args():
+    """Parse the limit and before (keyset cursor) query parameters"""
+    limit = request.args.get('limit', 50, type=int)
+    before = request.args.get('before', type=int)
+    return limit, before
+
+@app.route('/api/history/commands', methods=['GET'])
+def command_history():
+    """Page through executed terminal commands, newest first
+    
+    Pass the returned next_before as ?before= to get the next page. Without a
+    database only the recent in-memory history is available.
+    """
+    limit, before = _page_args()
+    if persistence is None:
+        items = [
+            {"command": command, "status": status, "executed_at": timestamp}
+            for command, status, timestamp in ollama_manager.get_command_history()
+        ]
+        return jsonify({"items": items[:limit] if before is None else [], "next_before": None})
+    try:
+        return jsonify(persistence.list_commands(limit, before))
+    except Exception as e:
+        logger.error(f"Error reading command history: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/history/chats', methods=['GET'])
+def chat_history():
+    """Page through stored chat messages, newest first, optionally of one session"""
+    if persistence is None:
+        return jsonify({"error": "Chat history is not stored; set DATABASE_URL"}), 503
+    limit, before = _page_args()
+    try:
+        return jsonify(persistence.list_chats(request.args.get('session_id'), limit, before))
+    except Exception as e:
+        logger.error(f"Error reading chat history: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Send a chat message to a model"""
@@ -147,16 +694,220 @@ def chat():
     model = data.get('model')
     message = data.get('message')
     
+    options = data.get('options')
+    
     if not model or not message:
         return jsonify({"error": "Model and message are required"}), 400
+    if options is not None and not isinstance(options, dict):
+        return jsonify({"error": "Options must be an object"}), 400
+    priority = _priority(data)
+    if priority is None:
+        return jsonify({"error": "Priority must be interactive or batch"}), 400
     
     try:
-        response = ollama_manager.chat(model, message)
+        with _admit(model, priority):
+            response = ollama_manager.chat(model, message, options=options, cache=data.get('cache', False))
         return jsonify({"response": response})
+    except AdmissionRejected as e:
+        return _rejected(e)
     except Exception as e:
         logger.error(f"Error chatting with model: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/sessions', methods=['GET', 'POST'])
+def sessions():
+    """List chat sessions, or create one"""
+    if request.method == 'GET':
+        return jsonify({"sessions": session_manager.list()})
+    
+    data = request.json or {}
+    model = data.get('model')
+    if not model:
+        return jsonify({"error": "Model is required"}), 400
+    options = data.get('options')
+    if options is not None and not isinstance(options, dict):
+        return jsonify({"error": "Options must be an object"}), 400
+    for num_ctx in (data.get('num_ctx'), (options or {}).get('num_ctx')):
+        if num_ctx is not None and (not isinstance(num_ctx, int) or isinstance(num_ctx, bool) or num_ctx <= 0):
+            return jsonify({"error": "num_ctx must be a positive integer"}), 400
+    
+    session = session_manager.create(
+        model,
+        system=data.get('system'),
+        num_ctx=data.get('num_ctx'),
+        summarize=bool(data.get('summarize', False)),
+        options=options
+    )
+    return jsonify(session), 201
+
+@app.route('/api/sessions/<session_id>', methods=['GET', 'DELETE'])
+def session_detail(session_id):
+    """Get a session with its turns, or delete it"""
+    if request.method == 'DELETE':
+        if not session_manager.delete(session_id):
+            return jsonify({"error": "Session not found"}), 404
+        return jsonify({"message": "Session deleted"})
+    
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify(session)
+
+@app.route('/api/sessions/<session_id>/messages', methods=['POST'])
+def session_message(session_id):
+    """Append a user turn and answer it with the session's context
+    
+    With "stream": true the reply is streamed as NDJSON events like /api/chat/stream.
+    """
+    data = request.json or {}
+    message = data.get('message')
+    if not message:
+        return jsonify({"error": "Message is required"}), 400
+    
+    priority = _priority(data)
+    if priority is None:
+        return jsonify({"error": "Priority must be interactive or batch"}), 400
+    
+    model = session_manager.get_model(session_id)
+    if model is None:
+        return jsonify({"error": "Session not found"}), 404
+    try:
+        ticket = _admit(model, priority)
+    except AdmissionRejected as e:
+        return _rejected(e)
+    
+    if data.get('stream'):
+        events = session_manager.stream(session_id, message, ollama_manager.chat_stream)
+        if events is None:
+            ticket.release()
+            return jsonify({"error": "Session not found"}), 404
+        
+        def generate():
+            try:
+                for event in events:
+                    yield json.dumps(event) + "\n"
+            finally:
+                events.close()
+        
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        # The slot is held until the stream ends or the client disconnects
+        response.call_on_close(ticket.release)
+        return response
+    
+    try:
+        with ticket:
+            result = session_manager.send(session_id, message)
+    except Exception as e:
+        logger.error(f"Error in session {session_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 502
+    if result is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify(result)
+
+@app.route('/api/embed', methods=['POST'])
+def embed():
+    """Embed one or more texts; concurrent requests are batched upstream"""
+    data = request.json or {}
+    model = data.get('model')
+    inputs = data.get('input')
+    
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    if not model or not inputs or not all(isinstance(text, str) for text in inputs):
+        return jsonify({"error": "Model and input (a string or list of strings) are required"}), 400
+    
+    try:
+        embeddings = ollama_manager.embed_batched(model, inputs)
+        return jsonify({"model": model, "embeddings": embeddings})
+    except Exception as e:
+        logger.error(f"Error embedding with model {model}: {str(e)}")
+        return jsonify({"error": str(e)}), 502
+
+@app.route('/api/ingest', methods=['POST'])
+def start_ingest():
+    """Start ingesting server-side files or directories into a Weaviate collection"""
+    data = request.json or {}
+    paths = data.get('paths')
+    if isinstance(paths, str):
+        paths = [paths]
+    if not paths:
+        return jsonify({"error": "Paths are required"}), 400
+    
+    options = {
+        key: data[key]
+        for key in ('embed_model', 'chunk_size', 'chunk_overlap', 'embed_batch_size', 'write_batch_size', 'text_field')
+        if key in data
+    }
+    try:
+        job = ingest_jobs.start(
+            paths,
+            collection=data.get('collection', 'Document'),
+            dry_run=bool(data.get('dry_run', False)),
+            **options
+        )
+        return jsonify({"job": job}), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error starting ingestion: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/ingest/jobs', methods=['GET'])
+def list_ingest_jobs():
+    """List ingestion jobs with per-stage throughput and queue depth"""
+    return jsonify({"jobs": ingest_jobs.list()})
+
+@app.route('/api/ingest/jobs/<job_id>', methods=['GET'])
+def get_ingest_job(job_id):
+    """Get a single ingestion job"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/ingest/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_ingest_job(job_id):
+    """Stop an ingestion job; documents imported so far stay checkpointed"""
+    if not ingest_jobs.cancel(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(ingest_jobs.get(job_id))
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream a chat response as newline-delimited JSON events"""
+    data = request.json
+    model = data.get('model')
+    message = data.get('message')
+    
+    if not model or not message:
+        return jsonify({"error": "Model and message are required"}), 400
+    priority = _priority(data)
+    if priority is None:
+        return jsonify({"error": "Priority must be interactive or batch"}), 400
+    try:
+        ticket = _admit(model, priority)
+    except AdmissionRejected as e:
+        return _rejected(e)
+    
+    def generate():
+        # When the client disconnects, the server closes this generator, which
+        # in turn closes the manager's stream and cancels the upstream generation
+        events = ollama_manager.chat_stream(model, message)
+        try:
+            for event in events:
+                yield json.dumps(event) + "\n"
+        finally:
+            events.close()
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering
+    # The slot is held until the stream ends or the client disconnects
+    response.call_on_close(ticket.release)
+    return response
+
 @app.route('/api/system/gpu', methods=['GET'])
 def get_gpu_info():
     """Get GPU information"""
@@ -167,24 +918,143 @@ def get_gpu_info():
         logger.error(f"Error getting GPU info: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/system/gpu/history', methods=['GET'])
+def get_gpu_history():
+    """Get sampled GPU utilization and memory history for charts"""
+    try:
+        history = ollama_manager.get_gpu_history(
+            device=request.args.get('device'),
+            limit=request.args.get('limit', type=int)
+        )
+        return jsonify(history)
+    except Exception as e:
+        logger.error(f"Error getting GPU history: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/system/host', methods=['GET'])
+def get_host_metrics():
+    """Get host CPU, memory, load and cgroup limit metrics"""
+    try:
+        return jsonify(ollama_manager.get_host_metrics())
+    except Exception as e:
+        logger.error(f"Error getting host metrics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/system/cache', methods=['GET', 'DELETE'])
+def chat_cache():
+    """Get chat response cache statistics, or clear the cache with DELETE"""
+    if request.method == 'DELETE':
+        ollama_manager.response_cache.clear()
+    return jsonify(ollama_manager.get_response_cache_stats())
+
+@app.route('/api/system/embed-batcher', methods=['GET'])
+def embed_batcher_stats():
+    """Get embedding batch sizes and fill ratio"""
+    return jsonify(ollama_manager.get_embed_batcher_stats())
+
+@app.route('/api/system/semantic-cache', methods=['GET'])
+def semantic_cache_stats():
+    """Get semantic cache hit rates and the similarity score distribution"""
+    return jsonify(ollama_manager.get_semantic_cache_stats())
+
+@app.route('/api/system/nodes', methods=['GET'])
+def node_stats():
+    """Get health, outstanding requests, latency and models of each Ollama server"""
+    return jsonify(ollama_manager.get_node_stats())
+
+@app.route('/api/system/admission', methods=['GET'])
+def admission_stats():
+    """Get per-model in-flight and queue depth gauges and chat wait times"""
+    return jsonify(admission.get_stats())
+
+@app.route('/api/system/persistence', methods=['GET'])
+def persistence_stats():
+    """Get write-behind queue depth and batch counters of the history database"""
+    if persistence is None:
+        return jsonify({"enabled": False})
+    stats = persistence.get_stats()
+    stats["enabled"] = True
+    return jsonify(stats)
+
+@app.route('/api/system/shared-state', methods=['GET'])
+def shared_state_stats():
+    """Get the size of the state shared by the worker processes and which worker answered"""
+    if shared_state is None:
+        return jsonify({"enabled": False, "pid": os.getpid()})
+    stats = shared_state.get_stats()
+    stats.update({"enabled": True, "pid": os.getpid()})
+    return jsonify(stats)
+
+@app.route('/api/debug/profiles', methods=['GET'])
+def list_profiles():
+    """List recent request profiles, newest first"""
+    if profiler is None:
+        return jsonify({"error": "Request profiling is disabled (set PROFILE_REQUESTS=header or all)"}), 404
+    return jsonify({"profiles": profiler.list(), "stats": profiler.get_stats()})
+
+@app.route('/api/debug/profiles/<capture_id>', methods=['GET'])
+def download_profile(capture_id):
+    """Download a profile (pstats or collapsed stacks); ?format=text renders a summary"""
+    if profiler is None:
+        return jsonify({"error": "Request profiling is disabled (set PROFILE_REQUESTS=header or all)"}), 404
+    capture = profiler.get(capture_id)
+    if capture is None:
+        return jsonify({"error": "Profile not found"}), 404
+    try:
+        if request.args.get('format') == 'text':
+            return Response(profiler.render_text(capture, request.args.get('limit', 40, type=int)), mimetype='text/plain')
+        return send_file(profiler.path(capture), as_attachment=True, download_name=capture["file"])
+    except OSError as e:
+        logger.error(f"Error reading profile {capture_id}: {str(e)}")
+        return jsonify({"error": "Profile not found"}), 404
+
+@app.route('/api/system/transport', methods=['GET'])
+def get_transport_stats():
+    """Get connection pool and reuse statistics for Ollama calls"""
+    try:
+        return jsonify(ollama_manager.get_transport_stats())
+    except Exception as e:
+        logger.error(f"Error getting transport stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/system/singleflight', methods=['GET'])
+def get_single_flight_stats():
+    """Get how many concurrent backend calls were collapsed into one"""
+    try:
+        return jsonify(ollama_manager.get_single_flight_stats())
+    except Exception as e:
+        logger.error(f"Error getting single-flight stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/models/search")
 def search_models():
+    """Search the Ollama library; results are cached per query and indexed for offline search"""
     try:
         query = request.args.get("q", "")
-        if not query:
+        if not query.strip():
             return jsonify({"error": "Search query is required"}), 400
+        return jsonify(library_search.search(query, limit=request.args.get('limit', 20, type=int)))
+    except Exception as e:
+        logger.error(f"Error searching models: {str(e)}")
+        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
-        # Use requests to fetch from Ollama's website
-        response = requests.get(f"https://ollama.com/search?q={query}")
-        response.raise_for_status()  # Raise an exception for bad status codes
+@app.route('/api/system/catalog', methods=['GET'])
+def get_catalog_stats():
+    """Get model catalog reloads and how often the joined view was reused"""
+    try:
+        return jsonify(model_catalog.get_stats())
+    except Exception as e:
+        logger.error(f"Error getting catalog stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({
-            "html": response.text
-        })
-    except requests.RequestException as e:
-        return jsonify({"error": f"Error fetching search results: {str(e)}"}), 500
+@app.route('/api/system/library-search', methods=['GET'])
+def get_library_search_stats():
+    """Get library search cache hits, remote fetches and index size"""
+    try:
+        return jsonify(library_search.get_stats())
     except Exception as e:
-        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+        logger.error(f"Error getting library search stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
 # Entry point
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+"""ASGI entry point for the Ollama Web Interface
+
+Serves the chat and model routes natively on asyncio, so thousands of in-flight
+chat and streaming requests cost coroutines instead of worker threads. Every
+other route (UI page, static files, catalog, search, ...) falls through to the
+Flask app, so both serving paths expose the same API.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 7071
+"""
+import os
+import json
+import time
+import logging
+import contextlib
+from typing import Optional
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, JSONResponse, StreamingResponse
+from starlette.routing import Route, Mount
+from starlette.background import BackgroundTask
+from starlette.middleware import Middleware
+
+from app import app as flask_app, ollama_manager, admission, CLIENT_ID_HEADER
+from modules.admission import AdmissionRejected, PRIORITIES
+from modules.async_ollama_manager import AsyncOllamaManager
+from modules.http_transport import timeouts_from_env
+from modules.metrics import HTTP_REQUESTS, HTTP_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Upstream connections are cheap on the async path, so allow one per in-flight chat
+ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', '1000'))
+
+async_manager = AsyncOllamaManager(
+    ollama_manager,
+    pool_size=ASYNC_POOL_SIZE,
+    timeouts=timeouts_from_env()
+)
+
+
+async def _json_body(request: Request) -> dict:
+    """Parse a JSON request body, treating an empty or invalid body as {}"""
+    try:
+        data = await request.json()
+    except (json.JSONDecodeError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _priority(request: Request, data: dict) -> Optional[str]:
+    """Get a chat's priority, see app._priority"""
+    priority = data.get('priority') or request.headers.get('x-priority', 'interactive')
+    return priority if isinstance(priority, str) and priority in PRIORITIES else None
+
+
+async def _admit(request: Request, model: str, priority: str):
+    """Wait for a chat slot without blocking the event loop, see app._admit"""
+    client = request.headers.get(CLIENT_ID_HEADER) if CLIENT_ID_HEADER else None
+    if not client:
+        client = request.client.host if request.client else 'unknown'
+    return await admission.acquire_async(model, client, priority)
+
+
+def _rejected(e: AdmissionRejected) -> JSONResponse:
+    """Answer a request that was not admitted"""
+    return JSONResponse(
+        {"error": str(e), "reason": e.reason, "retry_after": e.retry_after},
+        status_code=e.status,
+        headers={'Retry-After': str(e.retry_after)}
+    )
+
+
+async def health(request: Request) -> JSONResponse:
+    """Health check endpoint"""
+    return JSONResponse({"status": "ok"})
+
+
+async def get_models(request: Request) -> Response:
+    """Get the list of installed models
+
+    Serves the cached snapshot with an ETag, answering 304 when the client's
+    copy is current. ?refresh=1 forces a fetch from Ollama.
+    """
+    try:
+        snapshot = await async_manager.get_models_snapshot(force_refresh=request.query_params.get('refresh') == '1')
+        if snapshot["etag"] is None:
+            # Ollama unreachable and nothing cached
+            return JSONResponse({"models": snapshot["models"]})
+
+        etag = f'"{snapshot["etag"]}"'
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if_none_match = [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status_code=304, headers=headers)
+        return Response(snapshot["body"], media_type='application/json', headers=headers)
+    except Exception as e:
+        logger.error(f"Error getting models: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def delete_model(request: Request) -> JSONResponse:
+    """Delete a model"""
+    data = await _json_body(request)
+    model_name = data.get('model')
+
+    if not model_name:
+        return JSONResponse({"error": "Model name is required"}, status_code=400)
+
+    try:
+        result = await async_manager.delete_model(model_name)
+        return JSONResponse({"message": result})
+    except Exception as e:
+        logger.error(f"Error deleting model: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def execute_command(request: Request) -> JSONResponse:
+    """Execute a terminal command"""
+    data = await _json_body(request)
+    command = data.get('command')
+
+    if not command:
+        return JSONResponse({"error": "Command is required"}, status_code=400)
+
+    try:
+        result = await async_manager.execute_command(command)
+        return JSONResponse({"output": result})
+    except Exception as e:
+        logger.error(f"Error executing command: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def chat(request: Request) -> JSONResponse:
+    """Send a chat message to a model"""
+    data = await _json_body(request)
+    model = data.get('model')
+    message = data.get('message')
+
+    options = data.get('options')
+
+    if not model or not message:
+        return JSONResponse({"error": "Model and message are required"}, status_code=400)
+    if options is not None and not isinstance(options, dict):
+        return JSONResponse({"error": "Options must be an object"}, status_code=400)
+    priority = _priority(request, data)
+    if priority is None:
+        return JSONResponse({"error": "Priority must be interactive or batch"}, status_code=400)
+
+    try:
+        with await _admit(request, model, priority):
+            response = await async_manager.chat(model, message, options=options, cache=data.get('cache', False))
+        return JSONResponse({"response": response})
+    except AdmissionRejected as e:
+        return _rejected(e)
+    except Exception as e:
+        logger.error(f"Error chatting with model: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def chat_stream(request: Request):
+    """Stream a chat response as newline-delimited JSON events"""
+    data = await _json_body(request)
+    model = data.get('model')
+    message = data.get('message')
+
+    if not model or not message:
+        return JSONResponse({"error": "Model and message are required"}, status_code=400)
+    priority = _priority(request, data)
+    if priority is None:
+        return JSONResponse({"error": "Priority must be interactive or batch"}, status_code=400)
+    try:
+        ticket = await _admit(request, model, priority)
+    except AdmissionRejected as e:
+        return _rejected(e)
+
+    async def generate():
+        # Starlette cancels this generator when the client disconnects, which
+        # closes the upstream stream and cancels the generation in Ollama
+        try:
+            async for event in async_manager.chat_stream(model, message):
+                yield json.dumps(event) + "\n"
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        generate(),
+        media_type='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        # Releases the slot also if the stream never started
+        background=BackgroundTask(ticket.release)
+    )
+
+
+async def get_gpu_info(request: Request) -> JSONResponse:
+    """Get GPU information"""
+    try:
+        gpu_info = await async_manager.get_gpu_info()
+        return JSONResponse(gpu_info)
+    except Exception as e:
+        logger.error(f"Error getting GPU info: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    """Close pooled upstream connections on shutdown"""
+    yield
+    await async_manager.close()
+
+
+routes = [
+    Route('/health', health),
+    Route('/api/models', get_models, methods=['GET']),
+    Route('/api/models/delete', delete_model, methods=['POST']),
+    Route('/api/terminal/execute', execute_command, methods=['POST']),
+    Route('/api/chat', chat, methods=['POST']),
+    Route('/api/chat/stream', chat_stream, methods=['POST']),
+    Route('/api/system/gpu', get_gpu_info, methods=['GET']),
+    # Everything else is served by the Flask app
+    Mount('/', app=WSGIMiddleware(flask_app))
+]
+
+
+class RequestMetricsMiddleware:
+    """Record request metrics for the routes served here, like app.record_request_metrics
+
+    Requests passed on to the Flask app are already recorded by its hooks.
+    """
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        method, route = scope["method"], scope["path"]
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                HTTP_REQUESTS.inc(method, route, str(message["status"]))
+                HTTP_DURATION.observe(time.perf_counter() - start, method, route)
+            await send(message)
+
+        await self.app(scope, receive, send_with_metrics)
+
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[Middleware(RequestMetricsMiddleware, paths=[route.path for route in routes if isinstance(route, Route)])]
+)
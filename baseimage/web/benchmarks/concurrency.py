@@ -0,0 +1,152 @@
+"""Concurrency benchmark: Flask serving path vs. ASGI serving path
+
+Starts a fake Ollama server, then for each serving mode fires N simultaneous
+chat requests at the web app and records success rate, latency and the peak
+number of OS threads in the server process.
+
+Run from the web app directory:
+    python -m benchmarks.concurrency --levels 10,100,500,1000 --endpoint /api/chat/stream
+"""
+import json
+import time
+import asyncio
+import argparse
+import threading
+from typing import Dict, List, Any
+
+import httpx
+
+from benchmarks import servers
+
+
+class ThreadSampler:
+    """Samples the thread count of a process in the background"""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self.stop_event.is_set():
+            self.peak = max(self.peak, servers.thread_count(self.pid))
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self) -> "ThreadSampler":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop_event.set()
+        self.thread.join()
+
+
+async def _one_request(client: httpx.AsyncClient, url: str, payload: Dict[str, Any], stream: bool) -> float:
+    """Send one chat request and return its latency in seconds"""
+    start = time.perf_counter()
+    if stream:
+        async with client.stream("POST", url, json=payload) as response:
+            response.raise_for_status()
+            async for _ in response.aiter_lines():
+                pass
+    else:
+        response = await client.post(url, json=payload)
+        response.raise_for_status()
+        if "error" in response.json():
+            raise RuntimeError(response.json()["error"])
+    return time.perf_counter() - start
+
+
+async def run_level(base_url: str, endpoint: str, concurrency: int, timeout: float) -> Dict[str, Any]:
+    """Fire `concurrency` simultaneous chat requests
+
+    Args:
+        base_url: Web app base URL
+        endpoint: Chat route to call
+        concurrency: Number of simultaneous requests
+        timeout: Per-request timeout in seconds
+
+    Returns:
+        Dict with success count, error count and latency percentiles
+    """
+    payload = {"model": "fake-model-0:latest", "message": "Hello"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *[_one_request(client, base_url + endpoint, payload, endpoint.endswith("/stream"))
+              for _ in range(concurrency)],
+            return_exceptions=True
+        )
+        wall_time = time.perf_counter() - start
+
+    latencies = sorted(r for r in results if isinstance(r, float))
+    errors = len(results) - len(latencies)
+
+    def percentile(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3)
+
+    return {
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_time_s": round(wall_time, 3),
+        "p50_s": percentile(0.50),
+        "p99_s": percentile(0.99)
+    }
+
+
+def benchmark_mode(mode: str, levels: List[int], endpoint: str, port: int, ollama_port: int, timeout: float) -> List[Dict[str, Any]]:
+    """Run all concurrency levels against one serving mode"""
+    process = servers.start_web_app(mode, port, ollama_port)
+    results = []
+    try:
+        for level in levels:
+            with ThreadSampler(process.pid) as sampler:
+                result = asyncio.run(run_level(f"http://127.0.0.1:{port}", endpoint, level, timeout))
+            result["mode"] = mode
+            result["peak_threads"] = sampler.peak
+            results.append(result)
+            print(
+                f"{mode:>6} c={level:<5} ok={result['ok']:<5} errors={result['errors']:<5} "
+                f"p50={result['p50_s']:.3f}s p99={result['p99_s']:.3f}s "
+                f"wall={result['wall_time_s']:.2f}s peak_threads={result['peak_threads']}"
+            )
+    finally:
+        servers.stop(process)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare Flask and ASGI serving paths under concurrent chats')
+    parser.add_argument('--levels', type=str, default='10,100,500,1000', help='Comma-separated concurrency levels')
+    parser.add_argument('--modes', type=str, default='flask,asgi', help='Comma-separated serving modes')
+    parser.add_argument('--endpoint', type=str, default='/api/chat', help='Chat route to call (/api/chat or /api/chat/stream)')
+    parser.add_argument('--port', type=int, default=7171, help='Port for the web app under test')
+    parser.add_argument('--ollama-port', type=int, default=11500, help='Port for the fake Ollama server')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='Fake Ollama seconds between tokens')
+    parser.add_argument('--tokens', type=int, default=50, help='Fake Ollama tokens per response')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Per-request timeout in seconds')
+    parser.add_argument('--output', type=str, help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(',')]
+    fake = servers.start_fake_ollama(args.ollama_port, tokens=args.tokens, token_delay=args.token_delay)
+    results = []
+    try:
+        for mode in args.modes.split(','):
+            results += benchmark_mode(mode, levels, args.endpoint, args.port, args.ollama_port, args.timeout)
+    finally:
+        servers.stop(fake)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Embedding benchmark: micro-batched /api/embed vs. one upstream call per request
+
+Starts a fake Ollama server that, like Ollama, processes one embed call at a
+time with a fixed per-call cost. Then, for each mode, keeps N clients each
+sending single-text /api/embed requests back to back for a fixed duration,
+and records throughput, latency and the batch fill ratio the app achieved.
+
+Run from the web app directory:
+    python -m benchmarks.embed_batching --concurrency 64 --duration 10
+"""
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks import servers
+
+
+async def _client(client: httpx.AsyncClient, url: str, model: str, worker: int, deadline: float, latencies: List[float], errors: List[int]) -> None:
+    """Send single-text embed requests back to back until the deadline"""
+    sequence = 0
+    while time.perf_counter() < deadline:
+        payload = {"model": model, "input": f"document {worker}-{sequence}"}
+        sequence += 1
+        start = time.perf_counter()
+        try:
+            response = await client.post(url, json=payload)
+            response.raise_for_status()
+            if len(response.json()["embeddings"]) != 1:
+                raise RuntimeError("Wrong number of embeddings")
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors.append(1)
+
+
+async def run_load(base_url: str, model: str, concurrency: int, duration: float, timeout: float) -> Dict[str, Any]:
+    """Run `concurrency` closed-loop clients for `duration` seconds
+
+    Returns:
+        Dict with request count, throughput and latency percentiles
+    """
+    latencies: List[float] = []
+    errors: List[int] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*[
+            _client(client, base_url + "/api/embed", model, worker, deadline, latencies, errors)
+            for worker in range(concurrency)
+        ])
+        wall_time = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / wall_time, 1),
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99)
+    }
+
+
+def benchmark_mode(name: str, batch_size: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the load against the app configured with one batch size"""
+    env = {"EMBED_BATCH_SIZE": str(batch_size), "EMBED_BATCH_WAIT_MS": str(args.wait_ms)}
+    process = servers.start_web_app(args.server, args.port, args.ollama_port, env)
+    try:
+        result = asyncio.run(run_load(
+            f"http://127.0.0.1:{args.port}", args.model, args.concurrency, args.duration, args.timeout
+        ))
+        batcher = httpx.get(f"http://127.0.0.1:{args.port}/api/system/embed-batcher").json()
+    finally:
+        servers.stop(process)
+
+    result.update({
+        "mode": name,
+        "max_batch_size": batch_size,
+        "upstream_calls": batcher["batches"],
+        "mean_batch_size": batcher["mean_batch_size"],
+        "fill_ratio": batcher["fill_ratio"]
+    })
+    print(
+        f"{name:>9} c={args.concurrency:<4} requests={result['requests']:<6} errors={result['errors']:<4} "
+        f"throughput={result['throughput_rps']:.1f}/s p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms "
+        f"upstream_calls={result['upstream_calls']} mean_batch={result['mean_batch_size']} fill={result['fill_ratio']}"
+    )
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare batched and unbatched embedding throughput')
+    parser.add_argument('--concurrency', type=int, default=64, help='Number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run each mode')
+    parser.add_argument('--batch-size', type=int, default=32, help='EMBED_BATCH_SIZE for the batched mode')
+    parser.add_argument('--wait-ms', type=float, default=5.0, help='EMBED_BATCH_WAIT_MS for the batched mode')
+    parser.add_argument('--server', type=str, default='flask', help='Serving mode (flask or asgi)')
+    parser.add_argument('--model', type=str, default='nomic-embed-text:latest', help='Embedding model name')
+    parser.add_argument('--port', type=int, default=7171, help='Port for the web app under test')
+    parser.add_argument('--ollama-port', type=int, default=11500, help='Port for the fake Ollama server')
+    parser.add_argument('--embed-delay', type=float, default=0.02, help='Fake Ollama fixed seconds per embed call')
+    parser.add_argument('--embed-item-delay', type=float, default=0.001, help='Fake Ollama seconds per embedded text')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request timeout in seconds')
+    parser.add_argument('--output', type=str, help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    fake = servers.start_fake_ollama(
+        args.ollama_port,
+        embed_delay=args.embed_delay,
+        embed_item_delay=args.embed_item_delay
+    )
+    try:
+        results = [
+            benchmark_mode("unbatched", 1, args),
+            benchmark_mode("batched", args.batch_size, args)
+        ]
+    finally:
+        servers.stop(fake)
+
+    speedup = results[1]["throughput_rps"] / results[0]["throughput_rps"] if results[0]["throughput_rps"] else None
+    if speedup:
+        print(f"Batched throughput: {speedup:.1f}x unbatched")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
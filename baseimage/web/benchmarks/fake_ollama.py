@@ -0,0 +1,308 @@
+"""Fake Ollama server for benchmarks
+
+Emulates the parts of the Ollama HTTP API the web app uses (tags, chat with
+and without streaming, embed, pull progress streams, show, ps), with tunable
+latency and token rate, so benchmarks measure the web app rather than a GPU.
+Built on asyncio so it can hold thousands of concurrent streams itself.
+
+It also serves a library search page (/search) with the markup of
+ollama.com/search, for OLLAMA_LIBRARY_URL.
+
+Run with:
+    python -m benchmarks.fake_ollama --port 11500 --token-delay 0.02 --tokens 50
+"""
+import html
+import json
+import asyncio
+import hashlib
+import argparse
+from typing import List, Optional
+from datetime import datetime, timezone
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+def render_search_page(models: List[dict]) -> str:
+    """Render library models like the result list of ollama.com/search
+
+    Args:
+        models: Dicts with name, description, sizes, capabilities and pulls
+    """
+    items = []
+    for model in models:
+        name = html.escape(model["name"])
+        capabilities = "".join(
+            f'<span x-test-capability class="inline-flex items-center rounded-md bg-indigo-50 px-2 py-[2px]">{html.escape(c)}</span>'
+            for c in model.get("capabilities", [])
+        )
+        sizes = "".join(
+            f'<span x-test-size class="inline-flex items-center rounded-md bg-[#ddf4ff] px-2 py-[2px]">{html.escape(size)}</span>'
+            for size in model.get("sizes", [])
+        )
+        items.append(f"""
+    <li x-test-model class="flex items-baseline border-b border-neutral-200 py-6">
+      <a href="/library/{name}" class="group w-full">
+        <div class="flex flex-col mb-1" title="{name}">
+          <h2 class="truncate text-xl font-medium underline-offset-2 group-hover:underline md:text-2xl">
+            <span x-test-search-response-title>{name}</span>
+          </h2>
+          <p class="max-w-lg break-words text-neutral-800 text-md">{html.escape(model.get("description", ""))}</p>
+        </div>
+        <div class="flex flex-col">
+          <div class="flex flex-wrap space-x-2">{capabilities}{sizes}</div>
+          <p class="my-1 flex space-x-5 text-[13px] font-medium text-neutral-500">
+            <span class="flex items-center"><svg class="mr-1.5 h-[14px] w-[14px]" viewBox="0 0 24 24"><path d="M3 16.5v2.25"/></svg>
+              <span x-test-pull-count>{html.escape(model.get("pulls", "0"))}</span>&nbsp;<span>Pulls</span></span>
+            <span class="flex items-center"><span x-test-tag-count>{len(model.get("sizes", [])) + 1}</span>&nbsp;<span>Tags</span></span>
+            <span class="flex items-center">Updated&nbsp;<span x-test-updated>2 weeks ago</span></span>
+          </p>
+        </div>
+      </a>
+    </li>""")
+    return (
+        '<!DOCTYPE html><html class="h-full overflow-y-scroll"><head><meta charset="utf-8"><title>Ollama Search</title></head>'
+        '<body class="antialiased"><main class="mx-auto flex max-w-2xl flex-col"><div id="searchresults">'
+        f'<ul role="list" class="grid grid-cols-1">{"".join(items)}</ul></div></main></body></html>'
+    )
+
+
+def create_app(
+    tokens: int = 50,
+    token_delay: float = 0.02,
+    first_token_delay: float = 0.1,
+    models: int = 5,
+    embed_delay: float = 0.02,
+    embed_item_delay: float = 0.001,
+    embed_dimensions: int = 768,
+    embed_parallel: int = 1,
+    load_delay: float = 0.0,
+    model_names: Optional[List[str]] = None,
+    pull_size: int = 256 * 1024 * 1024,
+    pull_rate: float = 512 * 1024 * 1024,
+    pull_interval: float = 0.05,
+    context_length: int = 8192
+) -> Starlette:
+    """Create the fake Ollama ASGI app
+
+    Args:
+        tokens: Number of tokens in each chat response
+        token_delay: Seconds between streamed tokens
+        first_token_delay: Seconds before the first token (prompt evaluation)
+        models: Number of models reported by /api/tags
+        embed_delay: Fixed seconds per /api/embed call (model invocation overhead)
+        embed_item_delay: Additional seconds per embedded text
+        embed_dimensions: Length of the returned vectors
+        embed_parallel: Embed calls processed at the same time; like Ollama,
+            further calls queue behind them
+        load_delay: Seconds a request for a model that is not loaded waits
+            for it to load; keep_alive 0 unloads a model like in Ollama
+        model_names: Names reported by /api/tags instead of fake-model-0..N
+        pull_size: Bytes of the single layer each /api/pull downloads
+        pull_rate: Download rate of a pull in bytes per second
+        pull_interval: Seconds between pull progress lines
+        context_length: Context length reported by /api/show
+
+    Returns:
+        Starlette application
+    """
+    model_names = model_names or [f"fake-model-{i}:latest" for i in range(models)]
+    model_list = [
+        {
+            "name": name,
+            "model": name,
+            "size": (i + 1) * 1024 * 1024 * 1024,
+            "digest": f"{i:064x}",
+            "modified_at": datetime.now(timezone.utc).isoformat(),
+            "details": {"family": "fake", "parameter_size": f"{i + 1}B"}
+        }
+        for i, name in enumerate(model_names)
+    ]
+
+    # Library entries for /search: one per model name, with its tags as sizes
+    library = {}
+    for i, name in enumerate(model_names):
+        base, _, tag = name.partition(":")
+        entry = library.setdefault(base, {
+            "name": base,
+            "description": f"{base} is a fake model for benchmarks.",
+            "sizes": [],
+            "capabilities": ["tools"] if i % 2 == 0 else [],
+            "pulls": f"{len(model_names) - i}.{i}M"
+        })
+        if tag and tag != "latest":
+            entry["sizes"].append(tag)
+
+    embed_slots = asyncio.Semaphore(embed_parallel)
+    sizes = {model["name"]: model["size"] for model in model_list}
+    loaded = {}
+
+    async def ensure_loaded(body: dict) -> None:
+        model = body.get("model", "")
+        if ":" not in model:
+            model += ":latest"
+        if body.get("keep_alive") == 0:
+            loaded.pop(model, None)
+            return
+        if model not in loaded:
+            await asyncio.sleep(load_delay)
+        loaded[model] = datetime.now(timezone.utc).isoformat()
+
+    def final_chunk(model: str) -> dict:
+        return {
+            "model": model,
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": 10,
+            "eval_count": tokens,
+            "eval_duration": int(tokens * token_delay * 1e9),
+            "prompt_eval_duration": int(token_delay * 1e9),
+            "load_duration": 0
+        }
+
+    async def version(request: Request) -> JSONResponse:
+        return JSONResponse({"version": "0.0.0-fake"})
+
+    async def tags(request: Request) -> JSONResponse:
+        return JSONResponse({"models": model_list})
+
+    async def delete(request: Request) -> JSONResponse:
+        return JSONResponse({})
+
+    async def ps(request: Request) -> JSONResponse:
+        return JSONResponse({"models": [
+            {"name": model, "model": model, "size": sizes.get(model, 0), "size_vram": sizes.get(model, 0), "expires_at": since}
+            for model, since in loaded.items()
+        ]})
+
+    async def generate(request: Request) -> JSONResponse:
+        body = await request.json()
+        await ensure_loaded(body)
+        return JSONResponse({"model": body.get("model", ""), "response": "", "done": True})
+
+    async def show(request: Request) -> JSONResponse:
+        return JSONResponse({
+            "parameters": "",
+            "details": {"family": "fake"},
+            "model_info": {"fake.context_length": context_length}
+        })
+
+    async def search(request: Request) -> HTMLResponse:
+        query = request.query_params.get("q", "").lower()
+        return HTMLResponse(render_search_page(
+            [model for model in library.values() if query in model["name"] or query in model["description"].lower()]
+        ))
+
+    async def pull(request: Request):
+        body = await request.json()
+        model = body.get("model") or body.get("name", "")
+        digest = "sha256:" + hashlib.sha256(model.encode()).hexdigest()
+
+        async def progress():
+            yield json.dumps({"status": "pulling manifest"}) + "\n"
+            completed = 0
+            while completed < pull_size:
+                await asyncio.sleep(pull_interval)
+                completed = min(pull_size, completed + int(pull_rate * pull_interval))
+                yield json.dumps({
+                    "status": f"pulling {digest[7:19]}",
+                    "digest": digest,
+                    "total": pull_size,
+                    "completed": completed
+                }) + "\n"
+            for status in ("verifying sha256 digest", "writing manifest", "success"):
+                yield json.dumps({"status": status}) + "\n"
+
+        return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+    async def embed(request: Request) -> JSONResponse:
+        body = await request.json()
+        await ensure_loaded(body)
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        async with embed_slots:
+            await asyncio.sleep(embed_delay + len(inputs) * embed_item_delay)
+        embeddings = []
+        for text in inputs:
+            seed = sum(text.encode()) or 1
+            embeddings.append([((seed * (i + 1)) % 97 + 1) / 98 for i in range(embed_dimensions)])
+        return JSONResponse({"model": body.get("model", ""), "embeddings": embeddings})
+
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        await ensure_loaded(body)
+
+        if not body.get("stream", True):
+            await asyncio.sleep(first_token_delay + tokens * token_delay)
+            chunk = final_chunk(model)
+            chunk["message"]["content"] = " ".join(f"tok{i}" for i in range(tokens))
+            return JSONResponse(chunk)
+
+        async def stream_tokens():
+            await asyncio.sleep(first_token_delay)
+            for i in range(tokens):
+                yield json.dumps({
+                    "model": model,
+                    "message": {"role": "assistant", "content": f"tok{i} "},
+                    "done": False
+                }) + "\n"
+                await asyncio.sleep(token_delay)
+            yield json.dumps(final_chunk(model)) + "\n"
+
+        return StreamingResponse(stream_tokens(), media_type="application/x-ndjson")
+
+    routes = [
+        Route("/api/version", version, methods=["GET"]),
+        Route("/api/tags", tags, methods=["GET"]),
+        Route("/api/delete", delete, methods=["DELETE"]),
+        Route("/api/chat", chat, methods=["POST"]),
+        Route("/api/embed", embed, methods=["POST"]),
+        Route("/api/ps", ps, methods=["GET"]),
+        Route("/api/generate", generate, methods=["POST"]),
+        Route("/api/show", show, methods=["POST"]),
+        Route("/api/pull", pull, methods=["POST"]),
+        Route("/search", search, methods=["GET"])
+    ]
+    return Starlette(routes=routes)
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Fake Ollama server for benchmarks')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host to listen on')
+    parser.add_argument('--port', type=int, default=11500, help='Port to listen on')
+    parser.add_argument('--tokens', type=int, default=50, help='Tokens per chat response')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='Seconds between tokens')
+    parser.add_argument('--first-token-delay', type=float, default=0.1, help='Seconds before the first token')
+    parser.add_argument('--embed-delay', type=float, default=0.02, help='Fixed seconds per embed call')
+    parser.add_argument('--embed-item-delay', type=float, default=0.001, help='Additional seconds per embedded text')
+    parser.add_argument('--load-delay', type=float, default=0.0, help='Seconds to load a model that is not loaded')
+    parser.add_argument('--models', type=str, default='', help='Comma-separated model names to report (default: fake-model-0..4)')
+    parser.add_argument('--pull-size', type=int, default=256 * 1024 * 1024, help='Bytes downloaded by each pull')
+    parser.add_argument('--pull-rate', type=float, default=512 * 1024 * 1024, help='Pull download rate in bytes per second')
+    parser.add_argument('--context-length', type=int, default=8192, help='Context length reported by /api/show')
+    args = parser.parse_args()
+
+    app = create_app(
+        tokens=args.tokens,
+        token_delay=args.token_delay,
+        first_token_delay=args.first_token_delay,
+        embed_delay=args.embed_delay,
+        embed_item_delay=args.embed_item_delay,
+        load_delay=args.load_delay,
+        model_names=[name.strip() for name in args.models.split(',') if name.strip()] or None,
+        pull_size=args.pull_size,
+        pull_rate=args.pull_rate,
+        context_length=args.context_length
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", backlog=4096)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Load generator for the web app's routes
+
+Drives a mix of scenarios (chat, streamed chat, embed, model list, pull, ...)
+against the web app, either with a fixed number of closed-loop clients
+(--concurrency) or at a fixed arrival rate (--rate), and reports p50/p95/p99
+latency and throughput per scenario. Unless --url points at a running app, a
+fake Ollama server and the app are started locally.
+
+With --rate, latency is measured from the time a request was scheduled to
+start, so a stalled server cannot hide its delay by slowing the load down
+(coordinated omission).
+
+Run from the web app directory:
+    python -m benchmarks.loadgen --mix chat=6,chat-stream=2,models=2 --concurrency 32 --duration 30 --output run.json
+    python -m benchmarks.loadgen --mix embed --rate 200 --duration 30 --compare run.json
+"""
+import sys
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks import servers, report
+
+CHAT_MODEL = "fake-model-0:latest"
+EMBED_MODEL = "fake-model-1:latest"
+SEARCH_QUERIES = ["fake", "model", "fake-model-1", "fake-model-2"]
+
+
+async def _health(client: httpx.AsyncClient, sequence: int) -> Optional[float]:
+    (await client.get("/health")).raise_for_status()
+    return None
+
+
+async def _models(client: httpx.AsyncClient, sequence: int) -> Optional[float]:
+    (await client.get("/api/models")).raise_for_status()
+    return None
+
+
+async def _chat(client: httpx.AsyncClient, sequence: int) -> Optional[float]:
+    response = await client.post("/api/chat", json={"model": CHAT_MODEL, "message": f"Hello {sequence}"})
+    response.raise_for_status()
+    if "error" in response.json():
+        raise RuntimeError(response.json()["error"])
+    return None
+
+
+async def _chat_stream(client: httpx.AsyncClient, sequence: int) -> Optional[float]:
+    """Stream a chat; returns the time to the first token event"""
+    start = time.perf_counter()
+    first_token = None
+    async with client.stream("POST", "/api/chat/stream", json={"model": CHAT_MODEL, "message": f"Hello {sequence}"}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_token is None and '"token"' in line:
+                first_token = time.perf_counter() - start
+            if '"error"' in line:
+                raise RuntimeError(line)
+    return first_token
+
+
+async def _embed(client: httpx.AsyncClient, sequence: int) -> Optional[float]:
+    response = await client.post("/api/embed", json={"model": EMBED_MODEL, "input": f"document {sequence}"})
+    response.raise_for_status()
+    return None
+
+
+async def _pull(client: httpx.AsyncClient, sequence: int) -> Optional[float]:
+    """Install a new model and wait for its download to finish"""
+    response = await client.post("/api/models/install", json={"model": f"bench-{time.time_ns()}-{sequence}:latest"})
+    response.raise_for_status()
+    job_id = response.json()["job"]["id"]
+    while True:
+        await asyncio.sleep(0.05)
+        job = (await client.get(f"/api/models/jobs/{job_id}")).json()
+        if job["state"] == "completed":
+            return None
+        if job["state"] == "failed":
+            raise RuntimeError(job.get("error"))
+
+
+async def _search(client: httpx.AsyncClient, sequence: int) -> Optional[float]:
+    """Search the model library; a few distinct queries, so most are cache hits"""
+    response = await client.get("/api/models/search", params={"q": SEARCH_QUERIES[sequence % len(SEARCH_QUERIES)]})
+    response.raise_for_status()
+    return None
+
+
+# Scenario name -> coroutine sending one request (returns time to first token for streams)
+SCENARIOS: Dict[str, Callable[[httpx.AsyncClient, int], Awaitable[Optional[float]]]] = {
+    "health": _health,
+    "models": _models,
+    "chat": _chat,
+    "chat-stream": _chat_stream,
+    "embed": _embed,
+    "pull": _pull,
+    "search": _search
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse a scenario mix such as "chat=6,models=2,embed" (weight 1 if omitted)"""
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition("=")
+        if not name:
+            continue
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        mix[name] = float(weight) if weight else 1.0
+    if not mix:
+        raise ValueError("The scenario mix is empty")
+    return mix
+
+
+class Recorder:
+    """Collects samples per scenario, ignoring those that finish during the warmup"""
+
+    def __init__(self, mix: Dict[str, float], measure_from: float):
+        self.measure_from = measure_from
+        self.latencies: Dict[str, List[float]] = {name: [] for name in mix}
+        self.ttfbs: Dict[str, List[float]] = {name: [] for name in mix}
+        self.errors: Dict[str, int] = {name: 0 for name in mix}
+        self.error_samples: List[str] = []
+
+    async def run(self, client: httpx.AsyncClient, name: str, sequence: int, scheduled: Optional[float] = None) -> None:
+        """Send one request and record it
+
+        Args:
+            client: HTTP client for the app
+            name: Scenario
+            sequence: Request number, used to vary payloads
+            scheduled: Intended start time (open loop); defaults to now
+        """
+        start = time.perf_counter() if scheduled is None else scheduled
+        try:
+            ttfb = await SCENARIOS[name](client, sequence)
+            ok = True
+        except Exception as e:
+            ok = False
+            if len(self.error_samples) < 5:
+                self.error_samples.append(f"{name}: {type(e).__name__}: {str(e).splitlines()[0][:200] if str(e) else ''}")
+        end = time.perf_counter()
+        if end < self.measure_from:
+            return
+        if ok:
+            self.latencies[name].append(end - start)
+            if ttfb is not None:
+                self.ttfbs[name].append(ttfb)
+        else:
+            self.errors[name] += 1
+
+
+def _chooser(mix: Dict[str, float], seed: int) -> Callable[[], str]:
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    return lambda: rng.choices(names, weights)[0]
+
+
+async def run_closed_loop(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    mix: Dict[str, float],
+    concurrency: int,
+    deadline: float,
+    seed: int
+) -> None:
+    """Keep `concurrency` clients sending requests back to back until the deadline"""
+    async def worker(index: int) -> None:
+        choose = _chooser(mix, seed + index)
+        sequence = index
+        while time.perf_counter() < deadline:
+            await recorder.run(client, choose(), sequence)
+            sequence += concurrency
+
+    await asyncio.gather(*[worker(index) for index in range(concurrency)])
+
+
+async def run_open_loop(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    mix: Dict[str, float],
+    rate: float,
+    deadline: float,
+    seed: int,
+    poisson: bool = False,
+    max_outstanding: int = 10000
+) -> int:
+    """Start requests at a fixed rate, regardless of how fast they complete
+
+    Returns:
+        Number of arrivals skipped because max_outstanding requests were in flight
+    """
+    choose = _chooser(mix, seed)
+    rng = random.Random(seed)
+    tasks = set()
+    skipped = 0
+    sequence = 0
+    next_arrival = time.perf_counter()
+    while next_arrival < deadline:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= max_outstanding:
+            skipped += 1
+        else:
+            task = asyncio.ensure_future(recorder.run(client, choose(), sequence, scheduled=next_arrival))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        sequence += 1
+        next_arrival += rng.expovariate(rate) if poisson else 1 / rate
+    if tasks:
+        await asyncio.gather(*tasks)
+    return skipped
+
+
+async def run_load(args: argparse.Namespace, base_url: str, mix: Dict[str, float]) -> Dict[str, Any]:
+    """Run the configured load and build the report"""
+    connections = args.concurrency if args.rate is None else args.max_outstanding
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        start = time.perf_counter()
+        measure_from = start + args.warmup
+        deadline = measure_from + args.duration
+        recorder = Recorder(mix, measure_from)
+        skipped = 0
+        if args.rate is None:
+            await run_closed_loop(client, recorder, mix, args.concurrency, deadline, args.seed)
+        else:
+            skipped = await run_open_loop(
+                client, recorder, mix, args.rate, deadline, args.seed, args.poisson, args.max_outstanding
+            )
+        # Requests still running at the deadline are measured too
+        measured = time.perf_counter() - measure_from
+
+    scenarios = {
+        name: report.summarize(recorder.latencies[name], recorder.errors[name], measured, recorder.ttfbs[name])
+        for name in mix
+    }
+    all_latencies = [latency for latencies in recorder.latencies.values() for latency in latencies]
+    return {
+        "environment": report.environment(),
+        "load": {
+            "mode": "concurrency" if args.rate is None else "rate",
+            "concurrency": args.concurrency if args.rate is None else None,
+            "rate": args.rate,
+            "poisson": args.poisson if args.rate is not None else None,
+            "mix": mix,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "server": None if args.url else args.server,
+            "url": base_url,
+            "skipped_arrivals": skipped
+        },
+        "fake_ollama": None if args.url else {
+            "tokens": args.tokens,
+            "token_delay": args.token_delay,
+            "first_token_delay": args.first_token_delay
+        },
+        "total": report.summarize(all_latencies, sum(recorder.errors.values()), measured),
+        "scenarios": scenarios,
+        "error_samples": recorder.error_samples
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Drive the web app with a mix of requests and report latency percentiles')
+    parser.add_argument('--mix', type=str, default='chat', help=f"Weighted scenarios, e.g. chat=6,models=2 ({', '.join(SCENARIOS)})")
+    parser.add_argument('--concurrency', type=int, default=16, help='Closed-loop clients (ignored with --rate)')
+    parser.add_argument('--rate', type=float, help='Requests per second to start (open loop) instead of fixed concurrency')
+    parser.add_argument('--poisson', action='store_true', help='Exponentially distributed arrivals with --rate')
+    parser.add_argument('--max-outstanding', type=int, default=2000, help='Cap on requests in flight with --rate')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds of measurement')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of load before measuring')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the scenario mix')
+    parser.add_argument('--url', type=str, help='Base URL of a running app; otherwise one is started locally')
+    parser.add_argument('--server', type=str, default='flask', help='Serving mode of the started app (flask, asgi or gunicorn)')
+    parser.add_argument('--port', type=int, default=7171, help='Port for the started app')
+    parser.add_argument('--ollama-port', type=int, default=11500, help='Port for the fake Ollama server')
+    parser.add_argument('--tokens', type=int, default=50, help='Fake Ollama tokens per response')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='Fake Ollama seconds between tokens')
+    parser.add_argument('--first-token-delay', type=float, default=0.1, help='Fake Ollama seconds before the first token')
+    parser.add_argument('--app-env', type=str, action='append', default=[], help='KEY=VALUE environment for the started app (repeatable)')
+    parser.add_argument('--output', type=str, help='Write the report as JSON to this file')
+    parser.add_argument('--compare', type=str, help='Baseline report to compare against; exits 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative change counted as a regression')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    processes = []
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            processes.append(servers.start_fake_ollama(
+                args.ollama_port,
+                tokens=args.tokens,
+                token_delay=args.token_delay,
+                first_token_delay=args.first_token_delay
+            ))
+            app_env = dict(item.split('=', 1) for item in args.app_env)
+            processes.append(servers.start_web_app(args.server, args.port, args.ollama_port, app_env))
+            base_url = f"http://127.0.0.1:{args.port}"
+        result = asyncio.run(run_load(args, base_url, mix))
+    finally:
+        for process in reversed(processes):
+            servers.stop(process)
+
+    report.print_summary(result)
+    for sample in result["error_samples"]:
+        print(f"error: {sample}")
+    if result["load"]["skipped_arrivals"]:
+        print(f"Skipped {result['load']['skipped_arrivals']} arrivals: --max-outstanding requests were in flight")
+    if args.output:
+        report.save(result, args.output)
+
+    if args.compare:
+        rows = report.compare(report.load(args.compare), result, args.threshold)
+        report.print_comparison(rows)
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
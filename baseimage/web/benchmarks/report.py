@@ -0,0 +1,189 @@
+"""Benchmark reports: latency percentiles, throughput and regression comparison
+
+Reports are JSON files with the environment they were measured in (commit,
+Python, CPUs), the load settings and per-scenario summaries, so two runs can
+be compared, e.g. before and after a change:
+
+    python -m benchmarks.report baseline.json current.json --threshold 0.1
+
+The comparison exits with status 1 if a latency percentile or the throughput
+of any scenario got worse by more than the threshold.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from typing import Any, Dict, List, Optional, Sequence
+
+from benchmarks.servers import WEB_DIR
+
+# Metrics compared between reports and whether higher values are better
+COMPARED_METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "throughput_rps": True,
+    "error_rate": False
+}
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of already sorted values, None if there are none"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, duration: float, ttfbs: Optional[List[float]] = None) -> Dict[str, Any]:
+    """Summarize the samples of one scenario
+
+    Args:
+        latencies: Seconds per successful request
+        errors: Number of failed requests
+        duration: Seconds of measurement the samples were taken in
+        ttfbs: Seconds to the first response line, for streamed requests
+
+    Returns:
+        Dict with counts, throughput and latency percentiles in milliseconds
+    """
+    latencies = sorted(latencies)
+    total = len(latencies) + errors
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    summary = {
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(len(latencies) / duration, 2) if duration > 0 else 0.0,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1]) if latencies else None
+    }
+    if ttfbs:
+        ttfbs = sorted(ttfbs)
+        summary["ttfb_p50_ms"] = ms(percentile(ttfbs, 0.50))
+        summary["ttfb_p95_ms"] = ms(percentile(ttfbs, 0.95))
+        summary["ttfb_p99_ms"] = ms(percentile(ttfbs, 0.99))
+    return summary
+
+
+def environment() -> Dict[str, Any]:
+    """Describe where a benchmark ran: commit, Python version and hardware"""
+    def git(*args: str) -> Optional[str]:
+        try:
+            result = subprocess.run(["git", *args], cwd=WEB_DIR, capture_output=True, text=True, timeout=10)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+
+def save(report: Dict[str, Any], path: str) -> None:
+    """Write a report as JSON"""
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load(path: str) -> Dict[str, Any]:
+    """Read a report written by save()"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1) -> List[Dict[str, Any]]:
+    """Compare the scenarios two reports have in common
+
+    Args:
+        baseline: Earlier report
+        current: Report to check
+        threshold: Relative change beyond which a worse value is a regression
+
+    Returns:
+        One row per scenario and metric with both values, the relative change
+        and whether it is a regression
+    """
+    rows = []
+    for name, before in baseline.get("scenarios", {}).items():
+        after = current.get("scenarios", {}).get(name)
+        if after is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before.get(metric), after.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+            worse = -change if higher_is_better else change
+            # Error rates are compared in absolute terms; a relative change from ~0 means nothing
+            if metric == "error_rate":
+                worse = new - old
+            rows.append({
+                "scenario": name,
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "change": round(change, 4) if change != float("inf") else None,
+                "regression": worse > threshold
+            })
+    return rows
+
+
+def print_summary(report: Dict[str, Any]) -> None:
+    """Print the per-scenario summaries of a report as a table"""
+    print(f"{'scenario':<14}{'ok':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb p95':>10}")
+    for name, summary in report["scenarios"].items():
+        print(
+            f"{name:<14}{summary['ok']:>8}{summary['errors']:>8}{summary['throughput_rps']:>10}"
+            f"{_cell(summary['p50_ms'])}{_cell(summary['p95_ms'])}{_cell(summary['p99_ms'])}{_cell(summary.get('ttfb_p95_ms'))}"
+        )
+
+
+def print_comparison(rows: List[Dict[str, Any]]) -> None:
+    """Print the rows of compare() as a table"""
+    print(f"{'scenario':<14}{'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}")
+    for row in rows:
+        change = f"{row['change'] * 100:+.1f}%" if row["change"] is not None else "n/a"
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['scenario']:<14}{row['metric']:<16}{row['baseline']:>12}{row['current']:>12}{change:>10}{flag}")
+
+
+def _cell(value: Optional[float]) -> str:
+    return f"{value:>10}" if value is not None else f"{'-':>10}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports')
+    parser.add_argument('baseline', type=str, help='Earlier report (JSON)')
+    parser.add_argument('current', type=str, help='Report to check (JSON)')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative change counted as a regression')
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    for key in ("mode", "concurrency", "rate", "mix", "server"):
+        if baseline.get("load", {}).get(key) != current.get("load", {}).get(key):
+            print(f"Warning: the reports differ in {key}, so the comparison may not be meaningful")
+    print(f"baseline {baseline.get('environment', {}).get('commit')} vs. current {current.get('environment', {}).get('commit')}")
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows)
+    sys.exit(1 if any(row["regression"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
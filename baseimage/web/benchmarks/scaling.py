@@ -0,0 +1,128 @@
+"""Scaling benchmark: throughput of the production server by worker count
+
+Starts a fake Ollama server, then for each worker count starts the app with
+gunicorn (WEB_WORKERS=n, state shared through a fresh SHARED_STATE file) and
+drives it with closed-loop clients spread over several client processes, so
+the load generator is not the bottleneck. Reports throughput and latency per
+worker count and the speedup over the first count. Handlers that spend their
+time in Python (routing, JSON, cache lookups) are bound by one process's GIL,
+so their throughput should grow with the workers until the CPUs run out.
+
+Run from the web app directory:
+    python -m benchmarks.scaling --workers 1,2,4 --mix models=3,search=2,chat=1 --concurrency 64 --output scaling.json
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from benchmarks import servers, report, loadgen
+
+
+def _client_process(base_url: str, mix: Dict[str, float], concurrency: int, warmup: float, duration: float,
+                    timeout: float, seed: int) -> Tuple[List[float], int, float]:
+    """Run closed-loop clients in this process
+
+    Returns:
+        Tuple of (latencies of successful requests, errors, seconds measured)
+    """
+    async def run() -> Tuple[List[float], int, float]:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+            measure_from = time.perf_counter() + warmup
+            deadline = measure_from + duration
+            recorder = loadgen.Recorder(mix, measure_from)
+            await loadgen.run_closed_loop(client, recorder, mix, concurrency, deadline, seed)
+            measured = time.perf_counter() - measure_from
+        latencies = [latency for values in recorder.latencies.values() for latency in values]
+        return latencies, sum(recorder.errors.values()), measured
+
+    return asyncio.run(run())
+
+
+def measure(base_url: str, mix: Dict[str, float], concurrency: int, client_processes: int,
+            warmup: float, duration: float, timeout: float) -> Dict[str, Any]:
+    """Drive the app from several client processes and summarize all samples"""
+    share = max(1, concurrency // client_processes)
+    with multiprocessing.get_context("spawn").Pool(client_processes) as pool:
+        results = pool.starmap(_client_process, [
+            (base_url, mix, share, warmup, duration, timeout, index * share + 1)
+            for index in range(client_processes)
+        ])
+    latencies = [latency for result in results for latency in result[0]]
+    errors = sum(result[1] for result in results)
+    measured = max(result[2] for result in results)
+    return report.summarize(latencies, errors, measured)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure throughput of the gunicorn serving mode by worker count')
+    parser.add_argument('--workers', type=str, default='1,2,4', help='Comma-separated worker counts')
+    parser.add_argument('--mix', type=str, default='models=3,search=2,chat=1',
+                        help=f"Weighted scenarios ({', '.join(loadgen.SCENARIOS)})")
+    parser.add_argument('--concurrency', type=int, default=64, help='Closed-loop clients in total')
+    parser.add_argument('--client-processes', type=int, default=4, help='Processes the clients are spread over')
+    parser.add_argument('--threads', type=int, default=32, help='Threads per worker (WEB_THREADS)')
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds of measurement per worker count')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of load before measuring')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request timeout in seconds')
+    parser.add_argument('--port', type=int, default=7171, help='Port for the web app')
+    parser.add_argument('--ollama-port', type=int, default=11500, help='Port for the fake Ollama server')
+    parser.add_argument('--tokens', type=int, default=20, help='Fake Ollama tokens per response')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Fake Ollama seconds between tokens')
+    parser.add_argument('--app-env', type=str, action='append', default=[], help='KEY=VALUE environment for the app (repeatable)')
+    parser.add_argument('--output', type=str, help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    mix = loadgen.parse_mix(args.mix)
+    worker_counts = [int(count) for count in args.workers.split(',')]
+    state_dir = tempfile.mkdtemp(prefix="aione-scaling-")
+    base_url = f"http://127.0.0.1:{args.port}"
+    runs = []
+    fake = servers.start_fake_ollama(args.ollama_port, tokens=args.tokens, token_delay=args.token_delay, first_token_delay=0)
+    try:
+        for workers in worker_counts:
+            app_env = {
+                "WEB_WORKERS": str(workers),
+                "WEB_THREADS": str(args.threads),
+                "SHARED_STATE": os.path.join(state_dir, "shared_state.db")
+            }
+            app_env.update(item.split('=', 1) for item in args.app_env)
+            process = servers.start_web_app("gunicorn", args.port, args.ollama_port, app_env)
+            try:
+                summary = measure(base_url, mix, args.concurrency, args.client_processes,
+                                  args.warmup, args.duration, args.timeout)
+            finally:
+                servers.stop(process)
+            summary["workers"] = workers
+            runs.append(summary)
+            speedup = summary["throughput_rps"] / runs[0]["throughput_rps"] if runs[0]["throughput_rps"] else 0.0
+            print(
+                f"workers={workers:<3} rps={summary['throughput_rps']:<10} p50={summary['p50_ms']}ms "
+                f"p99={summary['p99_ms']}ms errors={summary['errors']:<5} speedup={speedup:.2f}x"
+            )
+    finally:
+        servers.stop(fake)
+
+    if args.output:
+        report.save({
+            "environment": report.environment(),
+            "load": {
+                "mix": mix,
+                "concurrency": args.concurrency,
+                "client_processes": args.client_processes,
+                "threads": args.threads,
+                "duration_s": args.duration,
+                "warmup_s": args.warmup
+            },
+            "runs": runs
+        }, args.output)
+
+
+if __name__ == "__main__":
+    main()
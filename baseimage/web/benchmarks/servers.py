@@ -0,0 +1,145 @@
+"""Helpers to launch the fake Ollama server and the web app under test"""
+import os
+import sys
+import time
+import signal
+import subprocess
+from typing import Dict, List, Optional
+
+import requests
+
+WEB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Commands used to serve the web app in each serving mode
+SERVER_COMMANDS = {
+    # Same as start.sh: the threaded Flask development server
+    "flask": lambda port: [sys.executable, "-m", "flask", "run", "--host=127.0.0.1", f"--port={port}"],
+    # Native asyncio serving path
+    "asgi": lambda port: [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1",
+                          "--port", str(port), "--log-level", "warning", "--backlog", "4096"],
+    # Production mode: WEB_WORKERS processes sharing state through SHARED_STATE
+    "gunicorn": lambda port: [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}",
+                              "--log-level", "warning", "app:app"]
+}
+
+
+def wait_for(url: str, timeout: float = 30.0) -> None:
+    """Wait until a URL answers with HTTP 200
+
+    Args:
+        url: URL to poll
+        timeout: Seconds to wait before giving up
+
+    Raises:
+        RuntimeError: If the URL does not come up in time
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout} seconds")
+
+
+def start_process(command: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """Start a server process in the web app directory
+
+    Args:
+        command: Command line
+        env: Extra environment variables
+
+    Returns:
+        The process handle
+    """
+    process_env = dict(os.environ)
+    process_env.update(env or {})
+    return subprocess.Popen(
+        command,
+        cwd=WEB_DIR,
+        env=process_env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+
+def start_fake_ollama(port: int, **options) -> subprocess.Popen:
+    """Start the fake Ollama server and wait until it is ready
+
+    Args:
+        port: Port to listen on
+        **options: Command line options of benchmarks.fake_ollama, e.g. token_delay=0.02
+
+    Returns:
+        The process handle
+    """
+    command = [sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(port)]
+    for name, value in options.items():
+        command += [f"--{name.replace('_', '-')}", str(value)]
+    process = start_process(command)
+    wait_for(f"http://127.0.0.1:{port}/api/version")
+    return process
+
+
+def start_web_app(mode: str, port: int, ollama_port: int, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """Start the web app in a serving mode and wait until it is ready
+
+    Args:
+        mode: Key of SERVER_COMMANDS
+        port: Port for the web app
+        ollama_port: Port of the (fake) Ollama server
+        env: Extra environment variables
+
+    Returns:
+        The process handle
+    """
+    app_env = {
+        "FLASK_APP": "app.py",
+        "OLLAMA_HOST": "127.0.0.1",
+        "OLLAMA_PORT": str(ollama_port),
+        "OLLAMA_LIBRARY_URL": f"http://127.0.0.1:{ollama_port}",
+        "LIBRARY_INDEX_PATH": "",
+        "LOG_LEVEL": "WARNING"
+    }
+    app_env.update(env or {})
+    process = start_process(SERVER_COMMANDS[mode](port), app_env)
+    wait_for(f"http://127.0.0.1:{port}/health")
+    return process
+
+
+def stop(process: subprocess.Popen) -> None:
+    """Stop a server process and everything it spawned
+
+    Args:
+        process: The process handle
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def thread_count(pid: int) -> int:
+    """Get the number of OS threads of a process (Linux only)
+
+    Args:
+        pid: Process ID
+
+    Returns:
+        Thread count, or 0 if it cannot be read
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
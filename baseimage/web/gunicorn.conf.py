@@ -0,0 +1,35 @@
+"""Gunicorn settings for the production serving mode (SERVER_MODE=gunicorn in start.sh)
+
+Every worker process imports the app and builds its own managers. State the
+workers must agree on (pull progress, the model list, command history,
+terminal jobs and chat sessions) lives in the SQLite file named by
+SHARED_STATE, which is set here whenever more than one worker runs.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('APP_PORT', '7071')}"
+workers = int(os.getenv('WEB_WORKERS', str(min(os.cpu_count() or 1, 4))))
+# Threads per worker; streams and long-polls (progress, terminal output) hold one each
+worker_class = "gthread"
+threads = int(os.getenv('WEB_THREADS', '32'))
+# gthread workers heartbeat independently of requests, so this doesn't cut long streams
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+backlog = 2048
+
+if workers > 1:
+    os.environ.setdefault("SHARED_STATE", "~/.aione/shared_state.db")
+
+
+def on_starting(server):
+    """Start every run with empty shared state; jobs of a previous run are gone with its workers"""
+    path = os.environ.get("SHARED_STATE")
+    if not path:
+        return
+    path = os.path.expanduser(path)
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
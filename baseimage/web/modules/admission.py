@@ -0,0 +1,413 @@
+import math
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from modules.response_cache import normalize_model_name
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Lower rank is admitted first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# Wait times kept for the percentile gauges
+WAIT_SAMPLES = 1000
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """Parse per-model concurrency limits from "llama3=4,mistral:7b=2"
+
+    Args:
+        spec: Comma-separated model=limit pairs
+
+    Returns:
+        Dict mapping normalized model name to limit
+    """
+    limits = {}
+    for item in spec.split(","):
+        model, _, value = item.strip().rpartition("=")
+        if not model:
+            continue
+        try:
+            limits[normalize_model_name(model)] = int(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid concurrency limit '{item}'")
+    return limits
+
+
+class AdmissionRejected(Exception):
+    """A request was not admitted; maps to an HTTP error with Retry-After"""
+
+    def __init__(self, reason: str, retry_after: float, status: int = 429):
+        """Initialize the rejection
+
+        Args:
+            reason: queue_full, rate_limited, displaced or timeout
+            retry_after: Seconds after which a retry is likely to be admitted
+            status: HTTP status to answer with
+        """
+        super().__init__(f"Request not admitted ({reason}), retry after {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status = status
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token
+
+        Returns:
+            0 if a token was taken, otherwise seconds until one is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self) -> None:
+        """Return a token taken for a request that was rejected anyway"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class _Waiter:
+    """A queued request; wake() is called with None (admitted) or an AdmissionRejected"""
+
+    def __init__(self, model: str, priority: int, wake: Callable[[Optional[AdmissionRejected]], None]):
+        self.model = model
+        self.priority = priority
+        self.wake = wake
+        self.enqueued = time.monotonic()
+        # Set under the controller lock: done once out of the queue, admitted if handed a slot
+        self.done = False
+        self.admitted = False
+
+
+class Ticket:
+    """An admitted request's slot; release it when the upstream call finishes"""
+
+    def __init__(self, controller: "AdmissionController", model: str, waited: float):
+        self.controller = controller
+        self.model = model
+        self.waited = waited
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        """Free the slot for the next queued request (idempotent)"""
+        if not self.released:
+            self.released = True
+            self.controller._release(self.model, time.monotonic() - self.started)
+
+    def __enter__(self) -> "Ticket":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class _ModelState:
+    """In-flight count and wait queue of one model"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.queue: List = []
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self.service_time = 1.0
+
+
+class AdmissionController:
+    """Admission control in front of chat requests to Ollama
+
+    Each model admits at most its limit of concurrent requests; the rest wait
+    in a bounded priority queue (interactive before batch, FIFO within a
+    priority) and are handed a slot directly when one is released. When the
+    queue is full, a new request is rejected at once with a Retry-After
+    estimate instead of piling up inside Ollama, except that an interactive
+    request displaces the newest queued batch request. Clients are
+    additionally limited by a token bucket each.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 2,
+        model_limits: Optional[Dict[str, int]] = None,
+        max_queue: int = 32,
+        max_wait: float = 120.0,
+        client_rate: float = 0.0,
+        client_burst: float = 10.0,
+        max_clients: int = 10000
+    ):
+        """Initialize the controller
+
+        Args:
+            max_in_flight: Concurrent requests per model, unless overridden
+            model_limits: Per-model concurrent request limits, keyed by model name
+            max_queue: Requests waiting per model before new ones are rejected
+            max_wait: Seconds a request may wait before it is rejected (503)
+            client_rate: Requests per second per client (0 disables rate limiting)
+            client_burst: Requests a client may send at once
+            max_clients: Token buckets kept; the least recently used are dropped
+        """
+        self.max_in_flight = max(1, max_in_flight)
+        self.model_limits = {normalize_model_name(model): max(1, limit) for model, limit in (model_limits or {}).items()}
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.client_rate = client_rate
+        self.client_burst = max(1.0, client_burst)
+        self.max_clients = max_clients
+
+        self.lock = threading.Lock()
+        self.models: Dict[str, _ModelState] = {}
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.sequence = itertools.count()
+        self.counters = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_rate_limited": 0,
+            "displaced": 0,
+            "timeouts": 0
+        }
+        self.wait_times: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+
+    def acquire(self, model: str, client: Optional[str] = None, priority: str = "interactive") -> Ticket:
+        """Wait for a slot to send a request for a model
+
+        Args:
+            model: Model name
+            client: Client identity for rate limiting (e.g. IP address)
+            priority: "interactive" or "batch"
+
+        Returns:
+            Ticket to release when the request is done
+
+        Raises:
+            AdmissionRejected: If the client is rate limited, the queue is full
+                or the wait timed out
+        """
+        start = time.monotonic()
+        event = threading.Event()
+        outcome: List[Optional[AdmissionRejected]] = []
+
+        def wake(result: Optional[AdmissionRejected]) -> None:
+            outcome.append(result)
+            event.set()
+
+        model = normalize_model_name(model)
+        waiter = self._admit_or_enqueue(model, client, priority, wake)
+        if waiter is not None and not event.wait(self.max_wait):
+            self._expire(waiter)
+            event.wait()
+        return self._ticket(model, outcome[0] if outcome else None, start)
+
+    async def acquire_async(self, model: str, client: Optional[str] = None, priority: str = "interactive") -> Ticket:
+        """Async version of acquire, waiting without blocking the event loop"""
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake(result: Optional[AdmissionRejected]) -> None:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(result))
+
+        model = normalize_model_name(model)
+        waiter = self._admit_or_enqueue(model, client, priority, wake)
+        if waiter is None:
+            return self._ticket(model, None, start)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            self._expire(waiter)
+            result = await future
+        except asyncio.CancelledError:
+            # Client went away while queued: give up the place, or the slot if already handed over
+            if not self._expire(waiter, cancelled=True) and waiter.admitted:
+                self._release(model, 0.0)
+            raise
+        return self._ticket(model, result, start)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth and in-flight gauges per model, and wait time percentiles
+
+        Returns:
+            Dict with counters, per-model gauges and wait_ms percentiles
+        """
+        with self.lock:
+            stats: Dict[str, Any] = dict(self.counters)
+            models = {}
+            for name, state in self.models.items():
+                waiting = [entry[2] for entry in state.queue if not entry[2].done]
+                models[name] = {
+                    "limit": state.limit,
+                    "in_flight": state.in_flight,
+                    "queue_depth": len(waiting),
+                    "queued_interactive": sum(1 for waiter in waiting if waiter.priority == 0),
+                    "queued_batch": sum(1 for waiter in waiting if waiter.priority != 0),
+                    "oldest_wait_ms": round((time.monotonic() - min(w.enqueued for w in waiting)) * 1000, 1) if waiting else 0,
+                    "service_time_ms": round(state.service_time * 1000, 1)
+                }
+            wait_times = sorted(self.wait_times)
+            clients = len(self.buckets)
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not wait_times:
+                return None
+            return round(wait_times[min(len(wait_times) - 1, int(len(wait_times) * fraction))] * 1000, 1)
+
+        stats.update({
+            "models": models,
+            "queue_depth": sum(model["queue_depth"] for model in models.values()),
+            "in_flight": sum(model["in_flight"] for model in models.values()),
+            "wait_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99), "max": percentile(1.0)},
+            "max_in_flight": self.max_in_flight,
+            "model_limits": dict(self.model_limits),
+            "max_queue": self.max_queue,
+            "client_rate": self.client_rate,
+            "clients": clients
+        })
+        return stats
+
+    def _state(self, model: str) -> _ModelState:
+        """Get or create the state of a model (lock held)"""
+        state = self.models.get(model)
+        if state is None:
+            state = self.models[model] = _ModelState(self.model_limits.get(model, self.max_in_flight))
+        return state
+
+    def _admit_or_enqueue(
+        self,
+        model: str,
+        client: Optional[str],
+        priority: str,
+        wake: Callable[[Optional[AdmissionRejected]], None]
+    ) -> Optional[_Waiter]:
+        """Take a slot right away or join the queue
+
+        Returns:
+            None if admitted, otherwise the queued waiter
+
+        Raises:
+            AdmissionRejected: If rate limited or the queue is full
+        """
+        rank = PRIORITIES.get(priority, PRIORITIES["interactive"])
+        displaced = None
+        with self.lock:
+            charged = bool(client and self.client_rate > 0)
+            if charged:
+                retry_after = self._take_token(client)
+                if retry_after:
+                    self.counters["rejected_rate_limited"] += 1
+                    raise AdmissionRejected("rate_limited", retry_after)
+
+            state = self._state(model)
+            if state.in_flight < state.limit and not self._waiting(state):
+                state.in_flight += 1
+                self.counters["admitted"] += 1
+                self.wait_times.append(0.0)
+                return None
+
+            waiting = self._waiting(state)
+            if waiting >= self.max_queue:
+                displaced = self._newest_batch_waiter(state) if rank == PRIORITIES["interactive"] else None
+                if displaced is None:
+                    if charged:
+                        # A request turned away for load shouldn't use up the client's budget
+                        self.buckets[client].refund()
+                    self.counters["rejected_queue_full"] += 1
+                    raise AdmissionRejected("queue_full", self._estimate_wait(state, waiting))
+                displaced.done = True
+                self.counters["displaced"] += 1
+
+            waiter = _Waiter(model, rank, wake)
+            heapq.heappush(state.queue, (rank, next(self.sequence), waiter))
+            self.counters["queued"] += 1
+            retry_after = self._estimate_wait(state, waiting)
+
+        if displaced is not None:
+            displaced.wake(AdmissionRejected("displaced", retry_after))
+        return waiter
+
+    def _take_token(self, client: str) -> float:
+        """Take a token from a client's bucket (lock held), see TokenBucket.take"""
+        bucket = self.buckets.pop(client, None)
+        if bucket is None:
+            bucket = TokenBucket(self.client_rate, self.client_burst)
+            if len(self.buckets) >= self.max_clients:
+                # Dicts keep insertion order, so the first key is the least recently used
+                del self.buckets[next(iter(self.buckets))]
+        self.buckets[client] = bucket
+        return bucket.take()
+
+    def _waiting(self, state: _ModelState) -> int:
+        """Number of live waiters of a model (lock held)"""
+        return sum(1 for entry in state.queue if not entry[2].done)
+
+    def _newest_batch_waiter(self, state: _ModelState) -> Optional[_Waiter]:
+        """The most recently queued batch request, to make room for an interactive one"""
+        candidates = [entry for entry in state.queue if entry[0] != PRIORITIES["interactive"] and not entry[2].done]
+        return max(candidates, key=lambda entry: entry[1])[2] if candidates else None
+
+    def _estimate_wait(self, state: _ModelState, position: int) -> float:
+        """Seconds until a request queued at `position` would likely be admitted"""
+        return (position + 1) / state.limit * state.service_time
+
+    def _release(self, model: str, held: float) -> None:
+        """Hand a freed slot to the next live waiter, or return it"""
+        with self.lock:
+            state = self._state(model)
+            if held > 0:
+                state.service_time = 0.8 * state.service_time + 0.2 * held
+            waiter = None
+            while state.queue:
+                _, _, candidate = heapq.heappop(state.queue)
+                if not candidate.done:
+                    waiter = candidate
+                    break
+            if waiter is None:
+                state.in_flight = max(0, state.in_flight - 1)
+                return
+            # The slot passes to the waiter; in_flight stays the same
+            waiter.done = True
+            waiter.admitted = True
+            self.counters["admitted"] += 1
+            self.wait_times.append(time.monotonic() - waiter.enqueued)
+        waiter.wake(None)
+
+    def _expire(self, waiter: _Waiter, cancelled: bool = False) -> bool:
+        """Take a waiter out of the queue after a timeout or cancellation
+
+        Returns:
+            True if it was still waiting (and has now been woken with a rejection)
+        """
+        with self.lock:
+            if waiter.done:
+                return False
+            waiter.done = True
+            if not cancelled:
+                self.counters["timeouts"] += 1
+            state = self._state(waiter.model)
+            retry_after = self._estimate_wait(state, self._waiting(state))
+        waiter.wake(AdmissionRejected("timeout", retry_after, status=503))
+        return True
+
+    def _ticket(self, model: str, rejection: Optional[AdmissionRejected], start: float) -> Ticket:
+        if rejection is not None:
+            raise rejection
+        return Ticket(self, model, time.monotonic() - start)
@@ -0,0 +1,426 @@
+import asyncio
+import logging
+import time
+import json
+from typing import List, Dict, Tuple, Optional, Any, AsyncIterator
+
+import httpx
+
+from modules.ollama_manager import OllamaManager
+from modules.node_pool import OllamaNode
+from modules.http_transport import DEFAULT_TIMEOUTS
+from modules.metrics import OLLAMA_ERRORS, observe_generation, observe_upstream
+from modules.single_flight import AsyncSingleFlight
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class AsyncOllamaManager:
+    """Asyncio counterpart of OllamaManager for the ASGI serving path
+
+    Upstream HTTP calls (model listing, deletion, chat) run as coroutines on a
+    shared httpx.AsyncClient, so an in-flight chat costs a coroutine rather than
+    a thread. Pulls, progress, terminal commands and GPU probes are delegated to
+    the synchronous manager so both serving paths share the same state.
+    """
+
+    def __init__(
+        self,
+        manager: OllamaManager,
+        pool_size: int = 100,
+        timeouts: Optional[Dict[str, Tuple[float, float]]] = None
+    ):
+        """Initialize the async manager
+
+        Args:
+            manager: Synchronous manager that owns the shared state
+            pool_size: Maximum number of keep-alive connections to Ollama
+            timeouts: (connect, read) timeouts per endpoint type, see http_transport
+        """
+        self.manager = manager
+        self.base_url = manager.base_url
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        # Counted together with the sync manager's calls for the same keys
+        self.single_flight = AsyncSingleFlight(stats=manager.single_flight.stats)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size
+            ),
+            event_hooks={"request": [self._start_timer], "response": [self._observe_response]}
+        )
+
+    async def _start_timer(self, request: httpx.Request) -> None:
+        request.extensions["started"] = time.perf_counter()
+
+    async def _observe_response(self, response: httpx.Response) -> None:
+        """Record the time to the response headers, like OllamaTransport does"""
+        request = response.request
+        started = request.extensions.get("started")
+        if started is not None:
+            observe_upstream(request.url.path, request.extensions.get("model"), time.perf_counter() - started)
+
+    def _timeout(self, endpoint_type: str) -> httpx.Timeout:
+        """Build an httpx timeout for an endpoint type
+
+        Args:
+            endpoint_type: Key into the timeout table
+
+        Returns:
+            httpx.Timeout with the configured connect and read timeouts
+        """
+        connect, read = self.timeouts.get(endpoint_type, DEFAULT_TIMEOUTS["metadata"])
+        return httpx.Timeout(read, connect=connect)
+
+    async def _prepare_model(self, model: str, payload: Dict[str, Any]) -> None:
+        """Async version of OllamaManager._prepare_model
+
+        Only cold models, which may need others evicted, leave the event loop.
+        """
+        residency = self.manager.residency
+        if not residency.touch(model):
+            await asyncio.to_thread(residency.prepare, model)
+        keep_alive = residency.keep_alive_for(model)
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+
+    async def _post_routed(self, path: str, model: str, payload: Dict[str, Any]) -> httpx.Response:
+        """POST to the node chosen for a model, retrying on the next node if one is unreachable"""
+        pool = self.manager.node_pool
+        tried = []
+        while True:
+            lease = pool.lease(model, exclude=tried)
+            try:
+                response = await self.client.post(
+                    f"{lease.url}{path}",
+                    json=payload,
+                    timeout=self._timeout("chat"),
+                    extensions={"model": model}
+                )
+            except httpx.ConnectError as e:
+                OLLAMA_ERRORS.inc(path)
+                lease.done(e)
+                tried.append(lease.node)
+                if len(tried) >= len(pool.nodes):
+                    raise
+                logger.warning(f"Ollama node {lease.node.name} unreachable, retrying {path} on another node")
+                continue
+            except Exception as e:
+                if isinstance(e, httpx.TransportError):
+                    OLLAMA_ERRORS.inc(path)
+                lease.done(e if isinstance(e, httpx.TransportError) else None)
+                raise
+            lease.done()
+            if response.status_code == 200:
+                pool.mark_loaded(lease.node, model)
+            return response
+
+    async def get_models(self, force_refresh: bool = False) -> List[Dict]:
+        """Get list of all models
+
+        Args:
+            force_refresh: Force a refresh of the models cache
+
+        Returns:
+            List of model information dictionaries
+        """
+        return (await self.get_models_snapshot(force_refresh))["models"]
+
+    async def get_models_snapshot(self, force_refresh: bool = False) -> Dict[str, Any]:
+        """Get the model list together with its ETag and serialized JSON body
+
+        Shares the stale-while-revalidate snapshot of the synchronous manager.
+
+        Args:
+            force_refresh: Fetch from Ollama even if the snapshot is fresh
+
+        Returns:
+            Dict with models, etag and body, see OllamaManager.get_models_snapshot
+        """
+        manager = self.manager
+        snapshot, state = manager._models_cache_state()
+
+        if not force_refresh and state != "missing":
+            if state == "stale":
+                manager._refresh_models_in_background()
+            return snapshot
+
+        return await self.single_flight.do("models", self._fetch_models)
+
+    async def _fetch_node_models(self, node: OllamaNode) -> Optional[List[Dict]]:
+        """Fetch one node's /api/tags, None on failure"""
+        try:
+            response = await self.client.get(f"{node.url}/api/tags", timeout=self._timeout("metadata"))
+            if response.status_code == 200:
+                return response.json().get("models", [])
+            logger.error(f"Failed to get models from {node.name}: {response.status_code}")
+        except Exception as e:
+            logger.error(f"Error getting models from {node.name}: {str(e)}")
+        return None
+
+    async def _fetch_models(self) -> Dict[str, Any]:
+        """Fetch and merge the model lists of all healthy nodes into the shared snapshot"""
+        manager = self.manager
+        nodes = manager.node_pool.healthy_nodes()
+        results = await asyncio.gather(*(self._fetch_node_models(node) for node in nodes))
+        per_node = [(node, models) for node, models in zip(nodes, results) if models is not None]
+        if per_node:
+            return manager._store_models(manager._merge_models(per_node))
+        return {
+            "models": manager.models_cache or [],
+            "etag": manager.models_etag,
+            "body": manager.models_body
+        }
+
+    async def get_model_names(self) -> List[str]:
+        """Get list of all model names
+
+        Returns:
+            List of model names
+        """
+        models = await self.get_models()
+        return [model.get("name") for model in models]
+
+    async def pull_model(self, model_name: str, priority: int = 0) -> str:
+        """Pull a model from Ollama (queued on the shared download scheduler)
+
+        Args:
+            model_name: Name of the model to pull
+            priority: Higher values are downloaded first
+
+        Returns:
+            Status message
+        """
+        return self.manager.pull_model(model_name, priority)
+
+    async def get_installation_progress(self) -> Dict[str, Any]:
+        """Get the current installation progress
+
+        Returns:
+            Dict with status and progress information
+        """
+        return self.manager.get_installation_progress()
+
+    async def delete_model(self, model_name: str) -> str:
+        """Delete a model from Ollama
+
+        Args:
+            model_name: Name of the model to delete
+
+        Returns:
+            Status message
+        """
+        try:
+            # Delete from every node; the model may be installed on several
+            responses = await asyncio.gather(*(
+                self.client.request(
+                    "DELETE",
+                    f"{node.url}/api/delete",
+                    json={"name": model_name},
+                    timeout=self._timeout("delete")
+                )
+                for node in self.manager.node_pool.nodes
+            ), return_exceptions=True)
+            statuses = [response.status_code for response in responses if not isinstance(response, BaseException)]
+            if not statuses:
+                raise responses[0]
+            status_code = 200 if 200 in statuses else statuses[0]
+
+            if status_code == 200:
+                # Same invalidation as the sync path, including the broadcast to other workers
+                await asyncio.to_thread(self.manager._model_changed, model_name)
+                return f"Successfully deleted {model_name}"
+            else:
+                return f"Failed to delete {model_name}: {status_code}"
+        except Exception as e:
+            logger.error(f"Error deleting model {model_name}: {str(e)}")
+            return f"Error deleting model: {str(e)}"
+
+    async def execute_command(self, command: str, timeout: int = 30) -> str:
+        """Execute a command in the terminal without blocking the event loop
+
+        Args:
+            command: Command to execute
+            timeout: Timeout in seconds (default: 30)
+
+        Returns:
+            Command output
+        """
+        return await asyncio.to_thread(self.manager.execute_command, command, timeout)
+
+    async def get_command_history(self) -> List[List[str]]:
+        """Get command history
+
+        Returns:
+            List of [command, status, timestamp] lists
+        """
+        return self.manager.get_command_history()
+
+    async def chat(
+        self,
+        model: str,
+        message: str,
+        options: Optional[Dict[str, Any]] = None,
+        cache: Any = False
+    ) -> str:
+        """Send a chat message to a model
+
+        Shares the response and semantic caches of the synchronous manager.
+
+        Args:
+            model: Model name
+            message: User message
+            options: Ollama generation options
+            cache: Response cache setting, see OllamaManager.chat
+
+        Returns:
+            Model response
+        """
+        messages = [
+            {
+                "role": "user",
+                "content": message
+            }
+        ]
+        cache_lookup = {"key": None, "semantic": False, "vector": None}
+        if cache:
+            # The semantic lookup embeds the prompt with a blocking request
+            cached, cache_lookup = await asyncio.to_thread(
+                self.manager._chat_cache_lookup, model, message, messages, options, cache
+            )
+            if cached is not None:
+                self.manager._record_chat(model, message, cached)
+                return cached
+
+        try:
+            payload = {
+                "model": model,
+                "messages": messages,
+                "stream": False
+            }
+            if options:
+                payload["options"] = options
+            await self._prepare_model(model, payload)
+
+            response = await self._post_routed("/api/chat", model, payload)
+
+            if response.status_code == 200:
+                try:
+                    response_json = response.json()
+                    observe_generation(model, response_json)
+                    content = response_json.get("message", {}).get("content", "")
+                    if cache:
+                        await asyncio.to_thread(self.manager._chat_cache_store, cache_lookup, model, message, content)
+                    # Only enqueues, so it doesn't block the event loop
+                    self.manager._record_chat(model, message, content)
+                    return content
+                except json.JSONDecodeError as e:
+                    logger.error(f"JSON decode error: {str(e)}, Response content: {response.text[:200]}...")
+                    return f"Response could not be parsed as JSON. Raw response: {response.text[:1000]}..."
+            else:
+                logger.error(f"Error in chat response: {response.status_code}")
+                return f"Error: Failed to get response from model. Status code: {response.status_code}"
+        except Exception as e:
+            logger.error(f"Error in chat: {str(e)}")
+            return f"Error: {str(e)}"
+
+    async def chat_stream(self, model: str, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a chat response from a model as it is generated
+
+        Cancelling the consuming task (e.g. when the client disconnects) exits
+        the stream context, which closes the upstream connection and makes
+        Ollama abort the generation.
+
+        Args:
+            model: Model name
+            message: User message
+
+        Yields:
+            The same event dicts as OllamaManager.chat_stream
+        """
+        payload = {
+            "model": model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": message
+                }
+            ],
+            "stream": True
+        }
+        await self._prepare_model(model, payload)
+
+        start_time = time.monotonic()
+        first_token_time = None
+        content_parts = []
+        # The node counts the request as outstanding until the stream is closed
+        lease = self.manager.node_pool.lease(model)
+        error = None
+
+        try:
+            async with self.client.stream(
+                "POST",
+                f"{lease.url}/api/chat",
+                json=payload,
+                timeout=self._timeout("chat"),
+                extensions={"model": model}
+            ) as response:
+                if response.status_code != 200:
+                    logger.error(f"Error in streaming chat response: {response.status_code}")
+                    yield {
+                        "type": "error",
+                        "error": f"Failed to get response from model. Status code: {response.status_code}"
+                    }
+                    return
+
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+                    if chunk.get("error"):
+                        yield {"type": "error", "error": chunk["error"]}
+                        return
+
+                    content = chunk.get("message", {}).get("content", "")
+                    if content:
+                        if first_token_time is None:
+                            first_token_time = time.monotonic()
+                        content_parts.append(content)
+                        yield {"type": "token", "content": content}
+
+                    if chunk.get("done"):
+                        observe_generation(model, chunk)
+                        self.manager._record_chat(model, message, "".join(content_parts))
+                        yield self.manager._stream_stats(chunk, start_time, first_token_time)
+                        return
+
+                yield {"type": "error", "error": "Stream ended before the model finished responding"}
+        except asyncio.CancelledError:
+            logger.info(f"Client disconnected, cancelling generation for model {model}")
+            raise
+        except Exception as e:
+            if isinstance(e, httpx.TransportError):
+                error = e
+                OLLAMA_ERRORS.inc("/api/chat")
+            logger.error(f"Error in streaming chat: {str(e)}")
+            yield {"type": "error", "error": str(e)}
+        finally:
+            lease.done(error)
+
+    async def get_gpu_info(self) -> Dict[str, Any]:
+        """Get information about available GPUs without blocking the event loop
+
+        Returns:
+            Dict with GPU availability and information
+        """
+        return await asyncio.to_thread(self.manager.get_gpu_info)
+
+    async def close(self) -> None:
+        """Close pooled connections"""
+        await self.client.aclose()
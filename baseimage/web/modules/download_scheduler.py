@@ -0,0 +1,296 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Any, Tuple
+
+from modules.metrics import PULL_BYTES
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class DownloadJob:
+    """Progress and state of a single model pull"""
+
+    def __init__(self, model_name: str, priority: int = 0):
+        """Initialize the job
+
+        Args:
+            model_name: Name of the model to pull
+            priority: Higher values are started first
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.model_name = model_name
+        self.priority = priority
+        self.state = QUEUED
+        self.message = "Queued"
+        self.error: Optional[str] = None
+
+        # Ollama reports progress per layer, keyed by digest
+        self.layers: Dict[str, Tuple[int, int]] = {}
+        self.completed_bytes = 0
+        self.total_bytes = 0
+        self.rate_bps = 0.0
+
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self._rate_sample: Optional[Tuple[float, int]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for the API
+
+        Returns:
+            Dict with job state and progress
+        """
+        percent = None
+        eta_seconds = None
+        if self.total_bytes > 0:
+            percent = min(int(self.completed_bytes / self.total_bytes * 100), 100)
+            if self.state == RUNNING and self.rate_bps > 0:
+                eta_seconds = round((self.total_bytes - self.completed_bytes) / self.rate_bps, 1)
+
+        return {
+            "id": self.id,
+            "model": self.model_name,
+            "priority": self.priority,
+            "state": self.state,
+            "message": self.message,
+            "error": self.error,
+            "completed_bytes": self.completed_bytes,
+            "total_bytes": self.total_bytes,
+            "percent": percent,
+            "rate_bps": round(self.rate_bps, 1),
+            "eta_seconds": eta_seconds,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class DownloadScheduler:
+    """Priority queue of model pulls executed by a fixed pool of worker threads
+
+    Repeated requests for a model that is already queued or downloading return
+    the existing job instead of starting a second pull.
+    """
+
+    def __init__(
+        self,
+        pull_function: Callable[[DownloadJob], None],
+        parallelism: int = 2,
+        history_size: int = 50
+    ):
+        """Initialize the scheduler
+
+        Args:
+            pull_function: Called on a worker thread to perform a pull; reports
+                progress through update_progress/set_message and finishes the
+                job with complete() or fail()
+            parallelism: Number of pulls run at the same time
+            history_size: Number of finished jobs kept for listing
+        """
+        self.pull_function = pull_function
+        self.parallelism = max(1, parallelism)
+        self.history_size = history_size
+
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.queue: List[Tuple[int, int, DownloadJob]] = []
+        self.sequence = itertools.count()
+        self.jobs: "OrderedDict[str, DownloadJob]" = OrderedDict()
+        self.active_by_model: Dict[str, DownloadJob] = {}
+        self.workers: List[threading.Thread] = []
+        self.listeners: List[Callable[[DownloadJob], None]] = []
+
+    def add_listener(self, listener: Callable[[DownloadJob], None]) -> None:
+        """Register a callback invoked after every job change
+
+        Listeners run on the thread that changed the job, without the
+        scheduler lock held, so they may call back into the scheduler.
+
+        Args:
+            listener: Callable receiving the changed job
+        """
+        self.listeners.append(listener)
+
+    def submit(self, model_name: str, priority: int = 0) -> Tuple[DownloadJob, bool]:
+        """Queue a pull, or return the active job for the same model
+
+        Args:
+            model_name: Name of the model to pull
+            priority: Higher values are started first; FIFO within a priority
+
+        Returns:
+            Tuple of (job, created) where created is False for a duplicate request
+        """
+        with self.condition:
+            existing = self.active_by_model.get(model_name)
+            if existing is not None:
+                return existing, False
+
+            job = DownloadJob(model_name, priority)
+            self.jobs[job.id] = job
+            self.active_by_model[model_name] = job
+            heapq.heappush(self.queue, (-priority, next(self.sequence), job))
+            self._trim_history()
+            self._ensure_workers()
+            self.condition.notify()
+
+        logger.info(f"Queued pull of {model_name} as job {job.id} (priority {priority})")
+        self._notify(job)
+        return job, True
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job by ID
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            Job dict, or None if unknown
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """List active and recently finished jobs, newest first
+
+        Returns:
+            List of job dicts
+        """
+        with self.lock:
+            return [job.to_dict() for job in reversed(self.jobs.values())]
+
+    def set_message(self, job: DownloadJob, message: str) -> None:
+        """Update a job's status message
+
+        Args:
+            job: The job
+            message: Human-readable status
+        """
+        with self.lock:
+            job.message = message
+        self._notify(job)
+
+    def update_progress(self, job: DownloadJob, digest: str, completed: int, total: int) -> None:
+        """Record download progress for one layer of a job
+
+        Args:
+            job: The job
+            digest: Layer digest the progress refers to
+            completed: Bytes downloaded for the layer
+            total: Total size of the layer in bytes
+        """
+        now = time.monotonic()
+        with self.lock:
+            previous = job.layers.get(digest, (0, 0))[0]
+            job.layers[digest] = (completed, total)
+            job.completed_bytes = sum(done for done, _ in job.layers.values())
+            job.total_bytes = sum(size for _, size in job.layers.values())
+
+            # Exponential moving average of the download rate, sampled at most
+            # twice a second so bursts of tiny updates don't skew it
+            if job._rate_sample is None:
+                job._rate_sample = (now, job.completed_bytes)
+            else:
+                last_time, last_bytes = job._rate_sample
+                elapsed = now - last_time
+                if elapsed >= 0.5:
+                    rate = max(job.completed_bytes - last_bytes, 0) / elapsed
+                    job.rate_bps = rate if job.rate_bps == 0 else 0.3 * rate + 0.7 * job.rate_bps
+                    job._rate_sample = (now, job.completed_bytes)
+        if completed > previous:
+            PULL_BYTES.inc(job.model_name, amount=completed - previous)
+        self._notify(job)
+
+    def complete(self, job: DownloadJob, message: str) -> None:
+        """Mark a job as successfully finished
+
+        Args:
+            job: The job
+            message: Final status message
+        """
+        self._finish(job, COMPLETED, message)
+
+    def fail(self, job: DownloadJob, error: str) -> None:
+        """Mark a job as failed
+
+        Args:
+            job: The job
+            error: Error description
+        """
+        self._finish(job, FAILED, error, error)
+
+    def _finish(self, job: DownloadJob, state: str, message: str, error: Optional[str] = None) -> None:
+        with self.lock:
+            if job.state not in ACTIVE_STATES:
+                return
+            job.state = state
+            job.message = message
+            job.error = error
+            job.finished_at = time.time()
+            if self.active_by_model.get(job.model_name) is job:
+                del self.active_by_model[job.model_name]
+        self._notify(job)
+
+    def _trim_history(self) -> None:
+        """Drop the oldest finished jobs beyond history_size (lock held)"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.state not in ACTIVE_STATES]
+        for job_id in finished[:max(len(finished) - self.history_size, 0)]:
+            del self.jobs[job_id]
+
+    def _ensure_workers(self) -> None:
+        """Start worker threads on first use (lock held)"""
+        while len(self.workers) < self.parallelism:
+            worker = threading.Thread(
+                target=self._worker,
+                name=f"pull-worker-{len(self.workers)}",
+                daemon=True
+            )
+            self.workers.append(worker)
+            worker.start()
+
+    def _worker(self) -> None:
+        """Worker loop: take the highest priority job and run the pull"""
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                _, _, job = heapq.heappop(self.queue)
+                job.state = RUNNING
+                job.message = f"Starting download of {job.model_name}"
+                job.started_at = time.time()
+            self._notify(job)
+
+            try:
+                self.pull_function(job)
+            except Exception as e:
+                logger.error(f"Unhandled error pulling {job.model_name}: {str(e)}")
+                self.fail(job, f"Error installing {job.model_name}: {str(e)}")
+            finally:
+                # The pull function should always finish the job; never leave it running
+                if job.state == RUNNING:
+                    self.complete(job, f"Successfully installed {job.model_name}")
+
+    def _notify(self, job: DownloadJob) -> None:
+        """Call all listeners for a changed job (lock not held)"""
+        for listener in self.listeners:
+            try:
+                listener(job)
+            except Exception as e:
+                logger.error(f"Error in download listener: {str(e)}")
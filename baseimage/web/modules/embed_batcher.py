@@ -0,0 +1,167 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    """Texts collected for one upstream embed call"""
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.vectors: List[List[float]] = []
+        self.error: Optional[BaseException] = None
+
+
+class EmbedBatcher:
+    """Merge concurrent embedding requests for a model into batched Ollama calls
+
+    The first request for a model opens a batch and waits up to `max_wait`
+    seconds (less if the batch fills up) for others to join, then sends all
+    collected texts in one call and hands each caller its slice of the vectors.
+    At most `max_in_flight` calls per model are sent at a time; while a batch
+    waits for a free slot it stays open, so under load batches grow towards
+    max_batch_size instead of queueing upstream as many small calls.
+    """
+
+    def __init__(
+        self,
+        embed_function: Callable[[str, List[str]], List[List[float]]],
+        max_batch_size: int = 32,
+        max_wait: float = 0.005,
+        max_in_flight: int = 2
+    ):
+        """Initialize the batcher
+
+        Args:
+            embed_function: Called as embed_function(model, texts) to get vectors
+            max_batch_size: Maximum texts per upstream call (1 disables batching)
+            max_wait: Seconds the first request of a batch waits for others
+            max_in_flight: Concurrent upstream calls per model
+        """
+        self.embed_function = embed_function
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.max_in_flight = max(1, max_in_flight)
+
+        self.lock = threading.Lock()
+        self.open_batches: Dict[str, _Batch] = {}
+        self.slots: Dict[str, threading.Semaphore] = {}
+        self.counters = {
+            "requests": 0,
+            "texts": 0,
+            "batches": 0,
+            "full_batches": 0,
+            "errors": 0,
+            "upstream_seconds": 0.0
+        }
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        """Embed texts, sharing an upstream call with concurrent requests
+
+        Args:
+            model: Embedding model name
+            texts: Texts to embed
+
+        Returns:
+            One vector per text
+
+        Raises:
+            Exception: Whatever the upstream call raised for the batch
+        """
+        if not texts:
+            return []
+
+        with self.lock:
+            self.counters["requests"] += 1
+            batch = self.open_batches.get(model)
+            if batch is not None and len(batch.texts) + len(texts) > self.max_batch_size:
+                # No room left: send the open batch now and start a new one
+                del self.open_batches[model]
+                batch.full.set()
+                batch = None
+
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self.open_batches[model] = batch
+            offset = len(batch.texts)
+            batch.texts.extend(texts)
+
+            if len(batch.texts) >= self.max_batch_size:
+                if self.open_batches.get(model) is batch:
+                    del self.open_batches[model]
+                batch.full.set()
+
+        if leader:
+            self._run_batch(model, batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.vectors[offset:offset + len(texts)]
+
+    def _run_batch(self, model: str, batch: _Batch) -> None:
+        """Wait for the batch to fill or the window to pass, then send it"""
+        if not batch.full.is_set() and self.max_wait > 0:
+            batch.full.wait(self.max_wait)
+
+        with self.lock:
+            slots = self.slots.get(model)
+            if slots is None:
+                slots = self.slots[model] = threading.Semaphore(self.max_in_flight)
+        # Keep accepting joiners until an upstream slot is free (or the batch is full)
+        slots.acquire()
+
+        with self.lock:
+            if self.open_batches.get(model) is batch:
+                del self.open_batches[model]
+            texts = list(batch.texts)
+
+        start = time.perf_counter()
+        try:
+            vectors = self.embed_function(model, texts)
+            if len(vectors) != len(texts):
+                raise RuntimeError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+            batch.vectors = vectors
+        except Exception as e:
+            logger.error(f"Error embedding batch of {len(texts)} texts with {model}: {str(e)}")
+            batch.error = e
+        finally:
+            slots.release()
+            with self.lock:
+                self.counters["batches"] += 1
+                self.counters["texts"] += len(texts)
+                self.counters["upstream_seconds"] += time.perf_counter() - start
+                if len(texts) >= self.max_batch_size:
+                    self.counters["full_batches"] += 1
+                if batch.error is not None:
+                    self.counters["errors"] += 1
+            batch.done.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batching configuration and achieved batch sizes
+
+        Returns:
+            Dict with counters, mean batch size and fill ratio (mean batch size
+            relative to max_batch_size)
+        """
+        with self.lock:
+            stats = dict(self.counters)
+        batches = stats["batches"]
+        mean_batch_size = stats["texts"] / batches if batches else None
+        stats.update({
+            "upstream_seconds": round(stats["upstream_seconds"], 3),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_in_flight": self.max_in_flight,
+            "mean_batch_size": round(mean_batch_size, 2) if mean_batch_size else None,
+            "fill_ratio": round(mean_batch_size / self.max_batch_size, 3) if mean_batch_size else None
+        })
+        return stats
@@ -0,0 +1,115 @@
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """In-process publish/subscribe of the latest state per topic
+
+    Every publish bumps a global version number. Subscribers remember the last
+    version they saw and only wake up when a topic moves past it, so they never
+    receive the same state twice and can resume from a cursor after reconnecting.
+    Versions start over when the process restarts; a cursor ahead of the
+    current version is from before that and gets the current state.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.latest: Dict[str, Tuple[int, Any]] = {}
+
+    def publish(self, topic: str, data: Any) -> int:
+        """Publish the new state of a topic and wake up waiting subscribers
+
+        Args:
+            topic: Topic name
+            data: New state (must be JSON-serializable for the HTTP endpoints)
+
+        Returns:
+            Version assigned to this state
+        """
+        with self.condition:
+            self.version += 1
+            self.latest[topic] = (self.version, data)
+            self.condition.notify_all()
+            return self.version
+
+    def get(self, topic: str) -> Tuple[int, Any]:
+        """Get the latest state of a topic
+
+        Args:
+            topic: Topic name
+
+        Returns:
+            Tuple of (version, data); (0, None) if nothing was published yet
+        """
+        with self.condition:
+            return self.latest.get(topic, (0, None))
+
+    def wait_for_change(self, topic: str, since: int, timeout: float) -> Optional[Tuple[int, Any]]:
+        """Block until a topic has a version newer than `since`
+
+        Args:
+            topic: Topic name
+            since: Last version the caller has seen (ignored if ahead of the
+                current version, i.e. from before a restart)
+            timeout: Maximum seconds to wait
+
+        Returns:
+            Tuple of (version, data), or None on timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            if since > self.version:
+                since = 0
+            while True:
+                version, data = self.latest.get(topic, (0, None))
+                if version > since:
+                    return version, data
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+    def subscribe(
+        self,
+        topic: str,
+        since: int = 0,
+        min_interval: float = 0.5,
+        keepalive: float = 15.0
+    ) -> Iterator[Optional[Tuple[int, Any]]]:
+        """Iterate over changes of a topic, coalesced to a maximum rate
+
+        States published within `min_interval` of the previous delivery are
+        merged: only the newest one is delivered once the interval has passed.
+
+        Args:
+            topic: Topic name
+            since: Last version the caller has seen (0 delivers the current state)
+            min_interval: Minimum seconds between two deliveries
+            keepalive: Yield None after this many idle seconds so callers can
+                send a heartbeat and notice disconnected clients
+
+        Yields:
+            (version, data) tuples, or None as a keepalive tick
+        """
+        last_sent = 0.0
+        while True:
+            change = self.wait_for_change(topic, since, keepalive)
+            if change is None:
+                yield None
+                continue
+
+            # Coalesce bursts: wait out the interval, then take the newest state
+            delay = last_sent + min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+                change = self.get(topic)
+
+            since = change[0]
+            last_sent = time.monotonic()
+            yield change
@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from modules.metrics import SUBPROCESS_SPAWNS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Fields requested from nvidia-smi, in output order
+NVIDIA_FIELDS = ["index", "name", "memory.total", "memory.used", "temperature.gpu", "utilization.gpu"]
+
+
+def _to_float(value: Any) -> Optional[float]:
+    """Parse a number from vendor tool output, None for N/A and the like"""
+    try:
+        return float(str(value).strip().split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def _lookup(values: Dict[str, Any], *prefixes: str) -> Any:
+    """Find the first value whose key starts with one of the prefixes (case-insensitive)
+
+    rocm-smi key names differ slightly between versions, e.g. "Card series"
+    vs "Card Series" or "Temperature (Sensor edge) (C)" vs "Temperature (Sensor junction) (C)".
+    """
+    for prefix in prefixes:
+        for key, value in values.items():
+            if key.lower().startswith(prefix.lower()):
+                return value
+    return None
+
+
+class GpuSampler:
+    """Background GPU telemetry sampler with a fixed-size history per device
+
+    Each tick runs at most one nvidia-smi and one rocm-smi process, covering
+    all devices of that vendor. Tools are looked up on PATH every tick, so fake
+    nvidia-smi/rocm-smi scripts can stand in for real hardware.
+    """
+
+    def __init__(
+        self,
+        interval: float = 5.0,
+        history_size: int = 720,
+        nvidia_smi: str = "nvidia-smi",
+        rocm_smi: str = "rocm-smi"
+    ):
+        """Initialize the sampler
+
+        Args:
+            interval: Seconds between samples
+            history_size: Samples kept per device (720 at 5s = one hour)
+            nvidia_smi: Name or path of the nvidia-smi executable
+            rocm_smi: Name or path of the rocm-smi executable
+        """
+        self.interval = interval
+        self.history_size = history_size
+        self.nvidia_smi = nvidia_smi
+        self.rocm_smi = rocm_smi
+
+        self.lock = threading.Lock()
+        self.latest: Optional[Dict[str, Any]] = None
+        self.latest_time = 0.0
+        self.history: Dict[str, Deque[Dict[str, Any]]] = {}
+        self.device_names: Dict[str, str] = {}
+
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the background thread is sampling"""
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self) -> None:
+        """Start sampling in a background thread"""
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="gpu-sampler", daemon=True)
+        self.thread.start()
+        logger.info(f"GPU sampler started (interval {self.interval}s, history {self.history_size} samples)")
+
+    def stop(self) -> None:
+        """Stop the background thread"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self) -> None:
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Error sampling GPU telemetry: {str(e)}")
+            self.stop_event.wait(max(self.interval - (time.monotonic() - started), 0))
+
+    def get_latest(self) -> Optional[Dict[str, Any]]:
+        """Get the most recent sample
+
+        Returns:
+            GPU info dict in the /api/system/gpu format, or None before the first sample
+        """
+        with self.lock:
+            return self.latest
+
+    def get_history(self, device: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Get the sample history per device
+
+        Args:
+            device: Only return this device key (e.g. "nvidia:0", "amd:card0")
+            limit: Only return the newest N samples per device
+
+        Returns:
+            Dict with the sampling interval and, per device, its name and samples
+        """
+        with self.lock:
+            devices = {}
+            for key, samples in self.history.items():
+                if device is not None and key != device:
+                    continue
+                points = list(samples)
+                if limit:
+                    points = points[-limit:]
+                devices[key] = {"name": self.device_names.get(key, key), "samples": points}
+        return {"interval": self.interval, "history_size": self.history_size, "devices": devices}
+
+    def sample(self) -> Dict[str, Any]:
+        """Probe all vendors once, record the result and return it
+
+        Returns:
+            GPU info dict in the /api/system/gpu format
+        """
+        gpu_info: Dict[str, Any] = {"gpu_available": False}
+        points: List[Dict[str, Any]] = []
+
+        nvidia_gpus = self._sample_nvidia(points)
+        gpu_info["nvidia_available"] = bool(nvidia_gpus)
+        if nvidia_gpus:
+            gpu_info["nvidia_gpus"] = nvidia_gpus
+            gpu_info["gpu_available"] = True
+
+        amd_gpus = self._sample_amd(points)
+        gpu_info["amd_available"] = bool(amd_gpus)
+        if amd_gpus:
+            gpu_info["amd_gpus"] = amd_gpus
+            gpu_info["gpu_available"] = True
+
+        now = time.time()
+        with self.lock:
+            self.latest = gpu_info
+            self.latest_time = now
+            for key, name, point in points:
+                self.device_names[key] = name
+                history = self.history.get(key)
+                if history is None:
+                    history = self.history[key] = deque(maxlen=self.history_size)
+                history.append(dict(point, t=now))
+        return gpu_info
+
+    def _run_tool(self, command: List[str]) -> Optional[str]:
+        """Run a vendor tool if it is on PATH
+
+        Returns:
+            Its stdout, or None if it is missing or failed
+        """
+        if shutil.which(command[0]) is None:
+            return None
+        SUBPROCESS_SPAWNS.inc(os.path.basename(command[0]))
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=5)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.debug(f"{command[0]} failed: {str(e)}")
+            return None
+        if result.returncode != 0 or not result.stdout.strip():
+            return None
+        return result.stdout
+
+    def _sample_nvidia(self, points: List) -> List[Dict[str, Any]]:
+        """Query all NVIDIA GPUs with a single nvidia-smi call
+
+        Args:
+            points: Receives (device key, name, history point) tuples
+
+        Returns:
+            List of GPU dicts, empty if there are none
+        """
+        output = self._run_tool([
+            self.nvidia_smi,
+            f"--query-gpu={','.join(NVIDIA_FIELDS)}",
+            "--format=csv,noheader,nounits"
+        ])
+        if output is None:
+            return []
+
+        gpus = []
+        for line in output.strip().split('\n'):
+            parts = [part.strip() for part in line.split(',')]
+            if len(parts) < len(NVIDIA_FIELDS):
+                continue
+            index, name, memory_total, memory_used, temperature, utilization = parts[:6]
+            memory_total_mb = _to_float(memory_total)
+            memory_used_mb = _to_float(memory_used)
+            temperature_c = _to_float(temperature)
+            utilization_percent = _to_float(utilization)
+
+            # Values a GPU doesn't report come as [N/A] or [Not Supported]
+            gpus.append({
+                "index": index,
+                "name": name,
+                "memory_total": f"{memory_total} MiB" if memory_total_mb is not None else None,
+                "memory_used": f"{memory_used} MiB" if memory_used_mb is not None else None,
+                "temperature": temperature if temperature_c is not None else None,
+                "utilization": f"{utilization} %" if utilization_percent is not None else None,
+                "memory_total_mb": memory_total_mb,
+                "memory_used_mb": memory_used_mb,
+                "temperature_c": temperature_c,
+                "utilization_percent": utilization_percent
+            })
+            points.append((f"nvidia:{index}", name, {
+                "utilization_percent": utilization_percent,
+                "memory_used_mb": memory_used_mb,
+                "memory_total_mb": memory_total_mb,
+                "temperature_c": temperature_c
+            }))
+        return gpus
+
+    def _sample_amd(self, points: List) -> List[Dict[str, Any]]:
+        """Query all AMD GPUs with a single rocm-smi call
+
+        Args:
+            points: Receives (device key, name, history point) tuples
+
+        Returns:
+            List of GPU dicts, empty if there are none
+        """
+        output = self._run_tool([
+            self.rocm_smi,
+            "--showmeminfo", "vram",
+            "--showproductname",
+            "--showuse",
+            "--showtemp",
+            "--json"
+        ])
+        if output is None:
+            return []
+
+        try:
+            cards = json.loads(output)
+        except json.JSONDecodeError:
+            logger.warning("Could not parse rocm-smi JSON output")
+            return []
+
+        gpus = []
+        for device_id, values in sorted(cards.items()):
+            if not device_id.lower().startswith("card") or not isinstance(values, dict):
+                continue
+
+            name = _lookup(values, "Card series", "Card model", "Device Name") or f"AMD GPU {device_id}"
+            memory_total = _to_float(_lookup(values, "VRAM Total Memory"))
+            memory_used = _to_float(_lookup(values, "VRAM Total Used Memory"))
+            memory_total_mb = memory_total / (1024 * 1024) if memory_total is not None else None
+            memory_used_mb = memory_used / (1024 * 1024) if memory_used is not None else None
+            temperature_c = _to_float(_lookup(values, "Temperature (Sensor edge)", "Temperature"))
+            utilization_percent = _to_float(_lookup(values, "GPU use"))
+
+            gpus.append({
+                "name": name,
+                "device_id": device_id,
+                "memory_total": f"{memory_total_mb:.0f} MiB" if memory_total_mb is not None else "Unknown",
+                "memory_used": f"{memory_used_mb:.0f} MiB" if memory_used_mb is not None else "Unknown",
+                "temperature": f"{temperature_c:.0f}" if temperature_c is not None else None,
+                "utilization": f"{utilization_percent:.0f} %" if utilization_percent is not None else None,
+                "memory_total_mb": memory_total_mb,
+                "memory_used_mb": memory_used_mb,
+                "temperature_c": temperature_c,
+                "utilization_percent": utilization_percent
+            })
+            points.append((f"amd:{device_id}", name, {
+                "utilization_percent": utilization_percent,
+                "memory_used_mb": memory_used_mb,
+                "memory_total_mb": memory_total_mb,
+                "temperature_c": temperature_c
+            }))
+        return gpus
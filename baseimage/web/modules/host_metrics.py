@@ -0,0 +1,258 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Columns of a cpu line in /proc/stat, in order
+CPU_FIELDS = ["user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal"]
+
+# cgroup v1 reports "no limit" as a huge page-aligned number instead of "max"
+CGROUP_V1_UNLIMITED = 1 << 62
+
+
+def _read_file(path: str) -> Optional[str]:
+    """Read a small pseudo-file, None if it does not exist or is unreadable"""
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _read_int(path: str) -> Optional[int]:
+    """Read a pseudo-file holding a single integer"""
+    content = _read_file(path)
+    if content is None:
+        return None
+    try:
+        return int(content.strip())
+    except ValueError:
+        return None
+
+
+def _read_keyed(path: str) -> Dict[str, int]:
+    """Read a "key value" per line pseudo-file such as cpu.stat"""
+    values = {}
+    for line in (_read_file(path) or "").splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            values[parts[0]] = int(parts[1])
+    return values
+
+
+class HostMetrics:
+    """CPU, memory, load and container limits read straight from /proc and cgroupfs
+
+    Per-core utilization is computed from the /proc/stat counter deltas between
+    two samples. Samples taken within `min_interval` of each other return the
+    previous result, so frequent callers don't shrink the measuring window.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 1.0,
+        proc_root: str = "/proc",
+        cgroup_root: str = "/sys/fs/cgroup"
+    ):
+        """Initialize the collector
+
+        Args:
+            min_interval: Minimum seconds between two measurements
+            proc_root: Mount point of procfs
+            cgroup_root: Mount point of cgroupfs
+        """
+        self.min_interval = min_interval
+        self.proc_root = proc_root
+        self.cgroup_root = cgroup_root
+        self.cgroup_version = 2 if os.path.exists(os.path.join(cgroup_root, "cgroup.controllers")) else 1
+
+        self.lock = threading.Lock()
+        self.cpu_info: Optional[Dict[str, Any]] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.last_time = 0.0
+        self.previous_cpu: Dict[str, List[int]] = {}
+        self.previous_cgroup_usage: Optional[Tuple[float, int]] = None
+
+    def get_cpu_info(self) -> Dict[str, Any]:
+        """Get the CPU model and logical core count (read once, it doesn't change)
+
+        Returns:
+            Dict with model and cores
+        """
+        if self.cpu_info is None:
+            cpu_model = "Unknown CPU"
+            cpu_cores = 0
+            for line in (_read_file(os.path.join(self.proc_root, "cpuinfo")) or "").splitlines():
+                if line.startswith('model name') and cpu_model == "Unknown CPU":
+                    cpu_model = line.split(':', 1)[1].strip()
+                if line.startswith('processor'):
+                    cpu_cores += 1
+            self.cpu_info = {"model": cpu_model, "cores": cpu_cores or os.cpu_count() or "Unknown"}
+        return self.cpu_info
+
+    def sample(self) -> Dict[str, Any]:
+        """Measure host metrics, or return the last result if it is recent enough
+
+        Returns:
+            Dict with cpu, memory, load and cgroup sections
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.last_result is not None and now - self.last_time < self.min_interval:
+                return self.last_result
+
+            result = {
+                "timestamp": time.time(),
+                "interval": round(now - self.last_time, 3) if self.last_time else None,
+                "cpu": self._sample_cpu(),
+                "memory": self._read_meminfo(),
+                "load": self._read_loadavg(),
+                "cgroup": self._read_cgroup(now)
+            }
+            self.last_result = result
+            self.last_time = now
+            return result
+
+    def _sample_cpu(self) -> Dict[str, Any]:
+        """Compute total and per-core utilization since the previous sample (lock held)
+
+        The first sample covers the time since boot.
+        """
+        current: Dict[str, List[int]] = {}
+        for line in (_read_file(os.path.join(self.proc_root, "stat")) or "").splitlines():
+            if not line.startswith("cpu"):
+                break
+            parts = line.split()
+            current[parts[0]] = [int(value) for value in parts[1:len(CPU_FIELDS) + 1]]
+
+        cores = []
+        total = None
+        for name, counters in current.items():
+            previous = self.previous_cpu.get(name, [0] * len(counters))
+            deltas = [max(now - before, 0) for now, before in zip(counters, previous)]
+            elapsed = sum(deltas)
+            usage = {"name": name, "utilization_percent": None}
+            if elapsed > 0:
+                # idle + iowait count as idle time
+                idle = deltas[3] + (deltas[4] if len(deltas) > 4 else 0)
+                usage["utilization_percent"] = round((elapsed - idle) / elapsed * 100, 1)
+                for field, delta in zip(CPU_FIELDS, deltas):
+                    usage[f"{field}_percent"] = round(delta / elapsed * 100, 1)
+            if name == "cpu":
+                total = usage
+            else:
+                cores.append(usage)
+        self.previous_cpu = current
+
+        cpu = dict(self.get_cpu_info())
+        cpu["total"] = total
+        cpu["per_core"] = cores
+        return cpu
+
+    def _read_meminfo(self) -> Dict[str, Any]:
+        """Read memory and swap usage from /proc/meminfo, in bytes"""
+        values = {}
+        for line in (_read_file(os.path.join(self.proc_root, "meminfo")) or "").splitlines():
+            key, _, rest = line.partition(":")
+            parts = rest.split()
+            if parts and parts[0].isdigit():
+                values[key] = int(parts[0]) * 1024
+
+        total = values.get("MemTotal")
+        available = values.get("MemAvailable", values.get("MemFree"))
+        memory = {
+            "total_bytes": total,
+            "available_bytes": available,
+            "free_bytes": values.get("MemFree"),
+            "cached_bytes": values.get("Cached"),
+            "swap_total_bytes": values.get("SwapTotal"),
+            "swap_free_bytes": values.get("SwapFree"),
+            "used_percent": None
+        }
+        if total and available is not None:
+            memory["used_bytes"] = total - available
+            memory["used_percent"] = round((total - available) / total * 100, 1)
+        return memory
+
+    def _read_loadavg(self) -> Dict[str, Any]:
+        """Read load averages and task counts from /proc/loadavg"""
+        parts = (_read_file(os.path.join(self.proc_root, "loadavg")) or "").split()
+        if len(parts) < 4:
+            return {}
+        running, _, total = parts[3].partition("/")
+        return {
+            "load1": float(parts[0]),
+            "load5": float(parts[1]),
+            "load15": float(parts[2]),
+            "running_tasks": int(running),
+            "total_tasks": int(total)
+        }
+
+    def _read_cgroup(self, now: float) -> Dict[str, Any]:
+        """Read the CPU and memory limits of the container (lock held)"""
+        if self.cgroup_version == 2:
+            cgroup = self._read_cgroup_v2()
+        else:
+            cgroup = self._read_cgroup_v1()
+        cgroup["version"] = self.cgroup_version
+
+        # CPU usage of the whole cgroup in cores, from its cumulative usage counter
+        usage_usec = cgroup.pop("usage_usec", None)
+        cgroup["cpu_usage_cores"] = None
+        if usage_usec is not None:
+            if self.previous_cgroup_usage is not None:
+                last_time, last_usage = self.previous_cgroup_usage
+                elapsed = now - last_time
+                if elapsed > 0:
+                    cgroup["cpu_usage_cores"] = round(max(usage_usec - last_usage, 0) / 1e6 / elapsed, 2)
+            self.previous_cgroup_usage = (now, usage_usec)
+
+        limit = cgroup.get("memory_limit_bytes")
+        usage = cgroup.get("memory_usage_bytes")
+        cgroup["memory_used_percent"] = round(usage / limit * 100, 1) if limit and usage is not None else None
+        return cgroup
+
+    def _read_cgroup_v2(self) -> Dict[str, Any]:
+        """Read limits from the unified (v2) hierarchy"""
+        root = self.cgroup_root
+        cpu_limit = None
+        cpu_max = (_read_file(os.path.join(root, "cpu.max")) or "").split()
+        if len(cpu_max) == 2 and cpu_max[0] != "max":
+            cpu_limit = int(cpu_max[0]) / int(cpu_max[1])
+
+        memory_max = (_read_file(os.path.join(root, "memory.max")) or "").strip()
+        cpu_stat = _read_keyed(os.path.join(root, "cpu.stat"))
+        return {
+            "cpu_limit_cores": round(cpu_limit, 2) if cpu_limit else None,
+            "cpu_throttled_periods": cpu_stat.get("nr_throttled"),
+            "usage_usec": cpu_stat.get("usage_usec"),
+            "memory_limit_bytes": int(memory_max) if memory_max.isdigit() else None,
+            "memory_usage_bytes": _read_int(os.path.join(root, "memory.current"))
+        }
+
+    def _read_cgroup_v1(self) -> Dict[str, Any]:
+        """Read limits from the per-controller (v1) hierarchies"""
+        root = self.cgroup_root
+        cpu_limit = None
+        quota = _read_int(os.path.join(root, "cpu", "cpu.cfs_quota_us"))
+        period = _read_int(os.path.join(root, "cpu", "cpu.cfs_period_us"))
+        if quota and quota > 0 and period:
+            cpu_limit = quota / period
+
+        memory_limit = _read_int(os.path.join(root, "memory", "memory.limit_in_bytes"))
+        if memory_limit is not None and memory_limit >= CGROUP_V1_UNLIMITED:
+            memory_limit = None
+
+        usage_ns = _read_int(os.path.join(root, "cpuacct", "cpuacct.usage"))
+        cpu_stat = _read_keyed(os.path.join(root, "cpu", "cpu.stat"))
+        return {
+            "cpu_limit_cores": round(cpu_limit, 2) if cpu_limit else None,
+            "cpu_throttled_periods": cpu_stat.get("nr_throttled"),
+            "usage_usec": usage_ns // 1000 if usage_ns is not None else None,
+            "memory_limit_bytes": memory_limit,
+            "memory_usage_bytes": _read_int(os.path.join(root, "memory", "memory.usage_in_bytes"))
+        }
@@ -0,0 +1,194 @@
+import os
+import logging
+import threading
+from typing import Dict, Tuple, Optional, Any
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from modules.metrics import OLLAMA_ERRORS, observe_upstream
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds per endpoint type. The read timeout is the
+# maximum wait between bytes, not the total duration of a streamed response.
+DEFAULT_TIMEOUTS = {
+    "metadata": (3.05, 30),   # /api/tags, /api/ps, /api/show, /api/version
+    "chat": (5, 300),         # /api/chat, /api/generate
+    "embed": (5, 120),        # /api/embed
+    "pull": (5, 3600),        # /api/pull progress stream
+    "delete": (3.05, 60)      # /api/delete
+}
+
+# Methods that are safe to retry automatically
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "DELETE"])
+
+
+def timeouts_from_env(defaults: Optional[Dict[str, Tuple[float, float]]] = None) -> Dict[str, Tuple[float, float]]:
+    """Build the timeout table, overridden by OLLAMA_TIMEOUT_<TYPE>=connect,read
+
+    Args:
+        defaults: Base timeout table (default: DEFAULT_TIMEOUTS)
+
+    Returns:
+        Dict mapping endpoint type to a (connect, read) tuple
+    """
+    timeouts = dict(defaults or DEFAULT_TIMEOUTS)
+    for kind in list(timeouts):
+        value = os.getenv(f"OLLAMA_TIMEOUT_{kind.upper()}")
+        if not value:
+            continue
+        try:
+            connect, read = (float(part) for part in value.split(','))
+            timeouts[kind] = (connect, read)
+        except ValueError:
+            logger.warning(f"Ignoring invalid OLLAMA_TIMEOUT_{kind.upper()}={value!r}, expected 'connect,read'")
+    return timeouts
+
+
+def request_model(payload: Any) -> Optional[str]:
+    """Model named in an Ollama request body, for per-model metrics"""
+    if isinstance(payload, dict):
+        return payload.get("model") or payload.get("name")
+    return None
+
+
+class OllamaTransport:
+    """Shared keep-alive HTTP transport for all calls to an Ollama server"""
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+        hosts: int = 1,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5
+    ):
+        """Initialize the transport
+
+        Args:
+            pool_size: Maximum number of pooled connections kept per host
+            hosts: Number of Ollama servers called; each keeps its own pool
+            timeouts: (connect, read) timeouts per endpoint type
+            max_retries: Retries for idempotent calls on connection errors and 502/503/504
+            backoff_factor: Exponential backoff factor between retries, in seconds
+        """
+        self.pool_size = pool_size
+        # urllib3 drops the least recently used host pool beyond this, which
+        # would close the keep-alive connections of servers rotated through
+        self.pool_connections = max(4, hosts)
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+
+        # urllib3 only retries methods in allowed_methods, so chat/pull POSTs
+        # are never replayed against the server
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self.lock = threading.Lock()
+        self.endpoint_stats: Dict[str, Dict[str, int]] = {}
+
+    def request(self, method: str, url: str, endpoint_type: str = "metadata", **kwargs) -> requests.Response:
+        """Send a request through the pooled session
+
+        Args:
+            method: HTTP method
+            url: Full request URL
+            endpoint_type: Key into the timeout table (metadata, chat, embed, pull, delete)
+            **kwargs: Passed through to requests.Session.request
+
+        Returns:
+            The response object
+        """
+        kwargs.setdefault("timeout", self.timeouts.get(endpoint_type, DEFAULT_TIMEOUTS["metadata"]))
+
+        with self.lock:
+            stats = self.endpoint_stats.setdefault(endpoint_type, {"requests": 0, "errors": 0})
+            stats["requests"] += 1
+
+        path = urlsplit(url).path
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self.lock:
+                self.endpoint_stats[endpoint_type]["errors"] += 1
+            OLLAMA_ERRORS.inc(path)
+            raise
+        # elapsed is the time to the response headers, also for streamed responses
+        observe_upstream(path, request_model(kwargs.get("json")), response.elapsed.total_seconds())
+        return response
+
+    def get(self, url: str, endpoint_type: str = "metadata", **kwargs) -> requests.Response:
+        """Send a GET request"""
+        return self.request("GET", url, endpoint_type, **kwargs)
+
+    def post(self, url: str, endpoint_type: str = "chat", **kwargs) -> requests.Response:
+        """Send a POST request"""
+        return self.request("POST", url, endpoint_type, **kwargs)
+
+    def delete(self, url: str, endpoint_type: str = "delete", **kwargs) -> requests.Response:
+        """Send a DELETE request"""
+        return self.request("DELETE", url, endpoint_type, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get connection reuse statistics
+
+        Returns:
+            Dict with request and connection counts overall, per host and per endpoint type
+        """
+        pools = []
+        total_requests = 0
+        total_connections = 0
+
+        pool_manager = self.adapter.poolmanager
+        for key in list(pool_manager.pools.keys()):
+            pool = pool_manager.pools.get(key)
+            if pool is None:
+                continue
+            total_requests += pool.num_requests
+            total_connections += pool.num_connections
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "requests": pool.num_requests,
+                "connections_opened": pool.num_connections,
+                # The pool queue is pre-filled with None placeholders
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0
+            })
+
+        with self.lock:
+            by_endpoint = {kind: dict(stats) for kind, stats in self.endpoint_stats.items()}
+
+        return {
+            "pool_size": self.pool_size,
+            "pool_connections": self.pool_connections,
+            "requests": total_requests,
+            "connections_opened": total_connections,
+            "connections_reused": max(total_requests - total_connections, 0),
+            "reuse_ratio": round(1 - total_connections / total_requests, 3) if total_requests else 0.0,
+            "timeouts": {kind: list(value) for kind, value in self.timeouts.items()},
+            "pools": pools,
+            "by_endpoint": by_endpoint
+        }
+
+    def close(self) -> None:
+        """Close all pooled connections"""
+        self.session.close()
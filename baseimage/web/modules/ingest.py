@@ -0,0 +1,759 @@
+"""Streaming document ingestion into Weaviate
+
+Files are read, chunked, embedded with an Ollama embedding model and imported
+into a Weaviate collection by four stages running on their own threads and
+connected by bounded queues, so memory use does not grow with the corpus.
+A checkpoint of content hashes makes re-runs skip unchanged documents and lets
+an interrupted run resume where it stopped.
+
+Run from the web app directory:
+    python -m modules.ingest docs/ notes.jsonl --collection Document
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import hashlib
+import logging
+import argparse
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# File types read by the pipeline
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown")
+JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+
+# Marks the end of a stage's output
+_DONE = object()
+
+# Namespace for deterministic chunk object IDs, so re-imports overwrite
+CHUNK_NAMESPACE = uuid.UUID("6f1d2c1e-8a4b-4c3e-9f57-2b7d1e0a9c11")
+
+
+def iter_documents(paths: List[str], text_field: str = "text") -> Iterator[Tuple[str, str, str]]:
+    """Walk files and directories and yield their documents
+
+    Text and Markdown files are one document each; every line of a JSONL file
+    is a document whose text is `text_field` and whose ID is its "id" field
+    (or the line number).
+
+    Args:
+        paths: Files or directories
+        text_field: JSONL field holding the text
+
+    Yields:
+        Tuples of (document ID, source path, text)
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            files = []
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files += [os.path.join(root, name) for name in sorted(names)]
+        else:
+            files = [path]
+
+        for file_path in files:
+            extension = os.path.splitext(file_path)[1].lower()
+            if extension in TEXT_EXTENSIONS:
+                with open(file_path, encoding="utf-8", errors="replace") as f:
+                    yield os.path.abspath(file_path), file_path, f.read()
+            elif extension in JSONL_EXTENSIONS:
+                with open(file_path, encoding="utf-8", errors="replace") as f:
+                    for line_number, line in enumerate(f, 1):
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            logger.warning(f"Skipping invalid JSON in {file_path} line {line_number}")
+                            continue
+                        text = record.get(text_field)
+                        if not isinstance(text, str):
+                            continue
+                        doc_id = str(record.get("id", f"{os.path.abspath(file_path)}:{line_number}"))
+                        yield doc_id, file_path, text
+
+
+def chunk_text(text: str, chunk_size: int = 1500, overlap: int = 200) -> List[str]:
+    """Split text into chunks of at most `chunk_size` characters
+
+    Paragraphs are kept together where possible; a paragraph longer than a
+    chunk is split with `overlap` characters repeated between pieces.
+
+    Args:
+        text: Document text
+        chunk_size: Maximum characters per chunk
+        overlap: Characters shared by consecutive pieces of a split paragraph
+
+    Returns:
+        List of chunks
+    """
+    step = max(chunk_size - overlap, 1)
+    chunks = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > chunk_size:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks += [paragraph[start:start + chunk_size] for start in range(0, len(paragraph) - overlap, step)]
+        elif current and len(current) + len(paragraph) + 2 > chunk_size:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class Checkpoint:
+    """Content hashes of fully imported documents, persisted as JSON"""
+
+    def __init__(self, path: Optional[str], save_interval: float = 2.0):
+        """Load the checkpoint file if it exists
+
+        Args:
+            path: Checkpoint file, None to keep the checkpoint in memory only
+            save_interval: Minimum seconds between two saves
+        """
+        self.path = path
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.hashes: Dict[str, str] = {}
+        self.dirty = False
+        self.last_save = 0.0
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.hashes = json.load(f).get("documents", {})
+            logger.info(f"Resuming from checkpoint {path} ({len(self.hashes)} documents)")
+
+    def get(self, doc_id: str) -> Optional[str]:
+        """Get the imported content hash of a document"""
+        with self.lock:
+            return self.hashes.get(doc_id)
+
+    def mark_done(self, doc_id: str, content_hash: str) -> None:
+        """Record a document as imported, saving at most every save_interval seconds"""
+        with self.lock:
+            self.hashes[doc_id] = content_hash
+            self.dirty = True
+        if time.monotonic() - self.last_save >= self.save_interval:
+            self.save()
+
+    def save(self) -> None:
+        """Write the checkpoint atomically"""
+        with self.lock:
+            if not self.dirty or not self.path:
+                return
+            data = json.dumps({"documents": self.hashes})
+            self.dirty = False
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(data)
+        os.replace(temporary, self.path)
+        self.last_save = time.monotonic()
+
+
+class WeaviateSink:
+    """Imports chunk objects into a Weaviate collection with the batch API"""
+
+    def __init__(self, url: str = "http://127.0.0.1:8081", class_name: str = "Document", timeout: float = 60.0):
+        """Initialize the sink and create the collection if needed
+
+        Args:
+            url: Weaviate base URL
+            class_name: Target collection
+            timeout: Seconds per Weaviate request
+        """
+        self.url = url.rstrip("/")
+        self.class_name = class_name
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._ensure_class()
+
+    def _ensure_class(self) -> None:
+        """Create the collection unless it exists"""
+        response = self.session.get(f"{self.url}/v1/schema/{self.class_name}", timeout=self.timeout)
+        if response.status_code == 200:
+            return
+        schema = {
+            "class": self.class_name,
+            "description": "Document chunks imported by the ingestion pipeline",
+            "vectorizer": "none",
+            "vectorIndexConfig": {"distance": "cosine"},
+            "properties": [
+                {"name": "docId", "dataType": ["text"], "tokenization": "field"},
+                {"name": "source", "dataType": ["text"], "tokenization": "field"},
+                {"name": "chunkIndex", "dataType": ["int"]},
+                {"name": "text", "dataType": ["text"]},
+                {"name": "contentHash", "dataType": ["text"], "tokenization": "field"}
+            ]
+        }
+        response = self.session.post(f"{self.url}/v1/schema", json=schema, timeout=self.timeout)
+        response.raise_for_status()
+        logger.info(f"Created Weaviate collection {self.class_name}")
+
+    def delete_document(self, doc_id: str) -> None:
+        """Delete all chunks of a document (before re-importing a changed one)"""
+        response = self.session.delete(
+            f"{self.url}/v1/batch/objects",
+            json={
+                "match": {
+                    "class": self.class_name,
+                    "where": {"path": ["docId"], "operator": "Equal", "valueText": doc_id}
+                }
+            },
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+
+    def write(self, objects: List[Dict[str, Any]]) -> None:
+        """Import a batch of objects
+
+        Raises:
+            RuntimeError: If Weaviate rejected any object
+        """
+        for obj in objects:
+            obj["class"] = self.class_name
+        response = self.session.post(f"{self.url}/v1/batch/objects", json={"objects": objects}, timeout=self.timeout)
+        response.raise_for_status()
+        for result in response.json():
+            errors = (result.get("result") or {}).get("errors")
+            if errors:
+                raise RuntimeError(f"Weaviate rejected object {result.get('id')}: {errors}")
+
+
+class NullSink:
+    """Discards objects; for dry runs measuring chunking and embedding"""
+
+    def delete_document(self, doc_id: str) -> None:
+        pass
+
+    def write(self, objects: List[Dict[str, Any]]) -> None:
+        pass
+
+
+class _Stage:
+    """Throughput and queue depth counters of one pipeline stage"""
+
+    def __init__(self, name: str, output: Optional[queue.Queue]):
+        self.name = name
+        self.output = output
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.monotonic()
+        elapsed = end - self.started_at if self.started_at else 0
+        stats = {
+            "items": self.items,
+            "items_per_second": round(self.items / elapsed, 1) if elapsed > 0 else None,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "running": self.started_at is not None and self.finished_at is None
+        }
+        if self.output is not None:
+            stats["queue_depth"] = self.output.qsize()
+            stats["queue_capacity"] = self.output.maxsize
+            stats["max_queue_depth"] = self.max_queue_depth
+        return stats
+
+
+class IngestPipeline:
+    """Read -> chunk -> embed -> import pipeline over bounded queues
+
+    Every document is hashed; documents whose hash matches the checkpoint are
+    skipped. A document is added to the checkpoint once all of its chunks have
+    been imported, so a crashed run only redoes unfinished documents. Chunk
+    object IDs are derived from the document ID and chunk index, so redone
+    chunks overwrite rather than duplicate.
+    """
+
+    def __init__(
+        self,
+        paths: List[str],
+        embed_function: Callable[[str, List[str]], List[List[float]]],
+        sink: Any,
+        checkpoint: Checkpoint,
+        embed_model: str = "nomic-embed-text:latest",
+        chunk_size: int = 1500,
+        chunk_overlap: int = 200,
+        embed_batch_size: int = 32,
+        write_batch_size: int = 100,
+        queue_size: int = 256,
+        text_field: str = "text"
+    ):
+        """Initialize the pipeline
+
+        Args:
+            paths: Files or directories to ingest
+            embed_function: Called as embed_function(model, texts) to get vectors
+            sink: WeaviateSink or NullSink
+            checkpoint: Checkpoint of imported documents
+            embed_model: Ollama embedding model
+            chunk_size: Maximum characters per chunk
+            chunk_overlap: Characters repeated between pieces of a long paragraph
+            embed_batch_size: Chunks per embedding call
+            write_batch_size: Objects per Weaviate batch import
+            queue_size: Capacity of each queue between stages
+            text_field: JSONL field holding the document text
+        """
+        self.paths = paths
+        self.embed_function = embed_function
+        self.sink = sink
+        self.checkpoint = checkpoint
+        self.embed_model = embed_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.text_field = text_field
+
+        self.documents: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.chunks: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.vectors: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stages = {
+            "read": _Stage("read", self.documents),
+            "chunk": _Stage("chunk", self.chunks),
+            "embed": _Stage("embed", self.vectors),
+            "write": _Stage("write", None)
+        }
+
+        self.lock = threading.Lock()
+        self.counts = {"documents": 0, "unchanged": 0, "empty": 0, "imported": 0, "chunks": 0}
+        self.stop_event = threading.Event()
+        self.error: Optional[str] = None
+
+    def run(self) -> Dict[str, Any]:
+        """Run all stages to completion
+
+        Returns:
+            Final statistics, see get_stats
+
+        Raises:
+            RuntimeError: If a stage failed
+        """
+        threads = [
+            threading.Thread(target=self._run_stage, args=(name, target), name=f"ingest-{name}", daemon=True)
+            for name, target in (
+                ("read", self._read),
+                ("chunk", self._chunk),
+                ("embed", self._embed),
+                ("write", self._write)
+            )
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.checkpoint.save()
+
+        if self.error:
+            raise RuntimeError(self.error)
+        return self.get_stats()
+
+    def stop(self) -> None:
+        """Ask all stages to stop; finished documents stay checkpointed"""
+        self.stop_event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get document counts and per-stage throughput and queue depth
+
+        Returns:
+            Dict with counts, stages and error
+        """
+        with self.lock:
+            counts = dict(self.counts)
+        return {
+            "counts": counts,
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+            "error": self.error
+        }
+
+    def _run_stage(self, name: str, target: Callable[[], None]) -> None:
+        stage = self.stages[name]
+        stage.started_at = time.monotonic()
+        try:
+            target()
+        except Exception as e:
+            logger.error(f"Ingest stage {name} failed: {str(e)}")
+            with self.lock:
+                if self.error is None:
+                    self.error = f"{name} stage: {str(e)}"
+            self.stop_event.set()
+        finally:
+            stage.finished_at = time.monotonic()
+
+    def _put(self, stage: _Stage, item: Any) -> bool:
+        """Put an item on a stage's output queue, blocking while it is full
+
+        Returns:
+            False if the pipeline is stopping
+        """
+        while not self.stop_event.is_set():
+            try:
+                stage.output.put(item, timeout=0.2)
+                stage.max_queue_depth = max(stage.max_queue_depth, stage.output.qsize())
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue, timeout: Optional[float] = None) -> Any:
+        """Take an item from an input queue
+
+        Returns:
+            The item, _DONE at the end of input or when stopping, or None if
+            `timeout` passed without an item
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.stop_event.is_set():
+            wait = 0.2 if deadline is None else min(0.2, deadline - time.monotonic())
+            if wait <= 0:
+                return None
+            try:
+                return source.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counts[name] += amount
+
+    def _read(self) -> None:
+        stage = self.stages["read"]
+        for doc_id, source, text in iter_documents(self.paths, self.text_field):
+            if self.stop_event.is_set():
+                return
+            started = time.perf_counter()
+            self._count("documents")
+            content_hash = hashlib.sha256(text.encode()).hexdigest()
+            previous = self.checkpoint.get(doc_id)
+            if previous == content_hash:
+                self._count("unchanged")
+                continue
+            if not text.strip():
+                self._count("empty")
+                continue
+            stage.items += 1
+            stage.busy_seconds += time.perf_counter() - started
+            if not self._put(stage, (doc_id, source, text, content_hash, previous is not None)):
+                return
+        self._put(stage, _DONE)
+
+    def _chunk(self) -> None:
+        stage = self.stages["chunk"]
+        while True:
+            document = self._get(self.documents)
+            if document is _DONE:
+                break
+            started = time.perf_counter()
+            doc_id, source, text, content_hash, changed = document
+            pieces = chunk_text(text, self.chunk_size, self.chunk_overlap)
+            stage.busy_seconds += time.perf_counter() - started
+            for index, piece in enumerate(pieces):
+                chunk = {
+                    "doc_id": doc_id,
+                    "source": source,
+                    "index": index,
+                    "text": piece,
+                    "hash": content_hash,
+                    "changed": changed,
+                    "last": index == len(pieces) - 1
+                }
+                stage.items += 1
+                if not self._put(stage, chunk):
+                    return
+        self._put(stage, _DONE)
+
+    def _embed(self) -> None:
+        stage = self.stages["embed"]
+        batch: List[Dict[str, Any]] = []
+        done = False
+        while not done:
+            # Send a partial batch when input momentarily dries up
+            chunk = self._get(self.chunks, timeout=0.05 if batch else None)
+            if chunk is _DONE:
+                done = True
+            elif chunk is not None:
+                batch.append(chunk)
+                if len(batch) < self.embed_batch_size:
+                    continue
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            vectors = self.embed_function(self.embed_model, [chunk["text"] for chunk in batch])
+            if len(vectors) != len(batch):
+                raise RuntimeError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+            stage.busy_seconds += time.perf_counter() - started
+            stage.items += len(batch)
+            if not self._put(stage, list(zip(batch, vectors))):
+                return
+            batch = []
+        self._put(stage, _DONE)
+
+    def _write(self) -> None:
+        stage = self.stages["write"]
+        pending: List[Tuple[Dict[str, Any], List[float]]] = []
+        done = False
+        while not done:
+            item = self._get(self.vectors, timeout=0.5 if pending else None)
+            if item is _DONE:
+                done = True
+            elif item is not None:
+                for chunk, vector in item:
+                    if chunk["changed"] and chunk["index"] == 0:
+                        # The document changed: drop its old chunks first
+                        self.sink.delete_document(chunk["doc_id"])
+                    pending.append((chunk, vector))
+                if len(pending) < self.write_batch_size:
+                    continue
+            if not pending or self.stop_event.is_set():
+                continue
+
+            started = time.perf_counter()
+            self.sink.write([
+                {
+                    "id": str(uuid.uuid5(CHUNK_NAMESPACE, f"{chunk['doc_id']}#{chunk['index']}")),
+                    "properties": {
+                        "docId": chunk["doc_id"],
+                        "source": chunk["source"],
+                        "chunkIndex": chunk["index"],
+                        "text": chunk["text"],
+                        "contentHash": chunk["hash"]
+                    },
+                    "vector": vector
+                }
+                for chunk, vector in pending
+            ])
+            stage.busy_seconds += time.perf_counter() - started
+            stage.items += len(pending)
+            self._count("chunks", len(pending))
+            for chunk, _ in pending:
+                if chunk["last"]:
+                    self.checkpoint.mark_done(chunk["doc_id"], chunk["hash"])
+                    self._count("imported")
+            pending = []
+
+
+class IngestJobs:
+    """Runs ingestion pipelines as background jobs for the API"""
+
+    def __init__(
+        self,
+        embed_function: Callable[[str, List[str]], List[List[float]]],
+        weaviate_url: str = "http://127.0.0.1:8081",
+        checkpoint_dir: str = "~/.aione/ingest",
+        history_size: int = 20
+    ):
+        """Initialize the job registry
+
+        Args:
+            embed_function: Called as embed_function(model, texts) to get vectors
+            weaviate_url: Weaviate base URL
+            checkpoint_dir: Directory of the per-collection checkpoint files
+            history_size: Number of finished jobs kept for listing
+        """
+        self.embed_function = embed_function
+        self.weaviate_url = weaviate_url
+        self.checkpoint_dir = os.path.expanduser(checkpoint_dir)
+        self.history_size = history_size
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+
+    def start(
+        self,
+        paths: List[str],
+        collection: str = "Document",
+        dry_run: bool = False,
+        **options
+    ) -> Dict[str, Any]:
+        """Start an ingestion job in a background thread
+
+        Args:
+            paths: Files or directories to ingest
+            collection: Weaviate collection to import into
+            dry_run: Chunk and embed but don't import
+            **options: IngestPipeline options (embed_model, chunk_size, ...)
+
+        Returns:
+            The job dict
+
+        Raises:
+            ValueError: If a path does not exist or the collection is already being ingested
+        """
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            raise ValueError(f"Paths not found: {', '.join(missing)}")
+
+        with self.lock:
+            if any(job["collection"] == collection and job["state"] == "running" for job in self.jobs.values()):
+                raise ValueError(f"An ingestion into {collection} is already running")
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "collection": collection,
+                "paths": paths,
+                "dry_run": dry_run,
+                "state": "running",
+                "error": None,
+                "created_at": time.time(),
+                "finished_at": None,
+                "cancelled": False,
+                "pipeline": None
+            }
+            self.jobs[job["id"]] = job
+            self._trim_history()
+
+        thread = threading.Thread(
+            target=self._run,
+            args=(job, options),
+            name=f"ingest-job-{job['id']}",
+            daemon=True
+        )
+        thread.start()
+        return self._to_dict(job)
+
+    def _run(self, job: Dict[str, Any], options: Dict[str, Any]) -> None:
+        try:
+            sink = NullSink() if job["dry_run"] else WeaviateSink(self.weaviate_url, job["collection"])
+            checkpoint_path = os.path.join(self.checkpoint_dir, f"{job['collection']}.json")
+            checkpoint = Checkpoint(None if job["dry_run"] else checkpoint_path)
+            pipeline = job["pipeline"] = IngestPipeline(job["paths"], self.embed_function, sink, checkpoint, **options)
+            # A cancel may have arrived while the sink was being set up
+            if job["cancelled"]:
+                pipeline.stop()
+            else:
+                pipeline.run()
+            # Stages only stop early on cancel or error, and errors raise above
+            job["state"] = "cancelled" if pipeline.stop_event.is_set() else "completed"
+        except Exception as e:
+            logger.error(f"Ingestion job {job['id']} failed: {str(e)}")
+            job["state"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job with its current pipeline statistics"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return self._to_dict(job) if job else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """List jobs, newest first"""
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [self._to_dict(job) for job in reversed(jobs)]
+
+    def cancel(self, job_id: str) -> bool:
+        """Stop a running job
+
+        Returns:
+            False if the job is unknown
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        # Checked by _run before the pipeline starts, in case it isn't built yet
+        job["cancelled"] = True
+        if job["pipeline"] is not None:
+            job["pipeline"].stop()
+        return True
+
+    def _to_dict(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        result = {key: value for key, value in job.items() if key not in ("pipeline", "cancelled")}
+        if job["pipeline"] is not None:
+            result.update(job["pipeline"].get_stats())
+            result["error"] = job["error"]
+        return result
+
+    def _trim_history(self) -> None:
+        """Drop the oldest finished jobs beyond history_size (lock held)"""
+        finished = [job_id for job_id, job in self.jobs.items() if job["state"] != "running"]
+        for job_id in finished[:max(len(finished) - self.history_size, 0)]:
+            del self.jobs[job_id]
+
+
+def main() -> None:
+    from modules.ollama_manager import OllamaManager
+
+    parser = argparse.ArgumentParser(description='Ingest txt/markdown/JSONL files into Weaviate')
+    parser.add_argument('paths', nargs='+', help='Files or directories to ingest')
+    parser.add_argument('--collection', type=str, default='Document', help='Weaviate collection')
+    parser.add_argument('--embed-model', type=str, default='nomic-embed-text:latest', help='Ollama embedding model')
+    parser.add_argument('--chunk-size', type=int, default=1500, help='Maximum characters per chunk')
+    parser.add_argument('--chunk-overlap', type=int, default=200, help='Overlap between pieces of long paragraphs')
+    parser.add_argument('--embed-batch-size', type=int, default=32, help='Chunks per embedding call')
+    parser.add_argument('--write-batch-size', type=int, default=100, help='Objects per Weaviate batch import')
+    parser.add_argument('--queue-size', type=int, default=256, help='Capacity of each queue between stages')
+    parser.add_argument('--text-field', type=str, default='text', help='JSONL field holding the text')
+    parser.add_argument('--checkpoint', type=str, help='Checkpoint file (default: ~/.aione/ingest/<collection>.json)')
+    parser.add_argument('--weaviate-url', type=str, default=os.getenv('WEAVIATE_URL', 'http://127.0.0.1:8081'))
+    parser.add_argument('--ollama-host', type=str, default=os.getenv('OLLAMA_HOST', 'localhost'))
+    parser.add_argument('--ollama-port', type=int, default=int(os.getenv('OLLAMA_PORT', '11434')))
+    parser.add_argument('--dry-run', action='store_true', help='Chunk and embed but do not import')
+    parser.add_argument('--progress-interval', type=float, default=5.0, help='Seconds between progress lines')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s - %(levelname)s - %(message)s')
+
+    manager = OllamaManager(host=args.ollama_host, port=args.ollama_port)
+    checkpoint_path = args.checkpoint or os.path.expanduser(f"~/.aione/ingest/{args.collection}.json")
+    pipeline = IngestPipeline(
+        args.paths,
+        manager.embed,
+        NullSink() if args.dry_run else WeaviateSink(args.weaviate_url, args.collection),
+        Checkpoint(None if args.dry_run else checkpoint_path),
+        embed_model=args.embed_model,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        embed_batch_size=args.embed_batch_size,
+        write_batch_size=args.write_batch_size,
+        queue_size=args.queue_size,
+        text_field=args.text_field
+    )
+
+    runner = threading.Thread(target=pipeline.run, daemon=True)
+    runner.start()
+    try:
+        while runner.is_alive():
+            runner.join(args.progress_interval)
+            stats = pipeline.get_stats()
+            stages = "  ".join(
+                f"{name}={stage['items']} ({stage['items_per_second'] or 0}/s, queue {stage.get('queue_depth', '-')})"
+                for name, stage in stats["stages"].items()
+            )
+            print(f"{stats['counts']}  {stages}", flush=True)
+    except KeyboardInterrupt:
+        pipeline.stop()
+        runner.join()
+
+    stats = pipeline.get_stats()
+    print(json.dumps(stats, indent=2))
+    if stats["error"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
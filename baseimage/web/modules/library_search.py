@@ -0,0 +1,435 @@
+import os
+import re
+import json
+import time
+import bisect
+import difflib
+import logging
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from modules.single_flight import SingleFlight
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Elements that never have an end tag
+VOID_ELEMENTS = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"])
+
+# Attribute marking each field of a search result on ollama.com/search
+FIELD_ATTRIBUTES = {
+    "x-test-search-response-title": "name",
+    "x-test-size": "sizes",
+    "x-test-capability": "capabilities",
+    "x-test-pull-count": "pulls",
+    "x-test-tag-count": "tag_count",
+    "x-test-updated": "updated"
+}
+
+# Fields holding several values per result
+LIST_FIELDS = frozenset(["sizes", "capabilities"])
+
+# Separators between the words of a model name ("deepseek-r1", "llama3.1")
+NAME_SEPARATORS = re.compile(r"[-_.:/\s]+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace so equivalent queries share a cache entry"""
+    return " ".join(query.lower().split())
+
+
+def parse_count(text: Optional[str]) -> int:
+    """Parse a pull count like "108.4M", "12.5K" or "1,234" into a number"""
+    if not text:
+        return 0
+    match = re.match(r"([\d.,]+)\s*([KMB]?)", text.strip().upper())
+    if not match:
+        return 0
+    try:
+        value = float(match.group(1).replace(",", ""))
+    except ValueError:
+        return 0
+    return int(value * {"": 1, "K": 1e3, "M": 1e6, "B": 1e9}[match.group(2)])
+
+
+class _SearchResultsParser(HTMLParser):
+    """Collects the results of an ollama.com search page
+
+    Each result is an <li x-test-model> element; its fields are marked with
+    x-test-* attributes, and the description is the <p class="max-w-lg ...">.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.results: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.stack: List[str] = []
+        # (field, stack depth of the element holding it, collected text)
+        self.field: Optional[Tuple[str, int, List[str]]] = None
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        attributes = dict(attrs)
+        if self.result is None:
+            if tag == "li" and "x-test-model" in attributes:
+                self.result = {"name": "", "description": "", "sizes": [], "capabilities": []}
+                self.stack = [tag]
+            return
+        if tag == "a" and not self.result.get("href") and (attributes.get("href") or "").startswith("/library/"):
+            self.result["href"] = attributes["href"]
+        if tag in VOID_ELEMENTS:
+            if self.field is not None and tag == "br":
+                self.field[2].append(" ")
+            return
+        self.stack.append(tag)
+        if self.field is not None:
+            return
+        for attribute, field in FIELD_ATTRIBUTES.items():
+            if attribute in attributes:
+                self.field = (field, len(self.stack), [])
+                return
+        if tag == "p" and "max-w-lg" in (attributes.get("class") or "").split():
+            self.field = ("description", len(self.stack), [])
+
+    def handle_endtag(self, tag: str) -> None:
+        if self.result is None or tag not in self.stack:
+            return
+        # Close elements left open by sloppy markup along with this one
+        while self.stack:
+            if self.field is not None and len(self.stack) <= self.field[1]:
+                self._finish_field()
+            if self.stack.pop() == tag:
+                break
+        if not self.stack:
+            self._finish_result()
+
+    def handle_data(self, data: str) -> None:
+        if self.field is not None:
+            self.field[2].append(data)
+
+    def close(self) -> None:
+        super().close()
+        if self.result is not None:
+            self._finish_result()
+
+    def _finish_field(self) -> None:
+        field, _, parts = self.field
+        self.field = None
+        text = " ".join("".join(parts).split())
+        if not text:
+            return
+        if field in LIST_FIELDS:
+            self.result[field].append(text.lower() if field == "sizes" else text)
+        elif field == "tag_count":
+            self.result[field] = parse_count(text)
+        else:
+            self.result[field] = text
+
+    def _finish_result(self) -> None:
+        result, self.result = self.result, None
+        self.field = None
+        href = result.pop("href", "")
+        if not result["name"] and href:
+            result["name"] = href[len("/library/"):]
+        if result["name"]:
+            result["pull_count"] = parse_count(result.get("pulls"))
+            self.results.append(result)
+
+
+def parse_search_results(html: str) -> List[Dict[str, Any]]:
+    """Parse an ollama.com search page into result dicts
+
+    Args:
+        html: Page markup
+
+    Returns:
+        One dict per model with name, description, sizes, capabilities and,
+        where the page shows them, pulls, pull_count, tag_count and updated
+    """
+    parser = _SearchResultsParser()
+    parser.feed(html)
+    parser.close()
+    return parser.results
+
+
+class LibraryIndex:
+    """Catalog of every library model seen in search results, searchable offline
+
+    Names are kept sorted for prefix lookups with bisect; words of names,
+    sizes, capabilities and descriptions are kept the same way for word
+    prefix matches. Names that don't match directly are compared with difflib to
+    tolerate typos.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models: Dict[str, Dict[str, Any]] = {}
+        self.names: List[str] = []
+        # Sorted (word, name, weight) tuples
+        self.words: List[Tuple[str, str, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    def update(self, results: Iterable[Dict[str, Any]], replace: bool = True) -> int:
+        """Add or refresh models
+
+        Args:
+            results: Result dicts as returned by parse_search_results
+            replace: Whether to overwrite models already in the index
+
+        Returns:
+            Number of models added or changed
+        """
+        changed = 0
+        with self.lock:
+            for result in results:
+                name = result["name"].lower()
+                if self.models.get(name) == result or (not replace and name in self.models):
+                    continue
+                self.models[name] = result
+                changed += 1
+            if changed:
+                self._rebuild()
+        return changed
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """All models, for persisting the index"""
+        with self.lock:
+            return list(self.models.values())
+
+    def match(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Find models matching every word of a query
+
+        Exact names rank first, then name prefixes, name word prefixes,
+        substrings, sizes, capabilities and description words, and finally close
+        (misspelled) names. Ties go to the more pulled model.
+
+        Args:
+            query: Search text
+            limit: Maximum number of results
+
+        Returns:
+            Matching result dicts, best first
+        """
+        terms = normalize_query(query).split()
+        if not terms:
+            return []
+        with self.lock:
+            scores: Optional[Dict[str, float]] = None
+            for term in terms:
+                term_scores = self._score_term(term)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {name: score + term_scores[name] for name, score in scores.items() if name in term_scores}
+                if not scores:
+                    return []
+            ranked = sorted(scores, key=lambda name: (-scores[name], -self.models[name].get("pull_count", 0), name))
+            return [self.models[name] for name in ranked[:limit]]
+
+    def _score_term(self, term: str) -> Dict[str, float]:
+        """Score every model matching one query word (lock held)"""
+        scores: Dict[str, float] = {}
+
+        def add(name: str, score: float) -> None:
+            if score > scores.get(name, 0):
+                scores[name] = score
+
+        for name in self._prefixed(self.names, term):
+            add(name, 100 if name == term else 90)
+        index = bisect.bisect_left(self.words, (term,))
+        while index < len(self.words) and self.words[index][0].startswith(term):
+            _, name, weight = self.words[index]
+            add(name, weight)
+            index += 1
+        if len(term) >= 3:
+            for name in self.names:
+                if term in name:
+                    add(name, 50)
+        if len(scores) < 5:
+            for name in difflib.get_close_matches(term, self.names, n=5, cutoff=0.6):
+                add(name, 10 + 20 * difflib.SequenceMatcher(None, term, name).ratio())
+        return scores
+
+    @staticmethod
+    def _prefixed(names: List[str], prefix: str) -> Iterable[str]:
+        index = bisect.bisect_left(names, prefix)
+        while index < len(names) and names[index].startswith(prefix):
+            yield names[index]
+            index += 1
+
+    def _rebuild(self) -> None:
+        """Rebuild the sorted lookup lists (lock held)"""
+        self.names = sorted(self.models)
+        words = set()
+        for name, model in self.models.items():
+            for word in NAME_SEPARATORS.split(name):
+                if word:
+                    words.add((word, name, 70))
+            for word in model.get("capabilities", []) + model.get("sizes", []):
+                words.add((word.lower(), name, 40))
+            for word in re.findall(r"[a-z0-9]+", model.get("description", "").lower()):
+                if len(word) >= 3:
+                    words.add((word, name, 30))
+        self.words = sorted(words)
+
+
+class LibrarySearch:
+    """Searches the Ollama model library with a per-query cache and a local index
+
+    Remote results are cached per normalized query for ttl seconds and fed
+    into a LibraryIndex, which is saved to index_path. When ollama.com can't
+    be reached, the search answers from an expired cache entry or the index
+    and doesn't try again for retry_interval seconds, so offline searches
+    return immediately.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "https://ollama.com",
+        ttl: float = 3600,
+        max_queries: int = 500,
+        index_path: Optional[str] = None,
+        timeout: Tuple[float, float] = (3.05, 10),
+        retry_interval: float = 60
+    ):
+        """Initialize the search
+
+        Args:
+            base_url: Site serving /search
+            ttl: Seconds a query's results are served from the cache
+            max_queries: Cached queries kept (least recently used are dropped)
+            index_path: JSON file the index is loaded from and saved to (None keeps it in memory)
+            timeout: (connect, read) timeout of a remote search
+            retry_interval: Seconds to answer locally after a remote search failed
+        """
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self.max_queries = max_queries
+        self.index_path = os.path.expanduser(index_path) if index_path else None
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+
+        self.session = requests.Session()
+        self.single_flight = SingleFlight()
+        self.index = LibraryIndex()
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        # query -> (results, fetched_at); most recently used last
+        self.cache: "OrderedDict[str, Tuple[List[Dict[str, Any]], float]]" = OrderedDict()
+        self.offline_until = 0.0
+        self.counters = {"cache_hits": 0, "remote": 0, "remote_errors": 0, "stale": 0, "index": 0}
+
+        self._load_index()
+
+    def seed(self, names: Iterable[str]) -> None:
+        """Add model names known without a search (e.g. "llama3:8b") to the index
+
+        Seeded names never overwrite models seen in search results.
+        """
+        sizes: Dict[str, List[str]] = {}
+        for name in names:
+            model, _, size = name.lower().partition(":")
+            model_sizes = sizes.setdefault(model, [])
+            if size and size != "latest" and size not in model_sizes:
+                model_sizes.append(size)
+        self.index.update(
+            ({"name": model, "description": "", "sizes": model_sizes, "capabilities": [], "pull_count": 0}
+             for model, model_sizes in sizes.items()),
+            replace=False
+        )
+
+    def search(self, query: str, limit: int = 20) -> Dict[str, Any]:
+        """Search the library
+
+        Args:
+            query: Search text
+            limit: Maximum results answered from the index
+
+        Returns:
+            Dict with the normalized query, results and source: cache, remote,
+            stale (an expired cache entry) or index
+        """
+        query = normalize_query(query)
+        now = time.monotonic()
+        with self.lock:
+            cached = self.cache.get(query)
+            if cached is not None and now - cached[1] < self.ttl:
+                self.cache.move_to_end(query)
+                self.counters["cache_hits"] += 1
+                return {"query": query, "source": "cache", "results": cached[0]}
+            offline = now < self.offline_until
+
+        if not offline:
+            try:
+                results = self.single_flight.do(query, self._fetch, query)
+                return {"query": query, "source": "remote", "results": results}
+            except requests.RequestException as e:
+                logger.warning(f"Library search unavailable ({str(e)}), answering from the local index for {self.retry_interval:.0f}s")
+                with self.lock:
+                    self.counters["remote_errors"] += 1
+                    self.offline_until = time.monotonic() + self.retry_interval
+
+        with self.lock:
+            if cached is not None:
+                self.counters["stale"] += 1
+                return {"query": query, "source": "stale", "results": cached[0]}
+            self.counters["index"] += 1
+        return {"query": query, "source": "index", "results": self.index.match(query, limit)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache and index counters"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update({
+                "cached_queries": len(self.cache),
+                "max_queries": self.max_queries,
+                "ttl": self.ttl,
+                "offline": time.monotonic() < self.offline_until
+            })
+        stats["indexed_models"] = len(self.index)
+        return stats
+
+    def _fetch(self, query: str) -> List[Dict[str, Any]]:
+        """Search ollama.com, then cache the results and add them to the index"""
+        response = self.session.get(f"{self.base_url}/search", params={"q": query}, timeout=self.timeout)
+        response.raise_for_status()
+        results = parse_search_results(response.text)
+        with self.lock:
+            self.counters["remote"] += 1
+            self.offline_until = 0.0
+            self.cache[query] = (results, time.monotonic())
+            self.cache.move_to_end(query)
+            while len(self.cache) > self.max_queries:
+                self.cache.popitem(last=False)
+        if self.index.update(results):
+            self._save_index()
+        return results
+
+    def _load_index(self) -> None:
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path) as f:
+                self.index.update(json.load(f)["models"])
+            logger.info(f"Loaded {len(self.index)} library models from {self.index_path}")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable library index {self.index_path}: {str(e)}")
+
+    def _save_index(self) -> None:
+        """Write the index atomically, so a crash never leaves a partial file"""
+        if not self.index_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            temporary = f"{self.index_path}.tmp"
+            with self.save_lock:
+                with open(temporary, "w") as f:
+                    json.dump({"models": self.index.snapshot()}, f)
+                os.replace(temporary, self.index_path)
+        except OSError as e:
+            logger.error(f"Error saving library index {self.index_path}: {str(e)}")
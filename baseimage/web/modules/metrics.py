@@ -0,0 +1,304 @@
+import bisect
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Seconds; spans fast metadata calls to long generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+class _Shard:
+    """Metric values written by one thread
+
+    Only the owning thread writes to `values`, so recording needs no lock;
+    the collector reads copies, which the GIL makes consistent per entry.
+    """
+
+    def __init__(self, thread: threading.Thread):
+        self.thread = thread
+        # (metric name, label values) -> float (counter) or list of bucket counts + sum (histogram)
+        self.values: Dict[Tuple[str, LabelValues], Any] = {}
+
+
+class MetricsRegistry:
+    """Counters, histograms and gauge callbacks rendered in the Prometheus text format
+
+    Each thread records into its own shard, so the request path never takes
+    a lock or contends with other threads; a scrape merges the shards. Shards
+    of finished threads are folded into a single total, so the per-request
+    threads of the Flask development server don't pile up.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, "_Metric"] = {}
+        self.gauges: List[Tuple[str, str, Sequence[str], Callable[[], Any]]] = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.shards: List[_Shard] = []
+        self.retired: Dict[Tuple[str, LabelValues], Any] = {}
+        self.retire_at = 64
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> "Counter":
+        """Register a counter"""
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> "Histogram":
+        """Register a histogram with the given upper bucket bounds"""
+        return self._register(Histogram(self, name, help_text, labelnames, buckets))
+
+    def gauge_function(
+        self,
+        name: str,
+        help_text: str,
+        function: Callable[[], Union[float, Dict[LabelValues, float]]],
+        labelnames: Sequence[str] = ()
+    ) -> None:
+        """Register a gauge read at scrape time
+
+        Args:
+            name: Metric name
+            help_text: HELP line
+            function: Returns the value, or a dict mapping label values to values
+            labelnames: Label names, matching the keys the function returns
+        """
+        with self.lock:
+            self.gauges.append((name, help_text, tuple(labelnames), function))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        values = self._collect()
+        by_metric: Dict[str, List[Tuple[LabelValues, Any]]] = {}
+        for (name, labels), value in values.items():
+            by_metric.setdefault(name, []).append((labels, value))
+
+        lines: List[str] = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+            gauges = list(self.gauges)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, value in sorted(by_metric.get(metric.name, [])):
+                metric.render(lines, labels, value)
+
+        for name, help_text, labelnames, function in gauges:
+            try:
+                result = function()
+            except Exception as e:
+                logger.warning(f"Error reading gauge {name}: {str(e)}")
+                continue
+            if result is None:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            items = result.items() if isinstance(result, dict) else [((), result)]
+            for labels, value in sorted(items):
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: "_Metric") -> Any:
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def _values(self) -> Dict[Tuple[str, LabelValues], Any]:
+        """The calling thread's shard values"""
+        try:
+            return self.local.shard.values
+        except AttributeError:
+            shard = _Shard(threading.current_thread())
+            with self.lock:
+                self.shards.append(shard)
+                if len(self.shards) >= self.retire_at:
+                    self._retire_finished()
+                    self.retire_at = max(64, 2 * len(self.shards))
+            self.local.shard = shard
+            return shard.values
+
+    def _retire_finished(self) -> None:
+        """Fold the shards of finished threads into the retired totals (lock held)"""
+        alive = []
+        for shard in self.shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                _merge(self.retired, shard.values)
+        self.shards = alive
+
+    def _collect(self) -> Dict[Tuple[str, LabelValues], Any]:
+        with self.lock:
+            self._retire_finished()
+            shards = list(self.shards)
+            totals: Dict[Tuple[str, LabelValues], Any] = {}
+            _merge(totals, self.retired)
+        for shard in shards:
+            _merge(totals, shard.values.copy())
+        return totals
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, registry: MetricsRegistry, name: str, help_text: str, labelnames: Sequence[str]):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+
+    def render(self, lines: List[str], labels: LabelValues, value: Any) -> None:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        """Add to the count for the given label values"""
+        values = self.registry._values()
+        key = (self.name, labels)
+        values[key] = values.get(key, 0.0) + amount
+
+    def render(self, lines: List[str], labels: LabelValues, value: Any) -> None:
+        lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float]
+    ):
+        super().__init__(registry, name, help_text, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record a value for the given label values"""
+        values = self.registry._values()
+        key = (self.name, labels)
+        counts = values.get(key)
+        if counts is None:
+            # One count per bucket plus +Inf, then the sum of observed values
+            counts = values[key] = [0] * (len(self.bounds) + 1) + [0.0]
+        counts[bisect.bisect_left(self.bounds, value)] += 1
+        counts[-1] += value
+
+    def render(self, lines: List[str], labels: LabelValues, value: Any) -> None:
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), value[:-1]):
+            cumulative += count
+            bucket_labels = _format_labels(self.labelnames + ("le",), labels + (_format_value(bound),))
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        label_text = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{label_text} {_format_value(value[-1])}")
+        lines.append(f"{self.name}_count{label_text} {cumulative}")
+
+
+def _merge(totals: Dict[Tuple[str, LabelValues], Any], values: Dict[Tuple[str, LabelValues], Any]) -> None:
+    """Add one shard's values to the totals"""
+    for key, value in values.items():
+        if isinstance(value, list):
+            value = list(value)
+            current = totals.get(key)
+            totals[key] = value if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            totals[key] = totals.get(key, 0.0) + value
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[Any]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# The process-wide registry and the metrics recorded by the modules
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "aione_http_requests_total", "HTTP requests served, by route template and status", ("method", "route", "status")
+)
+HTTP_DURATION = REGISTRY.histogram(
+    "aione_http_request_duration_seconds", "Time to response headers per route", ("method", "route")
+)
+OLLAMA_DURATION = REGISTRY.histogram(
+    "aione_ollama_request_duration_seconds", "Time to response headers of calls to Ollama", ("endpoint", "model")
+)
+OLLAMA_ERRORS = REGISTRY.counter(
+    "aione_ollama_request_errors_total", "Calls to Ollama that failed without a response", ("endpoint",)
+)
+GENERATION_TOKENS = REGISTRY.counter(
+    "aione_generation_tokens_total", "Prompt and generated tokens reported by Ollama", ("model", "kind")
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "aione_generation_tokens_per_second", "Generation rate from Ollama's eval_count/eval_duration",
+    ("model",), TOKENS_PER_SECOND_BUCKETS
+)
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "aione_generation_time_to_first_token_seconds",
+    "Ollama's load_duration + prompt_eval_duration: time until the first generated token", ("model",)
+)
+PULL_BYTES = REGISTRY.counter("aione_pull_bytes_total", "Bytes downloaded by model pulls", ("model",))
+SUBPROCESS_SPAWNS = REGISTRY.counter(
+    "aione_subprocess_spawns_total", "Subprocesses started, by command (terminal or the GPU tool)", ("command",)
+)
+
+
+def observe_upstream(path: str, model: Optional[str], seconds: float) -> None:
+    """Record the latency of a call to Ollama"""
+    OLLAMA_DURATION.observe(seconds, path, model or "")
+
+
+def observe_generation(model: str, result: Dict[str, Any]) -> None:
+    """Record token counts, generation rate and time to first token of a finished generation
+
+    Args:
+        model: Model name
+        result: Ollama's final response (or stream chunk) with its eval counters
+    """
+    prompt_tokens = result.get("prompt_eval_count") or 0
+    eval_count = result.get("eval_count") or 0
+    eval_duration = result.get("eval_duration") or 0  # Nanoseconds
+    if prompt_tokens:
+        GENERATION_TOKENS.inc(model, "prompt", amount=prompt_tokens)
+    if eval_count:
+        GENERATION_TOKENS.inc(model, "completion", amount=eval_count)
+        if eval_duration:
+            TOKENS_PER_SECOND.observe(eval_count / (eval_duration / 1e9), model)
+    if "prompt_eval_duration" in result or "load_duration" in result:
+        ttft = ((result.get("load_duration") or 0) + (result.get("prompt_eval_duration") or 0)) / 1e9
+        TIME_TO_FIRST_TOKEN.observe(ttft, model)
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules.response_cache import normalize_model_name
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class ModelCatalog:
+    """The curated model list (models.json) joined with the installed models
+
+    The file is parsed once and reloaded only when its modification time or
+    size changes, checked at most every check_interval seconds. The joined
+    view is serialized once per combination of catalog version and installed
+    snapshot ETag, so repeated requests are served from memory and unchanged
+    views keep their ETag.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        """Initialize the catalog
+
+        Args:
+            path: models.json, mapping category names to lists of model names
+            check_interval: Minimum seconds between checks of the file's mtime
+        """
+        self.path = path
+        self.check_interval = check_interval
+
+        self.lock = threading.Lock()
+        self.categories: Optional[Dict[str, List[str]]] = None
+        self.file_state: Optional[Tuple[int, int]] = None  # (mtime_ns, size) of the loaded file
+        self.version = 0
+        self.last_check = 0.0
+        # (catalog version, installed ETag) -> {"etag": ..., "body": ...}
+        self.view_key: Optional[Tuple[int, Optional[str]]] = None
+        self.view: Optional[Dict[str, Any]] = None
+        self.counters = {"reloads": 0, "reload_errors": 0, "builds": 0, "hits": 0}
+
+    def get(self, installed: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the catalog joined with the installed models
+
+        Args:
+            installed: Installed model snapshot with models and etag, as
+                returned by OllamaManager.get_models_snapshot
+
+        Returns:
+            Dict with etag and body (JSON bytes of categories, models,
+            families, tags and installed)
+
+        Raises:
+            FileNotFoundError: If the catalog file doesn't exist and was never loaded
+        """
+        with self.lock:
+            self._reload_if_changed()
+            key = (self.version, installed.get("etag"))
+            if self.view_key == key:
+                self.counters["hits"] += 1
+                return self.view
+            categories = self.categories
+
+        body = json.dumps(self._join(categories, installed.get("models") or []), sort_keys=True).encode()
+        view = {"etag": hashlib.sha1(body).hexdigest(), "body": body}
+        with self.lock:
+            self.counters["builds"] += 1
+            # A reload may have happened meanwhile; only the current version is kept
+            if key[0] == self.version:
+                self.view_key, self.view = key, view
+        return view
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get reload and view build counters"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update({
+                "path": self.path,
+                "version": self.version,
+                "models": len({name for names in (self.categories or {}).values() for name in names}),
+                "etag": self.view["etag"] if self.view is not None else None
+            })
+        return stats
+
+    def _reload_if_changed(self) -> None:
+        """Re-read the file if it changed since it was loaded (lock held)"""
+        now = time.monotonic()
+        if self.categories is not None and now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self.categories is None:
+                raise
+            return
+        file_state = (stat.st_mtime_ns, stat.st_size)
+        if file_state == self.file_state:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            categories = {
+                category: [str(name) for name in names]
+                for category, names in data.items()
+                if isinstance(names, list)
+            }
+        except (OSError, ValueError, AttributeError) as e:
+            self.counters["reload_errors"] += 1
+            if self.categories is None:
+                raise
+            logger.error(f"Error reloading {self.path}, keeping the previous catalog: {str(e)}")
+            self.file_state = file_state
+            return
+        self.categories = categories
+        self.file_state = file_state
+        self.version += 1
+        self.counters["reloads"] += 1
+        logger.info(f"Loaded model catalog {self.path} (version {self.version})")
+
+    def _join(self, categories: Dict[str, List[str]], installed: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the catalog view: one entry per model with its installed state
+
+        Args:
+            categories: Category name -> model names, from the file
+            installed: Installed model dicts
+
+        Returns:
+            Dict with categories (as in the file), models (name -> entry),
+            families and tags (-> sorted model names) and installed (the
+            installed model dicts)
+        """
+        installed_by_name = {normalize_model_name(model.get("name", "")): model for model in installed}
+        models: Dict[str, Dict[str, Any]] = {}
+        families: Dict[str, List[str]] = {}
+        tags: Dict[str, List[str]] = {}
+
+        for category, names in categories.items():
+            for name in names:
+                entry = models.get(name)
+                if entry is None:
+                    family, _, tag = name.partition(":")
+                    local = installed_by_name.get(normalize_model_name(name))
+                    entry = models[name] = {
+                        "name": name,
+                        "family": family,
+                        "tag": tag or "latest",
+                        "categories": [],
+                        "installed": local is not None,
+                        "size": local.get("size") if local else None,
+                        "size_formatted": local.get("size_formatted") if local else None,
+                        "digest": local.get("digest") if local else None
+                    }
+                    families.setdefault(family, []).append(name)
+                    tags.setdefault(entry["tag"], []).append(name)
+                entry["categories"].append(category)
+
+        return {
+            "categories": categories,
+            "models": models,
+            "families": {family: sorted(names) for family, names in families.items()},
+            "tags": {tag: sorted(names) for tag, names in tags.items()},
+            "installed": installed
+        }
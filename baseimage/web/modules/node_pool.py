@@ -0,0 +1,308 @@
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import requests
+
+from modules.response_cache import normalize_model_name
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Errors that count against a node's health; HTTP error responses do not,
+# since Ollama also answers model errors (e.g. out of memory) with them
+NODE_ERRORS = (requests.ConnectionError, requests.Timeout, OSError)
+
+
+def node_url(host: str, port: int = 11434) -> str:
+    """Build a node's base URL from a host that may already include a port or scheme"""
+    host = host.strip().rstrip("/")
+    if host.startswith(("http://", "https://")):
+        return host
+    if ":" in host:
+        return f"http://{host}"
+    return f"http://{host}:{port}"
+
+
+def parse_hosts(spec: str, default_port: int = 11434) -> List[str]:
+    """Parse OLLAMA_HOSTS ("gpu1:11434,gpu2,http://10.0.0.3:11434") into base URLs"""
+    return [node_url(host, default_port) for host in spec.split(",") if host.strip()]
+
+
+class OllamaNode:
+    """One Ollama server: its health, load and which models it has"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.name = url.split("://", 1)[-1]
+        self.healthy = True
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.errors = 0
+        # Moving average of request latency (time to response headers)
+        self.latency: Optional[float] = None
+        self.probe_latency: Optional[float] = None
+        self.last_probe: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.installed: Set[str] = set()
+        self.loaded: Set[str] = set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.consecutive_failures,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "probe_latency_ms": round(self.probe_latency * 1000, 1) if self.probe_latency is not None else None,
+            "last_probe": self.last_probe,
+            "last_error": self.last_error,
+            "installed_models": sorted(self.installed),
+            "loaded_models": sorted(self.loaded)
+        }
+
+
+class Lease:
+    """A request in flight on a node; finish it with done() or use it as a context manager"""
+
+    def __init__(self, pool: "NodePool", node: OllamaNode):
+        self.pool = pool
+        self.node = node
+        self.url = node.url
+        self.started = time.monotonic()
+        self.finished = False
+
+    def done(self, error: Optional[BaseException] = None) -> None:
+        """Record the outcome of the request (idempotent)
+
+        Args:
+            error: Exception if the node could not be reached or failed
+        """
+        if not self.finished:
+            self.finished = True
+            self.pool._finish(self.node, time.monotonic() - self.started, error)
+
+    def __enter__(self) -> "Lease":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.done(exc if isinstance(exc, NODE_ERRORS) else None)
+
+
+class NodePool:
+    """Routes requests across several Ollama servers
+
+    A request for a model goes to the least busy healthy node (fewest
+    outstanding requests) among those that have the model loaded, falling
+    back to nodes that have it installed, then to any node. Affinity gives
+    way to load balance once a loaded node is `affinity_slack` requests busier
+    than the least busy node. Nodes are ejected after `failure_threshold`
+    consecutive failed requests or health probes and re-admitted by the first
+    successful probe. If no node is healthy, all nodes are tried.
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        transport: Any,
+        health_interval: float = 10.0,
+        failure_threshold: int = 2,
+        affinity_slack: int = 4
+    ):
+        """Initialize the pool
+
+        Args:
+            urls: Base URLs of the Ollama servers; the first is the primary
+            transport: OllamaTransport used for health probes
+            health_interval: Seconds between health probes
+            failure_threshold: Consecutive failures after which a node is ejected
+            affinity_slack: Extra outstanding requests tolerated to stay on a node
+                that has the model loaded
+        """
+        self.nodes = [OllamaNode(url) for url in dict.fromkeys(urls)]
+        if not self.nodes:
+            raise ValueError("At least one Ollama node is required")
+        self.transport = transport
+        self.health_interval = health_interval
+        self.failure_threshold = max(1, failure_threshold)
+        self.affinity_slack = affinity_slack
+
+        self.lock = threading.Lock()
+        self.next_index = 0
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def primary(self) -> OllamaNode:
+        return self.nodes[0]
+
+    def lease(self, model: Optional[str] = None, exclude: Iterable[OllamaNode] = ()) -> Lease:
+        """Pick a node for a request and count it as outstanding
+
+        Args:
+            model: Model the request is for (None for model-independent calls)
+            exclude: Nodes not to use, e.g. ones that just failed
+
+        Returns:
+            Lease to finish when the request is done
+        """
+        with self.lock:
+            node = self._select(normalize_model_name(model) if model else None, set(exclude))
+            node.outstanding += 1
+            node.requests += 1
+        return Lease(self, node)
+
+    def choose(self, model: Optional[str] = None, exclude: Iterable[OllamaNode] = ()) -> OllamaNode:
+        """Pick a node like lease() without counting a request, e.g. for downloads"""
+        with self.lock:
+            return self._select(normalize_model_name(model) if model else None, set(exclude))
+
+    def healthy_nodes(self) -> List[OllamaNode]:
+        """Nodes currently in rotation (all nodes if none is healthy)"""
+        with self.lock:
+            return self._candidates(set())
+
+    def nodes_with(self, model: str, loaded: bool = False) -> List[OllamaNode]:
+        """Nodes known to have a model installed (or loaded)"""
+        model = normalize_model_name(model)
+        with self.lock:
+            return [node for node in self.nodes if model in (node.loaded if loaded else node.installed)]
+
+    def mark_loaded(self, node: OllamaNode, model: str, loaded: bool = True) -> None:
+        """Record that a node loaded (or unloaded) a model, ahead of the next probe"""
+        model = normalize_model_name(model)
+        with self.lock:
+            if loaded:
+                node.loaded.add(model)
+                node.installed.add(model)
+            else:
+                node.loaded.discard(model)
+
+    def set_installed(self, node: OllamaNode, models: Iterable[str]) -> None:
+        """Replace the installed models of a node, e.g. from its /api/tags"""
+        with self.lock:
+            node.installed = {normalize_model_name(model) for model in models}
+
+    def start(self) -> None:
+        """Start periodic health probes on a background thread"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="ollama-node-health", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop the health probes"""
+        self.stop_event.set()
+
+    def probe(self, node: OllamaNode) -> bool:
+        """Probe a node's /api/ps and /api/tags, updating its health and models
+
+        Returns:
+            True if the node answered
+        """
+        start = time.monotonic()
+        try:
+            response = self.transport.get(f"{node.url}/api/ps")
+            response.raise_for_status()
+            loaded = {normalize_model_name(entry.get("name", "")) for entry in response.json().get("models", [])}
+            latency = time.monotonic() - start
+            response = self.transport.get(f"{node.url}/api/tags")
+            response.raise_for_status()
+            installed = {normalize_model_name(entry.get("name", "")) for entry in response.json().get("models", [])}
+        except Exception as e:
+            self._record_failure(node, e, probe=True)
+            return False
+
+        with self.lock:
+            node.loaded = loaded
+            node.installed = installed
+            node.probe_latency = latency
+            node.last_probe = time.time()
+            node.consecutive_failures = 0
+            if not node.healthy:
+                node.healthy = True
+                logger.info(f"Ollama node {node.name} is healthy again, re-admitted")
+        return True
+
+    def probe_all(self) -> None:
+        """Probe every node once"""
+        for node in self.nodes:
+            self.probe(node)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-node health, load, latency and model placement
+
+        Returns:
+            Dict with nodes and the pool settings
+        """
+        with self.lock:
+            nodes = [node.to_dict() for node in self.nodes]
+        return {
+            "nodes": nodes,
+            "healthy": sum(1 for node in nodes if node["healthy"]),
+            "health_interval": self.health_interval,
+            "failure_threshold": self.failure_threshold,
+            "affinity_slack": self.affinity_slack,
+            "probing": self.thread is not None and self.thread.is_alive()
+        }
+
+    def _run(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                self.probe_all()
+            except Exception as e:
+                logger.error(f"Error probing Ollama nodes: {str(e)}")
+            self.stop_event.wait(self.health_interval)
+
+    def _candidates(self, exclude: Set[OllamaNode]) -> List[OllamaNode]:
+        """Healthy nodes not excluded; failing that, any node not excluded (lock held)"""
+        nodes = [node for node in self.nodes if node not in exclude]
+        healthy = [node for node in nodes if node.healthy]
+        return healthy or nodes or list(self.nodes)
+
+    def _select(self, model: Optional[str], exclude: Set[OllamaNode]) -> OllamaNode:
+        """Choose the node for a request (lock held), see the class docstring"""
+        candidates = self._candidates(exclude)
+        if model:
+            least = min(node.outstanding for node in candidates)
+            for preferred in (
+                [node for node in candidates if model in node.loaded],
+                [node for node in candidates if model in node.installed]
+            ):
+                preferred = [node for node in preferred if node.outstanding <= least + self.affinity_slack]
+                if preferred:
+                    candidates = preferred
+                    break
+
+        # Least outstanding requests; rotate the starting point so ties spread out
+        self.next_index = (self.next_index + 1) % len(self.nodes)
+        order = {node: (self.nodes.index(node) - self.next_index) % len(self.nodes) for node in candidates}
+        return min(candidates, key=lambda node: (node.outstanding, order[node]))
+
+    def _finish(self, node: OllamaNode, elapsed: float, error: Optional[BaseException]) -> None:
+        with self.lock:
+            node.outstanding = max(0, node.outstanding - 1)
+            if error is None:
+                node.latency = elapsed if node.latency is None else 0.8 * node.latency + 0.2 * elapsed
+                node.consecutive_failures = 0
+        if error is not None:
+            self._record_failure(node, error)
+
+    def _record_failure(self, node: OllamaNode, error: BaseException, probe: bool = False) -> None:
+        with self.lock:
+            node.errors += 1
+            node.consecutive_failures += 1
+            node.last_error = str(error)
+            if probe:
+                node.last_probe = time.time()
+            eject = node.healthy and len(self.nodes) > 1 and node.consecutive_failures >= self.failure_threshold
+            if eject:
+                node.healthy = False
+        if eject:
+            logger.warning(f"Ejecting Ollama node {node.name} after {node.consecutive_failures} failures: {str(error)}")
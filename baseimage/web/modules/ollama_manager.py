@@ -1,24 +1,108 @@
-import requests
+import os
 import logging
 import time
-import subprocess
 import threading
 from datetime import datetime
-from typing import List, Dict, Tuple, Optional, Any
+from collections import deque
+from typing import List, Dict, Tuple, Optional, Any, Iterator
 import json
+import hashlib
+import requests
+
+from modules.http_transport import OllamaTransport
+from modules.download_scheduler import DownloadScheduler, DownloadJob
+from modules.event_bus import EventBus
+from modules.single_flight import SingleFlight
+from modules.gpu_sampler import GpuSampler
+from modules.host_metrics import HostMetrics
+from modules.response_cache import ResponseCache, is_deterministic
+from modules.semantic_cache import SemanticCache
+from modules.embed_batcher import EmbedBatcher
+from modules.persistence import Persistence
+from modules.residency import ResidencyManager, KeepAlive
+from modules.node_pool import NodePool, OllamaNode, Lease
+from modules.metrics import observe_generation
+from modules.terminal_jobs import TerminalJobs, TerminalBusy, TIMEOUT
+from modules.shared_state import SharedStore, SharedEventBus, process_alive
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Event bus topic carrying the installation progress summary
+PROGRESS_TOPIC = "models.progress"
+
+# Seconds a finished download stays visible in the progress summary
+SUCCESS_STATUS_SECONDS = 10
+FAILURE_STATUS_SECONDS = 30
+
+# Keys and logs in the shared state (production mode with several workers)
+MODELS_KEY = "models"
+MODEL_CHANGES_KEY = "model_changes"
+PULL_JOB_PREFIX = "pull_job:"
+HISTORY_STREAM = "commands"
+
+# Minimum seconds between shared writes of a running pull's progress
+PULL_SHARE_INTERVAL = 0.25
+
+# Finished pulls and model changes kept in the shared state
+SHARED_HISTORY_SIZE = 50
+
 class OllamaManager:
     """Class to manage Ollama models, terminal commands, and chat"""
     
-    def __init__(self, host: str = 'localhost', port: int = 11434):
+    def __init__(
+        self,
+        host: str = 'localhost',
+        port: int = 11434,
+        pool_size: int = 10,
+        timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+        pull_parallelism: int = 2,
+        default_context_length: int = 2048,
+        response_cache: Optional[ResponseCache] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        embed_batch_size: int = 32,
+        embed_batch_wait: float = 0.005,
+        embed_max_in_flight: int = 2,
+        persistence: Optional[Persistence] = None,
+        keep_alive: Optional[KeepAlive] = None,
+        model_keep_alive: Optional[Dict[str, KeepAlive]] = None,
+        pinned_models: Optional[List[str]] = None,
+        vram_fraction: float = 0.9,
+        hosts: Optional[List[str]] = None,
+        node_health_interval: float = 10.0,
+        terminal_max_running: int = 4,
+        terminal_output_bytes: int = 1024 * 1024,
+        terminal_timeout: float = 300.0,
+        shared_state: Optional[SharedStore] = None
+    ):
         """Initialize the Ollama manager
         
         Args:
             host: Hostname of Ollama server
             port: Port of Ollama server
+            pool_size: Maximum number of keep-alive connections to Ollama
+            timeouts: (connect, read) timeouts per endpoint type, see http_transport
+            pull_parallelism: Number of model downloads run at the same time
+            default_context_length: num_ctx Ollama uses for models that don't set one
+            response_cache: Cache for deterministic chat responses (default: 256 entries)
+            semantic_cache: Cache matching similar prompts by embedding (default: disabled)
+            embed_batch_size: Maximum texts merged into one /api/embed call
+            embed_batch_wait: Seconds a request waits for others to join its batch
+            embed_max_in_flight: Concurrent /api/embed calls per model
+            persistence: Database store for command history and chats (default: memory only)
+            keep_alive: How long Ollama keeps models loaded after a request (default: Ollama's)
+            model_keep_alive: Per-model keep_alive overrides
+            pinned_models: Models kept loaded indefinitely and never evicted
+            vram_fraction: Share of GPU memory loaded models may fill before LRU eviction
+                (single server only: the local GPU says nothing about remote hosts)
+            hosts: Base URLs of several Ollama servers to route across (default: host and port)
+            node_health_interval: Seconds between health probes of the Ollama servers
+            terminal_max_running: Terminal commands running at the same time
+            terminal_output_bytes: Output kept per terminal command (older output is dropped)
+            terminal_timeout: Default seconds a terminal command may run
+            shared_state: Store shared with the other worker processes; pull
+                progress, the model list, command history and terminal jobs
+                are kept there instead of in this process (default: in-process)
         """
         self.host = host
         self.port = port
@@ -33,16 +117,95 @@ class OllamaManager:
             self.base_url = f"http://{host}:{port}"
             logger.info(f"Using host with port: {self.base_url}")
             
+        # All Ollama calls share one pooled, keep-alive transport
+        self.transport = OllamaTransport(pool_size=pool_size, timeouts=timeouts, hosts=len(hosts or [self.base_url]))
+        
+        # Requests are routed across the Ollama servers; with one server, base_url is it
+        self.node_pool = NodePool(hosts or [self.base_url], self.transport, health_interval=node_health_interval)
+        self.base_url = self.node_pool.primary.url
+        
+        # Concurrent identical reads (model list, GPU probe) share one execution
+        self.single_flight = SingleFlight()
+        
+        # GPU telemetry; sampled in the background once start_gpu_sampler is called
+        self.gpu_sampler = GpuSampler()
+        self.host_metrics = HostMetrics()
+        
+        # Model list snapshot, served stale-while-revalidate: after cache_ttl a
+        # read returns the old snapshot and refreshes it in the background.
+        # Pulls and deletes invalidate it so the next read fetches synchronously.
         self.models_cache = None
+        self.models_etag = None
+        self.models_body = None
         self.models_last_updated = 0
+        self.models_invalidated = False
+        self.models_refreshing = False
+        self.models_version = 0  # Version of the shared snapshot held locally
+        self.models_lock = threading.Lock()
         self.cache_ttl = 30  # 30 seconds cache TTL
-        self.installation_in_progress = False
-        self.installation_status = ""
-        self.installation_progress = ""
-        self.command_history = []
+        
+        # Responses of deterministic chat requests that opted in to caching
+        self.response_cache = response_cache or ResponseCache()
+        # Answers to similar prompts, for requests that opt in with cache="semantic"
+        self.semantic_cache = semantic_cache
+        
+        # Concurrent embedding requests are merged into batched /api/embed calls
+        self.embed_batcher = EmbedBatcher(self.embed, embed_batch_size, embed_batch_wait, embed_max_in_flight)
+        
+        # Which models are loaded; cold models get room made by evicting LRU ones
+        self.residency = ResidencyManager(
+            self.list_running_models,
+            self._load_model,
+            self._gpu_memory,
+            self._model_size,
+            default_keep_alive=keep_alive,
+            keep_alive=model_keep_alive,
+            pinned=pinned_models,
+            vram_fraction=vram_fraction
+        )
+        if len(self.node_pool.nodes) > 1:
+            logger.info("GPU memory based eviction is off with several Ollama servers; keep_alive and pins still apply")
+        
+        # num_ctx per model, read from /api/show on first use
+        self.default_context_length = default_context_length
+        self.context_lengths: Dict[str, int] = {}
+        
+        # Recent commands are kept in memory; the full history goes to the database
         self.max_history = 20
+        self.command_history = deque(maxlen=self.max_history)
+        self.persistence = persistence
         self.lock = threading.Lock()
         
+        # With several worker processes, state every worker must agree on
+        # lives in the shared store; the local fields above stay unused or
+        # act as a cache of it
+        self.shared_state = shared_state
+        self.pull_job_writes: Dict[str, Tuple[str, float]] = {}  # job ID -> (state, time) of the last shared write
+        
+        # Terminal commands run as background jobs with capped output
+        self.terminal_jobs = TerminalJobs(
+            max_running=terminal_max_running,
+            max_output_bytes=terminal_output_bytes,
+            default_timeout=terminal_timeout,
+            on_finish=self._add_to_history,
+            store=shared_state
+        )
+        
+        # Model pulls run on a queue with a fixed number of download workers
+        self.download_scheduler = DownloadScheduler(
+            self._pull_model_thread,
+            parallelism=pull_parallelism
+        )
+        
+        # Progress changes are pushed to subscribers instead of being polled
+        self.event_bus = SharedEventBus(shared_state) if shared_state is not None else EventBus()
+        self.download_scheduler.add_listener(self._on_pull_job_changed)
+        self._publish_progress()
+        
+        if shared_state is not None:
+            # Pulls and deletes in other workers invalidate this worker's caches too
+            threading.Thread(target=self._watch_model_changes, name="model-changes", daemon=True).start()
+        
     def get_models(self, force_refresh: bool = False) -> List[Dict]:
         """Get list of all models
         
@@ -52,45 +215,199 @@ class OllamaManager:
         Returns:
             List of model information dictionaries
         """
-        current_time = time.time()
+        return self.get_models_snapshot(force_refresh)["models"]
+    
+    def get_models_snapshot(self, force_refresh: bool = False) -> Dict[str, Any]:
+        """Get the model list together with its ETag and serialized JSON body
         
-        # Check if we need to refresh the cache
-        if (
-            force_refresh or 
-            self.models_cache is None or 
-            current_time - self.models_last_updated > self.cache_ttl
-        ):
+        Args:
+            force_refresh: Fetch from Ollama even if the snapshot is fresh
+            
+        Returns:
+            Dict with models, etag and body ({"models": [...]} as JSON bytes);
+            etag and body are None if Ollama could not be reached
+        """
+        snapshot, state = self._models_cache_state()
+        if force_refresh or state == "missing":
+            return self._refresh_models()
+        if state == "stale":
+            self._refresh_models_in_background()
+        return snapshot
+    
+    def invalidate_models_cache(self) -> None:
+        """Force the next model list read to fetch from Ollama"""
+        with self.models_lock:
+            self.models_invalidated = True
+        if self.shared_state is not None:
+            self.shared_state.delete(MODELS_KEY)
+    
+    def _models_cache_state(self) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Get the current model list snapshot and whether it can be served
+        
+        Returns:
+            Tuple of (snapshot, state) where state is "fresh", "stale" (serve
+            it, but revalidate) or "missing" (empty or invalidated, must fetch)
+        """
+        with self.models_lock:
+            if self.shared_state is not None and not self._sync_models_snapshot():
+                return None, "missing"
+            if self.models_cache is None or self.models_invalidated:
+                return None, "missing"
+            snapshot = {
+                "models": self.models_cache,
+                "etag": self.models_etag,
+                "body": self.models_body
+            }
+            if time.time() - self.models_last_updated > self.cache_ttl:
+                return snapshot, "stale"
+            return snapshot, "fresh"
+    
+    def _sync_models_snapshot(self) -> bool:
+        """Load the shared model list snapshot if another worker replaced it (models_lock held)
+        
+        Returns:
+            False if there is no shared snapshot (never fetched or invalidated)
+        """
+        version = self.shared_state.version(MODELS_KEY)
+        if version == 0:
+            return False
+        if version != self.models_version:
+            version, shared = self.shared_state.get(MODELS_KEY)
+            if shared is None:
+                return False
+            self.models_cache = shared["models"]
+            self.models_etag = shared["etag"]
+            self.models_body = shared["body"].encode()
+            self.models_last_updated = shared["updated_at"]
+            self.models_invalidated = False
+            self.models_version = version
+        return True
+    
+    def _refresh_models(self) -> Dict[str, Any]:
+        """Fetch the model list from Ollama and store a new snapshot
+        
+        Concurrent refreshes share a single request to Ollama.
+        
+        Returns:
+            The new snapshot, or the previous one (or an empty list) on failure
+        """
+        return self.single_flight.do("models", self._fetch_models)
+    
+    def _fetch_models(self) -> Dict[str, Any]:
+        """Fetch and merge the model lists of all healthy nodes, see _refresh_models"""
+        per_node = []
+        for node in self.node_pool.healthy_nodes():
             try:
-                response = requests.get(f"{self.base_url}/api/tags")
+                response = self.transport.get(f"{node.url}/api/tags")
                 if response.status_code == 200:
-                    models_data = response.json().get("models", [])
-                    
-                    # Format model information
-                    for model in models_data:
-                        # Format model size
-                        size_bytes = model.get("size", 0)
-                        model["size_formatted"] = self._format_size(size_bytes)
-                        
-                        # Format date
-                        if "modified_at" in model:
-                            timestamp = model.get("modified_at")
-                            try:
-                                dt = datetime.fromtimestamp(timestamp)
-                                model["modified_at_formatted"] = dt.strftime("%Y-%m-%d %H:%M:%S")
-                            except Exception:
-                                model["modified_at_formatted"] = "Unknown"
-                                
-                    self.models_cache = models_data
-                    self.models_last_updated = current_time
-                    return models_data
+                    per_node.append((node, response.json().get("models", [])))
                 else:
-                    logger.error(f"Failed to get models: {response.status_code}")
-                    return self.models_cache or []
+                    logger.error(f"Failed to get models from {node.name}: {response.status_code}")
             except Exception as e:
-                logger.error(f"Error getting models: {str(e)}")
-                return self.models_cache or []
-        else:
-            return self.models_cache
+                logger.error(f"Error getting models from {node.name}: {str(e)}")
+        if per_node:
+            return self._store_models(self._merge_models(per_node))
+        
+        with self.models_lock:
+            return {
+                "models": self.models_cache or [],
+                "etag": self.models_etag,
+                "body": self.models_body
+            }
+    
+    def _merge_models(self, per_node: List[Tuple[OllamaNode, List[Dict]]]) -> List[Dict]:
+        """Merge /api/tags lists of several nodes into one entry per model
+        
+        Args:
+            per_node: (node, models) pairs
+            
+        Returns:
+            Model dicts, each with the names of the nodes that have it in "nodes"
+        """
+        merged: Dict[str, Dict] = {}
+        for node, models in per_node:
+            self.node_pool.set_installed(node, [model.get("name", "") for model in models])
+            for model in models:
+                entry = merged.setdefault(model.get("name"), dict(model, nodes=[]))
+                entry["nodes"].append(node.name)
+        return list(merged.values())
+    
+    def _store_models(self, models_data: List[Dict]) -> Dict[str, Any]:
+        """Format a model list from /api/tags and store it as the current snapshot
+        
+        Args:
+            models_data: Model dicts from Ollama
+            
+        Returns:
+            The new snapshot
+        """
+        models_data = self._format_models(models_data)
+        
+        # Serialize once per refresh; the ETag is derived from the exact bytes served
+        body = json.dumps({"models": models_data}, sort_keys=True).encode()
+        etag = hashlib.sha1(body).hexdigest()
+        updated_at = time.time()
+        
+        version = 0
+        if self.shared_state is not None:
+            version = self.shared_state.put(MODELS_KEY, {
+                "models": models_data,
+                "etag": etag,
+                "body": body.decode(),
+                "updated_at": updated_at
+            })
+        
+        with self.models_lock:
+            self.models_cache = models_data
+            self.models_etag = etag
+            self.models_body = body
+            self.models_last_updated = updated_at
+            self.models_invalidated = False
+            self.models_version = version
+        
+        return {"models": models_data, "etag": etag, "body": body}
+    
+    def _refresh_models_in_background(self) -> None:
+        """Revalidate the model list on a background thread (at most one at a time)"""
+        with self.models_lock:
+            if self.models_refreshing:
+                return
+            self.models_refreshing = True
+        
+        def refresh():
+            try:
+                self._refresh_models()
+            finally:
+                with self.models_lock:
+                    self.models_refreshing = False
+        
+        thread = threading.Thread(target=refresh, daemon=True)
+        thread.start()
+    
+    def _format_models(self, models_data: List[Dict]) -> List[Dict]:
+        """Add display fields to the model entries returned by /api/tags
+        
+        Args:
+            models_data: Model dicts from Ollama
+            
+        Returns:
+            The same list, with size_formatted and modified_at_formatted set
+        """
+        for model in models_data:
+            # Format model size
+            size_bytes = model.get("size", 0)
+            model["size_formatted"] = self._format_size(size_bytes)
+            
+            # Format date
+            if "modified_at" in model:
+                timestamp = model.get("modified_at")
+                try:
+                    dt = datetime.fromtimestamp(timestamp)
+                    model["modified_at_formatted"] = dt.strftime("%Y-%m-%d %H:%M:%S")
+                except Exception:
+                    model["modified_at_formatted"] = "Unknown"
+        
+        return models_data
     
     def get_model_names(self) -> List[str]:
         """Get list of all model names
@@ -101,50 +418,106 @@ class OllamaManager:
         models = self.get_models()
         return [model.get("name") for model in models]
     
-    def pull_model(self, model_name: str) -> str:
+    def pull_model(self, model_name: str, priority: int = 0) -> str:
         """Pull a model from Ollama
         
         Args:
             model_name: Name of the model to pull
+            priority: Higher values are downloaded first
             
         Returns:
             Status message
         """
-        if self.installation_in_progress:
-            return f"Installation already in progress. Please wait."
+        job, created = self.queue_pull(model_name, priority)
+        if not created:
+            return f"{model_name} is already being installed (job {job['id']})."
+        return f"Queued installation of {model_name} (job {job['id']}). This may take several minutes."
+    
+    def queue_pull(self, model_name: str, priority: int = 0) -> Tuple[Dict[str, Any], bool]:
+        """Queue a model pull on the download scheduler
+        
+        Args:
+            model_name: Name of the model to pull
+            priority: Higher values are downloaded first
             
-        self.installation_in_progress = True
-        self.installation_status = f"Installing {model_name}..."
-        self.installation_progress = "0%"
+        Returns:
+            Tuple of (job dict, created); created is False if the model was
+            already queued or downloading
+        """
+        if self.shared_state is not None:
+            # The model may be downloading in another worker
+            for job in self.get_pull_jobs():
+                if job["model"] == model_name and job["state"] in ("queued", "running"):
+                    return job, False
+        job, created = self.download_scheduler.submit(model_name, priority)
+        return job.to_dict(), created
+    
+    def get_pull_jobs(self) -> List[Dict[str, Any]]:
+        """Get active and recently finished pull jobs
         
-        # Start a background thread for the installation
-        thread = threading.Thread(
-            target=self._pull_model_thread,
-            args=(model_name,)
-        )
-        thread.daemon = True
-        thread.start()
+        Returns:
+            List of job dicts, newest first
+        """
+        if self.shared_state is None:
+            return self.download_scheduler.list_jobs()
+        jobs = [self._shared_pull_job(job) for _, _, job in self.shared_state.items(PULL_JOB_PREFIX)]
+        jobs.sort(key=lambda job: job["created_at"], reverse=True)
+        return jobs
+    
+    def get_pull_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a single pull job
+        
+        Args:
+            job_id: Job ID
+            
+        Returns:
+            Job dict, or None if unknown
+        """
+        if self.shared_state is None:
+            return self.download_scheduler.get_job(job_id)
+        job = self.shared_state.get(f"{PULL_JOB_PREFIX}{job_id}")[1]
+        return self._shared_pull_job(job) if job is not None else None
+    
+    def _shared_pull_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Mark a shared pull job failed if the worker running it is gone
         
-        return f"Started installing {model_name}. This may take several minutes."
+        Args:
+            job: Job dict from the shared state, with the owner's process ID
+            
+        Returns:
+            The job dict for the API
+        """
+        job = dict(job)
+        owner = job.pop("owner", None)
+        if job["state"] in ("queued", "running") and not process_alive(owner):
+            job.update(
+                state="failed",
+                message=f"Failed to install {job['model']}: the worker process exited",
+                error="Worker exited",
+                eta_seconds=None,
+                finished_at=job["created_at"]
+            )
+        return job
         
-    def _pull_model_thread(self, model_name: str) -> None:
-        """Thread function to pull a model
+    def _pull_model_thread(self, job: DownloadJob) -> None:
+        """Scheduler worker function to pull a model
         
         Args:
-            model_name: Name of the model to pull
+            job: Download job to run
         """
+        model_name = job.model_name
+        scheduler = self.download_scheduler
+        # Install on a node that doesn't have the model yet; repeat installs spread it further
+        node = self.node_pool.choose(exclude=self.node_pool.nodes_with(model_name))
         try:
             # Use Ollama API to pull the model with streaming enabled
-            with requests.post(
-                f"{self.base_url}/api/pull",
+            with self.transport.post(
+                f"{node.url}/api/pull",
+                endpoint_type="pull",
                 json={"name": model_name, "stream": True},  # Enable streaming for progress updates
-                stream=True,  # Enable streaming in requests
-                timeout=3600  # 1 hour timeout
+                stream=True  # Enable streaming in requests
             ) as response:
                 if response.status_code == 200:
-                    total_size = 0
-                    downloaded = 0
-                    
                     # Process the streaming response line by line
                     for line in response.iter_lines():
                         if line:
@@ -152,122 +525,241 @@ class OllamaManager:
                                 # Parse the JSON line
                                 progress_data = json.loads(line)
                                 
+                                if progress_data.get("error"):
+                                    scheduler.fail(job, f"Failed to install {model_name}: {progress_data['error']}")
+                                    logger.error(f"Error pulling {model_name}: {progress_data['error']}")
+                                    return
+                                
                                 # Check for completion
                                 if progress_data.get("status") == "success":
-                                    self.installation_status = f"Successfully installed {model_name}"
-                                    self.installation_progress = "100% - Complete"
+                                    scheduler.complete(job, f"Successfully installed {model_name}")
                                     logger.info(f"Successfully installed model: {model_name}")
-                                    
-                                    # Start a timer to clear the status after completion
-                                    status_clear_timer = threading.Timer(
-                                        10.0,  # Clear status after 10 seconds
-                                        self._clear_installation_status
-                                    )
-                                    status_clear_timer.daemon = True
-                                    status_clear_timer.start()
-                                    break
+                                    return
                                 
                                 # Update progress based on download information
-                                if "total" in progress_data:
-                                    total_size = progress_data.get("total", 0)
-                                
-                                if "completed" in progress_data:
-                                    downloaded = progress_data.get("completed", 0)
-                                    if total_size > 0:
-                                        percent = int((downloaded / total_size) * 100)
-                                        self.installation_progress = f"{percent}%"
-                                        self.installation_status = f"Installing {model_name}... ({self._format_size(downloaded)} of {self._format_size(total_size)})"
-                                        logger.info(f"Download progress for {model_name}: {percent}%")
-                                
-                                # Handle digest pulling message
-                                if progress_data.get("status") == "pulling digest":
-                                    digest = progress_data.get("digest", "")
-                                    if digest:
-                                        self.installation_status = f"Pulling digest for {model_name}: {digest}"
-                                        logger.info(f"Pulling digest: {digest}")
+                                if "total" in progress_data and "completed" in progress_data:
+                                    scheduler.update_progress(
+                                        job,
+                                        progress_data.get("digest", ""),
+                                        progress_data.get("completed", 0),
+                                        progress_data.get("total", 0)
+                                    )
+                                    progress = job.to_dict()
+                                    scheduler.set_message(
+                                        job,
+                                        f"Installing {model_name}... ({self._format_size(progress['completed_bytes'])} of {self._format_size(progress['total_bytes'])})"
+                                    )
+                                    logger.debug(f"Download progress for {model_name}: {progress['percent']}%")
+                                elif progress_data.get("status"):
+                                    scheduler.set_message(job, f"{model_name}: {progress_data['status']}")
                             except json.JSONDecodeError:
                                 # Skip lines that aren't valid JSON
                                 pass
                             except Exception as e:
                                 logger.error(f"Error processing progress update: {str(e)}")
                     
-                    # Final check - if we have a non-100% progress but finished successfully
-                    if not self.installation_progress.startswith("100%"):
-                        self.installation_status = f"Successfully installed {model_name}"
-                        self.installation_progress = "100% - Complete"
-                        logger.info(f"Installation of {model_name} completed")
-                        
-                        # Start a timer to clear the status after completion
-                        status_clear_timer = threading.Timer(
-                            10.0,  # Clear status after 10 seconds
-                            self._clear_installation_status
-                        )
-                        status_clear_timer.daemon = True
-                        status_clear_timer.start()
+                    # Stream ended without an explicit success message
+                    scheduler.complete(job, f"Successfully installed {model_name}")
+                    logger.info(f"Installation of {model_name} completed")
                 else:
                     error_msg = f"Failed to install {model_name}: {response.status_code}"
-                    self.installation_status = error_msg
-                    self.installation_progress = "Failed"
-                    logger.error(error_msg)
-                    
                     try:
                         error_text = response.text
                         if error_text:
-                            self.installation_status = f"Failed to install {model_name}: {error_text}"
-                            logger.error(f"Error response: {error_text}")
+                            error_msg = f"Failed to install {model_name}: {error_text}"
                     except Exception:
                         pass
                     
-                    # Start a timer to clear the error status
-                    status_clear_timer = threading.Timer(
-                        30.0,  # Clear error status after 30 seconds
-                        self._clear_installation_status
-                    )
-                    status_clear_timer.daemon = True
-                    status_clear_timer.start()
+                    scheduler.fail(job, error_msg)
+                    logger.error(error_msg)
         except Exception as e:
             error_msg = f"Error installing {model_name}: {str(e)}"
-            self.installation_status = error_msg
-            self.installation_progress = "Failed"
+            scheduler.fail(job, error_msg)
             logger.error(error_msg)
-            
-            # Start a timer to clear the error status
-            status_clear_timer = threading.Timer(
-                30.0,  # Clear error status after 30 seconds
-                self._clear_installation_status
-            )
-            status_clear_timer.daemon = True
-            status_clear_timer.start()
-        finally:
-            # Ensure we always mark installation as complete
-            self.installation_in_progress = False
-    
-    def _clear_installation_status(self):
-        """Clear installation status and progress"""
-        logger.info("Clearing installation status and progress")
-        self.installation_status = ""
-        self.installation_progress = ""
-        self.installation_in_progress = False
     
     def get_installation_progress(self) -> Dict[str, Any]:
-        """Get the current installation progress
+        """Get a summary of installation progress across all pull jobs
         
         Returns:
             Dict with status and progress information
         """
-        # Only include detailed information if there's an active installation or status has been set
-        if self.installation_in_progress or self.installation_status or self.installation_progress:
-            return {
-                "status": self.installation_status,
-                "progress": self.installation_progress,
-                "in_progress": self.installation_in_progress
-            }
-        else:
-            # Return a minimal response when nothing is happening
-            # This helps reduce unnecessary data transfer for frequent polling
+        jobs = self.get_pull_jobs()
+        active = [job for job in jobs if job["state"] in ("queued", "running")]
+        
+        if active:
+            # Report the oldest running download, or the next queued one
+            running = [job for job in active if job["state"] == "running"]
+            current = (running or active)[-1]
+            status = current["message"]
+            if len(active) > 1:
+                status += f" (+{len(active) - 1} more queued or downloading)"
             return {
-                "in_progress": False
+                "status": status,
+                "progress": f"{current['percent'] or 0}%",
+                "in_progress": True,
+                "active_jobs": len(active)
             }
+        
+        # Keep reporting the last finished job for a short while so the UI can
+        # show the outcome (10 seconds after success, 30 after a failure)
+        finished = [job for job in jobs if job["finished_at"]]
+        if finished:
+            last = max(finished, key=lambda job: job["finished_at"])
+            failed = last["state"] == "failed"
+            if time.time() - last["finished_at"] < (FAILURE_STATUS_SECONDS if failed else SUCCESS_STATUS_SECONDS):
+                return {
+                    "status": last["message"],
+                    "progress": "Failed" if failed else "100% - Complete",
+                    "in_progress": False
+                }
+        
+        # Return a minimal response when nothing is happening
+        # This helps reduce unnecessary data transfer for frequent polling
+        return {
+            "in_progress": False
+        }
+    
+    def _on_pull_job_changed(self, job: DownloadJob) -> None:
+        """Download scheduler listener: publish the new progress summary
+        
+        Args:
+            job: The job that changed
+        """
+        if self.shared_state is not None and not self._share_pull_job(job):
+            return
+        self._publish_progress()
+        
+        if job.state == "completed":
+            self._model_changed(job.model_name)
+        
+        if job.finished_at is not None:
+            # Publish again once the finished job drops out of the summary
+            failed = job.state == "failed"
+            clear_timer = threading.Timer(
+                (FAILURE_STATUS_SECONDS if failed else SUCCESS_STATUS_SECONDS) + 0.1,
+                self._publish_progress
+            )
+            clear_timer.daemon = True
+            clear_timer.start()
+    
+    def _share_pull_job(self, job: DownloadJob) -> bool:
+        """Write a pull job to the shared state for the other workers
+        
+        Progress of a running job is written at most every
+        PULL_SHARE_INTERVAL seconds; state changes are always written.
+        
+        Args:
+            job: The job that changed
+            
+        Returns:
+            False if the write was skipped (a later one carries the change)
+        """
+        now = time.monotonic()
+        with self.lock:
+            last = self.pull_job_writes.get(job.id)
+            if last is not None and last[0] == job.state and now - last[1] < PULL_SHARE_INTERVAL:
+                return False
+            if job.finished_at is not None:
+                self.pull_job_writes.pop(job.id, None)
+            else:
+                self.pull_job_writes[job.id] = (job.state, now)
+        
+        self.shared_state.put(f"{PULL_JOB_PREFIX}{job.id}", dict(job.to_dict(), owner=os.getpid()))
+        if job.finished_at is not None:
+            # Jobs of exited workers count as finished too
+            jobs = [(key, self._shared_pull_job(data)) for key, _, data in self.shared_state.items(PULL_JOB_PREFIX)]
+            finished = [(data["finished_at"], key) for key, data in jobs if data["finished_at"] is not None]
+            finished.sort()
+            self.shared_state.delete(*[key for _, key in finished[:max(0, len(finished) - SHARED_HISTORY_SIZE)]])
+        return True
+    
+    def _publish_progress(self) -> None:
+        """Publish the installation progress summary and active jobs"""
+        jobs = [job for job in self.get_pull_jobs() if job["state"] in ("queued", "running")]
+        self.event_bus.publish(PROGRESS_TOPIC, {
+            "progress": self.get_installation_progress(),
+            "jobs": jobs
+        })
+    
+    def _model_changed(self, model_name: str) -> None:
+        """Drop cached state of a model that was installed or deleted, in every worker
+        
+        Args:
+            model_name: Name of the model
+        """
+        self.invalidate_models_cache()
+        self._forget_model(model_name)
+        if self.shared_state is not None:
+            def add_change(changes):
+                changes = changes or []
+                seq = changes[-1][0] + 1 if changes else 1
+                return (changes + [[seq, model_name, os.getpid()]])[-SHARED_HISTORY_SIZE:]
+            self.shared_state.update(MODEL_CHANGES_KEY, add_change)
+    
+    def _forget_model(self, model_name: str) -> None:
+        """Drop this process's cached responses, residency and context length of a model
+        
+        Args:
+            model_name: Name of the model
+        """
+        self.response_cache.invalidate_model(model_name)
+        self.residency.forget(model_name)
+        with self.lock:
+            self.context_lengths.pop(model_name, None)
+        if self.semantic_cache is not None:
+            self.semantic_cache.invalidate_model(model_name)
+    
+    def _watch_model_changes(self) -> None:
+        """Apply model changes made by other workers to this worker's caches"""
+        version, changes = self.shared_state.get(MODEL_CHANGES_KEY)
+        seen = changes[-1][0] if changes else 0
+        while True:
+            try:
+                change = self.shared_state.wait(MODEL_CHANGES_KEY, version, 60)
+                if change is None:
+                    continue
+                version, changes = change
+                for seq, model_name, pid in changes or []:
+                    if seq > seen and pid != os.getpid():
+                        self._forget_model(model_name)
+                if changes:
+                    seen = changes[-1][0]
+            except Exception as e:
+                logger.error(f"Error watching model changes: {str(e)}")
+                time.sleep(1)
+    
+    def get_progress_version(self) -> int:
+        """Get the version cursor of the current progress state
+        
+        Returns:
+            Version number, increasing with every change
+        """
+        return self.event_bus.get(PROGRESS_TOPIC)[0]
+    
+    def wait_for_progress(self, since: int, timeout: float) -> Tuple[int, Dict[str, Any]]:
+        """Wait until the progress state changes past a version cursor
+        
+        Args:
+            since: Last version the caller has seen
+            timeout: Maximum seconds to wait
+            
+        Returns:
+            Tuple of (version, state); the current state if nothing changed in time
+        """
+        change = self.event_bus.wait_for_change(PROGRESS_TOPIC, since, timeout)
+        return change or self.event_bus.get(PROGRESS_TOPIC)
+    
+    def subscribe_progress(self, since: int = 0, min_interval: float = 0.5) -> Iterator[Optional[Tuple[int, Dict[str, Any]]]]:
+        """Subscribe to progress changes, coalesced to at most one per min_interval
+        
+        Args:
+            since: Last version the caller has seen
+            min_interval: Minimum seconds between two deliveries
+            
+        Yields:
+            (version, state) tuples, or None as a keepalive tick
+        """
+        return self.event_bus.subscribe(PROGRESS_TOPIC, since, min_interval)
     
     def delete_model(self, model_name: str) -> str:
         """Delete a model from Ollama
@@ -279,21 +771,31 @@ class OllamaManager:
             Status message
         """
         try:
-            response = requests.delete(
-                f"{self.base_url}/api/delete",
-                json={"name": model_name}
-            )
+            # Delete from every node; the model may be installed on several
+            statuses = []
+            for node in self.node_pool.nodes:
+                try:
+                    statuses.append(self.transport.delete(f"{node.url}/api/delete", json={"name": model_name}).status_code)
+                except requests.RequestException as e:
+                    logger.warning(f"Could not delete {model_name} on {node.name}: {str(e)}")
+            if not statuses:
+                raise RuntimeError("No Ollama server could be reached")
+            status_code = 200 if 200 in statuses else statuses[0]
             
-            if response.status_code == 200:
+            if status_code == 200:
+                self._model_changed(model_name)
                 return f"Successfully deleted {model_name}"
             else:
-                return f"Failed to delete {model_name}: {response.status_code}"
+                return f"Failed to delete {model_name}: {status_code}"
         except Exception as e:
             logger.error(f"Error deleting model {model_name}: {str(e)}")
             return f"Error deleting model: {str(e)}"
     
     def execute_command(self, command: str, timeout: int = 30) -> str:
-        """Execute a command in the terminal
+        """Execute a command in the terminal and wait for it to finish
+        
+        Runs as a terminal job, so the output kept is capped like for jobs
+        started through start_terminal_job.
         
         Args:
             command: Command to execute
@@ -304,55 +806,48 @@ class OllamaManager:
         """
         if not command or command.strip() == "":
             return "No command specified"
-            
-        command = command.strip()
-        logger.info(f"Executing command: {command}")
-        
-        # Record the command in history
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         try:
-            # Execute the command
-            process = subprocess.Popen(
-                command,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            # Wait for the command to complete with timeout
-            try:
-                stdout, stderr = process.communicate(timeout=timeout)
-                exit_code = process.returncode
-                
-                # Process output
-                output = ""
-                if stdout:
-                    output += stdout
-                if stderr:
-                    if output:
-                        output += "\n\nERROR:\n"
-                    output += stderr
-                    
-                status = "SUCCESS" if exit_code == 0 else "ERROR"
-                self._add_to_history(command, status, timestamp)
-                
-                logger.info(f"Command completed with exit code {exit_code}")
-                return f"Exit Code: {exit_code}\n\n{output}"
-                
-            except subprocess.TimeoutExpired:
-                process.kill()
-                stdout, stderr = process.communicate()
-                self._add_to_history(command, "TIMEOUT", timestamp)
-                
-                logger.warning(f"Command timed out after {timeout} seconds: {command}")
-                return f"Command timed out after {timeout} seconds"
-                
+            job = self.terminal_jobs.start(command.strip(), timeout)
+        except TerminalBusy as e:
+            return f"Error executing command: {str(e)}"
         except Exception as e:
-            self._add_to_history(command, "ERROR", timestamp)
+            self._add_to_history(command.strip(), "ERROR", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
             logger.error(f"Error executing command: {str(e)}")
             return f"Error executing command: {str(e)}"
+        
+        self.terminal_jobs.wait(job)
+        output = job.output.read(0, limit=job.output.max_bytes)
+        text = output["text"]
+        if output["dropped"]:
+            text = f"[... {output['dropped']} bytes of earlier output dropped ...]\n{text}"
+        if job.state == TIMEOUT:
+            return f"Command timed out after {job.timeout:g} seconds\n\n{text}"
+        if job.error:
+            return f"Error executing command: {job.error}"
+        return f"Exit Code: {job.exit_code}\n\n{text}"
+    
+    def start_terminal_job(self, command: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Start a terminal command in the background
+        
+        Args:
+            command: Command to execute
+            timeout: Seconds before the command is stopped (default: the configured timeout)
+            
+        Returns:
+            The job as a dict
+            
+        Raises:
+            TerminalBusy: If the maximum number of commands is already running
+            ValueError: If the command is empty
+        """
+        if not command or not command.strip():
+            raise ValueError("Command is required")
+        try:
+            return self.terminal_jobs.start(command.strip(), timeout).to_dict()
+        except OSError:
+            self._add_to_history(command.strip(), "ERROR", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            raise
     
     def _add_to_history(self, command: str, status: str, timestamp: str) -> None:
         """Add a command to history
@@ -362,13 +857,15 @@ class OllamaManager:
             status: Command status (SUCCESS, ERROR, etc.)
             timestamp: Timestamp when the command was executed
         """
-        # Add to beginning of list
-        with self.lock:
-            self.command_history.insert(0, [command, status, timestamp])
-            
-            # Trim history if needed
-            if len(self.command_history) > self.max_history:
-                self.command_history = self.command_history[:self.max_history]
+        if self.shared_state is not None:
+            self.shared_state.append(HISTORY_STREAM, json.dumps([command, status, timestamp]).encode())
+            self.shared_state.trim(HISTORY_STREAM, keep=self.max_history)
+        else:
+            # Newest first; the deque drops the oldest entry beyond max_history
+            with self.lock:
+                self.command_history.appendleft([command, status, timestamp])
+        if self.persistence is not None:
+            self.persistence.record_command(command, status, timestamp)
     
     def get_command_history(self) -> List[List[str]]:
         """Get command history
@@ -376,42 +873,65 @@ class OllamaManager:
         Returns:
             List of [command, status, timestamp] lists
         """
+        if self.shared_state is not None:
+            records = self.shared_state.read(HISTORY_STREAM, limit=self.max_history, newest_first=True)
+            return [json.loads(data) for _, data in records]
         with self.lock:
-            return self.command_history
+            return list(self.command_history)
     
-    def chat(self, model: str, message: str) -> str:
+    def chat(
+        self,
+        model: str,
+        message: str,
+        options: Optional[Dict[str, Any]] = None,
+        cache: Any = False
+    ) -> str:
         """Send a chat message to a model
         
         Args:
             model: Model name
             message: User message
+            options: Ollama generation options (temperature, seed, num_ctx, ...)
+            cache: True to reuse the response of an identical earlier request
+                when decoding is deterministic (temperature 0), "force" to cache
+                regardless of temperature, "semantic" to additionally reuse the
+                response to a similar prompt sent with the same options (needs the
+                semantic cache enabled; the exact cache still only applies at temperature 0)
             
         Returns:
             Model response
         """
+        messages = [
+            {
+                "role": "user",
+                "content": message
+            }
+        ]
+        cached, cache_lookup = self._chat_cache_lookup(model, message, messages, options, cache)
+        if cached is not None:
+            self._record_chat(model, message, cached)
+            return cached
+        
         try:
             payload = {
                 "model": model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": message
-                    }
-                ],
+                "messages": messages,
                 "stream": False  # Ensure we get a complete response, not a stream
             }
+            if options:
+                payload["options"] = options
+            self._prepare_model(model, payload)
             
-            logger.info(f"Sending chat request to {self.base_url}/api/chat for model {model}")
-            
-            response = requests.post(
-                f"{self.base_url}/api/chat",
-                json=payload
-            )
+            response = self._routed_request("POST", "/api/chat", model, json=payload)
             
             if response.status_code == 200:
                 try:
                     response_json = response.json()
-                    return response_json.get("message", {}).get("content", "")
+                    observe_generation(model, response_json)
+                    content = response_json.get("message", {}).get("content", "")
+                    self._chat_cache_store(cache_lookup, model, message, content)
+                    self._record_chat(model, message, content)
+                    return content
                 except json.JSONDecodeError as e:
                     logger.error(f"JSON decode error: {str(e)}, Response content: {response.text[:200]}...")
                     
@@ -440,6 +960,573 @@ class OllamaManager:
             logger.error(f"Error in chat: {str(e)}")
             return f"Error: {str(e)}"
     
+    def _record_chat(self, model: str, message: str, response: str) -> None:
+        """Queue a completed single-message exchange for the database, if enabled"""
+        if self.persistence is None:
+            return
+        self.persistence.record_chat(None, model, "user", message)
+        self.persistence.record_chat(None, model, "assistant", response)
+    
+    def _chat_cache_key(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]],
+        cache: Any
+    ) -> Optional[str]:
+        """Get the response cache key of a chat request, None if it must not be cached
+        
+        Args:
+            model: Model name
+            messages: Chat messages
+            options: Ollama generation options
+            cache: The request's cache setting, see chat
+            
+        Returns:
+            Cache key, or None when caching is off or the request is non-deterministic
+        """
+        if not cache or not self.response_cache.enabled:
+            return None
+        if cache != "force" and not is_deterministic(options):
+            self.response_cache.skip()
+            return None
+        return self.response_cache.make_key(model, self._model_digest(model), messages, options)
+    
+    def _chat_cache_lookup(
+        self,
+        model: str,
+        message: str,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]],
+        cache: Any
+    ) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Look up a chat request in the exact and, if requested, the semantic cache
+        
+        Args:
+            model: Model name
+            message: User message (embedded for the semantic lookup)
+            messages: Chat messages
+            options: Ollama generation options
+            cache: The request's cache setting, see chat
+            
+        Returns:
+            Tuple of (cached response or None, lookup state for _chat_cache_store)
+        """
+        lookup = {"key": None, "semantic": False, "vector": None, "options": options}
+        if not cache:
+            return None, lookup
+        
+        lookup["key"] = self._chat_cache_key(model, messages, options, cache)
+        if lookup["key"] is not None:
+            cached = self.response_cache.get(lookup["key"])
+            if cached is not None:
+                return cached, lookup
+        
+        if cache == "semantic" and self.semantic_cache is not None:
+            lookup["semantic"] = True
+            cached, lookup["vector"] = self.semantic_cache.lookup(model, message, options)
+            if cached is not None:
+                return cached, lookup
+        return None, lookup
+    
+    def _chat_cache_store(self, lookup: Dict[str, Any], model: str, message: str, content: str) -> None:
+        """Store a fresh response in the caches its lookup missed, see _chat_cache_lookup"""
+        if lookup["key"] is not None:
+            self.response_cache.put(lookup["key"], model, content)
+        if lookup["semantic"]:
+            self.semantic_cache.store(model, message, content, lookup["vector"], lookup["options"])
+    
+    def embed(self, model: str, inputs: List[str]) -> List[List[float]]:
+        """Embed texts with an Ollama embedding model
+        
+        Args:
+            model: Embedding model name (e.g. nomic-embed-text)
+            inputs: Texts to embed
+            
+        Returns:
+            One vector per input
+            
+        Raises:
+            RuntimeError: If Ollama returns an error
+        """
+        payload = {"model": model, "input": inputs}
+        self._prepare_model(model, payload)
+        response = self._routed_request("POST", "/api/embed", model, endpoint_type="embed", json=payload)
+        if response.status_code != 200:
+            try:
+                error = response.json().get("error")
+            except ValueError:
+                error = None
+            raise RuntimeError(error or f"Embedding failed with status code {response.status_code}")
+        return response.json().get("embeddings", [])
+    
+    def embed_batched(self, model: str, inputs: List[str]) -> List[List[float]]:
+        """Embed texts, merging the call with concurrent requests for the same model
+        
+        Args:
+            model: Embedding model name
+            inputs: Texts to embed
+            
+        Returns:
+            One vector per input
+        """
+        return self.embed_batcher.embed(model, inputs)
+    
+    def get_embed_batcher_stats(self) -> Dict[str, Any]:
+        """Get embedding batch sizes and fill ratio
+        
+        Returns:
+            Dict with request, text and batch counters
+        """
+        return self.embed_batcher.get_stats()
+    
+    def get_semantic_cache_stats(self) -> Dict[str, Any]:
+        """Get semantic cache hit rates and similarity distribution
+        
+        Returns:
+            Dict with counters and a similarity histogram, or {"enabled": False}
+        """
+        if self.semantic_cache is None:
+            return {"enabled": False}
+        stats = self.semantic_cache.get_stats()
+        stats["enabled"] = True
+        return stats
+    
+    def _model_digest(self, model: str) -> Optional[str]:
+        """Look up the digest of an installed model in the model list snapshot
+        
+        Args:
+            model: Model name
+            
+        Returns:
+            Digest, or None if the model is not in the snapshot
+        """
+        with self.models_lock:
+            models = self.models_cache or []
+        names = {model, model if ":" in model else f"{model}:latest"}
+        for entry in models:
+            if entry.get("name") in names or entry.get("model") in names:
+                return entry.get("digest")
+        return None
+    
+    def get_response_cache_stats(self) -> Dict[str, Any]:
+        """Get chat response cache counters
+        
+        Returns:
+            Dict with hits, misses, evictions, entries and bytes
+        """
+        return self.response_cache.get_stats()
+    
+    def chat_stream(
+        self,
+        model: str,
+        message: Optional[str],
+        messages: Optional[List[Dict[str, Any]]] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream a chat response from a model as it is generated
+        
+        Closing the generator (e.g. when the browser disconnects) closes the
+        upstream connection, which makes Ollama abort the generation.
+        
+        Args:
+            model: Model name
+            message: User message (ignored if messages is given)
+            messages: Full conversation to send instead of a single message
+            options: Ollama generation options
+            
+        Yields:
+            Event dicts: {"type": "token", "content": ...} for each chunk, then a
+            final {"type": "done", ...} with timing stats or {"type": "error", ...}
+        """
+        payload = {
+            "model": model,
+            "messages": messages or [
+                {
+                    "role": "user",
+                    "content": message
+                }
+            ],
+            "stream": True
+        }
+        if options:
+            payload["options"] = options
+        self._prepare_model(model, payload)
+        
+        start_time = time.monotonic()
+        first_token_time = None
+        finished = False
+        # Whole conversations are recorded by their owner (e.g. the session manager)
+        content_parts = [] if messages is None else None
+        
+        try:
+            # The node counts the request as outstanding until the stream is closed
+            response, lease = self._send_routed("POST", "/api/chat", model, json=payload, stream=True)
+        except Exception as e:
+            logger.error(f"Error in streaming chat: {str(e)}")
+            yield {"type": "error", "error": str(e)}
+            return
+        
+        try:
+            if response.status_code != 200:
+                logger.error(f"Error in streaming chat response: {response.status_code}")
+                finished = True
+                yield {
+                    "type": "error",
+                    "error": f"Failed to get response from model. Status code: {response.status_code}"
+                }
+                return
+            
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line)
+                except json.JSONDecodeError:
+                    # Skip lines that aren't valid JSON
+                    continue
+                
+                if chunk.get("error"):
+                    finished = True
+                    yield {"type": "error", "error": chunk["error"]}
+                    return
+                
+                content = chunk.get("message", {}).get("content", "")
+                if content:
+                    if first_token_time is None:
+                        first_token_time = time.monotonic()
+                    if content_parts is not None:
+                        content_parts.append(content)
+                    yield {"type": "token", "content": content}
+                
+                if chunk.get("done"):
+                    finished = True
+                    observe_generation(model, chunk)
+                    if content_parts is not None:
+                        self._record_chat(model, message, "".join(content_parts))
+                    yield self._stream_stats(chunk, start_time, first_token_time)
+                    return
+            
+            finished = True
+            yield {"type": "error", "error": "Stream ended before the model finished responding"}
+        except GeneratorExit:
+            if not finished:
+                logger.info(f"Client disconnected, cancelling generation for model {model}")
+            raise
+        except Exception as e:
+            logger.error(f"Error in streaming chat: {str(e)}")
+            yield {"type": "error", "error": str(e)}
+        finally:
+            # Dropping the connection is what tells Ollama to stop generating
+            response.close()
+            lease.done()
+    
+    def chat_messages(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Send a whole conversation to a model and wait for the reply
+        
+        Args:
+            model: Model name
+            messages: Chat messages, oldest first
+            options: Ollama generation options
+            
+        Returns:
+            Dict with content and Ollama's prompt/eval token counts
+            
+        Raises:
+            RuntimeError: If Ollama fails to answer
+        """
+        payload = {"model": model, "messages": messages, "stream": False}
+        if options:
+            payload["options"] = options
+        self._prepare_model(model, payload)
+        
+        start_time = time.monotonic()
+        response = self._routed_request("POST", "/api/chat", model, json=payload)
+        if response.status_code != 200:
+            try:
+                error = response.json().get("error")
+            except ValueError:
+                error = None
+            raise RuntimeError(error or f"Failed to get response from model. Status code: {response.status_code}")
+        
+        result = response.json()
+        observe_generation(model, result)
+        return {
+            "content": result.get("message", {}).get("content", ""),
+            "done_reason": result.get("done_reason"),
+            "prompt_eval_count": result.get("prompt_eval_count", 0),
+            "eval_count": result.get("eval_count", 0),
+            "total_ms": round((time.monotonic() - start_time) * 1000, 1)
+        }
+    
+    def _prepare_model(self, model: str, payload: Dict[str, Any]) -> None:
+        """Make sure a model can be loaded and set its keep_alive on a request payload
+        
+        Args:
+            model: Model name
+            payload: Ollama request body, updated in place
+        """
+        self.residency.prepare(model)
+        keep_alive = self.residency.keep_alive_for(model)
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+    
+    def _send_routed(
+        self,
+        method: str,
+        path: str,
+        model: Optional[str] = None,
+        endpoint_type: str = "chat",
+        **kwargs
+    ) -> Tuple[requests.Response, Lease]:
+        """Send a request to the node chosen for a model
+        
+        If the node cannot be reached, the request is retried on the next
+        node. The caller must call lease.done() once the response is consumed.
+        
+        Args:
+            method: HTTP method
+            path: API path, e.g. /api/chat
+            model: Model the request is for, used for affinity
+            endpoint_type: Timeout class, see http_transport
+            **kwargs: Passed to the transport (json, stream, ...)
+            
+        Returns:
+            Tuple of (response, lease)
+        """
+        tried = []
+        while True:
+            lease = self.node_pool.lease(model, exclude=tried)
+            try:
+                response = self.transport.request(method, f"{lease.url}{path}", endpoint_type, **kwargs)
+            except requests.ConnectionError as e:
+                lease.done(e)
+                tried.append(lease.node)
+                if len(tried) >= len(self.node_pool.nodes):
+                    raise
+                logger.warning(f"Ollama node {lease.node.name} unreachable, retrying {path} on another node")
+                continue
+            except Exception as e:
+                lease.done(e)
+                raise
+            if model and endpoint_type in ("chat", "embed") and response.status_code == 200:
+                self.node_pool.mark_loaded(lease.node, model)
+            return response, lease
+    
+    def _routed_request(
+        self,
+        method: str,
+        path: str,
+        model: Optional[str] = None,
+        endpoint_type: str = "chat",
+        **kwargs
+    ) -> requests.Response:
+        """Like _send_routed for non-streaming requests, which are done once they return"""
+        response, lease = self._send_routed(method, path, model, endpoint_type, **kwargs)
+        lease.done()
+        return response
+    
+    def get_node_stats(self) -> Dict[str, Any]:
+        """Get health, outstanding requests, latency and models per Ollama node
+        
+        Returns:
+            Dict with nodes and pool settings
+        """
+        return self.node_pool.get_stats()
+    
+    def list_running_models(self) -> List[Dict[str, Any]]:
+        """Get the models Ollama currently has loaded (/api/ps)
+        
+        Concurrent calls share one request.
+        
+        Returns:
+            List of model dicts with size, size_vram and expires_at
+            
+        Raises:
+            RuntimeError: If Ollama cannot be asked
+        """
+        return self.single_flight.do("ps", self._fetch_running_models)
+    
+    def _fetch_running_models(self) -> List[Dict[str, Any]]:
+        """Fetch the loaded models of all healthy nodes, see list_running_models"""
+        nodes = self.node_pool.healthy_nodes()
+        models = []
+        errors = []
+        for node in nodes:
+            try:
+                response = self.transport.get(f"{node.url}/api/ps")
+                if response.status_code != 200:
+                    raise RuntimeError(f"status code {response.status_code}")
+            except Exception as e:
+                errors.append(f"{node.name}: {str(e)}")
+                continue
+            for entry in response.json().get("models", []):
+                models.append(dict(entry, node=node.name))
+        if len(errors) == len(nodes):
+            raise RuntimeError(f"Failed to list loaded models ({'; '.join(errors)})")
+        return models
+    
+    def _load_model(self, model: str, keep_alive: KeepAlive) -> None:
+        """Load a model, change how long it stays loaded, or unload it (keep_alive 0)
+        
+        Args:
+            model: Model name
+            keep_alive: Seconds or duration string; 0 unloads, negative keeps it loaded
+            
+        Raises:
+            RuntimeError: If Ollama returns an error
+        """
+        payload = {"model": model, "keep_alive": keep_alive}
+        if keep_alive == 0:
+            # Unload wherever the model is loaded
+            for node in self.node_pool.nodes_with(model, loaded=True) or self.node_pool.healthy_nodes():
+                self.transport.post(f"{node.url}/api/generate", json=payload)
+                self.node_pool.mark_loaded(node, model, loaded=False)
+            return
+        
+        # A generate request without a prompt only loads the model
+        response = self._routed_request("POST", "/api/generate", model, json=payload)
+        if response.status_code != 200:
+            try:
+                error = response.json().get("error")
+            except ValueError:
+                error = None
+            raise RuntimeError(error or f"Failed to load {model}: {response.status_code}")
+    
+    def _gpu_memory(self) -> Optional[Tuple[float, float]]:
+        """Get total and used GPU memory in bytes across all GPUs
+        
+        Returns:
+            Tuple of (total, used), or None if there is no GPU or several
+            Ollama servers, which turns VRAM based eviction off
+        """
+        if len(self.node_pool.nodes) > 1:
+            # The local probe says nothing about the memory of remote nodes
+            return None
+        gpu_info = self.get_gpu_info()
+        gpus = gpu_info.get("nvidia_gpus", []) + gpu_info.get("amd_gpus", [])
+        total = sum(gpu.get("memory_total_mb") or 0 for gpu in gpus)
+        used = sum(gpu.get("memory_used_mb") or 0 for gpu in gpus)
+        if not total:
+            return None
+        return total * 1024 * 1024, used * 1024 * 1024
+    
+    def _model_size(self, model: str) -> Optional[int]:
+        """Get the size on disk of an installed model from the model list"""
+        names = {model, model if ":" in model else f"{model}:latest"}
+        for entry in self.get_models():
+            if entry.get("name") in names or entry.get("model") in names:
+                return entry.get("size")
+        return None
+    
+    def get_residency(self) -> Dict[str, Any]:
+        """Get the loaded models with their memory footprint and last use
+        
+        Returns:
+            Dict with models, GPU memory budget, pinned models and counters
+        """
+        return self.residency.get_status()
+    
+    def get_context_length(self, model: str) -> int:
+        """Get the context window (num_ctx) a model runs with
+        
+        Uses the num_ctx parameter of the model's Modelfile if set, otherwise
+        Ollama's default context length, capped at what the model supports.
+        Looked up once per model with /api/show.
+        
+        Args:
+            model: Model name
+            
+        Returns:
+            Context length in tokens
+        """
+        with self.lock:
+            cached = self.context_lengths.get(model)
+        if cached is not None:
+            return cached
+        
+        context_length = self.single_flight.do(("show", model), self._fetch_context_length, model)
+        with self.lock:
+            self.context_lengths[model] = context_length
+        return context_length
+    
+    def _fetch_context_length(self, model: str) -> int:
+        """Read the context length of a model from /api/show, see get_context_length"""
+        context_length = self.default_context_length
+        try:
+            response = self._routed_request("POST", "/api/show", model, endpoint_type="metadata", json={"model": model})
+            if response.status_code != 200:
+                logger.warning(f"Could not get details of {model}: {response.status_code}")
+                return context_length
+            
+            details = response.json()
+            for line in (details.get("parameters") or "").splitlines():
+                parts = line.split()
+                if len(parts) == 2 and parts[0] == "num_ctx" and parts[1].isdigit():
+                    context_length = int(parts[1])
+            
+            for key, value in (details.get("model_info") or {}).items():
+                if key.endswith(".context_length") and isinstance(value, int):
+                    context_length = min(context_length, value)
+        except Exception as e:
+            logger.warning(f"Could not get context length of {model}: {str(e)}")
+        return context_length
+    
+    def _stream_stats(self, chunk: Dict[str, Any], start_time: float, first_token_time: Optional[float]) -> Dict[str, Any]:
+        """Build the final timing event for a streamed chat response
+        
+        Args:
+            chunk: Final chunk from Ollama (the one with "done": true)
+            start_time: Monotonic time the request was sent
+            first_token_time: Monotonic time the first token arrived, if any
+            
+        Returns:
+            Dict with time-to-first-token and generation rate information
+        """
+        eval_count = chunk.get("eval_count", 0)
+        eval_duration = chunk.get("eval_duration", 0)  # Nanoseconds
+        
+        tokens_per_second = None
+        if eval_count and eval_duration:
+            tokens_per_second = round(eval_count / (eval_duration / 1e9), 2)
+        
+        ttft_ms = None
+        if first_token_time is not None:
+            ttft_ms = round((first_token_time - start_time) * 1000, 1)
+        
+        return {
+            "type": "done",
+            "done_reason": chunk.get("done_reason"),
+            "ttft_ms": ttft_ms,
+            "total_ms": round((time.monotonic() - start_time) * 1000, 1),
+            "eval_count": eval_count,
+            "eval_duration_ms": round(eval_duration / 1e6, 1),
+            "prompt_eval_count": chunk.get("prompt_eval_count", 0),
+            "load_duration_ms": round(chunk.get("load_duration", 0) / 1e6, 1),
+            "tokens_per_second": tokens_per_second
+        }
+    
+    def get_transport_stats(self) -> Dict[str, Any]:
+        """Get connection pool statistics for calls to Ollama
+        
+        Returns:
+            Dict with request, connection and reuse counts
+        """
+        return self.transport.get_stats()
+    
+    def get_single_flight_stats(self) -> Dict[str, Dict[str, int]]:
+        """Get how many calls were collapsed into shared executions
+        
+        Returns:
+            Dict mapping call key to calls, executions and collapsed counts
+        """
+        return self.single_flight.get_stats()
+    
     def _format_size(self, size_bytes: int) -> str:
         """Format size in bytes to human-readable string
         
@@ -458,143 +1545,74 @@ class OllamaManager:
         else:
             return f"{size_bytes / (1024 * 1024 * 1024):.2f} GB"
     
+    def start_gpu_sampler(self, interval: float = 5.0, history_size: int = 720) -> None:
+        """Start background GPU telemetry sampling
+        
+        Args:
+            interval: Seconds between samples
+            history_size: Samples kept per device
+        """
+        self.gpu_sampler.interval = interval
+        self.gpu_sampler.history_size = history_size
+        self.gpu_sampler.start()
+    
     def get_gpu_info(self) -> Dict[str, Any]:
         """Get information about available GPUs for Ollama
         
+        Serves the latest background sample when the sampler is running;
+        otherwise probes on demand, with concurrent calls sharing one probe.
+        
         Returns:
             Dict with GPU availability and information
         """
-        try:
-            # Check GPU info using direct commands
-            gpu_info = {"gpu_available": False}
-            
-            # Try nvidia-smi for NVIDIA GPUs
-            try:
-                nvidia_smi = subprocess.run(
-                    ["nvidia-smi", "--query-gpu=name,memory.total,memory.used,temperature.gpu", "--format=csv,noheader"],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                
-                if nvidia_smi.returncode == 0 and nvidia_smi.stdout.strip():
-                    gpu_info["nvidia_available"] = True
-                    gpu_info["gpu_available"] = True
-                    
-                    # Parse the CSV output
-                    nvidia_gpus = []
-                    for line in nvidia_smi.stdout.strip().split('\n'):
-                        if line.strip():
-                            parts = [part.strip() for part in line.split(',')]
-                            if len(parts) >= 4:
-                                gpu_data = {
-                                    "name": parts[0],
-                                    "memory_total": parts[1],
-                                    "memory_used": parts[2],
-                                    "temperature": parts[3]
-                                }
-                                nvidia_gpus.append(gpu_data)
-                    
-                    gpu_info["nvidia_gpus"] = nvidia_gpus
-                else:
-                    gpu_info["nvidia_available"] = False
-            except (FileNotFoundError, subprocess.SubprocessError):
-                gpu_info["nvidia_available"] = False
-            
-            # Try rocm-smi for AMD GPUs
-            try:
-                rocm_smi = subprocess.run(
-                    ["rocm-smi", "--showmeminfo", "vram"],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                
-                if rocm_smi.returncode == 0 and rocm_smi.stdout.strip():
-                    gpu_info["amd_available"] = True
-                    gpu_info["gpu_available"] = True
-                    
-                    # Extract relevant info from rocm-smi output
-                    amd_gpus = []
-                    lines = rocm_smi.stdout.strip().split('\n')
-                    # Basic parsing of rocm-smi output (could be improved with more detailed parsing)
-                    for i, line in enumerate(lines):
-                        if line.startswith('GPU') and 'VRAM' in line and i + 1 < len(lines):
-                            # Extract device ID
-                            device_id = line.split()[1].strip(':')
-                            # Try to find name in a different command
-                            try:
-                                name_cmd = subprocess.run(
-                                    ["rocm-smi", "-d", device_id, "--showname"],
-                                    capture_output=True,
-                                    text=True,
-                                    timeout=2
-                                )
-                                name = "AMD GPU"
-                                for name_line in name_cmd.stdout.strip().split('\n'):
-                                    if 'GPU' in name_line and 'Name' in name_line:
-                                        name = name_line.split(':')[-1].strip()
-                                        break
-                            except:
-                                name = f"AMD GPU {device_id}"
-                                
-                            # Try to extract memory info
-                            mem_line = lines[i + 1]
-                            mem_total = "Unknown"
-                            mem_used = "Unknown"
-                            
-                            if 'Total' in mem_line and 'Used' in mem_line:
-                                parts = mem_line.split()
-                                for j, part in enumerate(parts):
-                                    if part == 'Total:' and j + 1 < len(parts):
-                                        mem_total = parts[j + 1]
-                                    if part == 'Used:' and j + 1 < len(parts):
-                                        mem_used = parts[j + 1]
-                            
-                            amd_gpus.append({
-                                "name": name,
-                                "memory_total": mem_total,
-                                "memory_used": mem_used,
-                                "device_id": device_id
-                            })
-                    
-                    gpu_info["amd_gpus"] = amd_gpus
-                else:
-                    gpu_info["amd_available"] = False
-            except (FileNotFoundError, subprocess.SubprocessError):
-                gpu_info["amd_available"] = False
-            
-            # If both nvidia and amd checks failed, get CPU info
-            if not gpu_info.get("gpu_available"):
-                # Get CPU info as fallback
-                try:
-                    cpu_info_cmd = subprocess.run(
-                        ["cat", "/proc/cpuinfo"],
-                        capture_output=True,
-                        text=True,
-                        timeout=2
-                    )
-                    
-                    if cpu_info_cmd.returncode == 0:
-                        # Parse CPU info
-                        cpu_model = "Unknown CPU"
-                        cpu_cores = 0
-                        
-                        for line in cpu_info_cmd.stdout.strip().split('\n'):
-                            if line.startswith('model name'):
-                                cpu_model = line.split(':', 1)[1].strip()
-                            if line.startswith('processor'):
-                                cpu_cores += 1
-                        
-                        gpu_info["cpu_info"] = {
-                            "model": cpu_model,
-                            "cores": cpu_cores
-                        }
-                except:
-                    gpu_info["cpu_info"] = {"model": "Unknown CPU", "cores": "Unknown"}
-            
-            return gpu_info
+        latest = self.gpu_sampler.get_latest() if self.gpu_sampler.running else None
+        if latest is not None:
+            return self._with_cpu_fallback(latest)
+        return self.single_flight.do("gpu_info", self._probe_gpu_info)
+    
+    def get_gpu_history(self, device: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Get the sampled utilization and memory history per GPU
+        
+        Args:
+            device: Only return this device key (e.g. "nvidia:0")
+            limit: Only return the newest N samples per device
             
+        Returns:
+            Dict with the sampling interval and per-device samples
+        """
+        history = self.gpu_sampler.get_history(device, limit)
+        history["sampling"] = self.gpu_sampler.running
+        return history
+    
+    def _probe_gpu_info(self) -> Dict[str, Any]:
+        """Run the vendor tools once to collect GPU information, see get_gpu_info"""
+        try:
+            return self._with_cpu_fallback(self.gpu_sampler.sample())
         except Exception as e:
             logger.error(f"Error getting GPU info: {str(e)}")
-            return {"error": str(e), "gpu_available": False} 
\ No newline at end of file
+            return {"error": str(e), "gpu_available": False}
+    
+    def _with_cpu_fallback(self, gpu_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Add CPU information when no GPU was found
+        
+        Args:
+            gpu_info: GPU info dict from the sampler
+            
+        Returns:
+            A copy of gpu_info, with cpu_info set if no GPU is available
+        """
+        gpu_info = dict(gpu_info)
+        
+        # If both nvidia and amd checks failed, report the CPU instead
+        if not gpu_info.get("gpu_available"):
+            gpu_info["cpu_info"] = dict(self.host_metrics.get_cpu_info())
+        
+        return gpu_info
+    
+    def get_host_metrics(self) -> Dict[str, Any]:
+        """Get CPU, memory, load and container limit metrics of the host
+        
+        Returns:
+            Dict with cpu (including per-core utilization), memory, load and cgroup sections
+        """
+        return self.host_metrics.sample()
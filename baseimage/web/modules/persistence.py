@@ -0,0 +1,390 @@
+import os
+import time
+import queue
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+try:
+    import psycopg2
+    import psycopg2.pool
+    import psycopg2.extras
+except ImportError:  # Only needed for postgresql:// URLs
+    psycopg2 = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Columns written per table, in insert order
+TABLES = {
+    "command_history": ("command", "status", "executed_at", "created_at"),
+    "chat_messages": ("session_id", "model", "role", "content", "created_at")
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS command_history (
+    id {id_type},
+    command TEXT NOT NULL,
+    status TEXT NOT NULL,
+    executed_at TEXT,
+    created_at DOUBLE PRECISION NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id {id_type},
+    session_id TEXT,
+    model TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_messages_session_id ON chat_messages (session_id, id);
+"""
+
+
+class PostgresBackend:
+    """PostgreSQL access through a thread-safe connection pool
+
+    psycopg2's pool raises PoolError instead of waiting when every connection
+    is in use, so callers queue on semaphores sized to the pool. Reads may use
+    all connections but one, which is kept for the write-behind thread so a
+    burst of history reads can never make persistence drop rows.
+    """
+
+    placeholder = "%s"
+
+    def __init__(self, dsn: str, min_connections: int = 1, max_connections: int = 5):
+        """Connect and create the tables if needed
+
+        Args:
+            dsn: postgresql:// connection URL
+            min_connections: Connections opened up front
+            max_connections: Maximum pooled connections (at least 2: one is reserved for writes)
+        """
+        if psycopg2 is None:
+            raise RuntimeError("psycopg2 is required for PostgreSQL persistence (pip install psycopg2-binary)")
+        max_connections = max(max_connections, 2)
+        self.pool = psycopg2.pool.ThreadedConnectionPool(min(min_connections, max_connections), max_connections, dsn)
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.read_slots = threading.BoundedSemaphore(max_connections - 1)
+        self.executescript(SCHEMA.format(id_type="BIGSERIAL PRIMARY KEY"))
+
+    @contextmanager
+    def _connection(self, write: bool = False):
+        """Borrow a pooled connection, waiting for a free one instead of failing
+
+        Args:
+            write: Whether the caller is the writer, which may use the reserved connection
+        """
+        if not write:
+            self.read_slots.acquire()
+        try:
+            with self.slots:
+                connection = self.pool.getconn()
+                try:
+                    yield connection
+                finally:
+                    self.pool.putconn(connection)
+        finally:
+            if not write:
+                self.read_slots.release()
+
+    def executescript(self, script: str) -> None:
+        with self._connection(write=True) as connection:
+            with connection, connection.cursor() as cursor:
+                cursor.execute(script)
+
+    def insert_many(self, table: str, rows: List[Tuple]) -> None:
+        """Insert rows in one transaction with a multi-row VALUES statement"""
+        columns = TABLES[table]
+        with self._connection(write=True) as connection:
+            with connection, connection.cursor() as cursor:
+                psycopg2.extras.execute_values(
+                    cursor,
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s",
+                    rows,
+                    page_size=len(rows)
+                )
+
+    def query(self, sql: str, params: Tuple) -> List[Dict[str, Any]]:
+        with self._connection() as connection:
+            with connection, connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                names = [column[0] for column in cursor.description]
+                return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def close(self) -> None:
+        self.pool.closeall()
+
+
+class SQLiteBackend:
+    """SQLite stand-in for PostgreSQL, e.g. for tests or running outside the container
+
+    Each thread gets its own connection; WAL mode lets readers run while the
+    write-behind thread commits.
+    """
+
+    placeholder = "?"
+
+    def __init__(self, path: str):
+        """Open the database and create the tables if needed
+
+        Args:
+            path: Database file, or ":memory:" (single connection, tests only)
+        """
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shared = None
+        if path == ":memory:":
+            # Separate in-memory connections would be separate databases
+            self.shared = sqlite3.connect(path, check_same_thread=False)
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        self.executescript(SCHEMA.format(id_type="INTEGER PRIMARY KEY AUTOINCREMENT"))
+
+    def _connection(self) -> sqlite3.Connection:
+        if self.shared is not None:
+            return self.shared
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def executescript(self, script: str) -> None:
+        with self.lock:
+            self._connection().executescript(script)
+
+    def insert_many(self, table: str, rows: List[Tuple]) -> None:
+        """Insert rows in one transaction"""
+        columns = TABLES[table]
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        connection = self._connection()
+        with self.lock, connection:
+            connection.executemany(sql, rows)
+
+    def query(self, sql: str, params: Tuple) -> List[Dict[str, Any]]:
+        connection = self._connection()
+        with self.lock:
+            cursor = connection.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def close(self) -> None:
+        if self.shared is not None:
+            self.shared.close()
+
+
+def create_backend(url: str, max_connections: int = 5) -> Any:
+    """Create a backend from a database URL
+
+    Args:
+        url: postgresql://user@host:port/db or sqlite:///path/to.db (sqlite:///:memory: for tests)
+        max_connections: Pool size for PostgreSQL
+
+    Returns:
+        PostgresBackend or SQLiteBackend
+    """
+    scheme = urlparse(url).scheme
+    if scheme in ("postgres", "postgresql"):
+        return PostgresBackend(url, max_connections=max_connections)
+    if scheme == "sqlite":
+        return SQLiteBackend(url[len("sqlite:///"):] or ":memory:")
+    raise ValueError(f"Unsupported database URL: {url}")
+
+
+class Persistence:
+    """Stores command history and chat messages behind a write-behind queue
+
+    Writes are queued and committed in batches by a background thread, so
+    request handlers never wait on the database. If the queue is full (the
+    database is down or too slow), new writes are dropped and counted rather
+    than blocking requests.
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        queue_size: int = 10000
+    ):
+        """Initialize the store and start the writer thread
+
+        Args:
+            backend: PostgresBackend or SQLiteBackend
+            batch_size: Maximum rows per commit
+            flush_interval: Maximum seconds a row waits before being committed
+            queue_size: Maximum rows waiting to be written
+        """
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+
+        self.lock = threading.Lock()
+        self.counters = {"enqueued": 0, "written": 0, "batches": 0, "dropped": 0, "failed": 0}
+        self.last_batch_ms: Optional[float] = None
+        self.flushed = threading.Condition(self.lock)
+        self.pending = 0
+
+        self.writer = threading.Thread(target=self._write_loop, name="persistence-writer", daemon=True)
+        self.writer.start()
+
+    def record_command(self, command: str, status: str, executed_at: str) -> None:
+        """Queue a terminal command for the history table"""
+        self._enqueue("command_history", (command, status, executed_at, time.time()))
+
+    def record_chat(self, session_id: Optional[str], model: str, role: str, content: str) -> None:
+        """Queue a chat message"""
+        self._enqueue("chat_messages", (session_id, model, role, content, time.time()))
+
+    def list_commands(self, limit: int = 50, before: Optional[int] = None) -> Dict[str, Any]:
+        """Page through the command history, newest first
+
+        Args:
+            limit: Page size
+            before: Cursor from the previous page (only IDs below it are returned)
+
+        Returns:
+            Dict with items and next_before (None on the last page)
+        """
+        return self._page("command_history", "id, command, status, executed_at, created_at", limit, before)
+
+    def list_chats(self, session_id: Optional[str] = None, limit: int = 50, before: Optional[int] = None) -> Dict[str, Any]:
+        """Page through stored chat messages, newest first
+
+        Args:
+            session_id: Only messages of this session
+            limit: Page size
+            before: Cursor from the previous page
+
+        Returns:
+            Dict with items and next_before (None on the last page)
+        """
+        filters = [("session_id", session_id)] if session_id else []
+        return self._page("chat_messages", "id, session_id, model, role, content, created_at", limit, before, filters)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until everything queued so far is written
+
+        Returns:
+            False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self.flushed:
+            while self.pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.flushed.wait(remaining)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get write-behind counters and queue depth"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats["pending"] = self.pending
+        stats.update({
+            "backend": type(self.backend).__name__,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "last_batch_ms": self.last_batch_ms
+        })
+        return stats
+
+    def close(self) -> None:
+        """Write what is queued and close the backend"""
+        self.flush()
+        self.backend.close()
+
+    def _enqueue(self, table: str, row: Tuple) -> None:
+        with self.lock:
+            self.pending += 1
+        try:
+            self.queue.put_nowait((table, row))
+            with self.lock:
+                self.counters["enqueued"] += 1
+        except queue.Full:
+            with self.flushed:
+                self.pending -= 1
+                self.counters["dropped"] += 1
+                self.flushed.notify_all()
+
+    def _page(
+        self,
+        table: str,
+        columns: str,
+        limit: int,
+        before: Optional[int],
+        filters: Optional[List[Tuple[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Keyset pagination on the primary key: no OFFSET scans on deep pages"""
+        limit = max(1, min(limit, 500))
+        placeholder = self.backend.placeholder
+        conditions = [f"{column} = {placeholder}" for column, _ in filters or []]
+        params = [value for _, value in filters or []]
+        if before is not None:
+            conditions.append(f"id < {placeholder}")
+            params.append(before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # Fetch one extra row to know whether another page exists
+        rows = self.backend.query(
+            f"SELECT {columns} FROM {table} {where} ORDER BY id DESC LIMIT {placeholder}",
+            tuple(params) + (limit + 1,)
+        )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {"items": rows, "next_before": rows[-1]["id"] if has_more else None}
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Tuple[str, Tuple]]) -> None:
+        """Commit a batch, grouped by table, retrying transient failures"""
+        by_table: Dict[str, List[Tuple]] = {}
+        for table, row in batch:
+            by_table.setdefault(table, []).append(row)
+
+        start = time.perf_counter()
+        written = 0
+        for table, rows in by_table.items():
+            for attempt in range(3):
+                try:
+                    self.backend.insert_many(table, rows)
+                    written += len(rows)
+                    break
+                except Exception as e:
+                    logger.error(f"Error writing {len(rows)} rows to {table} (attempt {attempt + 1}): {str(e)}")
+                    time.sleep(0.5 * 2 ** attempt)
+            else:
+                with self.lock:
+                    self.counters["failed"] += len(rows)
+
+        with self.flushed:
+            self.counters["written"] += written
+            self.counters["batches"] += 1
+            self.pending -= len(batch)
+            self.flushed.notify_all()
+        self.last_batch_ms = round((time.perf_counter() - start) * 1000, 2)
@@ -0,0 +1,290 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+MODES = ("cprofile", "sample")
+
+# File extension of each mode's output
+EXTENSIONS = {"cprofile": "pstats", "sample": "collapsed"}
+
+
+class Capture:
+    """A profile being recorded for one request"""
+
+    def __init__(self, profiler: "RequestProfiler", mode: str, method: str, path: str):
+        self.profiler = profiler
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self.created_at = time.time()
+        self.profile: Optional[cProfile.Profile] = None
+        self.stacks: Counter = Counter()
+        self.finished = False
+
+    def finish(self, status: Optional[int] = None) -> None:
+        """Stop recording and save the profile (idempotent)"""
+        if self.finished:
+            return
+        self.finished = True
+        if self.profile is not None:
+            self.profile.disable()
+        else:
+            self.profiler._stop_sampling(self)
+        self.profiler._save(self, status, time.perf_counter() - self.started)
+
+
+class StackSampler:
+    """Samples the stacks of the threads being profiled at a fixed interval
+
+    One background thread serves all sampled captures and only runs while
+    there are any, reading other threads' frames with sys._current_frames().
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.captures: Dict[int, Capture] = {}
+        self.thread: Optional[threading.Thread] = None
+
+    def add(self, capture: Capture) -> None:
+        with self.lock:
+            self.captures[capture.thread_id] = capture
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self.thread.start()
+
+    def remove(self, capture: Capture) -> None:
+        with self.lock:
+            if self.captures.get(capture.thread_id) is capture:
+                del self.captures[capture.thread_id]
+
+    def _run(self) -> None:
+        while True:
+            with self.lock:
+                if not self.captures:
+                    self.thread = None
+                    return
+                captures = dict(self.captures)
+            frames = sys._current_frames()
+            for thread_id, capture in captures.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    capture.stacks[_collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class RequestProfiler:
+    """Profiles individual requests and keeps the captures in a bounded directory
+
+    A capture is either a deterministic cProfile profile, saved as pstats, or
+    a sampled profile saved as collapsed stacks ("frame;frame;frame count"
+    lines, the input format of flame graph tools). The oldest captures are
+    deleted once the directory exceeds max_bytes or max_files.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        default_mode: str = "cprofile",
+        max_bytes: int = 100 * 1024 * 1024,
+        max_files: int = 200,
+        sample_interval: float = 0.005
+    ):
+        """Initialize the profiler
+
+        Args:
+            directory: Where captures are written
+            default_mode: cprofile or sample, used unless a request asks for the other
+            max_bytes: Maximum total size of the captures
+            max_files: Maximum number of captures
+            sample_interval: Seconds between stack samples in sample mode
+        """
+        if default_mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {default_mode!r}, expected one of {', '.join(MODES)}")
+        self.directory = os.path.expanduser(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.default_mode = default_mode
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.sampler = StackSampler(sample_interval)
+        self.lock = threading.Lock()
+        self.counters = {"captured": 0, "skipped": 0, "pruned": 0}
+
+    def start(self, method: str, path: str, mode: Optional[str] = None) -> Optional[Capture]:
+        """Start profiling the current request on the calling thread
+
+        Args:
+            method: HTTP method, recorded with the capture
+            path: Request path, recorded with the capture
+            mode: cprofile or sample (default: the profiler's default mode)
+
+        Returns:
+            The capture to finish when the request is done, None if it could not start
+        """
+        capture = Capture(self, mode if mode in MODES else self.default_mode, method, path)
+        if capture.mode == "cprofile":
+            capture.profile = cProfile.Profile()
+            try:
+                capture.profile.enable()
+            except ValueError:
+                # Python 3.12+ allows only one active profiler per process
+                with self.lock:
+                    self.counters["skipped"] += 1
+                return None
+        else:
+            self.sampler.add(capture)
+        return capture
+
+    def list(self) -> List[Dict[str, Any]]:
+        """List the saved captures, newest first"""
+        captures = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    captures.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        captures.sort(key=lambda capture: capture["created_at"], reverse=True)
+        return captures
+
+    def get(self, capture_id: str) -> Optional[Dict[str, Any]]:
+        """Get a capture's metadata, None if unknown"""
+        if not _valid_id(capture_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{capture_id}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def path(self, capture: Dict[str, Any]) -> str:
+        """Path of a capture's profile file"""
+        return os.path.join(self.directory, capture["file"])
+
+    def render_text(self, capture: Dict[str, Any], limit: int = 40) -> str:
+        """Readable summary of a capture: top functions by cumulative time, or the heaviest stacks"""
+        if capture["mode"] == "cprofile":
+            output = io.StringIO()
+            stats = pstats.Stats(self.path(capture), stream=output)
+            stats.sort_stats("cumulative").print_stats(limit)
+            return output.getvalue()
+        with open(self.path(capture)) as f:
+            lines = [line.rsplit(" ", 1) for line in f.read().splitlines() if line]
+        lines.sort(key=lambda line: int(line[1]), reverse=True)
+        return "\n".join(f"{count:>6}  {stack}" for stack, count in lines[:limit]) + "\n"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get capture counters and the directory usage"""
+        files = self._files()
+        with self.lock:
+            stats = dict(self.counters)
+        stats.update({
+            "directory": self.directory,
+            "default_mode": self.default_mode,
+            "files": len(files),
+            "bytes": sum(size for _, size, _ in files),
+            "max_bytes": self.max_bytes,
+            "max_files": self.max_files
+        })
+        return stats
+
+    def _stop_sampling(self, capture: Capture) -> None:
+        self.sampler.remove(capture)
+
+    def _save(self, capture: Capture, status: Optional[int], duration: float) -> None:
+        """Write a capture and its metadata, then prune the directory"""
+        filename = f"{capture.id}.{EXTENSIONS[capture.mode]}"
+        try:
+            if capture.mode == "cprofile":
+                capture.profile.dump_stats(os.path.join(self.directory, filename))
+                samples = None
+            else:
+                with open(os.path.join(self.directory, filename), "w") as f:
+                    for stack, count in capture.stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+                samples = sum(capture.stacks.values())
+            metadata = {
+                "id": capture.id,
+                "mode": capture.mode,
+                "method": capture.method,
+                "path": capture.path,
+                "status": status,
+                "duration_ms": round(duration * 1000, 1),
+                "samples": samples,
+                "created_at": capture.created_at,
+                "file": filename,
+                "size": os.path.getsize(os.path.join(self.directory, filename))
+            }
+            with open(os.path.join(self.directory, f"{capture.id}.json"), "w") as f:
+                json.dump(metadata, f)
+        except OSError as e:
+            logger.error(f"Error saving profile {capture.id}: {str(e)}")
+            return
+        with self.lock:
+            self.counters["captured"] += 1
+        self._prune()
+
+    def _files(self) -> List[tuple]:
+        """(capture id, total bytes, mtime) of every capture in the directory"""
+        captures: Dict[str, List[float]] = {}
+        for entry in os.scandir(self.directory):
+            capture_id = entry.name.split(".", 1)[0]
+            if not _valid_id(capture_id):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            size_and_time = captures.setdefault(capture_id, [0, 0.0])
+            size_and_time[0] += stat.st_size
+            size_and_time[1] = max(size_and_time[1], stat.st_mtime)
+        return [(capture_id, size, mtime) for capture_id, (size, mtime) in captures.items()]
+
+    def _prune(self) -> None:
+        """Delete the oldest captures beyond max_files or max_bytes"""
+        with self.lock:
+            files = sorted(self._files(), key=lambda item: item[2])
+            total = sum(size for _, size, _ in files)
+            while files and (len(files) > self.max_files or total > self.max_bytes):
+                capture_id, size, _ = files.pop(0)
+                for name in os.listdir(self.directory):
+                    if name.split(".", 1)[0] == capture_id:
+                        try:
+                            os.remove(os.path.join(self.directory, name))
+                        except OSError:
+                            pass
+                total -= size
+                self.counters["pruned"] += 1
+
+
+def _collapse(frame: Any) -> str:
+    """Render a stack as "outermost;...;innermost" for collapsed-stack output"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _valid_id(capture_id: str) -> bool:
+    """Capture IDs are generated here; anything else could be a path"""
+    return len(capture_id) == 24 and capture_id[8] == "T" and all(c.isalnum() or c == "-" for c in capture_id)
@@ -0,0 +1,323 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from modules.response_cache import normalize_model_name
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Loaded models need more memory than their weights on disk (KV cache, graph)
+LOAD_OVERHEAD = 1.2
+
+KeepAlive = Union[int, str]
+
+
+def parse_keep_alive(value: str) -> KeepAlive:
+    """Convert a keep_alive setting to what Ollama expects
+
+    Plain numbers are seconds (negative keeps the model loaded forever);
+    anything else is passed through as a duration string like "10m".
+    """
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def parse_keep_alive_map(spec: str) -> Dict[str, KeepAlive]:
+    """Parse per-model keep_alive settings from "llama3=1h,phi3=-1"
+
+    Args:
+        spec: Comma-separated model=keep_alive pairs
+
+    Returns:
+        Dict mapping normalized model name to keep_alive
+    """
+    settings = {}
+    for item in spec.split(","):
+        model, _, value = item.strip().rpartition("=")
+        if model and value:
+            settings[normalize_model_name(model)] = parse_keep_alive(value)
+    return settings
+
+
+def parse_model_list(spec: str) -> List[str]:
+    """Parse a comma-separated list of model names"""
+    return [normalize_model_name(model.strip()) for model in spec.split(",") if model.strip()]
+
+
+class ResidencyManager:
+    """Keeps track of which models Ollama has loaded and decides what stays loaded
+
+    Every request for a model goes through prepare(), which records its last
+    use and, when the model is not loaded yet, unloads least recently used
+    models until its estimated footprint fits into the GPU memory the probe
+    reports as free. Pinned models are kept loaded (keep_alive -1) and never
+    evicted; other models get their configured keep_alive.
+    """
+
+    def __init__(
+        self,
+        ps_function: Callable[[], List[Dict[str, Any]]],
+        load_function: Callable[[str, KeepAlive], None],
+        vram_function: Callable[[], Optional[Tuple[float, float]]],
+        size_function: Callable[[str], Optional[int]],
+        default_keep_alive: Optional[KeepAlive] = None,
+        keep_alive: Optional[Dict[str, KeepAlive]] = None,
+        pinned: Optional[Iterable[str]] = None,
+        vram_fraction: float = 0.9,
+        refresh_interval: float = 5.0
+    ):
+        """Initialize the residency manager
+
+        Args:
+            ps_function: Returns the loaded models (Ollama's /api/ps entries)
+            load_function: Called as load_function(model, keep_alive) to load a
+                model or change its keep_alive; keep_alive 0 unloads it
+            vram_function: Returns (total, used) GPU memory in bytes, None without a GPU
+            size_function: Returns a model's size on disk in bytes, None if unknown
+            default_keep_alive: keep_alive for models without a setting (None: Ollama's default)
+            keep_alive: Per-model keep_alive, keyed by model name
+            pinned: Models that are kept loaded and never evicted
+            vram_fraction: Share of the GPU memory loaded models may fill
+            refresh_interval: Seconds the view of loaded models is trusted
+        """
+        self.ps_function = ps_function
+        self.load_function = load_function
+        self.vram_function = vram_function
+        self.size_function = size_function
+        self.default_keep_alive = default_keep_alive
+        self.keep_alive = {normalize_model_name(model): value for model, value in (keep_alive or {}).items()}
+        self.pinned = {normalize_model_name(model) for model in pinned or ()}
+        self.vram_fraction = vram_fraction
+        self.refresh_interval = refresh_interval
+
+        self.lock = threading.Lock()
+        # Held while making room, so concurrent cold starts don't evict for each other twice
+        self.evict_lock = threading.Lock()
+        self.resident: Dict[str, Dict[str, Any]] = {}
+        self.resident_time = 0.0
+        self.last_used: Dict[str, float] = {}
+        # size_vram seen in /api/ps, a better estimate than the size on disk
+        self.observed_sizes: Dict[str, int] = {}
+        self.counters = {"warm": 0, "cold": 0, "evictions": 0, "preloads": 0, "errors": 0}
+
+    def keep_alive_for(self, model: str) -> Optional[KeepAlive]:
+        """keep_alive to send with requests for a model, None for Ollama's default"""
+        model = normalize_model_name(model)
+        if model in self.pinned:
+            return -1
+        return self.keep_alive.get(model, self.default_keep_alive)
+
+    def touch(self, model: str) -> bool:
+        """Record a use of a model
+
+        Returns:
+            True if the model is known to be loaded (no preparation needed)
+        """
+        model = normalize_model_name(model)
+        now = time.time()
+        with self.lock:
+            self.last_used[model] = now
+            warm = model in self.resident and now - self.resident_time < self.refresh_interval
+            if warm:
+                self.counters["warm"] += 1
+        return warm
+
+    def prepare(self, model: str) -> None:
+        """Record a use of a model and make room for it if it is not loaded
+
+        Never raises: residency is an optimization, so failures are logged and
+        the request goes ahead.
+        """
+        if self.touch(model):
+            return
+        model = normalize_model_name(model)
+        try:
+            if model in self.refresh():
+                with self.lock:
+                    self.counters["warm"] += 1
+                return
+            with self.lock:
+                self.counters["cold"] += 1
+            self._make_room(model)
+        except Exception as e:
+            logger.warning(f"Could not prepare residency for {model}: {str(e)}")
+            self._count("errors")
+
+    def refresh(self) -> Dict[str, Dict[str, Any]]:
+        """Fetch the loaded models from Ollama
+
+        Returns:
+            Dict mapping model name to its /api/ps entry
+        """
+        resident = {}
+        for entry in self.ps_function():
+            name = normalize_model_name(entry.get("name") or entry.get("model", ""))
+            resident[name] = entry
+        with self.lock:
+            self.resident = resident
+            self.resident_time = time.time()
+            for name, entry in resident.items():
+                if entry.get("size_vram"):
+                    self.observed_sizes[name] = entry["size_vram"]
+        return resident
+
+    def load(self, model: str, keep_alive: Optional[KeepAlive] = None) -> None:
+        """Load a model now, making room for it first
+
+        Args:
+            model: Model name
+            keep_alive: Override the model's configured keep_alive
+        """
+        self.prepare(model)
+        if keep_alive is None:
+            keep_alive = self.keep_alive_for(model)
+        # An explicit keep_alive is needed here; None would mean Ollama's default
+        self.load_function(model, "5m" if keep_alive is None else keep_alive)
+        self._invalidate()
+
+    def unload(self, model: str) -> None:
+        """Unload a model from GPU memory"""
+        self.load_function(model, 0)
+        self._invalidate()
+
+    def pin(self, model: str, pinned: bool = True) -> None:
+        """Pin a model (load it and keep it loaded) or unpin it
+
+        An unpinned model that is loaded gets its normal keep_alive back, so
+        it expires as usual.
+        """
+        model = normalize_model_name(model)
+        with self.lock:
+            if pinned:
+                self.pinned.add(model)
+            else:
+                self.pinned.discard(model)
+        if pinned:
+            self.load(model)
+        elif model in self.refresh():
+            self.load(model)
+
+    def preload(self, models: Iterable[str]) -> threading.Thread:
+        """Load models on a background thread, e.g. at startup
+
+        Returns:
+            The started thread
+        """
+        models = [normalize_model_name(model) for model in models]
+
+        def run():
+            for model in models:
+                try:
+                    start = time.perf_counter()
+                    self.load(model)
+                    self._count("preloads")
+                    logger.info(f"Preloaded {model} in {time.perf_counter() - start:.1f}s")
+                except Exception as e:
+                    logger.warning(f"Could not preload {model}: {str(e)}")
+                    self._count("errors")
+
+        thread = threading.Thread(target=run, name="model-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def forget(self, model: str) -> None:
+        """Drop what is known about a model, e.g. after it was deleted or re-pulled"""
+        model = normalize_model_name(model)
+        with self.lock:
+            self.observed_sizes.pop(model, None)
+            self.last_used.pop(model, None)
+            self.resident.pop(model, None)
+
+    def get_status(self) -> Dict[str, Any]:
+        """List the loaded models with their footprint, keep_alive and last use
+
+        Returns:
+            Dict with models, the GPU memory budget, pinned models and counters
+        """
+        resident = self.refresh()
+        vram = self.vram_function()
+        with self.lock:
+            models = [
+                {
+                    "name": name,
+                    "size": entry.get("size"),
+                    "size_vram": entry.get("size_vram"),
+                    "expires_at": entry.get("expires_at"),
+                    "last_used": self.last_used.get(name),
+                    "pinned": name in self.pinned,
+                    "keep_alive": self.keep_alive_for(name)
+                }
+                for name, entry in resident.items()
+            ]
+            pinned = sorted(self.pinned)
+            counters = dict(self.counters)
+        models.sort(key=lambda model: model["last_used"] or 0, reverse=True)
+        return {
+            "models": models,
+            "vram": {
+                "total": vram[0],
+                "used": vram[1],
+                "budget": vram[0] * self.vram_fraction
+            } if vram else None,
+            "pinned": pinned,
+            "default_keep_alive": self.default_keep_alive,
+            "counters": counters
+        }
+
+    def _estimate_size(self, model: str) -> Optional[float]:
+        """Estimated GPU memory a model needs once loaded"""
+        with self.lock:
+            observed = self.observed_sizes.get(model)
+        if observed:
+            return observed
+        size = self.size_function(model)
+        return size * LOAD_OVERHEAD if size else None
+
+    def _make_room(self, model: str) -> None:
+        """Unload least recently used models until `model` fits into GPU memory"""
+        with self.evict_lock:
+            vram = self.vram_function()
+            needed = self._estimate_size(model)
+            if vram is None or not needed:
+                return
+
+            with self.lock:
+                resident = dict(self.resident)
+                last_used = dict(self.last_used)
+                pinned = set(self.pinned)
+            total, used = vram
+            # The probe may predate recent loads; the /api/ps view does not
+            used = max(used, sum(entry.get("size_vram", 0) for entry in resident.values()))
+            free = total * self.vram_fraction - used
+            if needed <= free:
+                return
+
+            candidates = sorted(
+                (name for name in resident if name != model and name not in pinned),
+                key=lambda name: last_used.get(name, 0)
+            )
+            for name in candidates:
+                if needed <= free:
+                    break
+                logger.info(f"Unloading {name} to make room for {model}")
+                self.load_function(name, 0)
+                free += resident[name].get("size_vram", 0)
+                self._count("evictions")
+            self._invalidate()
+
+            if needed > free:
+                logger.warning(f"{model} may not fit into GPU memory; only pinned models are left to unload")
+
+    def _invalidate(self) -> None:
+        """Make the next touch() re-check the loaded models"""
+        with self.lock:
+            self.resident_time = 0.0
+
+    def _count(self, counter: str) -> None:
+        with self.lock:
+            self.counters[counter] += 1
@@ -0,0 +1,187 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def normalize_model_name(model: str) -> str:
+    """Add the implicit ":latest" tag so "llama3" and "llama3:latest" match"""
+    return model if ":" in model else f"{model}:latest"
+
+
+def is_deterministic(options: Optional[Dict[str, Any]]) -> bool:
+    """Whether a request asks for greedy decoding
+
+    Ollama samples with a non-zero temperature unless told otherwise, so only
+    an explicit temperature of 0 counts as deterministic.
+    """
+    try:
+        return options is not None and float(options.get("temperature", 1)) == 0
+    except (TypeError, ValueError):
+        return False
+
+
+class ResponseCache:
+    """LRU cache of chat responses bounded by entry count, total bytes and age
+
+    Keys cover the model name, the model digest, the messages and the options,
+    so a re-pulled model with a new digest never serves old answers; pulls and
+    deletes additionally drop all entries of the model.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024, ttl: float = 3600):
+        """Initialize the cache
+
+        Args:
+            max_entries: Maximum number of cached responses (0 disables the cache)
+            max_bytes: Maximum total size of the cached responses
+            ttl: Seconds a response stays valid
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        # key -> (model, response, size, expires_at); most recently used last
+        self.entries: "OrderedDict[str, Tuple[str, str, int, float]]" = OrderedDict()
+        self.total_bytes = 0
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "skipped": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the cache can hold any entry"""
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def make_key(
+        self,
+        model: str,
+        digest: Optional[str],
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]]
+    ) -> str:
+        """Build the cache key of a chat request
+
+        Args:
+            model: Model name
+            digest: Digest of the installed model, if known
+            messages: Chat messages
+            options: Ollama generation options
+
+        Returns:
+            Hex digest over the canonical JSON of all inputs
+        """
+        canonical = json.dumps(
+            [normalize_model_name(model), digest, messages, options or {}],
+            sort_keys=True,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def skip(self) -> None:
+        """Count a request that was not cacheable (non-deterministic)"""
+        with self.lock:
+            self.counters["skipped"] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a response and mark it as recently used
+
+        Args:
+            key: Key from make_key
+
+        Returns:
+            The cached response, or None on a miss
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[3] <= time.monotonic():
+                self._remove(key)
+                self.counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[1]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        """Store a response, evicting least recently used entries to make room
+
+        Args:
+            key: Key from make_key
+            model: Model name, used for invalidation
+            response: Response text
+        """
+        size = len(key) + len(response.encode())
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (normalize_model_name(model), response, size, time.monotonic() + self.ttl)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.counters["evictions"] += 1
+
+    def invalidate_model(self, model: str) -> int:
+        """Drop all responses of a model
+
+        Args:
+            model: Model name
+
+        Returns:
+            Number of entries removed
+        """
+        model = normalize_model_name(model)
+        with self.lock:
+            keys = [key for key, entry in self.entries.items() if entry[0] == model]
+            for key in keys:
+                self._remove(key)
+            self.counters["invalidations"] += len(keys)
+        if keys:
+            logger.info(f"Dropped {len(keys)} cached responses of {model}")
+        return len(keys)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache counters and occupancy
+
+        Returns:
+            Dict with hit/miss/eviction counters, hit ratio, entry count and size
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            lookups = stats["hits"] + stats["misses"]
+            stats.update({
+                "hit_ratio": round(stats["hits"] / lookups, 3) if lookups else None,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl
+            })
+        return stats
+
+    def _remove(self, key: str) -> None:
+        """Remove an entry and release its size (lock held)"""
+        _, _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
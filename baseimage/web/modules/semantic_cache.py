@@ -0,0 +1,419 @@
+import json
+import math
+import hashlib
+import time
+import uuid
+import bisect
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import requests
+
+from modules.response_cache import normalize_model_name
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the similarity histogram buckets; the last bucket ends at 1.0
+SIMILARITY_BUCKETS = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.925, 0.95, 0.975, 0.99]
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    """Scale a vector to unit length so the dot product is the cosine similarity"""
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else list(vector)
+
+
+def options_key(options: Optional[Dict[str, Any]]) -> str:
+    """Hash of a request's generation options; answers are only reused for identical options
+
+    Returns:
+        Hex digest over the canonical JSON of the options, "" for none
+    """
+    if not options:
+        return ""
+    canonical = json.dumps(options, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def parse_thresholds(spec: str) -> Dict[str, float]:
+    """Parse per-model thresholds from "model=0.97,other:7b=0.9"
+
+    Args:
+        spec: Comma-separated model=threshold pairs
+
+    Returns:
+        Dict mapping normalized model name to threshold
+    """
+    thresholds = {}
+    for item in spec.split(","):
+        model, _, value = item.strip().rpartition("=")
+        if not model:
+            continue
+        try:
+            thresholds[normalize_model_name(model)] = float(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid semantic cache threshold '{item}'")
+    return thresholds
+
+
+class InMemoryVectorIndex:
+    """Brute-force cosine similarity index, bounded per model and options
+
+    Good for a few thousand cached prompts and for running without Weaviate.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries_per_model: int = 1000):
+        """Initialize the index
+
+        Args:
+            max_entries_per_model: Oldest entries of a model and options are dropped beyond this
+        """
+        self.max_entries_per_model = max_entries_per_model
+        self.lock = threading.Lock()
+        # (model, options key) -> entries
+        self.entries: Dict[Tuple[str, str], Deque[Tuple[List[float], str, str]]] = {}
+
+    def add(self, model: str, vector: List[float], prompt: str, response: str, options: str = "") -> None:
+        """Store a prompt/response pair under a model and options key"""
+        with self.lock:
+            entries = self.entries.get((model, options))
+            if entries is None:
+                entries = self.entries[(model, options)] = deque(maxlen=self.max_entries_per_model)
+            entries.append((_normalize(vector), prompt, response))
+
+    def search(self, model: str, vector: List[float], options: str = "") -> Optional[Tuple[float, str, str]]:
+        """Find the most similar stored prompt of a model with the same options key
+
+        Returns:
+            Tuple of (similarity, prompt, response), or None if there are no such entries
+        """
+        query = _normalize(vector)
+        with self.lock:
+            entries = list(self.entries.get((model, options), ()))
+        best = None
+        for stored, prompt, response in entries:
+            if len(stored) != len(query):
+                continue
+            similarity = sum(a * b for a, b in zip(stored, query))
+            if best is None or similarity > best[0]:
+                best = (similarity, prompt, response)
+        return best
+
+    def delete_model(self, model: str) -> None:
+        """Drop all entries of a model"""
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == model]:
+                del self.entries[key]
+
+    def count(self) -> int:
+        """Number of stored entries"""
+        with self.lock:
+            return sum(len(entries) for entries in self.entries.values())
+
+
+class WeaviateVectorIndex:
+    """Vector index stored in a Weaviate collection through its REST and GraphQL APIs
+
+    Vectors are supplied by us (vectorizer "none"); cosine distance is
+    converted back to similarity.
+    """
+
+    name = "weaviate"
+
+    def __init__(self, url: str = "http://127.0.0.1:8081", class_name: str = "PromptCache", timeout: float = 5.0):
+        """Initialize the index and create the collection if needed
+
+        Args:
+            url: Weaviate base URL
+            class_name: Collection holding the cached prompts
+            timeout: Seconds per Weaviate request
+
+        Raises:
+            requests.RequestException: If Weaviate cannot be reached
+        """
+        self.url = url.rstrip("/")
+        self.class_name = class_name
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._ensure_class()
+
+    def _ensure_class(self) -> None:
+        """Create the cache collection unless it exists, adding properties it lacks"""
+        response = self.session.get(f"{self.url}/v1/schema/{self.class_name}", timeout=self.timeout)
+        if response.status_code == 200:
+            if not any(prop["name"] == "optionsKey" for prop in response.json().get("properties", [])):
+                # Entries stored before have no options key, so they never match again
+                response = self.session.post(
+                    f"{self.url}/v1/schema/{self.class_name}/properties",
+                    json={"name": "optionsKey", "dataType": ["text"], "tokenization": "field"},
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+            return
+        schema = {
+            "class": self.class_name,
+            "description": "Semantic cache of chat prompts and responses",
+            "vectorizer": "none",
+            "vectorIndexConfig": {"distance": "cosine"},
+            "properties": [
+                {"name": "model", "dataType": ["text"], "tokenization": "field"},
+                {"name": "optionsKey", "dataType": ["text"], "tokenization": "field"},
+                {"name": "prompt", "dataType": ["text"]},
+                {"name": "response", "dataType": ["text"]},
+                {"name": "createdAt", "dataType": ["number"]}
+            ]
+        }
+        response = self.session.post(f"{self.url}/v1/schema", json=schema, timeout=self.timeout)
+        response.raise_for_status()
+        logger.info(f"Created Weaviate collection {self.class_name}")
+
+    def add(self, model: str, vector: List[float], prompt: str, response: str, options: str = "") -> None:
+        """Store a prompt/response pair under a model and options key"""
+        result = self.session.post(
+            f"{self.url}/v1/objects",
+            json={
+                "class": self.class_name,
+                "id": str(uuid.uuid4()),
+                "properties": {
+                    "model": model,
+                    "optionsKey": options,
+                    "prompt": prompt,
+                    "response": response,
+                    "createdAt": time.time()
+                },
+                "vector": vector
+            },
+            timeout=self.timeout
+        )
+        result.raise_for_status()
+
+    def search(self, model: str, vector: List[float], options: str = "") -> Optional[Tuple[float, str, str]]:
+        """Find the most similar stored prompt of a model and options key with a nearVector query
+
+        Returns:
+            Tuple of (similarity, prompt, response), or None if there are no such entries
+        """
+        # Inlined rather than passed as GraphQL variables, which Weaviate
+        # does not accept for nearVector and where filters
+        query = """
+        {
+          Get {
+            %s(
+              nearVector: {vector: %s}
+              where: {operator: And, operands: [
+                {path: ["model"], operator: Equal, valueText: %s},
+                {path: ["optionsKey"], operator: Equal, valueText: %s}
+              ]}
+              limit: 1
+            ) {
+              prompt
+              response
+              _additional { distance }
+            }
+          }
+        }
+        """ % (self.class_name, json.dumps(vector), json.dumps(model), json.dumps(options))
+        result = self.session.post(f"{self.url}/v1/graphql", json={"query": query}, timeout=self.timeout)
+        result.raise_for_status()
+        data = result.json()
+        if data.get("errors"):
+            raise RuntimeError(data["errors"][0].get("message", "Weaviate query failed"))
+
+        hits = (data.get("data") or {}).get("Get", {}).get(self.class_name) or []
+        if not hits:
+            return None
+        hit = hits[0]
+        return 1 - hit["_additional"]["distance"], hit.get("prompt", ""), hit.get("response", "")
+
+    def delete_model(self, model: str) -> None:
+        """Drop all entries of a model with a batch delete"""
+        result = self.session.delete(
+            f"{self.url}/v1/batch/objects",
+            json={
+                "match": {
+                    "class": self.class_name,
+                    "where": {"path": ["model"], "operator": "Equal", "valueText": model}
+                }
+            },
+            timeout=self.timeout
+        )
+        result.raise_for_status()
+
+    def count(self) -> Optional[int]:
+        """Number of stored entries, None if Weaviate cannot be asked"""
+        try:
+            result = self.session.post(
+                f"{self.url}/v1/graphql",
+                json={"query": "{ Aggregate { %s { meta { count } } } }" % self.class_name},
+                timeout=self.timeout
+            )
+            return result.json()["data"]["Aggregate"][self.class_name][0]["meta"]["count"]
+        except Exception:
+            return None
+
+
+class SemanticCache:
+    """Reuse answers to prompts that are similar, not only identical, to earlier ones
+
+    Each prompt is embedded and looked up in a vector index; a stored answer is
+    returned when its prompt's cosine similarity reaches the model's threshold
+    and it was generated with the same options (format, seed, num_predict, ...).
+    """
+
+    def __init__(
+        self,
+        index: Any,
+        embed_function: Callable[[str, List[str]], List[List[float]]],
+        embed_model: str = "nomic-embed-text:latest",
+        threshold: float = 0.95,
+        thresholds: Optional[Dict[str, float]] = None
+    ):
+        """Initialize the cache
+
+        Args:
+            index: InMemoryVectorIndex or WeaviateVectorIndex
+            embed_function: Called as embed_function(model, texts) to get vectors
+            embed_model: Ollama model used to embed prompts
+            threshold: Minimum similarity for a hit, unless overridden per model
+            thresholds: Per-model minimum similarity, keyed by model name
+        """
+        self.index = index
+        self.embed_function = embed_function
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.thresholds = {normalize_model_name(model): value for model, value in (thresholds or {}).items()}
+
+        self.lock = threading.Lock()
+        self.counters = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "errors": 0}
+        self.per_model: Dict[str, Dict[str, int]] = {}
+        # Best similarity per lookup, so thresholds can be tuned from the distribution
+        self.histogram = [0] * (len(SIMILARITY_BUCKETS) + 1)
+
+    def get_threshold(self, model: str) -> float:
+        """Minimum similarity for a hit on a model"""
+        return self.thresholds.get(normalize_model_name(model), self.threshold)
+
+    def embed(self, prompt: str) -> Optional[List[float]]:
+        """Embed a prompt, None if the embedding model is unavailable"""
+        try:
+            vectors = self.embed_function(self.embed_model, [prompt])
+            return vectors[0] if vectors else None
+        except Exception as e:
+            logger.warning(f"Could not embed prompt for the semantic cache: {str(e)}")
+            self._count("errors")
+            return None
+
+    def lookup(
+        self,
+        model: str,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Optional[str], Optional[List[float]]]:
+        """Find a stored answer for a similar prompt
+
+        Args:
+            model: Chat model name
+            prompt: User prompt
+            options: Ollama generation options of the request
+
+        Returns:
+            Tuple of (answer or None, prompt vector); pass the vector to store()
+            after a miss to avoid embedding the prompt twice
+        """
+        model = normalize_model_name(model)
+        vector = self.embed(prompt)
+        if vector is None:
+            return None, None
+
+        try:
+            best = self.index.search(model, vector, options_key(options))
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {str(e)}")
+            self._count("errors")
+            return None, vector
+
+        similarity = best[0] if best else None
+        hit = similarity is not None and similarity >= self.get_threshold(model)
+        with self.lock:
+            self.counters["lookups"] += 1
+            self.counters["hits" if hit else "misses"] += 1
+            model_counters = self.per_model.setdefault(model, {"hits": 0, "misses": 0})
+            model_counters["hits" if hit else "misses"] += 1
+            if similarity is not None:
+                self.histogram[bisect.bisect_right(SIMILARITY_BUCKETS, similarity)] += 1
+
+        if hit:
+            logger.info(f"Semantic cache hit for {model} (similarity {similarity:.3f})")
+            return best[2], vector
+        return None, vector
+
+    def store(
+        self,
+        model: str,
+        prompt: str,
+        response: str,
+        vector: Optional[List[float]] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Store an answer
+
+        Args:
+            model: Chat model name
+            prompt: User prompt
+            response: Model answer
+            vector: Prompt vector from lookup(), embedded again if omitted
+            options: Ollama generation options the answer was generated with
+        """
+        if vector is None:
+            vector = self.embed(prompt)
+            if vector is None:
+                return
+        try:
+            self.index.add(normalize_model_name(model), vector, prompt, response, options_key(options))
+            self._count("stores")
+        except Exception as e:
+            logger.warning(f"Could not store semantic cache entry: {str(e)}")
+            self._count("errors")
+
+    def invalidate_model(self, model: str) -> None:
+        """Drop all answers of a model, e.g. after it was re-pulled or deleted"""
+        try:
+            self.index.delete_model(normalize_model_name(model))
+        except Exception as e:
+            logger.warning(f"Could not invalidate semantic cache for {model}: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit rates and the distribution of best-match similarities
+
+        Returns:
+            Dict with counters, hit ratio, per-model counters, thresholds and
+            a histogram of similarity scores
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats["per_model"] = {model: dict(counters) for model, counters in self.per_model.items()}
+            counts = list(self.histogram)
+        lookups = stats["lookups"]
+        bounds = [0.0] + SIMILARITY_BUCKETS + [1.0]
+        stats.update({
+            "backend": self.index.name,
+            "entries": self.index.count(),
+            "embed_model": self.embed_model,
+            "hit_ratio": round(stats["hits"] / lookups, 3) if lookups else None,
+            "threshold": self.threshold,
+            "thresholds": dict(self.thresholds),
+            "similarity_histogram": [
+                {"from": bounds[i], "to": bounds[i + 1], "count": count}
+                for i, count in enumerate(counts)
+            ]
+        })
+        return stats
+
+    def _count(self, counter: str) -> None:
+        with self.lock:
+            self.counters[counter] += 1
@@ -0,0 +1,494 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from modules.shared_state import SharedStore
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rough per-message overhead of chat templates, in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the following conversation between a user and an assistant. "
+    "Keep names, facts, decisions and open questions; be concise."
+)
+
+# Shared state key prefix of sessions
+SESSION_PREFIX = "session:"
+
+
+class Session:
+    """A conversation with one model: its turns and how much of them is in context"""
+
+    def __init__(
+        self,
+        model: str,
+        system: Optional[str] = None,
+        num_ctx: Optional[int] = None,
+        summarize: bool = False,
+        options: Optional[Dict[str, Any]] = None
+    ):
+        """Initialize the session
+
+        Args:
+            model: Model name
+            system: System prompt
+            num_ctx: Context window to request from Ollama (default: the model's)
+            summarize: Replace trimmed turns with a model-written summary
+            options: Ollama generation options sent with every turn
+        """
+        self.id = uuid.uuid4().hex
+        self.model = model
+        self.system = system
+        self.num_ctx = num_ctx
+        self.summarize = summarize
+        self.options = dict(options or {})
+        if num_ctx:
+            self.options["num_ctx"] = num_ctx
+
+        self.turns: List[Dict[str, Any]] = []
+        # Turns before context_start are no longer sent; summary stands in for them
+        self.context_start = 0
+        self.summary: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.version = 0  # Shared state version this copy was loaded from or saved as
+        self.lock = threading.Lock()
+
+    def to_dict(self, include_turns: bool = True) -> Dict[str, Any]:
+        """Serialize the session for the API"""
+        result = {
+            "id": self.id,
+            "model": self.model,
+            "system": self.system,
+            "num_ctx": self.num_ctx,
+            "summarize": self.summarize,
+            "options": self.options,
+            "turn_count": len(self.turns),
+            "context_start": self.context_start,
+            "summary": self.summary,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+        if include_turns:
+            result["turns"] = [{"role": turn["role"], "content": turn["content"]} for turn in self.turns]
+        return result
+
+    def to_state(self) -> Dict[str, Any]:
+        """Serialize everything needed to restore the session in another process"""
+        return dict(self.to_dict(include_turns=False), turns=self.turns)
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], version: int = 0) -> "Session":
+        """Restore a session serialized with to_state"""
+        session = cls(state["model"], state["system"], None, state["summarize"], state["options"])
+        session.id = state["id"]
+        session.num_ctx = state["num_ctx"]
+        session.turns = state["turns"]
+        session.context_start = state["context_start"]
+        session.summary = state["summary"]
+        session.created_at = state["created_at"]
+        session.updated_at = state["updated_at"]
+        session.version = version
+        return session
+
+
+class SessionManager:
+    """Server-side chat sessions with token-budgeted context assembly
+
+    The context sent for a turn is the system prompt (plus the summary of
+    trimmed turns), the turns from `context_start` on, and the new message.
+    When it no longer fits the model's num_ctx, the oldest turns are trimmed
+    down to `trim_target` of the budget in one step rather than one turn per
+    request, so the message prefix stays byte-identical for many turns and
+    Ollama can reuse its prompt cache instead of re-evaluating the history.
+
+    With a shared store, sessions are saved there after every turn, so any
+    worker process can continue them; each worker keeps the copies it used
+    and reloads one when another worker changed it. Saves are compare-and-swap
+    on the version a copy was loaded at, so when two workers run a turn of the
+    same session at once, the later one re-appends its exchange onto the
+    other's instead of overwriting it.
+    """
+
+    def __init__(
+        self,
+        chat_function: Callable[[str, List[Dict[str, Any]], Optional[Dict[str, Any]]], Dict[str, Any]],
+        context_length_function: Callable[[str], int],
+        max_sessions: int = 1000,
+        idle_ttl: float = 24 * 3600,
+        chars_per_token: float = 4.0,
+        trim_target: float = 0.6,
+        persistence: Optional[Any] = None,
+        store: Optional[SharedStore] = None
+    ):
+        """Initialize the session manager
+
+        Args:
+            chat_function: Called as chat_function(model, messages, options);
+                returns a dict with content and prompt_eval_count
+            context_length_function: Returns the num_ctx of a model
+            max_sessions: Least recently used sessions are dropped beyond this
+            idle_ttl: Seconds after which an unused session is dropped
+            chars_per_token: Characters per token for estimating context size
+            trim_target: Fraction of the budget the context is trimmed down to
+            persistence: Persistence store that completed turns are written to
+            store: Store shared with other worker processes (default: sessions are local)
+        """
+        self.chat_function = chat_function
+        self.context_length_function = context_length_function
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.chars_per_token = chars_per_token
+        self.trim_target = trim_target
+        self.persistence = persistence
+        self.store = store
+
+        self.lock = threading.Lock()
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def create(self, model: str, **settings) -> Dict[str, Any]:
+        """Create a session
+
+        Args:
+            model: Model name
+            **settings: system, num_ctx, summarize and options, see Session
+
+        Returns:
+            Session dict
+        """
+        session = Session(model, **settings)
+        with self.lock:
+            self.sessions[session.id] = session
+            self._expire()
+        if self.store is not None:
+            self._save(session)
+            self._shared_sessions()
+        return session.to_dict()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a session with all of its turns"""
+        session = self._lookup(session_id)
+        if session is None:
+            return None
+        with session.lock:
+            return session.to_dict()
+
+    def get_model(self, session_id: str) -> Optional[str]:
+        """Get the model of a session, None if it does not exist"""
+        session = self._lookup(session_id)
+        return session.model if session is not None else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """List sessions, most recently used first, without their turns"""
+        if self.store is not None:
+            return [
+                {key: value for key, value in state.items() if key != "turns"}
+                for state in self._shared_sessions()
+            ]
+        with self.lock:
+            self._expire()
+            sessions = list(self.sessions.values())
+        return [session.to_dict(include_turns=False) for session in reversed(sessions)]
+
+    def delete(self, session_id: str) -> bool:
+        """Delete a session
+
+        Returns:
+            False if the session does not exist
+        """
+        with self.lock:
+            deleted = self.sessions.pop(session_id, None) is not None
+        if self.store is not None:
+            deleted = self.store.version(f"{SESSION_PREFIX}{session_id}") > 0
+            self.store.delete(f"{SESSION_PREFIX}{session_id}")
+        return deleted
+
+    def send(self, session_id: str, message: str) -> Optional[Dict[str, Any]]:
+        """Append a user turn, get the model's reply and append it too
+
+        Turns of one session are processed one at a time within a worker;
+        turns sent to different workers at once are both kept, in the order
+        they finish.
+
+        Args:
+            session_id: Session ID
+            message: User message
+
+        Returns:
+            Dict with response and context statistics, or None if the session
+            does not exist
+
+        Raises:
+            RuntimeError: If the model fails to answer (no turn is recorded)
+        """
+        session = self._lookup(session_id)
+        if session is None:
+            return None
+
+        with session.lock:
+            messages, context = self._build_context(session, message)
+            result = self.chat_function(session.model, messages, session.options or None)
+            self._record(session, message, result["content"])
+
+        context["prompt_eval_count"] = result.get("prompt_eval_count")
+        return {"session_id": session.id, "response": result["content"], "context": context}
+
+    def stream(
+        self,
+        session_id: str,
+        message: str,
+        stream_function: Callable[..., Iterator[Dict[str, Any]]]
+    ) -> Optional[Iterator[Dict[str, Any]]]:
+        """Like send, but stream the reply as chat_stream events
+
+        The turns are recorded when the stream finishes successfully; if the
+        client disconnects first, nothing is recorded.
+
+        Args:
+            session_id: Session ID
+            message: User message
+            stream_function: Called as stream_function(model, None, messages=..., options=...)
+
+        Returns:
+            Event iterator; its final "done" event carries a "context" dict.
+            None if the session does not exist
+        """
+        session = self._lookup(session_id)
+        if session is None:
+            return None
+        return self._stream(session, message, stream_function)
+
+    def _stream(
+        self,
+        session: Session,
+        message: str,
+        stream_function: Callable[..., Iterator[Dict[str, Any]]]
+    ) -> Iterator[Dict[str, Any]]:
+        with session.lock:
+            try:
+                messages, context = self._build_context(session, message)
+            except Exception as e:
+                yield {"type": "error", "error": str(e)}
+                return
+
+            events = stream_function(session.model, None, messages=messages, options=session.options or None)
+            content = []
+            try:
+                for event in events:
+                    if event.get("type") == "token":
+                        content.append(event["content"])
+                    elif event.get("type") == "done":
+                        self._record(session, message, "".join(content))
+                        context["prompt_eval_count"] = event.get("prompt_eval_count")
+                        event = dict(event, session_id=session.id, context=context)
+                    yield event
+            finally:
+                events.close()
+
+    def _lookup(self, session_id: str) -> Optional[Session]:
+        if self.store is not None:
+            return self._lookup_shared(session_id)
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def _lookup_shared(self, session_id: str) -> Optional[Session]:
+        """Get a session, reloading it from the store if another worker changed it"""
+        key = f"{SESSION_PREFIX}{session_id}"
+        version = self.store.version(key)
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if version == 0:
+                self.sessions.pop(session_id, None)
+                return None
+            if session is not None and session.version == version:
+                self.sessions.move_to_end(session_id)
+                return session
+        version, state = self.store.get(key)
+        if state is None:
+            return None
+        session = Session.from_state(state, version)
+        with self.lock:
+            self.sessions[session_id] = session
+            self._expire()
+        return session
+
+    def _save(self, session: Session, new_turns: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Write a session to the shared store (session lock held)
+
+        If another worker saved the session since this copy was loaded, its
+        state is taken over and new_turns are appended to it again.
+
+        Args:
+            session: Session to write
+            new_turns: Turns added since the copy was loaded or last saved
+        """
+        key = f"{SESSION_PREFIX}{session.id}"
+        while True:
+            version = self.store.put_if_version(key, session.to_state(), session.version)
+            if version:
+                session.version = version
+                return
+            current_version, state = self.store.get(key)
+            if state is None:
+                logger.warning(f"Session {session.id} was deleted by another worker, dropping its new turns")
+                return
+            logger.info(f"Session {session.id} changed in another worker, merging the new turns")
+            # Both copies share the turns up to the version this one was loaded at,
+            # so context_start indexes the same turns in either
+            if session.context_start <= state["context_start"]:
+                session.context_start = state["context_start"]
+                session.summary = state["summary"]
+            session.turns = state["turns"] + (new_turns or [])
+            session.updated_at = max(session.updated_at, state["updated_at"])
+            session.version = current_version
+
+    def _shared_sessions(self) -> List[Dict[str, Any]]:
+        """Load the shared sessions, dropping expired ones, most recently used first"""
+        cutoff = time.time() - self.idle_ttl
+        states = sorted(
+            (state for _, _, state in self.store.items(SESSION_PREFIX)),
+            key=lambda state: state["updated_at"],
+            reverse=True
+        )
+        expired = states[self.max_sessions:] + [
+            state for state in states[:self.max_sessions] if state["updated_at"] < cutoff
+        ]
+        if expired:
+            self.store.delete(*[f"{SESSION_PREFIX}{state['id']}" for state in expired])
+        return [state for state in states[:self.max_sessions] if state["updated_at"] >= cutoff]
+
+    def _expire(self) -> None:
+        """Drop idle sessions and the least recently used beyond max_sessions (lock held)"""
+        cutoff = time.time() - self.idle_ttl
+        for session_id in [key for key, session in self.sessions.items() if session.updated_at < cutoff]:
+            del self.sessions[session_id]
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+
+    def _estimate_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Estimate the prompt size of messages in tokens"""
+        return sum(
+            int(len(message["content"]) / self.chars_per_token) + MESSAGE_OVERHEAD_TOKENS
+            for message in messages
+        )
+
+    def _system_message(self, session: Session) -> Optional[Dict[str, str]]:
+        parts = []
+        if session.system:
+            parts.append(session.system)
+        if session.summary:
+            parts.append(f"Summary of the earlier conversation:\n{session.summary}")
+        return {"role": "system", "content": "\n\n".join(parts)} if parts else None
+
+    def _messages(self, session: Session, message: str) -> List[Dict[str, Any]]:
+        system = self._system_message(session)
+        messages = [system] if system else []
+        messages += [{"role": turn["role"], "content": turn["content"]} for turn in session.turns[session.context_start:]]
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def _context_length(self, session: Session) -> int:
+        """The num_ctx Ollama runs the session's turns with"""
+        return session.num_ctx or session.options.get("num_ctx") or self.context_length_function(session.model)
+
+    def _build_context(self, session: Session, message: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Assemble the messages for a new turn within the token budget (session lock held)
+
+        Returns:
+            Tuple of (messages, context statistics)
+        """
+        num_ctx = self._context_length(session)
+        # Leave room for the reply
+        reserve = session.options.get("num_predict") or min(1024, num_ctx // 4)
+        budget = max(num_ctx - reserve, 1)
+
+        messages = self._messages(session, message)
+        estimate = self._estimate_tokens(messages)
+        trimmed = 0
+        if estimate > budget and session.context_start < len(session.turns):
+            trimmed = self._trim(session, message, int(budget * self.trim_target))
+            messages = self._messages(session, message)
+            estimate = self._estimate_tokens(messages)
+
+        return messages, {
+            "num_ctx": num_ctx,
+            "budget_tokens": budget,
+            "estimated_tokens": estimate,
+            "turns_in_context": len(session.turns) - session.context_start,
+            "trimmed_turns": trimmed,
+            "summarized": bool(session.summary)
+        }
+
+    def _trim(self, session: Session, message: str, target: int) -> int:
+        """Move context_start forward until the context fits `target` tokens
+
+        Only whole user/assistant exchanges are dropped, so the context always
+        starts with a user turn.
+
+        Returns:
+            Number of turns dropped
+        """
+        start = session.context_start
+        dropped = []
+        while start < len(session.turns):
+            remaining = session.turns[start:]
+            size = self._estimate_tokens(remaining + [{"content": message}])
+            system = self._system_message(session)
+            if system:
+                size += self._estimate_tokens([system])
+            if size <= target:
+                break
+            dropped.append(session.turns[start])
+            start += 1
+            while start < len(session.turns) and session.turns[start]["role"] != "user":
+                dropped.append(session.turns[start])
+                start += 1
+
+        session.context_start = start
+        if dropped:
+            logger.info(f"Trimmed {len(dropped)} turns from the context of session {session.id}")
+            if session.summarize:
+                self._summarize(session, dropped)
+        return len(dropped)
+
+    def _summarize(self, session: Session, dropped: List[Dict[str, Any]]) -> None:
+        """Fold trimmed turns into the session summary using the session's model"""
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in dropped)
+        if session.summary:
+            transcript = f"Earlier summary:\n{session.summary}\n\nConversation:\n{transcript}"
+        # Keep the summarization request itself within the session's context window
+        num_ctx = self._context_length(session)
+        limit = int(num_ctx * self.chars_per_token * 0.75)
+        options = {"num_ctx": num_ctx} if session.options.get("num_ctx") else None
+        try:
+            result = self.chat_function(session.model, [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript[-limit:]}
+            ], options)
+            session.summary = result["content"].strip() or session.summary
+        except Exception as e:
+            logger.warning(f"Could not summarize session {session.id}: {str(e)}")
+
+    def _record(self, session: Session, message: str, response: str) -> None:
+        """Append a completed exchange (session lock held)"""
+        now = time.time()
+        new_turns = [
+            {"role": "user", "content": message, "created_at": now},
+            {"role": "assistant", "content": response, "created_at": now}
+        ]
+        session.turns.extend(new_turns)
+        session.updated_at = now
+        if self.store is not None:
+            self._save(session, new_turns)
+        if self.persistence is not None:
+            self.persistence.record_chat(session.id, session.model, "user", message)
+            self.persistence.record_chat(session.id, session.model, "assistant", response)
@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from modules.event_bus import EventBus
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sequence (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO sequence (id, version) VALUES (1, 0);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log (
+    stream TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (stream, seq)
+);
+"""
+
+
+def process_alive(pid: Optional[int]) -> bool:
+    """Whether a process on this host is still running
+
+    The store is a local file, so every process writing to it runs here too.
+    """
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedStore:
+    """State shared by the worker processes of the production server
+
+    A SQLite database in WAL mode: readers never block the writer, and every
+    process opening the same file sees the same data. Two kinds of state are
+    kept:
+
+    - Keys holding a JSON value. Every write takes the next number of one
+      global version sequence, so a reader can tell whether a key changed
+      without decoding it, and wait() can poll for changes across processes.
+    - Append-only logs of (seq, bytes) records per stream, for command
+      history and terminal output.
+
+    Each thread uses its own connection; nothing is opened before a worker
+    process forks, as the app is imported in every worker.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.1):
+        """Open the store and create the tables if needed
+
+        Args:
+            path: Database file, shared by all workers
+            poll_interval: Seconds between checks while waiting for a change
+        """
+        self.path = os.path.expanduser(path)
+        self.poll_interval = poll_interval
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.local = threading.local()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+
+    def get(self, key: str) -> Tuple[int, Any]:
+        """Get a key's value
+
+        Returns:
+            Tuple of (version, data); (0, None) if the key doesn't exist
+        """
+        row = self._connection().execute("SELECT version, data FROM state WHERE key = ?", (key,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else (0, None)
+
+    def current_version(self) -> int:
+        """Get the version of the newest write to any key or log"""
+        return self._connection().execute("SELECT version FROM sequence").fetchone()[0]
+
+    def version(self, key: str) -> int:
+        """Get a key's version without reading its value (0 if it doesn't exist)"""
+        row = self._connection().execute("SELECT version FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def put(self, key: str, data: Any) -> int:
+        """Set a key's value
+
+        Returns:
+            The new version
+        """
+        encoded = json.dumps(data)
+        with self._transaction() as connection:
+            return self._write(connection, key, encoded)
+
+    def put_if_version(self, key: str, data: Any, version: int) -> int:
+        """Set a key's value only if it is still at `version` (compare-and-swap)
+
+        Args:
+            key: Key
+            data: New value
+            version: Version the caller read; 0 if the key must not exist yet
+
+        Returns:
+            The new version, 0 if the key changed meanwhile and nothing was written
+        """
+        encoded = json.dumps(data)
+        with self._transaction() as connection:
+            row = connection.execute("SELECT version FROM state WHERE key = ?", (key,)).fetchone()
+            if (row[0] if row else 0) != version:
+                return 0
+            return self._write(connection, key, encoded)
+
+    def put_if(self, key: str, data: Any, prefix: str, predicate: Callable[[List[Any]], bool]) -> int:
+        """Set a key's value only if predicate(values of all keys starting with prefix) holds
+
+        The check and the write happen in one transaction, so concurrent
+        callers in any worker can't both pass a check that only one of them
+        should, e.g. a limit on how many keys exist.
+
+        Returns:
+            The new version, 0 if the predicate failed and nothing was written
+        """
+        encoded = json.dumps(data)
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT data FROM state WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff")
+            ).fetchall()
+            if not predicate([json.loads(row[0]) for row in rows]):
+                return 0
+            return self._write(connection, key, encoded)
+
+    def update(self, key: str, function: Callable[[Any], Any]) -> Tuple[int, Any]:
+        """Atomically replace a key's value with function(current value)
+
+        The function gets None if the key doesn't exist and runs while other
+        writers wait, so it should be quick.
+
+        Returns:
+            Tuple of (new version, new data)
+        """
+        with self._transaction() as connection:
+            row = connection.execute("SELECT data FROM state WHERE key = ?", (key,)).fetchone()
+            data = function(json.loads(row[0]) if row else None)
+            return self._write(connection, key, json.dumps(data)), data
+
+    def delete(self, *keys: str) -> None:
+        """Remove keys"""
+        if not keys:
+            return
+        with self._transaction() as connection:
+            connection.executemany("DELETE FROM state WHERE key = ?", [(key,) for key in keys])
+
+    def items(self, prefix: str) -> List[Tuple[str, int, Any]]:
+        """Get all keys starting with a prefix
+
+        Returns:
+            (key, version, data) tuples, ordered by key
+        """
+        rows = self._connection().execute(
+            "SELECT key, version, data FROM state WHERE key >= ? AND key < ? ORDER BY key",
+            (prefix, prefix + "\uffff")
+        ).fetchall()
+        return [(key, version, json.loads(data)) for key, version, data in rows]
+
+    def wait(self, key: str, since: int, timeout: float) -> Optional[Tuple[int, Any]]:
+        """Block until a key has a version newer than `since`
+
+        Returns:
+            Tuple of (version, data), or None on timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.version(key) > since:
+                return self.get(key)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(self.poll_interval, remaining))
+
+    def append(self, stream: str, data: bytes, seq: Optional[int] = None) -> int:
+        """Append a record to a log
+
+        Args:
+            stream: Log name
+            data: Record
+            seq: Position of the record (default: the next global version)
+
+        Returns:
+            The record's position
+        """
+        with self._transaction() as connection:
+            if seq is None:
+                seq = self._next_version(connection)
+            connection.execute("INSERT OR REPLACE INTO log (stream, seq, data) VALUES (?, ?, ?)", (stream, seq, data))
+            return seq
+
+    def read(self, stream: str, after: int = -1, limit: int = 1000, newest_first: bool = False) -> List[Tuple[int, bytes]]:
+        """Read log records
+
+        Args:
+            stream: Log name
+            after: Only records positioned after this (ignored for newest_first)
+            limit: Maximum records
+            newest_first: Return the last records, newest first
+
+        Returns:
+            (seq, data) tuples
+        """
+        if newest_first:
+            sql = "SELECT seq, data FROM log WHERE stream = ? ORDER BY seq DESC LIMIT ?"
+            params: Tuple = (stream, limit)
+        else:
+            sql = "SELECT seq, data FROM log WHERE stream = ? AND seq > ? ORDER BY seq LIMIT ?"
+            params = (stream, after, limit)
+        return [(seq, bytes(data)) for seq, data in self._connection().execute(sql, params).fetchall()]
+
+    def trim(self, stream: str, keep: Optional[int] = None, before: Optional[int] = None) -> None:
+        """Drop old log records
+
+        Args:
+            stream: Log name
+            keep: Keep only the last this many records
+            before: Drop records positioned before this
+        """
+        with self._transaction() as connection:
+            if keep is not None:
+                connection.execute(
+                    "DELETE FROM log WHERE stream = ? AND seq <= "
+                    "(SELECT seq FROM log WHERE stream = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                    (stream, stream, keep)
+                )
+            if before is not None:
+                connection.execute("DELETE FROM log WHERE stream = ? AND seq < ?", (stream, before))
+
+    def drop(self, stream: str) -> None:
+        """Remove a whole log"""
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM log WHERE stream = ?", (stream,))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the store's size and version"""
+        connection = self._connection()
+        return {
+            "path": self.path,
+            "version": self.current_version(),
+            "keys": connection.execute("SELECT COUNT(*) FROM state").fetchone()[0],
+            "log_records": connection.execute("SELECT COUNT(*) FROM log").fetchone()[0],
+            "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        }
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            # Autocommit; writes open their own transactions
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def _transaction(self) -> "_Transaction":
+        return _Transaction(self._connection())
+
+    def _next_version(self, connection: sqlite3.Connection) -> int:
+        return connection.execute("UPDATE sequence SET version = version + 1 RETURNING version").fetchone()[0]
+
+    def _write(self, connection: sqlite3.Connection, key: str, encoded: str) -> int:
+        version = self._next_version(connection)
+        connection.execute(
+            "INSERT OR REPLACE INTO state (key, version, data, updated_at) VALUES (?, ?, ?, ?)",
+            (key, version, encoded, time.time())
+        )
+        return version
+
+
+class _Transaction:
+    """Write transaction; BEGIN IMMEDIATE takes the write lock up front, so
+    read-modify-write sequences never fail halfway on a busy database"""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class SharedEventBus(EventBus):
+    """EventBus whose topics live in a SharedStore
+
+    Publishing in one worker process wakes subscribers in all of them, within
+    the store's poll interval. Versions come from the store's global sequence,
+    so cursors stay valid whichever worker a client reconnects to.
+    """
+
+    def __init__(self, store: SharedStore):
+        super().__init__()
+        self.store = store
+
+    def publish(self, topic: str, data: Any) -> int:
+        return self.store.put(f"topic:{topic}", data)
+
+    def get(self, topic: str) -> Tuple[int, Any]:
+        return self.store.get(f"topic:{topic}")
+
+    def wait_for_change(self, topic: str, since: int, timeout: float) -> Optional[Tuple[int, Any]]:
+        # The store is emptied when the server starts, so older cursors can be ahead
+        if since > self.store.current_version():
+            since = 0
+        return self.store.wait(f"topic:{topic}", since, timeout)
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """An in-progress execution that concurrent callers wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlightStats:
+    """Per-key call counters, shareable between SingleFlight instances"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Hashable, Dict[str, int]] = {}
+
+    def record(self, key: Hashable, leader: bool) -> None:
+        """Count a call; leader calls execute, the others are collapsed"""
+        with self.lock:
+            counters = self.counters.setdefault(key, {"calls": 0, "executions": 0, "collapsed": 0})
+            counters["calls"] += 1
+            counters["executions" if leader else "collapsed"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """Get a copy of the counters, keyed by str(key)"""
+        with self.lock:
+            return {str(key): dict(counters) for key, counters in self.counters.items()}
+
+
+class SingleFlight:
+    """Collapse concurrent identical calls into one execution
+
+    The first caller for a key runs the function; callers arriving with the
+    same key while it runs wait for it and receive the same result (or
+    exception). Nothing is cached: once the call returns, the next caller
+    triggers a new execution.
+    """
+
+    def __init__(self, stats: Optional[SingleFlightStats] = None):
+        """Initialize the single-flight group
+
+        Args:
+            stats: Counters to record into (default: a new SingleFlightStats)
+        """
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, _Call] = {}
+        self.stats = stats or SingleFlightStats()
+
+    def do(self, key: Hashable, function: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run function(*args, **kwargs), or join an in-progress run for the same key
+
+        Args:
+            key: Identifies calls that may share a result
+            function: Function to run
+            *args: Positional arguments for function
+            **kwargs: Keyword arguments for function
+
+        Returns:
+            The function's result
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+        self.stats.record(key, leader)
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Get per-key counters
+
+        Returns:
+            Dict mapping key to calls, executions and collapsed (calls that
+            shared another call's result instead of executing)
+        """
+        return self.stats.snapshot()
+
+
+class AsyncSingleFlight:
+    """Asyncio variant of SingleFlight for coroutines on one event loop"""
+
+    def __init__(self, stats: Optional[SingleFlightStats] = None):
+        """Initialize the single-flight group
+
+        Args:
+            stats: Counters to record into, e.g. those of a SingleFlight serving
+                the same keys from threads
+        """
+        self.calls: Dict[Hashable, asyncio.Future] = {}
+        self.stats = stats or SingleFlightStats()
+
+    async def do(self, key: Hashable, function: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Await function(*args, **kwargs), or join an in-progress run for the same key
+
+        Args:
+            key: Identifies calls that may share a result
+            function: Coroutine function to run
+            *args: Positional arguments for function
+            **kwargs: Keyword arguments for function
+
+        Returns:
+            The function's result
+        """
+        future = self.calls.get(key)
+        self.stats.record(key, future is None)
+        if future is not None:
+            # shield: a cancelled waiter must not cancel the shared call
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        try:
+            result = await function(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Avoid "exception was never retrieved" when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self.calls[key]
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Get per-key counters, see SingleFlight.get_stats"""
+        return self.stats.snapshot()
@@ -0,0 +1,572 @@
+import os
+import math
+import time
+import uuid
+import signal
+import logging
+import threading
+import subprocess
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from modules.metrics import SUBPROCESS_SPAWNS
+from modules.shared_state import SharedStore, process_alive
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Job states
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"
+
+# Command history status per final state
+HISTORY_STATUS = {SUCCEEDED: "SUCCESS", FAILED: "ERROR", TIMEOUT: "TIMEOUT", CANCELLED: "CANCELLED"}
+
+# Seconds between SIGTERM and SIGKILL when a job is stopped
+KILL_GRACE = 2.0
+
+# Largest chunk read from a command at once
+CHUNK_SIZE = 64 * 1024
+
+# Shared state keys: job, cancel request and output log per job ID
+JOB_PREFIX = "terminal:"
+CANCEL_PREFIX = "terminal_cancel:"
+OUTPUT_PREFIX = "terminal_output:"
+
+
+class TerminalBusy(Exception):
+    """Raised when the maximum number of commands is already running"""
+
+
+class OutputBuffer:
+    """Ring buffer keeping the last max_bytes of a command's output
+
+    Positions are absolute byte offsets into the whole output, so readers can
+    resume where they left off and tell when older output was dropped.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.chunks: Deque[Tuple[int, bytes]] = deque()  # (offset, data)
+        self.size = 0
+        self.end = 0
+        self.closed = False
+        self.changed = threading.Condition()
+
+    @property
+    def start(self) -> int:
+        """Offset of the oldest byte still held"""
+        return self.end - self.size
+
+    def append(self, data: bytes) -> None:
+        with self.changed:
+            if len(data) > self.max_bytes:
+                self.end += len(data) - self.max_bytes
+                data = data[-self.max_bytes:]
+            self.chunks.append((self.end, data))
+            self.end += len(data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                offset, oldest = self.chunks.popleft()
+                excess = self.size - self.max_bytes
+                if len(oldest) > excess:
+                    self.chunks.appendleft((offset + excess, oldest[excess:]))
+                    self.size -= excess
+                else:
+                    self.size -= len(oldest)
+            self.changed.notify_all()
+
+    def close(self) -> None:
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+    def read(self, since: int = 0, limit: int = 256 * 1024) -> Dict[str, Any]:
+        """Read output from an offset
+
+        Args:
+            since: Offset to read from (0 for everything still held)
+            limit: Maximum bytes to return
+
+        Returns:
+            Dict with text, next (offset to continue from), dropped (bytes
+            between `since` and the oldest output held) and done
+        """
+        with self.changed:
+            start = max(since, self.start)
+            parts = []
+            remaining = limit
+            for offset, data in self.chunks:
+                if offset + len(data) <= start or remaining <= 0:
+                    continue
+                part = data[max(0, start - offset):][:remaining]
+                parts.append(part)
+                remaining -= len(part)
+            data = b"".join(parts)
+            done = self.closed and start + len(data) >= self.end
+        if not done:
+            # Don't split a UTF-8 sequence; the rest comes with the next read
+            data = data[:_utf8_boundary(data)]
+        return {
+            "text": data.decode("utf-8", errors="replace"),
+            "next": start + len(data),
+            "dropped": max(0, start - since),
+            "done": done
+        }
+
+    def wait(self, since: int, timeout: float) -> bool:
+        """Wait until there is output beyond `since` or the output is complete
+
+        Returns:
+            False on timeout
+        """
+        with self.changed:
+            return self.changed.wait_for(lambda: self.end > since or self.closed, timeout)
+
+
+class TerminalJob:
+    """A shell command running in the background"""
+
+    def __init__(self, command: str, timeout: float, max_output_bytes: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.command = command
+        self.timeout = timeout
+        self.state = RUNNING
+        self.exit_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.output = OutputBuffer(max_output_bytes)
+        self.process: Optional[subprocess.Popen] = None
+        self.stop_reason: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for the API"""
+        return {
+            "id": self.id,
+            "command": self.command,
+            "state": self.state,
+            "exit_code": self.exit_code,
+            "error": self.error,
+            "timeout": self.timeout,
+            "pid": self.process.pid if self.process is not None else None,
+            "output_bytes": self.output.end,
+            "output_dropped_bytes": self.output.start,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "duration": round((self.finished_at or time.time()) - self.created_at, 3)
+        }
+
+
+class SharedOutput:
+    """Output of a job running in another worker process, read from the shared store
+
+    The owning worker mirrors every chunk into a log keyed by its byte
+    offset, so reads use the same positions as OutputBuffer. Waiting polls
+    the store.
+    """
+
+    def __init__(self, job: "RemoteTerminalJob", max_bytes: int):
+        self.job = job
+        self.max_bytes = max_bytes
+        self.stream = f"{OUTPUT_PREFIX}{job.id}"
+
+    @property
+    def end(self) -> int:
+        """Offset just past the newest byte written"""
+        last = self.job.store.read(self.stream, limit=1, newest_first=True)
+        return last[0][0] + len(last[0][1]) if last else 0
+
+    def read(self, since: int = 0, limit: int = 256 * 1024) -> Dict[str, Any]:
+        """Read output from an offset, see OutputBuffer.read"""
+        # The state is read first: all output is written before a job finishes
+        closed = self.job.refresh() != RUNNING
+        records = self.job.store.read(self.stream, after=since - CHUNK_SIZE - 1)
+        records = [(offset, data) for offset, data in records if offset + len(data) > since]
+        start = max(since, records[0][0]) if records else since
+        parts = []
+        remaining = limit
+        for offset, data in records:
+            if remaining <= 0:
+                break
+            part = data[max(0, start - offset):][:remaining]
+            parts.append(part)
+            remaining -= len(part)
+        data = b"".join(parts)
+        done = closed and start + len(data) >= self.end
+        if not done:
+            data = data[:_utf8_boundary(data)]
+        return {
+            "text": data.decode("utf-8", errors="replace"),
+            "next": start + len(data),
+            "dropped": max(0, start - since),
+            "done": done
+        }
+
+    def wait(self, since: int, timeout: float) -> bool:
+        """Wait until there is output beyond `since` or the job finished
+
+        Returns:
+            False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        while self.job.refresh() == RUNNING and self.end <= since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.job.store.poll_interval, remaining))
+        return True
+
+
+class RemoteTerminalJob:
+    """A job started by another worker process, seen through the shared store"""
+
+    def __init__(self, store: SharedStore, data: Dict[str, Any], max_output_bytes: int):
+        self.store = store
+        self.id = data["id"]
+        self.data = data
+        self.output = SharedOutput(self, max_output_bytes)
+
+    @property
+    def state(self) -> str:
+        return self.data["state"]
+
+    @property
+    def timeout(self) -> float:
+        return self.data["timeout"]
+
+    def refresh(self) -> str:
+        """Re-read the job from the store
+
+        Returns:
+            The job's state; failed if the owning worker exited while it ran
+        """
+        data = self.store.get(f"{JOB_PREFIX}{self.id}")[1]
+        if data is not None:
+            self.data = _check_owner(data)
+        return self.state
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for the API"""
+        job = dict(self.data)
+        job.pop("owner", None)
+        if job["state"] == RUNNING:
+            job["output_bytes"] = self.output.end
+            job["duration"] = round(time.time() - job["created_at"], 3)
+        return job
+
+
+class TerminalJobs:
+    """Runs terminal commands as background jobs with capped, streamable output
+
+    Each command runs in its own process group, so stopping a job (cancel or
+    timeout) also stops the processes the shell started. stdout and stderr
+    are merged into one ring buffer per job; only the last max_output_bytes
+    are kept. At most max_running commands run at once.
+
+    With a shared store, jobs and their output are mirrored into it, so any
+    worker process can list, read, stream and cancel a job; the process is
+    still signalled by the worker that started it.
+    """
+
+    def __init__(
+        self,
+        max_running: int = 4,
+        max_output_bytes: int = 1024 * 1024,
+        default_timeout: float = 300.0,
+        max_timeout: float = 3600.0,
+        history_size: int = 50,
+        on_finish: Optional[Callable[[str, str, str], None]] = None,
+        store: Optional[SharedStore] = None
+    ):
+        """Initialize the job manager
+
+        Args:
+            max_running: Maximum commands running at the same time
+            max_output_bytes: Output kept per job (older output is dropped)
+            default_timeout: Seconds a command may run unless the request sets a timeout
+            max_timeout: Upper limit for requested timeouts
+            history_size: Finished jobs kept for the API
+            on_finish: Called as on_finish(command, status, timestamp) when a job ends,
+                with status SUCCESS, ERROR, TIMEOUT or CANCELLED
+            store: Store shared with other worker processes (default: jobs are local)
+        """
+        self.max_running = max_running
+        self.max_output_bytes = max_output_bytes
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+        self.history_size = history_size
+        self.on_finish = on_finish
+        self.store = store
+
+        self.lock = threading.Lock()
+        self.jobs: "OrderedDict[str, TerminalJob]" = OrderedDict()
+        self.running = 0
+
+        if store is not None:
+            # Cancels requested through other workers arrive through the store
+            threading.Thread(target=self._watch_cancels, name="terminal-cancels", daemon=True).start()
+
+    def start(self, command: str, timeout: Optional[float] = None) -> TerminalJob:
+        """Start a command in the background
+
+        Args:
+            command: Shell command
+            timeout: Seconds before the command is stopped (at least 1, capped at max_timeout)
+
+        Returns:
+            The running job
+
+        Raises:
+            TerminalBusy: If max_running commands are already running
+            OSError: If the command could not be started
+        """
+        if not timeout or math.isnan(timeout):
+            timeout = self.default_timeout
+        timeout = max(min(timeout, self.max_timeout), 1)
+        job = TerminalJob(command, timeout, self.max_output_bytes)
+        with self.lock:
+            self._reserve(job)
+            self.running += 1
+
+        logger.info(f"Executing command: {command}")
+        try:
+            SUBPROCESS_SPAWNS.inc("terminal")
+            job.process = subprocess.Popen(
+                command,
+                shell=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True
+            )
+        except OSError:
+            with self.lock:
+                self.running -= 1
+            if self.store is not None:
+                self.store.delete(f"{JOB_PREFIX}{job.id}")
+            raise
+
+        with self.lock:
+            self.jobs[job.id] = job
+            self._trim_history()
+        self._share(job)
+        threading.Thread(target=self._run, args=(job,), name=f"terminal-{job.id}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[TerminalJob]:
+        """Get a job, which may be a RemoteTerminalJob started by another worker"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None and self.store is not None:
+            data = self.store.get(f"{JOB_PREFIX}{job_id}")[1]
+            if data is not None:
+                return RemoteTerminalJob(self.store, _check_owner(data), self.max_output_bytes)
+        return job
+
+    def list(self) -> List[Dict[str, Any]]:
+        """List running and recent jobs, newest first"""
+        if self.store is not None:
+            jobs = [
+                RemoteTerminalJob(self.store, _check_owner(data), self.max_output_bytes).to_dict()
+                for _, _, data in self.store.items(JOB_PREFIX)
+            ]
+            return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def cancel(self, job_id: str) -> Optional[TerminalJob]:
+        """Stop a running job
+
+        Returns:
+            The job, None if unknown
+        """
+        job = self.get(job_id)
+        if isinstance(job, RemoteTerminalJob):
+            if job.state == RUNNING:
+                # The worker that started the job stops it
+                self.store.put(f"{CANCEL_PREFIX}{job_id}", True)
+        elif job is not None and job.state == RUNNING:
+            self._stop(job, CANCELLED)
+        return job
+
+    def wait(self, job: TerminalJob, timeout: Optional[float] = None) -> bool:
+        """Wait for a job to finish
+
+        Returns:
+            False on timeout
+        """
+        if isinstance(job, RemoteTerminalJob):
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while job.refresh() == RUNNING:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(self.store.poll_interval)
+            return True
+        with job.output.changed:
+            return job.output.changed.wait_for(lambda: job.state != RUNNING, timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "running": self._running_everywhere(),
+                "max_running": self.max_running,
+                "jobs": len(self.jobs),
+                "max_output_bytes": self.max_output_bytes,
+                "default_timeout": self.default_timeout
+            }
+
+    def _run(self, job: TerminalJob) -> None:
+        """Copy the output into the ring buffer until the command exits"""
+        timer = threading.Timer(job.timeout, self._stop, args=(job, TIMEOUT))
+        timer.daemon = True
+        timer.start()
+        try:
+            stream = job.process.stdout
+            while True:
+                data = stream.read1(CHUNK_SIZE)
+                if not data:
+                    break
+                offset = job.output.end
+                job.output.append(data)
+                if self.store is not None:
+                    self._share_output(job, offset, data)
+            job.exit_code = job.process.wait()
+        except Exception as e:
+            job.error = str(e)
+            logger.error(f"Error running command {job.command}: {str(e)}")
+        finally:
+            timer.cancel()
+            job.process.stdout.close()
+
+        with job.output.changed:
+            if job.stop_reason is not None:
+                job.state = job.stop_reason
+            elif job.exit_code == 0:
+                job.state = SUCCEEDED
+            else:
+                job.state = FAILED
+            job.finished_at = time.time()
+        job.output.close()
+        with self.lock:
+            self.running -= 1
+        self._share(job)
+        logger.info(f"Command finished ({job.state}, exit code {job.exit_code}): {job.command}")
+        if self.on_finish is not None:
+            self.on_finish(job.command, HISTORY_STATUS[job.state], job.timestamp)
+
+    def _stop(self, job: TerminalJob, reason: str) -> None:
+        """Terminate a job's process group, killing it if it doesn't exit in time"""
+        if job.stop_reason is not None or job.process is None:
+            return
+        job.stop_reason = reason
+        if reason == TIMEOUT:
+            logger.warning(f"Command timed out after {job.timeout} seconds: {job.command}")
+        self._signal(job, signal.SIGTERM)
+        killer = threading.Timer(KILL_GRACE, self._signal, args=(job, signal.SIGKILL))
+        killer.daemon = True
+        killer.start()
+
+    def _signal(self, job: TerminalJob, signum: int) -> None:
+        # The shell may have exited while processes it started still run, so
+        # the group is signalled regardless of the shell's state
+        try:
+            os.killpg(job.process.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _trim_history(self) -> None:
+        """Drop the oldest finished jobs beyond history_size (lock held)"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.state != RUNNING]
+        for job_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self.jobs[job_id]
+
+    def _reserve(self, job: TerminalJob) -> None:
+        """Claim a slot for a job about to start (lock held)
+
+        With a shared store the job is written as running in the same
+        transaction that counts the running jobs, so starts racing in other
+        workers can't exceed max_running between the count and the spawn.
+
+        Raises:
+            TerminalBusy: If max_running commands are already running
+        """
+        running = [self.running]
+        if self.store is not None:
+            def below_limit(jobs: List[Dict[str, Any]]) -> bool:
+                running[0] = sum(1 for data in jobs if _check_owner(data)["state"] == RUNNING)
+                return running[0] < self.max_running
+
+            data = dict(job.to_dict(), owner=os.getpid())
+            if self.store.put_if(f"{JOB_PREFIX}{job.id}", data, JOB_PREFIX, below_limit):
+                return
+        elif self.running < self.max_running:
+            return
+        raise TerminalBusy(f"{running[0]} commands are already running, try again when one finishes")
+
+    def _running_everywhere(self) -> int:
+        """Commands running in this worker, or in all workers with a shared store"""
+        if self.store is None:
+            return self.running
+        return sum(1 for _, _, data in self.store.items(JOB_PREFIX) if _check_owner(data)["state"] == RUNNING)
+
+    def _share(self, job: TerminalJob) -> None:
+        """Write a job's state to the shared store; finished jobs beyond history_size are removed"""
+        if self.store is None:
+            return
+        self.store.put(f"{JOB_PREFIX}{job.id}", dict(job.to_dict(), owner=os.getpid()))
+        if job.state == RUNNING:
+            return
+        self.store.delete(f"{CANCEL_PREFIX}{job.id}")
+        jobs = [_check_owner(data) for _, _, data in self.store.items(JOB_PREFIX)]
+        finished = sorted((data["finished_at"], data["id"]) for data in jobs if data["finished_at"] is not None)
+        for _, job_id in finished[:max(0, len(finished) - self.history_size)]:
+            self.store.delete(f"{JOB_PREFIX}{job_id}")
+            self.store.drop(f"{OUTPUT_PREFIX}{job_id}")
+
+    def _share_output(self, job: TerminalJob, offset: int, data: bytes) -> None:
+        """Mirror an output chunk into the shared store, dropping chunks the ring buffer no longer holds"""
+        stream = f"{OUTPUT_PREFIX}{job.id}"
+        self.store.append(stream, data, seq=offset)
+        # Chunks are at most CHUNK_SIZE, so one starting this far back has been dropped entirely
+        if job.output.start > CHUNK_SIZE:
+            self.store.trim(stream, before=job.output.start - CHUNK_SIZE)
+
+    def _watch_cancels(self) -> None:
+        """Stop this worker's jobs when another worker asked to cancel them"""
+        while True:
+            time.sleep(self.store.poll_interval)
+            with self.lock:
+                running = [job for job in self.jobs.values() if job.state == RUNNING]
+            for job in running:
+                try:
+                    if self.store.version(f"{CANCEL_PREFIX}{job.id}"):
+                        self._stop(job, CANCELLED)
+                except Exception as e:
+                    logger.error(f"Error checking for cancellation of {job.id}: {str(e)}")
+
+
+def _check_owner(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Mark a shared running job failed if the worker that started it is gone"""
+    if data["state"] == RUNNING and not process_alive(data.get("owner")):
+        return dict(data, state=FAILED, error="Worker exited", finished_at=data["created_at"])
+    return data
+
+
+def _utf8_boundary(data: bytes) -> int:
+    """Length of the longest prefix of data that doesn't end inside a UTF-8 sequence"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue  # Continuation byte, keep looking for the lead byte
+        if byte & 0x80 == 0:
+            return len(data)
+        length = 2 if byte & 0xE0 == 0xC0 else 3 if byte & 0xF0 == 0xE0 else 4
+        return len(data) if back >= length else len(data) - back
+    return len(data)
@@ -12,29 +12,44 @@ document.addEventListener("DOMContentLoaded", function () {
   const commandInput = document.getElementById("command-input");
   const executeCommandBtn = document.getElementById("execute-command-btn");
   const commandOutput = document.getElementById("command-output");
+  const cancelCommandBtn = document.getElementById("cancel-command-btn");
   const quickCommands = document.querySelectorAll(".quick-command");
   const chatModelSelect = document.getElementById("chat-model-select");
   const chatMessages = document.getElementById("chat-messages");
   const chatInput = document.getElementById("chat-input");
   const sendMessageBtn = document.getElementById("send-message-btn");
 
-  // Available models data storage
+  // Available models data storage: category -> names, and name -> catalog entry
   let availableModels = {};
+  let catalogModels = {};
+
+  // Terminal job whose output is shown, and the most output kept in the textarea
+  let currentJob = null;
+  const MAX_COMMAND_OUTPUT_CHARS = 200000;
 
   // Initialize
   loadModels();
-  loadAvailableModels();
   loadGpuInfo();
   setupEventListeners();
   setupProgressChecker();
 
-  // Load models into the table and chat selector
-  function loadModels() {
-    fetch("/api/models")
+  // Load the Models tab from the catalog: installed models for the table and
+  // chat selector, and the curated models with their installed state.
+  // The server answers with an ETag, so an unchanged catalog comes back as 304
+  function loadModels(forceRefresh = false) {
+    fetch(
+      forceRefresh === true
+        ? "/api/models/available?refresh=1"
+        : "/api/models/available"
+    )
       .then((response) => response.json())
       .then((data) => {
-        updateModelsTable(data.models);
-        updateChatModelSelect(data.models);
+        if (data.error) {
+          throw new Error(data.error);
+        }
+        updateModelsTable(data.installed);
+        updateChatModelSelect(data.installed);
+        updateAvailableModels(data);
       })
       .catch((error) => {
         console.error("Error loading models:", error);
@@ -42,52 +57,43 @@ document.addEventListener("DOMContentLoaded", function () {
       });
   }
 
-  // Load available models from models.json
-  function loadAvailableModels() {
-    fetch("/api/models/available")
-      .then((response) => response.json())
-      .then((data) => {
-        availableModels = data;
-
-        // If model input has a datalist, let's update it
-        let datalist = document.getElementById("available-models");
-        if (!datalist) {
-          datalist = document.createElement("datalist");
-          datalist.id = "available-models";
-          document.body.appendChild(datalist);
-          modelInput.setAttribute("list", "available-models");
-        }
-
-        // Clear datalist
-        datalist.innerHTML = "";
-
-        // Add all available models as options
-        let allModels = [];
-        for (const category in availableModels) {
-          if (Array.isArray(availableModels[category])) {
-            allModels = allModels.concat(availableModels[category]);
-          }
-        }
-
-        // Remove duplicates
-        allModels = [...new Set(allModels)];
+  // Show the curated models in the install suggestions
+  function updateAvailableModels(catalog) {
+    availableModels = catalog.categories;
+    catalogModels = catalog.models;
+
+    // If model input has a datalist, let's update it
+    let datalist = document.getElementById("available-models");
+    if (!datalist) {
+      datalist = document.createElement("datalist");
+      datalist.id = "available-models";
+      document.body.appendChild(datalist);
+      modelInput.setAttribute("list", "available-models");
+    }
 
-        // Sort alphabetically
-        allModels.sort();
+    // Add all available models as options, sorted alphabetically
+    datalist.innerHTML = "";
+    Object.keys(catalogModels)
+      .sort()
+      .forEach((model) => {
+        const option = document.createElement("option");
+        option.value = model;
+        datalist.appendChild(option);
+      });
 
-        // Add to datalist
-        allModels.forEach((model) => {
-          const option = document.createElement("option");
-          option.value = model;
-          datalist.appendChild(option);
-        });
+    // Create or update model categories for suggestion display
+    updateModelSuggestions();
+  }
 
-        // Create or update model categories for suggestion display
-        updateModelSuggestions();
-      })
-      .catch((error) => {
-        console.error("Error loading available models:", error);
-      });
+  // Suggestion button for a catalog model; installed ones are marked
+  function modelSuggestionButton(model) {
+    const entry = catalogModels[model];
+    if (entry && entry.installed) {
+      return `<button class="btn btn-sm btn-outline-success model-suggestion" 
+                data-model="${model}" title="Installed (${entry.size_formatted})">&#10003; ${model}</button>`;
+    }
+    return `<button class="btn btn-sm btn-outline-secondary model-suggestion" 
+                data-model="${model}">${model}</button>`;
   }
 
   // Load GPU information
@@ -254,8 +260,7 @@ document.addEventListener("DOMContentLoaded", function () {
 
         // Display up to 6 models from this category
         availableModels[category.key].slice(0, 12).forEach((model) => {
-          html += `<button class="btn btn-sm btn-outline-secondary model-suggestion" 
-                    data-model="${model}">${model}</button>`;
+          html += modelSuggestionButton(model);
         });
 
         html += "</div></div>";
@@ -313,22 +318,12 @@ document.addEventListener("DOMContentLoaded", function () {
         <div class="d-flex flex-wrap gap-2">
     `;
 
-    // Add all available models as buttons
-    let allModels = [];
-    for (const category in availableModels) {
-      if (Array.isArray(availableModels[category])) {
-        allModels = allModels.concat(availableModels[category]);
-      }
-    }
-
-    // Remove duplicates and sort
-    allModels = [...new Set(allModels)].sort();
-
-    // Add model buttons
-    allModels.forEach((model) => {
-      html += `<button class="btn btn-sm btn-outline-secondary model-suggestion" 
-                data-model="${model}">${model}</button>`;
-    });
+    // Add all available models as buttons, sorted
+    Object.keys(catalogModels)
+      .sort()
+      .forEach((model) => {
+        html += modelSuggestionButton(model);
+      });
 
     html += `
         </div>
@@ -352,6 +347,7 @@ document.addEventListener("DOMContentLoaded", function () {
 
     // Add local search functionality
     const searchInput = document.getElementById("model-search");
+    let searchTimer = null;
     if (searchInput) {
       searchInput.addEventListener("input", function () {
         const searchTerm = this.value.toLowerCase();
@@ -377,9 +373,10 @@ document.addEventListener("DOMContentLoaded", function () {
           }
         });
 
-        // If search term is long enough, trigger Ollama search
+        // If search term is long enough, trigger Ollama search once typing pauses
+        clearTimeout(searchTimer);
         if (searchTerm.length >= 2) {
-          searchOllamaModels(searchTerm);
+          searchTimer = setTimeout(() => searchOllamaModels(searchTerm), 250);
         }
       });
     }
@@ -417,52 +414,17 @@ document.addEventListener("DOMContentLoaded", function () {
           return;
         }
 
-        // Create an array to store model information
-        const modelInfoArray = [];
-
         try {
-          // Parse the HTML content from our backend
-          const parser = new DOMParser();
-          const doc = parser.parseFromString(data.html, "text/html");
-
-          // Find all model items using the specific structure
-          const modelItems = doc.querySelectorAll("li[x-test-model]");
-
-          modelItems.forEach((item) => {
-            // Get model name from the h2 element
-            const modelNameElement = item.querySelector(
-              "h2 span[x-test-search-response-title]"
-            );
-            if (!modelNameElement) return;
-
-            const modelName = modelNameElement.textContent.trim();
-
-            // Get model description
-            const descriptionElement = item.querySelector("p.max-w-lg");
-            const description = descriptionElement
-              ? descriptionElement.textContent.trim()
-              : "";
-
-            // Get all size spans
-            const sizeSpans = item.querySelectorAll("span[x-test-size]");
-
-            if (sizeSpans.length > 0) {
-              // For each size, create a full model name
-              sizeSpans.forEach((span) => {
-                const size = span.textContent.trim().toLowerCase();
-                const fullModelName = `${modelName}:${size}`;
-                modelInfoArray.push({
-                  name: fullModelName,
-                  description: description,
-                });
-              });
-            } else {
-              // If no sizes found, just use the model name
+          // Expand each result into one pullable name per size
+          const modelInfoArray = [];
+          data.results.forEach((result) => {
+            const sizes = result.sizes.length > 0 ? result.sizes : [null];
+            sizes.forEach((size) => {
               modelInfoArray.push({
-                name: modelName,
-                description: description,
+                name: size ? `${result.name}:${size}` : result.name,
+                description: result.description,
               });
-            }
+            });
           });
 
           // Deduplicate models by name
@@ -505,9 +467,9 @@ document.addEventListener("DOMContentLoaded", function () {
               '<div class="text-muted">No models found. Try a different search term.</div>';
           }
         } catch (err) {
-          console.error("Error parsing search results:", err);
+          console.error("Error showing search results:", err);
           searchResults.innerHTML =
-            '<div class="text-warning">Unable to parse search results. Try using a more specific search term.</div>';
+            '<div class="text-warning">Unable to show search results. Try using a more specific search term.</div>';
         }
       })
       .catch((error) => {
@@ -599,7 +561,7 @@ document.addEventListener("DOMContentLoaded", function () {
     });
 
     // Refresh models button
-    refreshModelsBtn.addEventListener("click", loadModels);
+    refreshModelsBtn.addEventListener("click", () => loadModels(true));
 
     // GPU info refresh button
     const refreshGpuBtn = document.getElementById("refresh-gpu-btn");
@@ -617,6 +579,15 @@ document.addEventListener("DOMContentLoaded", function () {
       }
     });
 
+    // Stop the running command
+    cancelCommandBtn.addEventListener("click", function () {
+      if (currentJob) {
+        fetch(`/api/terminal/jobs/${currentJob}/cancel`, { method: "POST" }).catch(
+          (error) => console.error("Error cancelling command:", error)
+        );
+      }
+    });
+
     // Allow pressing Enter in command input to execute
     commandInput.addEventListener("keypress", function (e) {
       if (e.key === "Enter") {
@@ -653,137 +624,117 @@ document.addEventListener("DOMContentLoaded", function () {
     });
   }
 
-  // Check installation progress periodically
+  // Receive installation progress pushed by the server
   function setupProgressChecker() {
-    let pollInterval = 2000; // Start with 2-second interval
-    let consecutiveEmptyResponses = 0;
-    let isPollingActive = true;
+    let source = null;
     let pollTimer = null;
 
-    // Initial check when page loads
-    checkProgress();
+    function handleProgress(data) {
+      // Handle installation in progress
+      if (data.in_progress) {
+        // Show progress UI
+        installationProgress.classList.remove("d-none");
+        installationStatus.textContent = data.status;
+
+        // Update progress bar if percentage is in the status
+        const match = data.progress.match(/(\d+)%/);
+        if (match) {
+          const percent = match[1];
+          progressBar.style.width = `${percent}%`;
+          progressBar.setAttribute("aria-valuenow", percent);
+          // Add percentage to the progress bar text if > 5%
+          if (parseInt(percent) > 5) {
+            progressBar.textContent = `${percent}%`;
+          } else {
+            progressBar.textContent = "";
+          }
+        }
+      }
+      // Handle when installation UI is shown but install is complete
+      else if (!installationProgress.classList.contains("d-none")) {
+        // If we were showing progress but now it's complete
+        // Check if it was a successful install or a failure
+        if (data.progress === "Failed") {
+          // Show error
+          progressBar.classList.add("bg-danger");
+          installationStatus.classList.add("text-danger");
+          installationStatus.textContent = `Installation failed: ${data.status}`;
+
+          // Hide progress bar after 10 seconds
+          setTimeout(function () {
+            installationProgress.classList.add("d-none");
+            // Reset classes
+            progressBar.classList.remove("bg-danger");
+            installationStatus.classList.remove("text-danger");
+          }, 10000);
+        } else {
+          // Hide progress bar after 3 seconds
+          setTimeout(function () {
+            installationProgress.classList.add("d-none");
+            loadModels(); // Refresh models list
+          }, 3000);
+        }
+      }
+    }
 
-    function checkProgress() {
-      if (!isPollingActive) return;
+    // Server-Sent Events: one long-lived connection, messages only on change
+    function connect() {
+      if (!window.EventSource) {
+        longPoll(0);
+        return;
+      }
 
-      fetch("/api/models/progress")
+      source = new EventSource("/api/models/progress/stream");
+      source.addEventListener("progress", function (event) {
+        handleProgress(JSON.parse(event.data).progress);
+      });
+      source.onerror = function () {
+        // EventSource reconnects on its own, resuming from the last event ID
+        console.warn("Progress stream interrupted, reconnecting...");
+      };
+    }
+
+    // Fallback for browsers without EventSource: long-poll with a version cursor
+    function longPoll(version) {
+      fetch(`/api/models/progress?since=${version}&wait=30`)
         .then((response) => response.json())
         .then((data) => {
-          // Handle installation in progress
-          if (data.in_progress) {
-            // Reset counter since we have an active installation
-            consecutiveEmptyResponses = 0;
-            pollInterval = 2000; // Reset to fast polling
-
-            // Show progress UI
-            installationProgress.classList.remove("d-none");
-            installationStatus.textContent = data.status;
-
-            // Update progress bar if percentage is in the status
-            const match = data.progress.match(/(\d+)%/);
-            if (match) {
-              const percent = match[1];
-              progressBar.style.width = `${percent}%`;
-              progressBar.setAttribute("aria-valuenow", percent);
-              // Add percentage to the progress bar text if > 5%
-              if (parseInt(percent) > 5) {
-                progressBar.textContent = `${percent}%`;
-              } else {
-                progressBar.textContent = "";
-              }
-            }
-
-            // If progress is 100%, automatically refresh models list after 3 seconds
-            if (data.progress.startsWith("100%")) {
-              setTimeout(loadModels, 3000);
-            }
-          }
-          // Handle when installation UI is shown but install is complete
-          else if (!installationProgress.classList.contains("d-none")) {
-            // If we were showing progress but now it's complete
-            // Check if it was a successful install or a failure
-            if (data.progress === "Failed") {
-              // Show error
-              progressBar.classList.add("bg-danger");
-              installationStatus.classList.add("text-danger");
-              installationStatus.textContent = `Installation failed: ${data.status}`;
-
-              // Hide progress bar after 10 seconds
-              setTimeout(function () {
-                installationProgress.classList.add("d-none");
-                // Reset classes
-                progressBar.classList.remove("bg-danger");
-                installationStatus.classList.remove("text-danger");
-              }, 10000);
-            } else {
-              // Hide progress bar after 3 seconds
-              setTimeout(function () {
-                installationProgress.classList.add("d-none");
-                loadModels(); // Refresh models list
-              }, 3000);
-            }
-          }
-          // Handle when there's no installation in progress or UI shown
-          else {
-            // Check if response is empty (no installation activity)
-            if (!data.in_progress && !data.progress && !data.status) {
-              consecutiveEmptyResponses++;
-
-              // After 5 consecutive empty responses, slow down polling
-              if (consecutiveEmptyResponses >= 5) {
-                pollInterval = 10000; // Switch to 10-second polling
-              }
-
-              // After 15 consecutive empty responses, slow down further
-              if (consecutiveEmptyResponses >= 15) {
-                pollInterval = 30000; // Switch to 30-second polling
-              }
-            } else {
-              // Reset if we got a non-empty response
-              consecutiveEmptyResponses = 0;
-              pollInterval = 2000; // Reset to fast polling
-            }
-          }
+          handleProgress(data);
+          pollTimer = setTimeout(() => longPoll(data.version), 0);
         })
         .catch((error) => {
           console.error("Error checking progress:", error);
-          // On error, slow down polling
-          pollInterval = 5000;
-        })
-        .finally(() => {
-          // Schedule next poll with adaptive interval
-          clearTimeout(pollTimer);
-          pollTimer = setTimeout(checkProgress, pollInterval);
+          pollTimer = setTimeout(() => longPoll(version), 5000);
         });
     }
 
-    // Handle tab visibility changes to reduce unnecessary background requests
+    function disconnect() {
+      if (source) {
+        source.close();
+        source = null;
+      }
+      clearTimeout(pollTimer);
+    }
+
+    connect();
+
+    // Drop the connection while the tab is hidden, resume when visible again
     document.addEventListener("visibilitychange", function () {
       if (document.hidden) {
-        // Page is not visible, pause polling
-        clearTimeout(pollTimer);
-        isPollingActive = false;
+        disconnect();
       } else {
-        // Page is visible again, resume polling
-        isPollingActive = true;
-        checkProgress();
+        disconnect();
+        connect();
       }
     });
 
     // Provide method to force an immediate check
     window.forceProgressCheck = function () {
-      consecutiveEmptyResponses = 0;
-      pollInterval = 2000;
-      clearTimeout(pollTimer);
-      checkProgress();
+      fetch("/api/models/progress")
+        .then((response) => response.json())
+        .then(handleProgress)
+        .catch((error) => console.error("Error checking progress:", error));
     };
-
-    // When a user initiates an installation, immediately start polling
-    installModelBtn.addEventListener("click", function () {
-      if (modelInput.value.trim()) {
-        window.forceProgressCheck();
-      }
-    });
   }
 
   // Install a model
@@ -854,13 +805,12 @@ document.addEventListener("DOMContentLoaded", function () {
       });
   }
 
-  // Execute a terminal command
+  // Execute a terminal command as a background job and stream its output
   function executeCommand(command) {
-    // Disable button and show spinner
     executeCommandBtn.disabled = true;
     commandOutput.value = "Executing command...";
 
-    fetch("/api/terminal/execute", {
+    fetch("/api/terminal/jobs", {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
@@ -871,19 +821,93 @@ document.addEventListener("DOMContentLoaded", function () {
       .then((data) => {
         if (data.error) {
           commandOutput.value = `Error: ${data.error}`;
-        } else {
-          commandOutput.value = data.output;
+          executeCommandBtn.disabled = false;
+          return;
         }
+        currentJob = data.id;
+        commandOutput.value = "";
+        cancelCommandBtn.disabled = false;
+        streamCommandOutput(data.id);
       })
       .catch((error) => {
         console.error("Error executing command:", error);
         commandOutput.value = `Error executing command: ${error.message}`;
-      })
-      .finally(() => {
         executeCommandBtn.disabled = false;
       });
   }
 
+  // Append output, keeping only the end of very long output
+  function appendCommandOutput(text, dropped) {
+    if (dropped) {
+      text = `\n[... ${dropped} bytes of earlier output dropped ...]\n` + text;
+    }
+    let output = commandOutput.value + text;
+    if (output.length > MAX_COMMAND_OUTPUT_CHARS) {
+      output = output.slice(output.length - MAX_COMMAND_OUTPUT_CHARS);
+    }
+    commandOutput.value = output;
+    commandOutput.scrollTop = commandOutput.scrollHeight;
+  }
+
+  function finishCommand(job) {
+    if (job.id !== currentJob) {
+      return;
+    }
+    let status = `Exit Code: ${job.exit_code}`;
+    if (job.state === "timeout") {
+      status = `Command timed out after ${job.timeout} seconds`;
+    } else if (job.state === "cancelled") {
+      status = "Command cancelled";
+    } else if (job.error) {
+      status = `Error: ${job.error}`;
+    }
+    appendCommandOutput(`\n${status}\n`);
+    currentJob = null;
+    cancelCommandBtn.disabled = true;
+    executeCommandBtn.disabled = false;
+  }
+
+  function streamCommandOutput(jobId) {
+    if (!window.EventSource) {
+      pollCommandOutput(jobId, 0);
+      return;
+    }
+
+    // EventSource resumes from the last output offset if the connection drops
+    const source = new EventSource(`/api/terminal/jobs/${jobId}/stream`);
+    source.addEventListener("output", function (event) {
+      const data = JSON.parse(event.data);
+      appendCommandOutput(data.text, data.dropped);
+    });
+    source.addEventListener("done", function (event) {
+      source.close();
+      finishCommand(JSON.parse(event.data));
+    });
+    source.onerror = function () {
+      console.warn("Command output stream interrupted, reconnecting...");
+    };
+  }
+
+  // Fallback for browsers without EventSource: long-poll with an offset cursor
+  function pollCommandOutput(jobId, since) {
+    fetch(`/api/terminal/jobs/${jobId}/output?since=${since}&wait=30`)
+      .then((response) => response.json())
+      .then((data) => {
+        appendCommandOutput(data.text, data.dropped);
+        if (!data.done) {
+          pollCommandOutput(jobId, data.next);
+          return;
+        }
+        return fetch(`/api/terminal/jobs/${jobId}`)
+          .then((response) => response.json())
+          .then(finishCommand);
+      })
+      .catch((error) => {
+        console.error("Error reading command output:", error);
+        setTimeout(() => pollCommandOutput(jobId, since), 5000);
+      });
+  }
+
   // Update chat availability based on model selection
   function updateChatAvailability() {
     const selectedModel = chatModelSelect.value;
@@ -917,7 +941,7 @@ document.addEventListener("DOMContentLoaded", function () {
     // Show thinking indicator
     const thinkingId = addThinkingIndicator();
 
-    fetch("/api/chat", {
+    fetch("/api/chat/stream", {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
@@ -927,16 +951,13 @@ document.addEventListener("DOMContentLoaded", function () {
         message: message,
       }),
     })
-      .then((response) => response.json())
-      .then((data) => {
-        // Remove thinking indicator
-        removeThinkingIndicator(thinkingId);
-
-        if (data.error) {
-          addChatMessage("model", `Error: ${data.error}`);
-        } else {
-          addChatMessage("model", data.response);
+      .then((response) => {
+        if (!response.ok || !response.body) {
+          return response.json().then((data) => {
+            throw new Error(data.error || `HTTP ${response.status}`);
+          });
         }
+        return readChatStream(response.body, thinkingId);
       })
       .catch((error) => {
         // Remove thinking indicator
@@ -951,6 +972,68 @@ document.addEventListener("DOMContentLoaded", function () {
       });
   }
 
+  // Read NDJSON chat events and render tokens as they arrive
+  function readChatStream(body, thinkingId) {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let messageDiv = null;
+
+    function handleEvent(event) {
+      if (event.type === "token") {
+        if (!messageDiv) {
+          removeThinkingIndicator(thinkingId);
+          messageDiv = addChatMessage("model", "");
+        }
+        messageDiv.textContent += event.content;
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+      } else if (event.type === "error") {
+        removeThinkingIndicator(thinkingId);
+        addChatMessage("model", `Error: ${event.error}`);
+      } else if (event.type === "done") {
+        removeThinkingIndicator(thinkingId);
+        if (!messageDiv) {
+          messageDiv = addChatMessage("model", "");
+        }
+        const stats = document.createElement("div");
+        stats.className = "small text-muted mt-1";
+        const parts = [];
+        if (event.ttft_ms !== null) {
+          parts.push(`first token ${(event.ttft_ms / 1000).toFixed(2)}s`);
+        }
+        if (event.tokens_per_second !== null) {
+          parts.push(`${event.tokens_per_second} tokens/s`);
+        }
+        stats.textContent = parts.join(" · ");
+        messageDiv.appendChild(stats);
+      }
+    }
+
+    function pump() {
+      return reader.read().then(({ done, value }) => {
+        if (done) {
+          if (buffer.trim()) {
+            handleEvent(JSON.parse(buffer));
+          }
+          removeThinkingIndicator(thinkingId);
+          return;
+        }
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        lines.forEach((line) => {
+          if (line.trim()) {
+            handleEvent(JSON.parse(line));
+          }
+        });
+        return pump();
+      });
+    }
+
+    return pump();
+  }
+
   // Add message to chat
   function addChatMessage(role, content) {
     const messageDiv = document.createElement("div");
@@ -960,6 +1043,8 @@ document.addEventListener("DOMContentLoaded", function () {
 
     // Scroll to bottom
     chatMessages.scrollTop = chatMessages.scrollHeight;
+
+    return messageDiv;
   }
 
   // Add thinking indicator
@@ -0,0 +1,130 @@
+import os
+import json
+import stat
+
+import pytest
+
+from modules.gpu_sampler import GpuSampler
+from modules.ollama_manager import OllamaManager
+
+NVIDIA_OUTPUT = """0, NVIDIA A100-SXM4-80GB, 81920, 40960, 54, 87
+1, NVIDIA GeForce RTX 3090, [N/A], [N/A], [Not Supported], [N/A]
+"""
+
+ROCM_OUTPUT = {
+    "card0": {
+        "Card series": "Instinct MI210",
+        "Temperature (Sensor edge) (C)": "41.0",
+        "GPU use (%)": "12",
+        "VRAM Total Memory (B)": str(64 * 1024 ** 3),
+        "VRAM Total Used Memory (B)": str(16 * 1024 ** 3)
+    },
+    "system": {"Driver version": "6.7.0"}
+}
+
+
+def _write_tool(directory, name, output):
+    """Write a fake vendor tool that logs each call and prints `output`"""
+    path = directory / name
+    path.write_text(
+        "#!/bin/sh\n"
+        f"echo \"$0 $*\" >> {directory / 'calls.log'}\n"
+        f"cat <<'EOF'\n{output}\nEOF\n"
+    )
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+
+
+@pytest.fixture
+def fake_tools(tmp_path, monkeypatch):
+    """Put fake nvidia-smi and rocm-smi first on PATH; returns a function counting calls per tool"""
+    _write_tool(tmp_path, "nvidia-smi", NVIDIA_OUTPUT.strip())
+    _write_tool(tmp_path, "rocm-smi", json.dumps(ROCM_OUTPUT))
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ.get('PATH', '')}")
+
+    def calls(tool):
+        log = tmp_path / "calls.log"
+        lines = log.read_text().splitlines() if log.exists() else []
+        return sum(1 for line in lines if os.path.basename(line.split()[0]) == tool)
+
+    return calls
+
+
+def test_each_tick_runs_each_vendor_tool_once(fake_tools):
+    sampler = GpuSampler()
+
+    for tick in range(1, 4):
+        sampler.sample()
+        assert fake_tools("nvidia-smi") == tick
+        assert fake_tools("rocm-smi") == tick
+
+
+def test_missing_tools_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+
+    info = GpuSampler().sample()
+
+    assert info == {"gpu_available": False, "nvidia_available": False, "amd_available": False}
+
+
+def test_sample_parses_nvidia_and_amd_devices(fake_tools):
+    info = GpuSampler().sample()
+
+    assert info["gpu_available"] and info["nvidia_available"] and info["amd_available"]
+    a100, rtx = info["nvidia_gpus"]
+    assert a100 == {
+        "index": "0",
+        "name": "NVIDIA A100-SXM4-80GB",
+        "memory_total": "81920 MiB",
+        "memory_used": "40960 MiB",
+        "temperature": "54",
+        "utilization": "87 %",
+        "memory_total_mb": 81920.0,
+        "memory_used_mb": 40960.0,
+        "temperature_c": 54.0,
+        "utilization_percent": 87.0
+    }
+    (mi210,) = info["amd_gpus"]
+    assert mi210["name"] == "Instinct MI210"
+    assert mi210["device_id"] == "card0"
+    assert mi210["memory_total"] == "65536 MiB"
+    assert mi210["memory_used_mb"] == 16384.0
+    assert mi210["utilization_percent"] == 12.0
+    assert mi210["temperature_c"] == 41.0
+
+
+def test_unsupported_nvidia_values_are_none(fake_tools):
+    rtx = GpuSampler().sample()["nvidia_gpus"][1]
+
+    assert rtx["name"] == "NVIDIA GeForce RTX 3090"
+    for field in ("memory_total", "memory_used", "temperature", "utilization",
+                  "memory_total_mb", "memory_used_mb", "temperature_c", "utilization_percent"):
+        assert rtx[field] is None, field
+
+
+def test_gpu_info_has_the_api_shape(fake_tools):
+    manager = OllamaManager()
+
+    info = manager.get_gpu_info()
+
+    assert set(info) == {"gpu_available", "nvidia_available", "nvidia_gpus", "amd_available", "amd_gpus"}
+    assert "cpu_info" not in info
+    assert json.loads(json.dumps(info)) == info
+    assert fake_tools("nvidia-smi") == 1
+
+
+def test_history_is_bounded_per_device(fake_tools):
+    sampler = GpuSampler(history_size=3)
+    for _ in range(5):
+        sampler.sample()
+
+    history = sampler.get_history()
+
+    assert history["history_size"] == 3
+    assert set(history["devices"]) == {"nvidia:0", "nvidia:1", "amd:card0"}
+    for device in history["devices"].values():
+        assert len(device["samples"]) == 3
+    samples = history["devices"]["nvidia:0"]["samples"]
+    assert samples[-1]["utilization_percent"] == 87.0
+    assert samples[0]["t"] <= samples[-1]["t"]
+    assert history["devices"]["amd:card0"]["name"] == "Instinct MI210"
+    assert len(sampler.get_history("nvidia:0", limit=2)["devices"]["nvidia:0"]["samples"]) == 2
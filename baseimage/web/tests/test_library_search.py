@@ -0,0 +1,157 @@
+import os
+
+import pytest
+import requests
+
+from modules.library_search import LibraryIndex, LibrarySearch, parse_search_results
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "ollama_search_llama.html")
+
+
+@pytest.fixture(scope="module")
+def page():
+    with open(FIXTURE, encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def index(page):
+    index = LibraryIndex()
+    index.update(parse_search_results(page))
+    return index
+
+
+def _names(results):
+    return [result["name"] for result in results]
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+class _Session:
+    """Stands in for requests.Session; answers with the saved page until `fail` is set"""
+
+    def __init__(self, text):
+        self.text = text
+        self.fail = False
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        if self.fail:
+            raise requests.ConnectionError("ollama.com unreachable")
+        return _Response(self.text)
+
+
+def test_parse_extracts_every_result_in_page_order(page):
+    assert _names(parse_search_results(page)) == [
+        "llama3.1", "llama3.2", "llama3", "llama3.2-vision",
+        "codellama", "tinyllama", "llama4", "dolphin-llama3"
+    ]
+
+
+def test_parse_extracts_sizes_capabilities_and_pull_count(page):
+    results = {result["name"]: result for result in parse_search_results(page)}
+
+    assert results["llama3.1"]["sizes"] == ["8b", "70b", "405b"]
+    assert results["llama3.1"]["capabilities"] == ["tools"]
+    assert results["llama3.1"]["pull_count"] == 98_900_000
+    assert results["llama3.1"]["tag_count"] == 93
+    assert results["llama3.1"]["updated"] == "10 months ago"
+    assert results["llama4"]["sizes"] == ["16x17b", "128x17b"]
+    assert results["llama4"]["capabilities"] == ["vision", "tools"]
+    assert results["llama4"]["pull_count"] == 612_400
+    assert results["codellama"]["capabilities"] == []
+    assert results["dolphin-llama3"]["pull_count"] == 1234
+
+
+def test_parse_decodes_entities_and_line_breaks_in_descriptions(page):
+    results = {result["name"]: result for result in parse_search_results(page)}
+
+    assert results["llama3.2"]["description"] == "Meta's Llama 3.2 goes small with 1B and 3B models."
+    assert "based on Llama 3 that has" in results["dolphin-llama3"]["description"]
+
+
+def test_parse_ignores_pages_without_results():
+    assert parse_search_results("<html><body><p>No models found</p></body></html>") == []
+
+
+def test_match_ranks_exact_name_first(index):
+    assert _names(index.match("llama3.1"))[0] == "llama3.1"
+
+
+def test_match_ranks_prefixes_by_pulls_after_the_exact_name(index):
+    assert _names(index.match("llama3")) == ["llama3", "llama3.1", "llama3.2", "llama3.2-vision", "dolphin-llama3"]
+
+
+def test_match_ranks_name_word_prefix_above_capability(index):
+    # "vis" starts a word of llama3.2-vision's name but only a capability of llama4
+    assert _names(index.match("vis")) == ["llama3.2-vision", "llama4"]
+
+
+def test_match_requires_every_term(index):
+    assert _names(index.match("llama3 vision")) == ["llama3.2-vision"]
+
+
+def test_match_tolerates_typos(index):
+    assert _names(index.match("codelama")) == ["codellama"]
+    assert _names(index.match("tinylama")) == ["tinyllama"]
+
+
+def test_match_finds_nothing_for_unknown_models(index):
+    assert index.match("mistral") == []
+
+
+def test_search_serves_remote_then_cache(page):
+    search = LibrarySearch()
+    search.session = _Session(page)
+
+    first = search.search("Llama")
+    second = search.search("llama")
+
+    assert first["source"] == "remote"
+    assert first["query"] == "llama"
+    assert len(first["results"]) == 8
+    assert second["source"] == "cache"
+    assert search.session.calls == 1
+
+
+def test_search_falls_back_to_stale_results_when_remote_raises(page):
+    search = LibrarySearch(ttl=0)
+    search.session = _Session(page)
+    search.search("llama")
+    search.session.fail = True
+
+    result = search.search("llama")
+
+    assert result["source"] == "stale"
+    assert _names(result["results"])[0] == "llama3.1"
+    assert search.get_stats()["remote_errors"] == 1
+    assert search.get_stats()["offline"]
+
+
+def test_search_falls_back_to_index_when_remote_raises(page):
+    search = LibrarySearch()
+    search.session = _Session(page)
+    search.search("llama")
+    search.session.fail = True
+
+    result = search.search("codelama")
+
+    assert result["source"] == "index"
+    assert _names(result["results"]) == ["codellama"]
+
+
+def test_search_stays_local_until_retry_interval_passes(page):
+    search = LibrarySearch(retry_interval=60)
+    search.session = _Session(page)
+    search.session.fail = True
+
+    assert search.search("llama")["source"] == "index"
+    assert search.search("tiny")["source"] == "index"
+    assert search.session.calls == 1
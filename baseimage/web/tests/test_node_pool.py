@@ -0,0 +1,222 @@
+import socket
+
+import pytest
+import requests
+from urllib3.util.retry import Retry
+
+from benchmarks import servers
+from modules.node_pool import Lease, NodePool
+from modules.ollama_manager import OllamaManager
+
+NODES = ["http://gpu1:11434", "http://gpu2:11434", "http://gpu3:11434"]
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class _Transport:
+    """Stands in for OllamaTransport in health probes; nodes in `down` refuse connections"""
+
+    def __init__(self, ps=None, tags=None):
+        self.ps = ps or {}
+        self.tags = tags or {}
+        self.down = set()
+
+    def get(self, url):
+        base, _, path = url.partition("/api/")
+        if base in self.down:
+            raise requests.ConnectionError(f"{base} refused the connection")
+        names = (self.ps if path == "ps" else self.tags).get(base, [])
+        return _Response({"models": [{"name": name} for name in names]})
+
+
+def _pool(transport=None, **settings):
+    return NodePool(NODES, transport or _Transport(), **settings)
+
+
+def _node(pool, url):
+    return next(node for node in pool.nodes if node.url == url)
+
+
+def _busy(pool, url, count):
+    """Hold `count` requests outstanding on a node"""
+    node = _node(pool, url)
+    with pool.lock:
+        node.outstanding += count
+
+
+def _manager(hosts):
+    manager = OllamaManager(hosts=hosts)
+    # Refused connections fail over at once instead of after the transport's retry backoff
+    manager.transport.adapter.max_retries = Retry(0)
+    return manager
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_lease_picks_least_outstanding_node():
+    pool = _pool()
+    _busy(pool, NODES[0], 3)
+    _busy(pool, NODES[1], 1)
+
+    lease = pool.lease()
+
+    assert lease.url == NODES[2]
+    assert _node(pool, NODES[2]).outstanding == 1
+    lease.done()
+    assert _node(pool, NODES[2]).outstanding == 0
+
+
+def test_leases_spread_over_idle_nodes():
+    pool = _pool()
+    leases = [pool.lease() for _ in NODES]
+    assert sorted(lease.url for lease in leases) == NODES
+
+
+def test_loaded_model_sticks_to_its_node_within_slack():
+    pool = _pool(affinity_slack=2)
+    pool.mark_loaded(_node(pool, NODES[1]), "llama3")
+    _busy(pool, NODES[1], 2)
+
+    assert pool.choose("llama3:latest").url == NODES[1]
+
+    _busy(pool, NODES[1], 1)
+    assert pool.choose("llama3").url != NODES[1]
+
+
+def test_installed_model_is_preferred_over_other_nodes():
+    pool = _pool(affinity_slack=1)
+    pool.set_installed(_node(pool, NODES[2]), ["mistral:latest"])
+    _busy(pool, NODES[2], 1)
+
+    assert pool.choose("mistral").url == NODES[2]
+
+
+def test_loaded_beats_installed():
+    pool = _pool()
+    pool.set_installed(_node(pool, NODES[0]), ["llama3:latest"])
+    pool.mark_loaded(_node(pool, NODES[1]), "llama3")
+
+    assert pool.choose("llama3").url == NODES[1]
+
+
+def test_node_is_ejected_after_failure_threshold():
+    pool = _pool(failure_threshold=2)
+    node = _node(pool, NODES[0])
+    error = requests.ConnectionError("refused")
+
+    Lease(pool, node).done(error)
+    assert node.healthy
+    Lease(pool, node).done(error)
+
+    assert not node.healthy
+    assert node not in pool.healthy_nodes()
+    assert all(pool.lease().node is not node for _ in range(6))
+
+
+def test_success_resets_the_failure_count():
+    pool = _pool(failure_threshold=2)
+    node = _node(pool, NODES[0])
+
+    Lease(pool, node).done(requests.ConnectionError("refused"))
+    Lease(pool, node).done()
+    Lease(pool, node).done(requests.ConnectionError("refused"))
+
+    assert node.healthy
+
+
+def test_failed_probes_eject_and_a_successful_probe_readmits():
+    transport = _Transport(ps={NODES[0]: ["llama3:latest"]}, tags={NODES[0]: ["llama3:latest", "mistral:latest"]})
+    pool = _pool(transport, failure_threshold=2)
+    node = _node(pool, NODES[0])
+    transport.down.add(NODES[0])
+
+    assert not pool.probe(node)
+    assert not pool.probe(node)
+    assert not node.healthy
+
+    transport.down.clear()
+    assert pool.probe(node)
+    assert node.healthy
+    assert node.loaded == {"llama3:latest"}
+    assert node.installed == {"llama3:latest", "mistral:latest"}
+    assert pool.choose("llama3").url == NODES[0]
+
+
+def test_all_nodes_are_tried_when_none_is_healthy():
+    pool = _pool(failure_threshold=1)
+    for node in pool.nodes:
+        pool._record_failure(node, requests.ConnectionError("refused"))
+
+    assert not any(node.healthy for node in pool.nodes)
+    assert pool.healthy_nodes() == pool.nodes
+    assert pool.lease().url in NODES
+
+
+@pytest.fixture(scope="module")
+def fake_nodes():
+    """Two fake Ollama servers with overlapping models"""
+    models = [["llama3:latest", "mistral:latest"], ["llama3:latest", "phi3:latest"]]
+    ports = [_free_port() for _ in models]
+    processes = []
+    try:
+        for port, names in zip(ports, models):
+            processes.append(servers.start_fake_ollama(
+                port, models=",".join(names), tokens=3, token_delay=0, first_token_delay=0
+            ))
+        yield [f"http://127.0.0.1:{port}" for port in ports]
+    finally:
+        for process in processes:
+            servers.stop(process)
+
+
+def test_model_list_merges_nodes(fake_nodes):
+    manager = _manager(fake_nodes)
+
+    models = {model["name"]: sorted(model["nodes"]) for model in manager.get_models(force_refresh=True)}
+
+    first, second = (url.split("://", 1)[1] for url in fake_nodes)
+    assert models == {
+        "llama3:latest": sorted([first, second]),
+        "mistral:latest": [first],
+        "phi3:latest": [second]
+    }
+    assert manager.node_pool.nodes_with("phi3") == [manager.node_pool.nodes[1]]
+
+
+def test_routed_request_fails_over_from_an_unreachable_node(fake_nodes):
+    dead = f"http://127.0.0.1:{_free_port()}"
+    manager = _manager([dead] + fake_nodes)
+    manager.node_pool.failure_threshold = 1
+    dead_node = manager.node_pool.nodes[0]
+    # Affinity sends the first request to the unreachable node
+    manager.node_pool.mark_loaded(dead_node, "llama3")
+    payload = {"model": "llama3", "messages": [{"role": "user", "content": "hi"}], "stream": False}
+
+    responses = [manager._routed_request("POST", "/api/chat", "llama3", json=payload) for _ in range(4)]
+
+    assert all(response.status_code == 200 for response in responses)
+    assert not dead_node.healthy
+    assert dead_node.errors == 1
+    assert all(node.outstanding == 0 for node in manager.node_pool.nodes)
+
+
+def test_routed_request_raises_when_every_node_is_unreachable():
+    manager = _manager([f"http://127.0.0.1:{_free_port()}", f"http://127.0.0.1:{_free_port()}"])
+    payload = {"model": "llama3", "messages": [], "stream": False}
+
+    with pytest.raises(requests.ConnectionError):
+        manager._routed_request("POST", "/api/chat", "llama3", json=payload)
+    assert all(node.errors == 1 for node in manager.node_pool.nodes)
@@ -0,0 +1,161 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from modules.single_flight import SingleFlight, AsyncSingleFlight, SingleFlightStats
+
+CALLERS = 16
+
+
+def _wait_for_calls(flight, key, count, timeout=5.0):
+    """Block until `count` callers have joined `key`, so they all overlap the leader"""
+    deadline = time.monotonic() + timeout
+    while flight.get_stats().get(str(key), {}).get("calls", 0) < count:
+        assert time.monotonic() < deadline, "callers did not arrive in time"
+        time.sleep(0.001)
+
+
+def _run_concurrently(function, count):
+    """Start `count` threads released together by a barrier; returns results and errors"""
+    barrier = threading.Barrier(count)
+    results, errors = [], []
+
+    def caller():
+        barrier.wait()
+        try:
+            results.append(function())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results, errors
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    executions = []
+
+    def upstream():
+        executions.append(1)
+        _wait_for_calls(flight, "models", CALLERS)
+        return {"models": ["llama3"]}
+
+    results, errors = _run_concurrently(lambda: flight.do("models", upstream), CALLERS)
+
+    assert errors == []
+    assert len(executions) == 1
+    assert len(results) == CALLERS
+    assert all(result is results[0] for result in results)
+    assert flight.get_stats()["models"] == {"calls": CALLERS, "executions": 1, "collapsed": CALLERS - 1}
+
+
+def test_exception_propagates_to_every_caller():
+    flight = SingleFlight()
+    executions = []
+
+    def upstream():
+        executions.append(1)
+        _wait_for_calls(flight, "gpu", CALLERS)
+        raise RuntimeError("Ollama unreachable")
+
+    results, errors = _run_concurrently(lambda: flight.do("gpu", upstream), CALLERS)
+
+    assert results == []
+    assert len(errors) == CALLERS
+    assert all(isinstance(error, RuntimeError) and str(error) == "Ollama unreachable" for error in errors)
+    assert len(executions) == 1
+
+
+def test_sequential_calls_are_not_cached():
+    flight = SingleFlight()
+    counter = iter(range(10))
+
+    assert flight.do("key", lambda: next(counter)) == 0
+    assert flight.do("key", lambda: next(counter)) == 1
+    assert flight.get_stats()["key"] == {"calls": 2, "executions": 2, "collapsed": 0}
+
+
+def test_different_keys_execute_separately():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: "A") == "A"
+    assert flight.do("b", lambda: "B") == "B"
+    assert set(flight.get_stats()) == {"a", "b"}
+
+
+def test_async_concurrent_callers_share_one_execution():
+    flight = AsyncSingleFlight()
+    executions = []
+
+    async def upstream():
+        executions.append(1)
+        while flight.get_stats()["models"]["calls"] < CALLERS:
+            await asyncio.sleep(0.001)
+        return ["llama3"]
+
+    async def main():
+        return await asyncio.gather(*[flight.do("models", upstream) for _ in range(CALLERS)])
+
+    results = asyncio.run(main())
+
+    assert len(executions) == 1
+    assert results == [["llama3"]] * CALLERS
+    assert flight.get_stats()["models"] == {"calls": CALLERS, "executions": 1, "collapsed": CALLERS - 1}
+
+
+def test_async_exception_propagates_to_every_caller():
+    flight = AsyncSingleFlight()
+
+    async def upstream():
+        while flight.get_stats()["gpu"]["calls"] < CALLERS:
+            await asyncio.sleep(0.001)
+        raise RuntimeError("Ollama unreachable")
+
+    async def main():
+        return await asyncio.gather(*[flight.do("gpu", upstream) for _ in range(CALLERS)], return_exceptions=True)
+
+    results = asyncio.run(main())
+
+    assert len(results) == CALLERS
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.get_stats()["gpu"]["executions"] == 1
+
+
+def test_async_cancelled_waiter_does_not_cancel_the_shared_call():
+    flight = AsyncSingleFlight()
+    release = None
+
+    async def upstream():
+        await release.wait()
+        return "done"
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        leader = asyncio.ensure_future(flight.do("key", upstream))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do("key", upstream))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_stats_can_be_shared_between_sync_and_async_groups():
+    stats = SingleFlightStats()
+    SingleFlight(stats).do("models", lambda: None)
+
+    async def upstream():
+        return None
+
+    asyncio.run(AsyncSingleFlight(stats).do("models", upstream))
+    assert stats.snapshot()["models"] == {"calls": 2, "executions": 2, "collapsed": 0}